@@ -0,0 +1,125 @@
+import os
+
+import sqlalchemy as sa
+
+
+# Фабрика подключений к MySQL и Postgres.
+# Engine создаются один раз на процесс и на класс нагрузки; соединения переиспользуются через пул.
+
+# Параметры сессии по классам нагрузки:
+# etl - короткие выборки и загрузки, report - тяжелые отчетные запросы (CROSS JOIN, оконные функции),
+# bulk - догрузка зеркальных таблиц и первое заполнение агрегатов: потоковый SELECT открыт всю догрузку,
+#     поэтому без ограничения времени (0 отключает и statement_timeout, и max_execution_time).
+# Значения по умолчанию переопределяются переменными окружения <класс>_<параметр>,
+# например etl_statement_timeout=20min или bulk_max_execution_time=3600000.
+POSTGRES_WORKLOADS = {
+    'etl': {'statement_timeout': '10min', 'work_mem': '64MB'},
+    'report': {'statement_timeout': '30min', 'work_mem': '256MB'},
+    'bulk': {'statement_timeout': '0', 'work_mem': '64MB'},
+}
+
+MYSQL_WORKLOADS = {
+    # max_execution_time в миллисекундах, действует только на SELECT
+    'etl': {'max_execution_time': 10 * 60 * 1000},
+    'report': {'max_execution_time': 30 * 60 * 1000},
+    'bulk': {'max_execution_time': 0},
+}
+
+# Сколько раз запрос должен выполниться, прежде чем psycopg подготовит его на сервере.
+# Пустое значение в переменной окружения отключает подготовленные запросы (нужно за pgbouncer в режиме transaction).
+DEFAULT_PREPARE_THRESHOLD = 5
+
+# MySQL закрывает простаивающие соединения по wait_timeout, поэтому соединения в пуле обновляются заранее
+POOL_RECYCLE_SECONDS = 3600
+
+
+def get_prepare_threshold():
+    value = os.environ.get('postgres_prepare_threshold', str(DEFAULT_PREPARE_THRESHOLD))
+    return int(value) if value else None
+
+
+def get_workload_settings(workloads: dict, workload: str) -> dict:
+    """
+    Параметры сессии класса нагрузки с учетом переменных окружения <класс>_<параметр>.
+    """
+    settings = dict(workloads[workload])
+    for name in settings:
+        value = os.environ.get(f'{workload}_{name}')
+        if value:
+            settings[name] = value
+    return settings
+
+
+def create_mysql_engine(url: str, workload: str = 'etl', pool_size: int = 5):
+    """
+    Создает Engine для MySQL (mysql-connector с C-расширением).
+
+    Args:
+        url: Строка подключения к MySQL.
+        workload: Класс нагрузки из MYSQL_WORKLOADS.
+        pool_size: Размер пула соединений (по числу параллельных стадий).
+
+    Returns:
+        Engine SQLAlchemy.
+    """
+    settings = get_workload_settings(MYSQL_WORKLOADS, workload)
+    url = sa.engine.make_url(url)
+    url = url.set(drivername="mysql+mysqlconnector")
+    engine = sa.create_engine(
+        url,
+        pool_size=pool_size,
+        max_overflow=pool_size,
+        pool_pre_ping=True,
+        pool_recycle=POOL_RECYCLE_SECONDS,
+        pool_use_lifo=True,
+        # C-расширение вместо чистого Python; буферизованные курсоры по умолчанию.
+        # raw не включаем: pandas нужны уже преобразованные в Python типы значения
+        connect_args={'use_pure': False, 'buffered': True},
+    )
+
+    @sa.event.listens_for(engine, 'connect')
+    def set_session(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in settings.items():
+            cursor.execute(f"SET SESSION {name} = {int(value)}")
+        cursor.close()
+
+    return engine
+
+
+def create_postgres_engine(url: str, workload: str = 'etl', pool_size: int = 5):
+    """
+    Создает Engine для Postgres (psycopg 3) с параметрами сессии класса нагрузки.
+
+    Args:
+        url: Строка подключения к Postgres.
+        workload: Класс нагрузки из POSTGRES_WORKLOADS.
+        pool_size: Размер пула соединений (по числу параллельных стадий).
+
+    Returns:
+        Engine SQLAlchemy.
+    """
+    settings = get_workload_settings(POSTGRES_WORKLOADS, workload)
+    url = sa.engine.make_url(url)
+    url = url.set(drivername="postgresql+psycopg")
+    options = ' '.join(f"-c {name}={value}" for name, value in settings.items())
+    return sa.create_engine(
+        url,
+        pool_size=pool_size,
+        max_overflow=pool_size,
+        pool_pre_ping=True,
+        pool_use_lifo=True,
+        connect_args={'options': options, 'prepare_threshold': get_prepare_threshold()},
+    )
+
+
+def create_engines(mysql_url: str, postgres_url: str, pool_size: int = 5) -> dict:
+    """
+    Создает по паре Engine (MySQL, Postgres) на каждый класс нагрузки.
+
+    Returns:
+        Словарь {класс нагрузки: (engine_mysql, engine_postgresql)}.
+    """
+    return {workload: (create_mysql_engine(mysql_url, workload, pool_size),
+                       create_postgres_engine(postgres_url, workload, pool_size))
+            for workload in POSTGRES_WORKLOADS}
@@ -0,0 +1,72 @@
+import pandas as pd
+
+
+# Компактные типы для больших DataFrame из MySQL, которые живут долго: снимок парка t_bike (весь запуск).
+# Порции зеркальных таблиц не сужаются: они сразу уходят в COPY, и сужение было бы лишней копией
+# в момент пика памяти. pd.read_sql и from_records отдают int64/float64/object:
+# - целые столбцы сужаются до int8/int16/int32, если значения помещаются;
+# - строковые столбцы из плана с малым числом различных значений становятся category;
+# - целые столбцы из плана, пришедшие float64 из-за NULL, становятся nullable Int.
+# float64 не сужаются: в них координаты и суммы, float32 теряет точность.
+# Таблицы в Postgres создаются и хэши строк считаются по расширенным типам (widen_dtypes),
+# чтобы сужение не меняло ни схему, ни хэши.
+
+DTYPE_PLANS = {
+    't_bike': {
+        'category': ['gps_number', 'server_ip', 'model', 'frame_number', 'ble_key'],
+    },
+}
+
+# Столбец из плана становится category, только если различных значений не больше этой доли строк
+MAX_CATEGORY_SHARE = 0.5
+
+
+def _is_low_cardinality(values: pd.Series) -> bool:
+    return values.nunique(dropna=False) <= len(values) * MAX_CATEGORY_SHARE
+
+
+def plan_dtypes(df: pd.DataFrame, table_name: str) -> pd.DataFrame:
+    """
+    Сужает типы столбцов DataFrame по плану таблицы-источника.
+    Замены строк (replace) делаются до вызова: у category они меняют категории.
+
+    Args:
+        df: Данные из MySQL.
+        table_name: Таблица-источник (ключ DTYPE_PLANS); без плана сужаются только целые столбцы.
+
+    Returns:
+        Новый DataFrame с теми же столбцами и значениями.
+    """
+    plan = DTYPE_PLANS.get(table_name, {})
+    category = set(plan.get('category', []))
+    nullable_int = set(plan.get('nullable_int', []))
+
+    dtypes = {}
+    for column in df.columns:
+        values = df[column]
+        if pd.api.types.is_integer_dtype(values.dtype):
+            dtypes[column] = pd.to_numeric(values, downcast='integer').dtype
+        elif column in nullable_int and pd.api.types.is_float_dtype(values.dtype):
+            notna = values.dropna()
+            if (notna % 1 == 0).all():
+                dtypes[column] = pd.to_numeric(values.astype('Int64'), downcast='integer').dtype
+        elif column in category and values.dtype == object and _is_low_cardinality(values):
+            dtypes[column] = 'category'
+    changed = {column: dtype for column, dtype in dtypes.items() if dtype != df[column].dtype}
+    return df.astype(changed) if changed else df
+
+
+def widen_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Обратное к plan_dtypes расширение: целые до int64/Int64, category - до типа ее значений.
+    """
+    dtypes = {}
+    for column, dtype in df.dtypes.items():
+        if isinstance(dtype, pd.CategoricalDtype):
+            dtypes[column] = dtype.categories.dtype
+        elif isinstance(dtype, pd.api.extensions.ExtensionDtype) and pd.api.types.is_integer_dtype(dtype):
+            if dtype != 'Int64':
+                dtypes[column] = 'Int64'
+        elif pd.api.types.is_signed_integer_dtype(dtype) and dtype != 'int64':
+            dtypes[column] = 'int64'
+    return df.astype(dtypes) if dtypes else df
@@ -1,14 +1,35 @@
+import argparse
 import os
 
 import pandas as pd
 import numpy as np
 import sqlalchemy as sa
-import json
-import google.oauth2.service_account
-import googleapiclient.discovery
+import uuid
 import datetime
 import polyline
-from shapely.geometry import Point, Polygon
+from functools import partial
+
+from db_engines import create_engines
+from fleet_history import create_history_snapshot_function, ensure_fleet_history_tables, save_fleet_history
+from fleet_snapshot import clear_fleet_snapshot, get_fleet_snapshot, instant_scooters
+from geo import areas_containing_polygons, polygons_from_tuples
+from google_sheets import (clear_sheets, ensure_sheet_hashes_table, get_sheet, get_sheets_service,
+                           plan_sheet_ranges, remember_sheet, sheet_changed)
+from history_partitions import (ensure_history_hourly_table, ensure_history_partitions,
+                                migrate_history_to_partitions, roll_up_history_partitions)
+from mirror_sync import MIRROR_TABLES, ensure_watermark_table, sync_mirror_table
+from nearest_parking import count_by_distance, load_parking_index, nearest_parking
+from pipeline import get_max_workers, run_stages
+from postgres_loader import copy_dataframe_to_postgres, replace_table, replace_table_contents
+from run_window import get_run_window, next_day
+from salary_calendar import expand_salary_calendar
+from sheet_schemas import coerce_sheet
+from stage_metrics import ensure_stage_runs_table, extract_sql, measure_stage
+from test_users import sync_excluded_test_users, with_excluded_test_users
+from vni_base import (ensure_vni_city_daily_base_table, refresh_vni_city_daily_base, vni_cities_base_rows,
+                      vni_total_base_rows)
+from vni_state import (VNI_START_DATE, VNI_TOTAL_CUMULATIVE, ensure_vni_total_state_table, get_vni_total_states,
+                       save_vni_total_state)
 
 
 # Секреты MySQL
@@ -29,140 +50,32 @@ def get_google_creds() -> str:
     return url
 
 
-def read_sheet_data_to_pandas(service, spreadsheet_id: str, range_name: str):
-    """
-    Читает данные из Google Таблицы по указанному диапазону и преобразует их в Pandas DataFrame.
-
-    Args:
-        service: Объект службы Google Sheets API.
-        spreadsheet_id: ID Google Таблицы.
-        range_name: Диапазон ячеек (например, 'Sheet1!A1:D10').
-
-    Returns:
-        Pandas DataFrame с данными или None в случае ошибки.
-    """
-    if not service:
-        return None
-
-    try:
-        # Выполняем запрос к Sheets API для получения значений
-        result = service.spreadsheets().values().get(
-            spreadsheetId=spreadsheet_id,
-            range=range_name,
-            majorDimension='ROWS' # Получаем данные по строкам
-        ).execute()
-
-        values = result.get('values', [])
-
-        if not values:
-            print(f"В диапазоне '{range_name}' таблицы '{spreadsheet_id}' нет данных.")
-            return pd.DataFrame() # Возвращаем пустой DataFrame
-
-        # Pandas может напрямую создать DataFrame из списка списков.
-        # Обычно первая строка содержит заголовки.
-        headers = values[0]
-        data_rows = values[1:]
-
-        # Создаем Pandas DataFrame
-        if headers:
-            # Преобразуем данные в DataFrame, используя первую строку как заголовки
-            df = pd.DataFrame(data_rows, columns=headers)
-        else:
-            # Если заголовков нет, просто создаем DataFrame из данных
-            df = pd.DataFrame(values)
-            print("Предупреждение: Заголовки не обнаружены. Столбцы названы автоматически (0, 1, 2...).")
-
-        print(f"Данные из диапазона '{range_name}' успешно прочитаны и преобразованы в Pandas DataFrame.")
-        return df
-
-    except googleapiclient.errors.HttpError as error:
-        print(f"Ошибка Google Sheets API: {error}")
-        print(f"Код ошибки: {error.resp.status}")
-        print(f"Сообщение об ошибке: {error._get_reason()}")
-        return None
-    except Exception as e:
-        print(f"Произошла непредвиденная ошибка: {e}")
-        return None
-
-
-def get_sheets_service(service_account_file: str):
-    """
-    Создает и возвращает объект службы Google Sheets API.
-
-    Args:
-        service_account_file: Путь к JSON-файлу учетных данных сервисного аккаунта.
-
-    Returns:
-        Объект googleapiclient.discovery.Resource для Sheets API.
-    """
-    try:
-        # Определяем области доступа. Для чтения достаточно 'spreadsheets.readonly'.
-        SCOPES = ['https://www.googleapis.com/auth/spreadsheets.readonly']
+# Google Таблицы, из которых читают стадии
+WORKERS_SPREADSHEET_ID = '1dSOV9X2FV3mnOmnwWvTMJuCCZ-tVBf64DP90k3EYD90'
+PLAN_SPREADSHEET_ID = '1BMH_HSxmK33SZvv3cIAH_SIgvm2NncSTTKI1aa7CoG8'
 
-        # Загружаем учетные данные сервисного аккаунта
-        creds = google.oauth2.service_account.Credentials.from_service_account_file(
-            service_account_file, scopes=SCOPES
-        )
-
-        # Строим сервис Sheets API
-        service = googleapiclient.discovery.build('sheets', 'v4', credentials=creds)
-        print("Сервис Google Sheets API успешно инициализирован.")
-        return service
-    except Exception as e:
-        print(f"Ошибка при инициализации сервиса Google Sheets API: {e}")
-        return None
 
 def decode_polyline_to_tuples(encoded_polyline_string):
     coordinates_tuples = polyline.decode(encoded_polyline_string)
     return coordinates_tuples
 
-def poly_contains(df):
-    a = df['area_detail_tuple']
-    b = df['parking_detail_tuple']
-    res = Polygon(a).contains(Polygon(b))
-    return res
-
-def poly_contains_point_kvt(df):
-    start_point = Point(df['g_lat'], df['g_lng'])
-    area_poly = Polygon(df['area_poly'])
-    res = area_poly.contains(start_point)
-    return res
+def update_vni_city_daily_base(engine_mysql, engine_postgresql):
+    # Пересчет дневных агрегатов поездок по городам для ВНИ Общий и ВНИ по городам
+    today = get_run_window(engine_mysql)['today']
+    rows = refresh_vni_city_daily_base(engine_mysql, engine_postgresql, today)
+    print('Added {x} records to vni_city_daily_base in Postgres!'.format(x=rows))
 
-def poly_contains_point_orders(df):
-    start_point = Point(df['start_lat'], df['start_lng'])
-    area_poly = Polygon(df['area_poly'])
-    res = area_poly.contains(start_point)
-    return res
-
-def main():
-
-    url = get_mysql_url()
-    url = sa.engine.make_url(url)
-    url = url.set(drivername="mysql+mysqlconnector")
-    engine_mysql = sa.create_engine(url)
-
-    url = get_postgres_url()
-    url = sa.engine.make_url(url)
-    url = url.set(drivername="postgresql+psycopg")
-    engine_postgresql = sa.create_engine(url)
 
+def update_vni_total(engine_mysql, engine_postgresql):
     try:
-        # Выгрузка за сегодня из MySQL ВНИ Общий
+        # Выгрузка из MySQL ВНИ Общий по дням начиная с {date_from}.
+        # Накопительные столбцы (SUM OVER) считаются только по этим дням и дополняются сохраненным состоянием.
+        # Поездки по дням берутся из vni_city_daily_base (стадия vni_city_daily_base)
         select_vni_total = """
         -- ВНИ Общий
         WITH three_left_cols AS (
-            SELECT 
-                DATE_FORMAT(FROM_UNIXTIME(t_bike_use.start_time), '%Y-%m-%d') AS  'start_time',
-                COUNT(t_bike_use.ride_amount) AS 'poezdok',
-                SUM(IFNULL(t_bike_use.ride_amount,0)) AS 'obzchaya_stoimost',
-                SUM(IFNULL(t_bike_use.discount,0)) AS 'oplacheno_bonusami',
-                SUM(IFNULL(t_bike_use.duration,0)) / 60 AS 'obschee_vremya_min',
-                SUM(IFNULL(tpd.bike_discount_amount,0)) AS skidka 
-                FROM shamri.t_bike_use
-            LEFT JOIN shamri.t_payment_details tpd ON t_bike_use.id = tpd.ride_id 
-            WHERE t_bike_use.ride_status!=5 AND DATE_FORMAT(FROM_UNIXTIME(t_bike_use.start_time), '%Y-%m-%d') >= '2024-07-21'
-                AND t_bike_use.uid NOT IN (52536,58249,72860,37592,63824,49704,54187,70354,70408,49618,72907,70404,44902,45094)
-            GROUP BY DATE_FORMAT(FROM_UNIXTIME(t_bike_use.start_time), '%Y-%m-%d')
+            -- Дневные агрегаты поездок из vni_city_daily_base
+            {three_left_cols}
         ),
         sum_uspeh_abon AS(
             SELECT 
@@ -170,7 +83,8 @@ def main():
                 sum(IFNULL(t_trade.amount,0)) AS vyruchka_s_abonementov
             FROM t_trade
             WHERE t_trade.`type` = 6 AND t_trade.status = 1
-                AND t_trade.uid NOT IN (52536,58249,72860,37592,63824,49704,54187,70354,70408,49618,72907,70404,44902,45094)
+                AND t_trade.`date` >= '{date_from}'
+                AND t_trade.uid IS NOT NULL AND NOT EXISTS (SELECT 1 FROM excluded_test_users etu WHERE etu.uid = t_trade.uid)
             GROUP BY start_time
             ),
         sum_mnogor_abon AS (
@@ -179,7 +93,8 @@ def main():
                 sum(IFNULL(t_subscription.price,0)) AS sum_mnogor_abon
             FROM t_subscription_mapping
             LEFT JOIN t_subscription ON t_subscription_mapping.subscription_id = t_subscription.id
-                AND t_subscription_mapping.user_id NOT IN (52536,58249,72860,37592,63824,49704,54187,70354,70408,49618,72907,70404,44902,45094)
+                AND t_subscription_mapping.user_id IS NOT NULL AND NOT EXISTS (SELECT 1 FROM excluded_test_users etu WHERE etu.uid = t_subscription_mapping.user_id)
+            WHERE t_subscription_mapping.start_time >= '{date_from}'
             GROUP BY DATE_FORMAT(t_subscription_mapping.start_time, '%Y-%m-%d')
         ),
         kvt AS (
@@ -208,7 +123,8 @@ def main():
                 SUM(IFNULL(t_trade.account_pay_amount,0)) AS 'vyruchka_v_statuse_1'
             FROM t_trade
             WHERE t_trade.status=1 AND t_trade.way=26 AND t_trade.`type` IN (1,2,6,7)
-                AND t_trade.uid NOT IN (52536,58249,72860,37592,63824,49704,54187,70354,70408,49618,72907,70404,44902,45094)
+                AND t_trade.`date` >= '{date_from}'
+                AND t_trade.uid IS NOT NULL AND NOT EXISTS (SELECT 1 FROM excluded_test_users etu WHERE etu.uid = t_trade.uid)
             GROUP BY DATE_FORMAT(t_trade.`date`, '%Y-%m-%d')
             ) AS vyruchka_v_statuse_1
         LEFT JOIN 	
@@ -217,7 +133,8 @@ def main():
                 SUM(IFNULL(t_trade.account_pay_amount,0)) AS 'vozvraty'
              FROM t_trade
              WHERE t_trade.status=4 AND t_trade.way=26
-                AND t_trade.uid NOT IN (52536,58249,72860,37592,63824,49704,54187,70354,70408,49618,72907,70404,44902,45094)
+                AND t_trade.`date` >= '{date_from}'
+                AND t_trade.uid IS NOT NULL AND NOT EXISTS (SELECT 1 FROM excluded_test_users etu WHERE etu.uid = t_trade.uid)
              GROUP BY DATE_FORMAT(t_trade.`date`, '%Y-%m-%d')
         ) AS vozvraty ON vyruchka_v_statuse_1.start_time=vozvraty.start_time
         LEFT JOIN 
@@ -226,7 +143,8 @@ def main():
                 SUM(IFNULL(t_trade.account_pay_amount,0)) AS 'stripe_1'
              FROM t_trade
              WHERE t_trade.status=1 AND t_trade.way=6
-                AND t_trade.uid NOT IN (52536,58249,72860,37592,63824,49704,54187,70354,70408,49618,72907,70404,44902,45094)
+                AND t_trade.`date` >= '{date_from}'
+                AND t_trade.uid IS NOT NULL AND NOT EXISTS (SELECT 1 FROM excluded_test_users etu WHERE etu.uid = t_trade.uid)
              GROUP BY DATE_FORMAT(t_trade.`date`, '%Y-%m-%d')
             ) AS stripe_1 ON vyruchka_v_statuse_1.start_time=stripe_1.start_time
         LEFT JOIN 
@@ -235,7 +153,8 @@ def main():
                 SUM(IFNULL(t_trade.account_pay_amount,0)) AS 'stripe_4'
              FROM t_trade
              WHERE t_trade.status=4 AND t_trade.way=6
-                AND t_trade.uid NOT IN (52536,58249,72860,37592,63824,49704,54187,70354,70408,49618,72907,70404,44902,45094)
+                AND t_trade.`date` >= '{date_from}'
+                AND t_trade.uid IS NOT NULL AND NOT EXISTS (SELECT 1 FROM excluded_test_users etu WHERE etu.uid = t_trade.uid)
              GROUP BY DATE_FORMAT(t_trade.`date`, '%Y-%m-%d')
             ) AS stripe_4 ON vyruchka_v_statuse_1.start_time=stripe_4.start_time
         LEFT JOIN 
@@ -245,7 +164,8 @@ def main():
                 SUM(IFNULL(t_trade.account_pay_amount,0)) AS 'chastichno_vozvrascheny'
             FROM t_trade
             WHERE t_trade.status=3
-                AND t_trade.uid NOT IN (52536,58249,72860,37592,63824,49704,54187,70354,70408,49618,72907,70404,44902,45094)
+                AND t_trade.`date` >= '{date_from}'
+                AND t_trade.uid IS NOT NULL AND NOT EXISTS (SELECT 1 FROM excluded_test_users etu WHERE etu.uid = t_trade.uid)
             GROUP BY DATE_FORMAT(t_trade.`date`, '%Y-%m-%d')
             ) AS chastichno_vozvrascheny ON vyruchka_v_statuse_1.start_time = chastichno_vozvrascheny.start_time
         ),
@@ -254,6 +174,7 @@ def main():
             DATE_FORMAT(t_user.register_date, '%Y-%m-%d') AS start_time,
             COUNT(t_user.id) AS 'user_v_den_register'
         FROM t_user
+        WHERE t_user.register_date >= '{date_from}'
         GROUP BY DATE_FORMAT(t_user.register_date, '%Y-%m-%d')
         ),
         kolichestvo_novyh_s_1_poezdkoy AS ( 
@@ -277,6 +198,7 @@ def main():
                 ON t_bike_use.uid=register_users.id
                 WHERE DATE(DATE_FORMAT(FROM_UNIXTIME(t_bike_use.start_time), '%Y-%m-%d')) = DATE(DATE_FORMAT(register_users.register_date, '%Y-%m-%d')) 
                 AND t_bike_use.ride_status!=5
+                AND t_bike_use.start_time >= UNIX_TIMESTAMP('{date_from}')
                 ) AS register_date_as_start_date
             GROUP BY register_date_as_start_date.start_date
         ),
@@ -290,14 +212,16 @@ def main():
                     t_bike_use.*
                 FROM t_bike_use
                 WHERE t_bike_use.ride_status = 2
-                    AND t_bike_use.uid NOT IN (52536,58249,72860,37592,63824,49704,54187,70354,70408,49618,72907,70404,44902,45094)
+                    AND t_bike_use.uid IS NOT NULL AND NOT EXISTS (SELECT 1 FROM excluded_test_users etu WHERE etu.uid = t_bike_use.uid)
                 ORDER BY t_bike_use.id DESC
             ) AS dolgovye_poezdki
             ON t_payment_details.user_id = dolgovye_poezdki.uid AND t_payment_details.ride_id = dolgovye_poezdki.id
+            WHERE t_payment_details.created >= '{date_from}'
             GROUP BY DATE_FORMAT(t_payment_details.created, '%Y-%m-%d')
         )
         SELECT 
             NOW() AS 'timestamp',
+            three_left_cols.start_time AS 'state_day',
             -- CAST(DATE_FORMAT(three_left_cols.start_time, '%Y-%m-%d %h:%m:%s') AS datetime) AS 'day_', 
             IFNULL(three_left_cols.poezdok,0)  AS 'poezdok',
             IFNULL(three_left_cols.poezdok / kvt.kvt,0) AS 'poezdok_v_srednem_na_samokat',
@@ -343,54 +267,45 @@ def main():
         LEFT JOIN dolgi ON three_left_cols.start_time = dolgi.create_debit_date
         -- WHERE DATE_FORMAT(NOW(), '%Y-%m-%d') = three_left_cols.start_time
         ORDER BY three_left_cols.start_time DESC
-        LIMIT 1
             """
-        df_vni = pd.read_sql(select_vni_total, engine_mysql)
+        today = get_run_window(engine_mysql)['today']
+
+        # Считаем от последнего сохраненного состояния; если после него еще нет поездок,
+        # берем более раннее состояние, а без состояний - всю историю
+        states = get_vni_total_states(engine_postgresql, before=today)
+        for _, state in list(states.iterrows()) + [(None, None)]:
+            date_from = VNI_START_DATE if state is None else next_day(state['day'])
+            df_vni = extract_sql(with_excluded_test_users(select_vni_total.format(
+                date_from=date_from, three_left_cols=vni_total_base_rows(engine_postgresql, date_from))), engine_mysql)
+            if not df_vni.empty:
+                break
+
+        if state is not None:
+            for column in VNI_TOTAL_CUMULATIVE:
+                df_vni[column] = df_vni[column] + float(state[column])
+
+        # Последний закрытый день становится новым состоянием
+        df_closed = df_vni[df_vni['state_day'] < today]
+        if not df_closed.empty:
+            save_vni_total_state(engine_postgresql, df_closed['state_day'].iloc[0], df_closed.iloc[0])
+        df_vni = df_vni.head(1).drop(columns='state_day')
 
         # Загрузка за сегодня в Postgres
-        df_vni.to_sql("vni_total", engine_postgresql, if_exists="append", index=False)
+        copy_dataframe_to_postgres(df_vni, "vni_total", engine_postgresql)
         print('Got it: VNI_total')
     except Exception as e:
         print(f"Произошла ошибка VNI_total: {e}")
-        pass
+        raise
+
 
+def update_vni_cities(engine_mysql, engine_postgresql):
     try:
+        today = get_run_window(engine_mysql)['today']
         select_vni_cities = '''
         WITH three_left_cols AS 
-        (    
-            SELECT 
-                three_left_cols.start_time,
-                three_left_cols.city_id,
-                three_left_cols.poezdok,
-                three_left_cols.obzchaya_stoimost,
-                SUM(IFNULL(three_left_cols.obzchaya_stoimost, 0)) OVER(PARTITION BY three_left_cols.city_id ORDER BY three_left_cols.start_time) AS 'obzchaya_stoimost_ni',
-                SUM(IFNULL(three_left_cols.oplacheno_bonusami, 0)) OVER(PARTITION BY three_left_cols.city_id ORDER BY three_left_cols.start_time) AS 'oplacheno_bonusami_ni',
-                three_left_cols.oplacheno_bonusami,
-                three_left_cols.obschee_vremya_min,
-                IFNULL(three_left_cols.skidka,0) AS 'skidka',
-                SUM(IFNULL(three_left_cols.skidka, 0)) OVER(PARTITION BY three_left_cols.city_id ORDER BY three_left_cols.start_time) AS 'skidka_ni'
-            FROM 
-                (
-                    SELECT 
-                        DATE_FORMAT(FROM_UNIXTIME(t_bike_use.start_time), '%Y-%m-%d') AS  'start_time',
-                        t_bike.city_id,
-                        COUNT(t_bike_use.ride_amount) AS 'poezdok',
-                        SUM(IFNULL(t_bike_use.ride_amount,0)) AS 'obzchaya_stoimost',
-                        SUM(IFNULL(t_bike_use.discount,0)) AS 'oplacheno_bonusami',
-                        SUM(IFNULL(t_bike_use.duration,0)) / 60 AS 'obschee_vremya_min',
-                        SUM(IFNULL(tpd.bike_discount_amount,0)) AS skidka
-                    FROM shamri.t_bike_use
-                    LEFT JOIN t_bike ON t_bike_use.bid = t_bike.id
-                    LEFT JOIN shamri.t_payment_details tpd ON t_bike_use.id = tpd.ride_id
-                    WHERE 
-                    t_bike_use.ride_status!=5 
-                    AND 
-                    DATE_FORMAT(FROM_UNIXTIME(t_bike_use.start_time), '%Y-%m-%d') >= '2024-07-21'
-                    AND t_bike_use.uid NOT IN (52536,58249,72860,37592,63824,49704,54187,70354,70408,49618,72907,70404,44902,45094)
-                    AND tpd.user_id NOT IN (52536,58249,72860,37592,63824,49704,54187,70354,70408,49618,72907,70404,44902,45094)
-                    GROUP BY DATE_FORMAT(FROM_UNIXTIME(t_bike_use.start_time), '%Y-%m-%d'), t_bike.city_id
-                ) AS three_left_cols
-            ORDER BY three_left_cols.start_time DESC
+        (
+            -- Поездки по городам за сегодня с накопительными итогами из vni_city_daily_base
+            {three_left_cols}
         ),
         sum_uspeh_abon AS (
             SELECT 
@@ -418,8 +333,8 @@ def main():
                     FROM shamri.t_bike_use
                     LEFT JOIN t_bike ON t_bike_use.bid = t_bike.id
                     WHERE t_bike_use.ride_status!=5 
-                        AND DATE_FORMAT(FROM_UNIXTIME(t_bike_use.start_time), '%Y-%m-%d') >= '2024-07-21'
-                        AND t_bike_use.uid NOT IN (52536,58249,72860,37592,63824,49704,54187,70354,70408,49618,72907,70404,44902,45094)
+                        AND t_bike_use.start_time >= UNIX_TIMESTAMP('{date_from}')
+                        AND t_bike_use.uid IS NOT NULL AND NOT EXISTS (SELECT 1 FROM excluded_test_users etu WHERE etu.uid = t_bike_use.uid)
                     GROUP BY DATE_FORMAT(FROM_UNIXTIME(t_bike_use.start_time), '%Y-%m-%d'), t_bike.city_id
                     ORDER BY DATE_FORMAT(FROM_UNIXTIME(t_bike_use.start_time), '%Y-%m-%d') DESC
                     ) 
@@ -433,8 +348,8 @@ def main():
                 FROM shamri.t_trade
                 WHERE t_trade.`type` = 6 
                     AND t_trade.status = 1 
-                    AND DATE_FORMAT(t_trade.`date`, '%Y-%m-%d') >= '2024-07-21'
-                    AND t_trade.uid NOT IN (52536,58249,72860,37592,63824,49704,54187,70354,70408,49618,72907,70404,44902,45094)
+                    AND t_trade.`date` >= '{date_from}'
+                    AND t_trade.uid IS NOT NULL AND NOT EXISTS (SELECT 1 FROM excluded_test_users etu WHERE etu.uid = t_trade.uid)
                 GROUP BY DATE_FORMAT(t_trade.`date`, '%Y-%m-%d')
                 ORDER BY DATE_FORMAT(t_trade.`date`, '%Y-%m-%d') DESC
             ) AS sum_uspeh_abon
@@ -465,8 +380,8 @@ def main():
                 FROM shamri.t_bike_use
                 LEFT JOIN t_bike ON t_bike_use.bid = t_bike.id
                 WHERE t_bike_use.ride_status!=5 
-                    AND DATE_FORMAT(FROM_UNIXTIME(t_bike_use.start_time), '%Y-%m-%d') >= '2024-07-21'
-                    AND t_bike_use.uid NOT IN (52536,58249,72860,37592,63824,49704,54187,70354,70408,49618,72907,70404,44902,45094)
+                    AND t_bike_use.start_time >= UNIX_TIMESTAMP('{date_from}')
+                    AND t_bike_use.uid IS NOT NULL AND NOT EXISTS (SELECT 1 FROM excluded_test_users etu WHERE etu.uid = t_bike_use.uid)
                 GROUP BY DATE_FORMAT(FROM_UNIXTIME(t_bike_use.start_time), '%Y-%m-%d'), t_bike.city_id
                 ORDER BY DATE_FORMAT(FROM_UNIXTIME(t_bike_use.start_time), '%Y-%m-%d') DESC) 
                 AS distr_poezdki_po_gorodam
@@ -478,8 +393,8 @@ def main():
                     SUM(IFNULL(t_subscription.price,0)) AS sum_mnogor_abon
                 FROM t_subscription_mapping
                 LEFT JOIN t_subscription ON t_subscription_mapping.subscription_id = t_subscription.id
-                WHERE DATE_FORMAT(t_subscription_mapping.start_time, '%Y-%m-%d') >= '2024-07-21'
-                    AND t_subscription_mapping.user_id NOT IN (52536,58249,72860,37592,63824,49704,54187,70354,70408,49618,72907,70404,44902,45094) 
+                WHERE t_subscription_mapping.start_time >= '{date_from}'
+                    AND t_subscription_mapping.user_id IS NOT NULL AND NOT EXISTS (SELECT 1 FROM excluded_test_users etu WHERE etu.uid = t_subscription_mapping.user_id) 
                 GROUP BY DATE_FORMAT(t_subscription_mapping.start_time, '%Y-%m-%d')
                 ORDER BY DATE_FORMAT(t_subscription_mapping.start_time, '%Y-%m-%d') DESC
                 ) AS sum_mnogor_abon
@@ -514,8 +429,8 @@ def main():
                 WHERE t_trade.status=1 
                     AND t_trade.way=26 
                     AND t_trade.`type` IN (1,2,6,7)
-                    AND DATE_FORMAT(t_trade.`date`, '%Y-%m-%d') >= '2024-07-21'
-                    AND t_trade.uid NOT IN (52536,58249,72860,37592,63824,49704,54187,70354,70408,49618,72907,70404,44902,45094)
+                    AND t_trade.`date` >= '{date_from}'
+                    AND t_trade.uid IS NOT NULL AND NOT EXISTS (SELECT 1 FROM excluded_test_users etu WHERE etu.uid = t_trade.uid)
                 GROUP BY DATE_FORMAT(t_trade.`date`, '%Y-%m-%d'), t_trade.city_id
                 ORDER BY DATE_FORMAT(t_trade.`date`, '%Y-%m-%d') DESC, t_trade.city_id DESC
                 ) AS vyruchka_uspeh_payTabs
@@ -527,8 +442,8 @@ def main():
                     SUM(IFNULL(t_trade.account_pay_amount,0)) AS 'chastichno_vozvrascheny'
                 FROM t_trade
                 WHERE t_trade.status=3
-                    AND DATE_FORMAT(t_trade.`date`, '%Y-%m-%d') >= '2024-07-21'
-                    AND t_trade.uid NOT IN (52536,58249,72860,37592,63824,49704,54187,70354,70408,49618,72907,70404,44902,45094)
+                    AND t_trade.`date` >= '{date_from}'
+                    AND t_trade.uid IS NOT NULL AND NOT EXISTS (SELECT 1 FROM excluded_test_users etu WHERE etu.uid = t_trade.uid)
                 GROUP BY DATE_FORMAT(t_trade.`date`, '%Y-%m-%d'), t_trade.city_id
                 ) AS chastichno_vozvrascheny ON vyruchka_uspeh_payTabs.start_time = chastichno_vozvrascheny.start_time AND vyruchka_uspeh_payTabs.city_id = chastichno_vozvrascheny.city_id
         ),
@@ -556,8 +471,8 @@ def main():
                     WHERE t_trade.status=1 
                         AND t_trade.way=26 
                         AND t_trade.`type` IN (1,2,6,7) 
-                        AND DATE_FORMAT(t_trade.`date`, '%Y-%m-%d') >= '2024-07-21' 
-                        AND t_trade.uid NOT IN (52536,58249,72860,37592,63824,49704,54187,70354,70408,49618,72907,70404,44902,45094)
+                        AND t_trade.`date` >= '{date_from}' 
+                        AND t_trade.uid IS NOT NULL AND NOT EXISTS (SELECT 1 FROM excluded_test_users etu WHERE etu.uid = t_trade.uid)
                     GROUP BY DATE_FORMAT(t_trade.`date`, '%Y-%m-%d'), t_trade.city_id
                     ORDER BY DATE_FORMAT(t_trade.`date`, '%Y-%m-%d') DESC, t_trade.city_id DESC) AS vyruchka_uspeh_payTabs
                 LEFT JOIN 
@@ -568,8 +483,8 @@ def main():
                         SUM(IFNULL(t_trade.account_pay_amount,0)) AS 'chastichno_vozvrascheny'
                     FROM t_trade
                     WHERE t_trade.status=3
-                        AND DATE_FORMAT(t_trade.`date`, '%Y-%m-%d') >= '2024-07-21'
-                        AND t_trade.uid NOT IN (52536,58249,72860,37592,63824,49704,54187,70354,70408,49618,72907,70404,44902,45094)
+                        AND t_trade.`date` >= '{date_from}'
+                        AND t_trade.uid IS NOT NULL AND NOT EXISTS (SELECT 1 FROM excluded_test_users etu WHERE etu.uid = t_trade.uid)
                     GROUP BY DATE_FORMAT(t_trade.`date`, '%Y-%m-%d'), t_trade.city_id
                     ) AS chastichno_vozvrascheny ON vyruchka_uspeh_payTabs.start_time = chastichno_vozvrascheny.start_time AND vyruchka_uspeh_payTabs.city_id = chastichno_vozvrascheny.city_id
                     )
@@ -589,8 +504,8 @@ def main():
                 FROM t_trade
                 WHERE t_trade.status=4 
                      AND t_trade.way=26 
-                     AND DATE_FORMAT(t_trade.`date`, '%Y-%m-%d') >= '2024-07-21'
-                     AND t_trade.uid NOT IN (52536,58249,72860,37592,63824,49704,54187,70354,70408,49618,72907,70404,44902,45094)
+                     AND t_trade.`date` >= '{date_from}'
+                     AND t_trade.uid IS NOT NULL AND NOT EXISTS (SELECT 1 FROM excluded_test_users etu WHERE etu.uid = t_trade.uid)
                 GROUP BY DATE_FORMAT(t_trade.`date`, '%Y-%m-%d'), t_trade.city_id
                 ORDER BY DATE_FORMAT(t_trade.`date`, '%Y-%m-%d') DESC) AS trade
          ),
@@ -613,8 +528,8 @@ def main():
                     FROM t_trade
                     WHERE t_trade.status=4 
                          AND t_trade.way=26 
-                         AND DATE_FORMAT(t_trade.`date`, '%Y-%m-%d') >= '2024-07-21'
-                         AND t_trade.uid NOT IN (52536,58249,72860,37592,63824,49704,54187,70354,70408,49618,72907,70404,44902,45094)
+                         AND t_trade.`date` >= '{date_from}'
+                         AND t_trade.uid IS NOT NULL AND NOT EXISTS (SELECT 1 FROM excluded_test_users etu WHERE etu.uid = t_trade.uid)
                     GROUP BY DATE_FORMAT(t_trade.`date`, '%Y-%m-%d'), t_trade.city_id
                     ORDER BY DATE_FORMAT(t_trade.`date`, '%Y-%m-%d') DESC) AS trade) AS vozvraty_payTabs
          ),
@@ -632,8 +547,8 @@ def main():
                 FROM t_trade
                 WHERE t_trade.status=1 
                      AND t_trade.way=6 
-                     AND DATE_FORMAT(t_trade.`date`, '%Y-%m-%d') > '2024-07-21'
-                     AND t_trade.uid NOT IN (52536,58249,72860,37592,63824,49704,54187,70354,70408,49618,72907,70404,44902,45094)
+                     AND t_trade.`date` >= '{date_after}'
+                     AND t_trade.uid IS NOT NULL AND NOT EXISTS (SELECT 1 FROM excluded_test_users etu WHERE etu.uid = t_trade.uid)
                 GROUP BY DATE_FORMAT(t_trade.`date`, '%Y-%m-%d'), t_trade.city_id
                 ORDER BY DATE_FORMAT(t_trade.`date`, '%Y-%m-%d') DESC) AS trade
          ),
@@ -657,8 +572,8 @@ def main():
                     FROM t_trade
                     WHERE t_trade.status=1 
                          AND t_trade.way=6 
-                         AND DATE_FORMAT(t_trade.`date`, '%Y-%m-%d') >= '2024-07-21'
-                         AND t_trade.uid NOT IN (52536,58249,72860,37592,63824,49704,54187,70354,70408,49618,72907,70404,44902,45094)
+                         AND t_trade.`date` >= '{date_from}'
+                         AND t_trade.uid IS NOT NULL AND NOT EXISTS (SELECT 1 FROM excluded_test_users etu WHERE etu.uid = t_trade.uid)
                     GROUP BY DATE_FORMAT(t_trade.`date`, '%Y-%m-%d'), t_trade.city_id
                     ORDER BY DATE_FORMAT(t_trade.`date`, '%Y-%m-%d') DESC) AS trade) 
                 AS uspeh_Stripe
@@ -678,8 +593,8 @@ def main():
                  FROM t_trade
                  WHERE t_trade.status=4 
                      AND t_trade.way=6 
-                     AND DATE_FORMAT(t_trade.`date`, '%Y-%m-%d') >= '2024-07-21'
-                     AND t_trade.uid NOT IN (52536,58249,72860,37592,63824,49704,54187,70354,70408,49618,72907,70404,44902,45094)
+                     AND t_trade.`date` >= '{date_from}'
+                     AND t_trade.uid IS NOT NULL AND NOT EXISTS (SELECT 1 FROM excluded_test_users etu WHERE etu.uid = t_trade.uid)
                  GROUP BY DATE_FORMAT(t_trade.`date`, '%Y-%m-%d'), t_trade.city_id
                  ORDER BY DATE_FORMAT(t_trade.`date`, '%Y-%m-%d') DESC) AS trade
          ),
@@ -702,8 +617,8 @@ def main():
                      FROM t_trade
                      WHERE t_trade.status=4 
                          AND t_trade.way=6 
-                         AND DATE_FORMAT(t_trade.`date`, '%Y-%m-%d') >= '2024-07-21'
-                         AND t_trade.uid NOT IN (52536,58249,72860,37592,63824,49704,54187,70354,70408,49618,72907,70404,44902,45094)
+                         AND t_trade.`date` >= '{date_from}'
+                         AND t_trade.uid IS NOT NULL AND NOT EXISTS (SELECT 1 FROM excluded_test_users etu WHERE etu.uid = t_trade.uid)
                      GROUP BY DATE_FORMAT(t_trade.`date`, '%Y-%m-%d'), t_trade.city_id
                      ORDER BY DATE_FORMAT(t_trade.`date`, '%Y-%m-%d') DESC) AS trade)
                 AS vozvraty_Stripe
@@ -721,7 +636,7 @@ def main():
                     t_user.registration_city_id AS city_id ,
                     COUNT(t_user.id) AS 'user_v_den_register'
                 FROM t_user
-                WHERE DATE_FORMAT(t_user.register_date, '%Y-%m-%d') >= '2025-11-01'
+                WHERE t_user.register_date >= '2025-11-01'
                 GROUP BY DATE_FORMAT(t_user.register_date, '%Y-%m-%d'), t_user.registration_city_id
                 UNION ALL
                 SELECT 
@@ -762,11 +677,11 @@ def main():
                     t_user.id,
                     t_user.city_id
                 FROM t_user
+                WHERE t_user.register_date >= '{date_from}'
                                 ) AS register_users
             ON t_bike_use.uid=register_users.id
             WHERE DATE(DATE_FORMAT(FROM_UNIXTIME(t_bike_use.start_time), '%Y-%m-%d')) = DATE(DATE_FORMAT(register_users.register_date, '%Y-%m-%d'))
-                AND DATE(DATE_FORMAT(register_users.register_date, '%Y-%m-%d')) >= '2024-07-21'
-                AND DATE(DATE_FORMAT(FROM_UNIXTIME(t_bike_use.start_time), '%Y-%m-%d')) >= '2024-07-21'
+                AND t_bike_use.start_time >= UNIX_TIMESTAMP('{date_from}')
                 AND t_bike_use.ride_status != 5
             GROUP BY DATE(DATE_FORMAT(FROM_UNIXTIME(t_bike_use.start_time), '%Y-%m-%d')), register_users.city_id   
         ),
@@ -791,11 +706,11 @@ def main():
                         FROM t_bike_use
                         LEFT JOIN t_bike ON t_bike_use.bid = t_bike.id
                         WHERE t_bike_use.ride_status = 2 
-                            AND DATE(DATE_FORMAT(FROM_UNIXTIME(t_bike_use.start_time), '%Y-%m-%d')) >= '2024-07-21'
+                            AND t_bike_use.start_time >= UNIX_TIMESTAMP('{date_from}')
                             ) AS dolgovye_poezdki
                 ON t_payment_details.user_id = dolgovye_poezdki.uid AND t_payment_details.ride_id = dolgovye_poezdki.id
-                WHERE DATE_FORMAT(t_payment_details.created, '%Y-%m-%d') >= '2024-07-21'
-                    AND t_payment_details.user_id NOT IN (52536,58249,72860,37592,63824,49704,54187,70354,70408,49618,72907,70404,44902,45094)
+                WHERE t_payment_details.created >= '{date_from}'
+                    AND t_payment_details.user_id IS NOT NULL AND NOT EXISTS (SELECT 1 FROM excluded_test_users etu WHERE etu.uid = t_payment_details.user_id)
                 GROUP BY DATE_FORMAT(t_payment_details.created, '%Y-%m-%d'), dolgovye_poezdki.city_id
                 ORDER BY DATE_FORMAT(t_payment_details.created, '%Y-%m-%d') DESC
                 ) AS dolgi
@@ -813,7 +728,7 @@ def main():
                  (select 0 t2 union select 1 union select 2 union select 3 union select 4 union select 5 union select 6 union select 7 union select 8 union select 9) t2,
                  (select 0 t3 union select 1 union select 2 union select 3 union select 4 union select 5 union select 6 union select 7 union select 8 union select 9) t3,
                  (select 0 t4 union select 1 union select 2 union select 3 union select 4 union select 5 union select 6 union select 7 union select 8 union select 9) t4) v
-                where gen_date between '2024-07-21' and DATE_FORMAT(NOW(), '%Y-%m-%d')
+                where gen_date between '{date_from}' and '{today}'
             ) AS calendar
             CROSS JOIN (
                 SELECT 
@@ -832,7 +747,7 @@ def main():
                     '00:00' AS 'start_time', 
                     '00:24' AS 'end_time', 
                     NULL AS 'invite_code', 
-                    '{"max_speed_limit":0}' AS 'extend_info', 
+                    '{{"max_speed_limit":0}}' AS 'extend_info', 
                     1 AS 'industry_id'
             ) AS t_city_with_noname
         )
@@ -911,10 +826,11 @@ def main():
             --	t_city_with_noname.start_day = DATE_FORMAT(NOW(), '%Y-%m-%d')
             -- ORDER BY t_city_with_noname.start_day DESC
             ) AS res
-        WHERE res.start_day = DATE_FORMAT(NOW(), '%Y-%m-%d')
-        '''
+        WHERE res.start_day = '{today}'
+        '''.format(date_from=VNI_START_DATE, date_after=next_day(VNI_START_DATE), today=today,
+                   three_left_cols=vni_cities_base_rows(engine_postgresql, today))
 
-        df_cities = pd.read_sql(select_vni_cities, engine_mysql)
+        df_cities = extract_sql(with_excluded_test_users(select_vni_cities), engine_mysql)
 
         # Средняя погода за сегодня
         select_avg_cities_weather = '''
@@ -934,23 +850,20 @@ def main():
             WHERE tcw.add_time >= (NOW() AT TIME ZONE 'Europe/Athens')::date 
             GROUP BY tcw.city_id
         '''
-        df_avg_cities_weather = pd.read_sql(select_avg_cities_weather, engine_postgresql)
+        df_avg_cities_weather = extract_sql(select_avg_cities_weather, engine_postgresql)
 
         # Соединяю ВНИ и погоду
         df_cities = df_cities.merge(df_avg_cities_weather, how='left', on='id').fillna(0)
 
-        df_cities.to_sql("vni_cities", engine_postgresql, if_exists="append", index=False)
+        copy_dataframe_to_postgres(df_cities, "vni_cities", engine_postgresql)
         print('Got it: VNI_cities')
 
     except Exception as e:
         print(f"Произошла ошибка в VNI_cities: {e}")
-        pass
+        raise
 
-    google_service_account_json = get_google_creds()
-    with open('google_json.json', 'w') as fp:
-        json.dump(json.loads(google_service_account_json, strict=False), fp)
-    generated_json_file = './google_json.json'
 
+def update_akb(engine_mysql, engine_postgresql):
     try:
         # # АКБ - начало
         select_df1_all = '''
@@ -1049,7 +962,7 @@ def main():
                 FROM
                     t_bike
                 WHERE
-                    TIMESTAMPDIFF(SECOND, FROM_UNIXTIME(t_bike.heart_time), NOW()) < 900
+                    t_bike.heart_time > UNIX_TIMESTAMP() - 900
                     AND t_bike.error_status IN (0, 7)
                     AND t_bike.bike_type = 2
                 GROUP BY
@@ -1065,7 +978,7 @@ def main():
                 FROM
                     t_bike
                 WHERE
-                    TIMESTAMPDIFF(SECOND, FROM_UNIXTIME(t_bike.heart_time), NOW()) >= 900
+                    t_bike.heart_time <= UNIX_TIMESTAMP() - 900
                     AND t_bike.error_status IN (0, 7)
                     AND t_bike.bike_type = 2
                 GROUP BY
@@ -1149,7 +1062,7 @@ def main():
             ORDER BY t_city_sklady.id DESC
             '''
 
-        df1_all = pd.read_sql(select_df1_all, engine_mysql)
+        df1_all = extract_sql(select_df1_all, engine_mysql)
 
         list_cities = [13, 15, 18, 16, 17, 19, 20, 21, 22, 25, 28, 29, 14, 32, 31, 33, 30, 35, 34]
         list_stocks = [11, 12]
@@ -1195,23 +1108,17 @@ def main():
                 AND vni_cities_for_graph."date" > DATE(TO_CHAR(current_date - interval '8' DAY, 'YYYY-mm-dd'))
             GROUP BY vni_cities_for_graph.id, vni_cities_for_graph."name"
         '''
-        df2 = pd.read_sql(select_df2, engine_postgresql).fillna(0)
+        df2 = extract_sql(select_df2, engine_postgresql).fillna(0)
 
-        SERVICE_ACCOUNT_FILE = './google_json.json'
-        SPREADSHEET_ID = '1BMH_HSxmK33SZvv3cIAH_SIgvm2NncSTTKI1aa7CoG8'
+        SPREADSHEET_ID = PLAN_SPREADSHEET_ID
         RANGE_NAME = 'Плановое!A:E'
-        service_account_file = generated_json_file
-        sheets_service = get_sheets_service(SERVICE_ACCOUNT_FILE)
-        df3 = read_sheet_data_to_pandas(sheets_service, SPREADSHEET_ID, RANGE_NAME)
+        sheets_service = get_sheets_service(get_google_creds())
+        df3 = get_sheet(sheets_service, SPREADSHEET_ID, RANGE_NAME)
 
         df_broken_repair = df3[(df3['city_id'] == '') & (df3['city_name'] != 'Итого')]
 
         df3 = df3[df3['city_id'] != '']
-        df3 = df3.replace('', '0')
-        df3['city_id'] = df3['city_id'].astype(int)
-        df3['planovoye'] = df3['planovoye'].fillna('0').replace('', '0').astype(int)
-        df3['Batteries V4.6/V4.7'] = df3['Batteries V4.6/V4.7'].fillna('0').replace('', '0').astype(int)
-        df3['Batteries numbers V3 PRO'] = df3['Batteries numbers V3 PRO'].fillna('0').replace('', '0').astype(int)
+        df3 = coerce_sheet(df3, RANGE_NAME)
 
         # Соединяю данные для окончательного расчета
         df = df1.merge(df2[['city_id', 'poezdok_7day', 'kvt_7day', 'akb_na_park', 'akb_na_park_percent']], on='city_id',
@@ -1263,7 +1170,7 @@ def main():
                     WHERE t_bike.user_group_id IS NOT NULL 
                         GROUP BY t_bike.model) AS total
             '''
-        df_spisannye = pd.read_sql(select_spisannye, engine_mysql)
+        df_spisannye = extract_sql(select_spisannye, engine_mysql)
 
         df = df.merge(df_spisannye[['name', 'spisannye']], how='left', on='name')
         df.fillna(0, inplace=True)
@@ -1451,14 +1358,16 @@ def main():
                                                                      df.loc[df[
                                                                                 'name'] == 'Volos', 'svobodnyh_akb'].iloc[
                                                                          0]
-        df.to_sql("akb_cities_and_stocks", engine_postgresql, if_exists="append", index=False)
+        copy_dataframe_to_postgres(df, "akb_cities_and_stocks", engine_postgresql)
         print('akb_cities_and_stocks UPDATED!')
 
         # # АКБ - конец
     except Exception as e:
         print(f"Произошла ошибка в АКБ: {e}")
-        pass
+        raise
 
+
+def update_akb_result(engine_mysql, engine_postgresql):
     try:
         # АКБ с красными столбцами Начало
         select_akb_cities_and_stocks_result = '''
@@ -1555,83 +1464,45 @@ def main():
                 ORDER BY raw."timestamp" DESC) AS res
             WHERE res.day_ = DATE(NOW())
         '''
-        df_akb_cities_and_stocks_result = pd.read_sql(select_akb_cities_and_stocks_result, engine_postgresql)
-        df_akb_cities_and_stocks_result.to_sql("akb_cities_and_stocks_result", engine_postgresql, if_exists="append",
-                                               index=False)
+        df_akb_cities_and_stocks_result = extract_sql(select_akb_cities_and_stocks_result, engine_postgresql)
+        copy_dataframe_to_postgres(df_akb_cities_and_stocks_result, "akb_cities_and_stocks_result", engine_postgresql)
         print('АКБ с красными столбцами UPDATED!')
 
         # АКБ с красными столбцами Конец
     except Exception as e:
         print(f"Произошла ошибка в АКБ с красными столбцами: {e}")
-        pass
+        raise
+
 
+def update_t_bike_history(engine_mysql, engine_postgresql):
     # Выгрузка t_bike_history Начало
-    select_df_t_bike = '''
-       SELECT
-            NOW() as 'timestamp',
-            IFNULL(t_bike.id,0) AS id,
-            IFNULL(t_bike.number,0) AS number,
-            IFNULL(t_bike.imei,0) AS imei,
-            IFNULL(t_bike.type_id,0) AS type_id,
-            IFNULL(t_bike.g_time,0) AS g_time,
-            IFNULL(t_bike.g_lat,0) AS g_lat,
-            IFNULL(t_bike.g_lng,0) AS g_lng,
-            IFNULL(t_bike.status,0) AS status,
-            IFNULL(t_bike.use_status,0) AS use_status,
-            IFNULL(t_bike.power,0) AS power,
-            IFNULL(t_bike.gsm,0) AS gsm,
-            IFNULL(t_bike.gps_number,'empty') AS gps_number,
-            IFNULL(t_bike.city_id,0) AS city_id,
-            IFNULL(t_bike.heart_time,0) AS heart_time,
-            IFNULL(t_bike.version,0) AS version,
-            IFNULL(t_bike.version_time,0) AS version_time,
-            IFNULL(t_bike.readpack,0) AS readpack,
-            IFNULL(t_bike.add_date, STR_TO_DATE("2024-01-01 00:00:00", "%Y-%m-%d %H:%i:%s")) AS add_date,
-            IFNULL(t_bike.error_status,0) AS error_status,
-            IFNULL(t_bike.server_ip,'0.0.0.0') AS server_ip,
-            IFNULL(t_bike.bike_status,0) AS bike_status,
-            IFNULL(t_bike.sponsors_id,0) AS sponsors_id,
-            IFNULL(t_bike.bike_no,0) AS bike_no,
-            IFNULL(t_bike.bike_type,0) AS bike_type,
-            IFNULL(t_bike.extend_info,0) AS extend_info,
-            IFNULL(t_bike.area_id,0) AS area_id,
-            IFNULL(t_bike.bike_power,0) AS bike_power,
-            IFNULL(t_bike.bike_power_status,0) AS bike_power_status,
-            IFNULL(t_bike.mac,0) AS mac,
-            IFNULL(t_bike.iccid,'empty') AS iccid,
-            IFNULL(t_bike.maintain_status,0) AS maintain_status,
-            IFNULL(t_bike.extra_lock_status,0) AS extra_lock_status,
-            IFNULL(t_bike.available,0) AS available,
-            IFNULL(t_bike.model,'empty') AS model,
-            IFNULL(t_bike.protocol,0) AS protocol,
-            IFNULL(t_bike.frame_number,'empty') AS frame_number,
-            IFNULL(t_bike.battery_key,0) AS battery_key,
-            IFNULL(t_bike.release_time, STR_TO_DATE("2024-01-01 00:00:00", "%Y-%m-%d %H:%i:%s")) AS release_time,
-            IFNULL(t_bike.last_service_time, STR_TO_DATE("2024-01-01 00:00:00", "%Y-%m-%d %H:%i:%s")) AS last_service_time,
-            IFNULL(t_bike.industry_id,0) AS industry_id,
-            IFNULL(t_bike.ble_key,'empty') AS ble_key,
-            IFNULL(t_bike.user_group_id,0) AS user_group_id 
-       FROM shamri.t_bike
-    '''
-    df_t_bike = pd.read_sql(select_df_t_bike, engine_mysql)
-    df_t_bike.to_sql("t_bike_history", engine_postgresql, if_exists="append", index=False)
-    print('t_bike_history UPDATED!')
+    df_t_bike = get_fleet_snapshot(engine_mysql)['frame']
+
+    # В t_bike_history_delta пишутся только изменившиеся самокаты; полный снимок - по t_bike_history_full_snapshots=1
+    if os.environ.get('t_bike_history_full_snapshots') == '1':
+        copy_dataframe_to_postgres(df_t_bike, "t_bike_history", engine_postgresql)
+        print('t_bike_history UPDATED!')
+    if not df_t_bike.empty:
+        ensure_history_partitions(engine_postgresql, df_t_bike)
+    # Изменения, пульс запуска и полный снимок дня (опорный кадр) - в одной транзакции
+    delta = save_fleet_history(engine_postgresql, df_t_bike)
+    print('t_bike_history_delta и t_bike_history_last_of_day UPDATED! Самокатов: {bikes}, изменилось: {changed}, '
+          'пропало: {removed}, перенесено запусков из t_bike_history: {backfilled}'.format(**delta))
+
+    # Функция восстановления снимка t_bike_history_at
+    create_history_snapshot_function(engine_postgresql)
 
-    delete_t_bike_history_last_of_day = '''
-        DELETE FROM t_bike_history_last_of_day 
-        WHERE t_bike_history_last_of_day."timestamp"::date = (NOW() AT TIME ZONE 'Europe/Athens')::date
-    '''
-    with engine_postgresql.connect() as connection:
-        with connection.begin() as transaction:
-            connection.execute(sa.text(delete_t_bike_history_last_of_day))
-            transaction.commit()
-            print(f"Таблица t_bike_history_last_of_day успешно очищена!")
+    # Выгрузка t_bike_history Конец
 
-    df_t_bike.to_sql("t_bike_history_last_of_day", engine_postgresql, if_exists="append", index=False)
-    print('t_bike_history_last_of_day UPDATED!')
 
-    # Выгрузка t_bike_history Конец
+def update_t_bike_history_retention(engine_mysql, engine_postgresql):
+    # Старые дневные секции t_bike_history_delta сворачиваются в t_bike_history_hourly и удаляются
+    today = get_run_window(engine_mysql)['today']
+    dropped = roll_up_history_partitions(engine_postgresql, today)
+    print(f"Свернуто секций t_bike_history_delta: {len(dropped)}")
+
 
+def update_vni_cities_for_graph(engine_mysql, engine_postgresql):
     # Выгрузка по городам для графиков
     select_vni_cities_for_graph = '''
     SELECT *
@@ -1669,81 +1540,17 @@ def main():
     WHERE ranked."rank" = 1 
     '''
 
-    df_vni_cities_for_graph = pd.read_sql(select_vni_cities_for_graph, engine_postgresql)
+    df_vni_cities_for_graph = extract_sql(select_vni_cities_for_graph, engine_postgresql)
 
-    # Очистка таблиц
-    truncate_vni_cities_for_graph = "TRUNCATE TABLE vni_cities_for_graph RESTART IDENTITY;"
-    truncate_t_bike = "TRUNCATE TABLE t_bike RESTART IDENTITY;"
-    truncate_t_city = "TRUNCATE TABLE t_city RESTART IDENTITY;"
-    truncate_t_subscription = "TRUNCATE TABLE t_subscription RESTART IDENTITY;"
-
-    with engine_postgresql.connect() as connection:
-        with connection.begin() as transaction:
-            print(f"Попытка очистить таблицы")
-            connection.execute(sa.text(truncate_vni_cities_for_graph))
-            # Очистка t_bike
-            connection.execute(sa.text(truncate_t_bike))
-            # Очистка t_city
-            connection.execute(sa.text(truncate_t_city))
-            # Очистка t_subscription
-            connection.execute(sa.text(truncate_t_subscription))
-            # Если ошибок нет, транзакция фиксируется автоматически
-            print(f"Таблица vni_cities_for_graph успешно очищена.")
-            print(f"Таблица t_bike успешно очищена.")
-            print(f"Таблица t_city успешно очищена.")
-            print(f"Таблица t_subscription успешно очищена.")
-
-    # Загрузка таблицы для графиков
-    df_vni_cities_for_graph.to_sql("vni_cities_for_graph", engine_postgresql, if_exists="append", index=False)
+    # Замена содержимого таблицы
+    replace_table_contents(df_vni_cities_for_graph, "vni_cities_for_graph", engine_postgresql)
     print('Table for graphs vni_cities_for_graph updated!')
 
+
+def update_t_bike_t_city_t_subscription(engine_mysql, engine_postgresql):
     # Копирую t_bike, t_city, t_subscription
-    select_t_bike = '''	SELECT
-        NOW() as 'timestamp',
-        IFNULL(t_bike.id,0) AS id,
-        IFNULL(t_bike.number,0) AS number,
-        IFNULL(t_bike.imei,0) AS imei,
-        IFNULL(t_bike.type_id,0) AS type_id,
-        IFNULL(t_bike.g_time,0) AS g_time,
-        IFNULL(t_bike.g_lat,0) AS g_lat,
-        IFNULL(t_bike.g_lng,0) AS g_lng,
-        IFNULL(t_bike.status,0) AS status,
-        IFNULL(t_bike.use_status,0) AS use_status,
-        IFNULL(t_bike.power,0) AS power,
-        IFNULL(t_bike.gsm,0) AS gsm,
-        IFNULL(t_bike.gps_number,'empty') AS gps_number,
-        IFNULL(t_bike.city_id,0) AS city_id,
-        IFNULL(t_bike.heart_time,0) AS heart_time,
-        IFNULL(t_bike.version,0) AS version,
-        IFNULL(t_bike.version_time,0) AS version_time,
-        IFNULL(t_bike.readpack,0) AS readpack,
-        IFNULL(t_bike.add_date, STR_TO_DATE("2024-01-01 00:00:00", "%Y-%m-%d %H:%i:%s")) AS add_date,
-        IFNULL(t_bike.error_status,0) AS error_status,
-        IFNULL(t_bike.server_ip,'0.0.0.0') AS server_ip,
-        IFNULL(t_bike.bike_status,0) AS bike_status,
-        IFNULL(t_bike.sponsors_id,0) AS sponsors_id,
-        IFNULL(t_bike.bike_no,0) AS bike_no,
-        IFNULL(t_bike.bike_type,0) AS bike_type,
-        IFNULL(t_bike.extend_info,0) AS extend_info,
-        IFNULL(t_bike.area_id,0) AS area_id,
-        IFNULL(t_bike.bike_power,0) AS bike_power,
-        IFNULL(t_bike.bike_power_status,0) AS bike_power_status,
-        IFNULL(t_bike.mac,0) AS mac,
-        IFNULL(t_bike.iccid,'empty') AS iccid,
-        IFNULL(t_bike.maintain_status,0) AS maintain_status,
-        IFNULL(t_bike.extra_lock_status,0) AS extra_lock_status,
-        IFNULL(t_bike.available,0) AS available,
-        IFNULL(t_bike.model,'empty') AS model,
-        IFNULL(t_bike.protocol,0) AS protocol,
-        IFNULL(t_bike.frame_number,'empty') AS frame_number,
-        IFNULL(t_bike.battery_key,0) AS battery_key,
-        IFNULL(t_bike.release_time, STR_TO_DATE("2024-01-01 00:00:00", "%Y-%m-%d %H:%i:%s")) AS release_time,
-        IFNULL(t_bike.last_service_time, STR_TO_DATE("2024-01-01 00:00:00", "%Y-%m-%d %H:%i:%s")) AS last_service_time,
-        IFNULL(t_bike.industry_id,0) AS industry_id,
-        IFNULL(t_bike.ble_key,'empty') AS ble_key,
-        IFNULL(t_bike.user_group_id,0) AS user_group_id FROM shamri.t_bike
-	'''
-    df_t_bike = pd.read_sql(select_t_bike, engine_mysql)
+    # Тот же снимок t_bike, что и в t_bike_history
+    df_t_bike = get_fleet_snapshot(engine_mysql)['frame']
 
     select_t_city = '''	SELECT
     	NOW() as 'timestamp',
@@ -1761,7 +1568,7 @@ def main():
     	IFNULL(t_city.extend_info,'Empty') AS extend_info,
     	IFNULL(t_city.industry_id,0) AS industry_id FROM shamri.t_city
     '''
-    df_t_city = pd.read_sql(select_t_city, engine_mysql)
+    df_t_city = extract_sql(select_t_city, engine_mysql)
 
     select_t_subscription = '''
         SELECT 
@@ -1784,920 +1591,656 @@ def main():
             IFNULL(ts.end_time, STR_TO_DATE("2024-01-01 00:00:00", "%Y-%m-%d %H:%i:%s")) AS end_time 
         FROM shamri.t_subscription ts 
     '''
-    df_t_subscription = pd.read_sql(select_t_subscription, engine_mysql)
-
-    # Загрузка t_bike
-    df_t_bike.to_sql("t_bike", engine_postgresql, if_exists="append", index=False)
-    print('Table for graphs t_bike!')
-
-    # Загрузка t_city
-    df_t_city.to_sql("t_city", engine_postgresql, if_exists="append", index=False)
-    print('Table for graphs t_city!')
-
-    # Загрузка t_subscription
-    df_t_subscription.to_sql("t_subscription", engine_postgresql, if_exists="append", index=False)
+    df_t_subscription = extract_sql(select_t_subscription, engine_mysql)
+
+    # Замена содержимого t_bike, t_city и t_subscription в одной транзакции
+    with engine_postgresql.begin() as connection:
+        replace_table(connection, df_t_bike, "t_bike")
+        print('Table for graphs t_bike!')
+        replace_table(connection, df_t_city, "t_city")
+        print('Table for graphs t_city!')
+        replace_table(connection, df_t_subscription, "t_subscription")
     print('Таблица t_subscription успешно обновлена!')
 
+
+def update_checkup_goals(engine_mysql, engine_postgresql):
     # Цели по чекапам. Начало
 
-    SERVICE_ACCOUNT_FILE = './google_json.json'
-    SPREADSHEET_ID = '1dSOV9X2FV3mnOmnwWvTMJuCCZ-tVBf64DP90k3EYD90'
+    SPREADSHEET_ID = WORKERS_SPREADSHEET_ID
     RANGE_NAME = 'Цели по чекапам!A:E'
-    service_account_file = generated_json_file
+    sheets_service = get_sheets_service(get_google_creds())
     try:
-        df = read_sheet_data_to_pandas(sheets_service, SPREADSHEET_ID, RANGE_NAME)
-        df = df[df['Worker Id'].notna()]
-        df.fillna(0, inplace=True)
-        df['Worker Id'] = df['Worker Id'].astype(int)
-        df['Цель на смену'] = df['Цель на смену'].astype(int)
+        df = get_sheet(sheets_service, SPREADSHEET_ID, RANGE_NAME)
+        if not sheet_changed(engine_postgresql, SPREADSHEET_ID, RANGE_NAME, "checkup_goals_from_google"):
+            print('Цели по чекапам не изменились, checkup_goals_from_google не перезагружается')
+            return
+        df = df[df['Worker Id'].notna() & df['Worker Id'].ne('')]
+        df = coerce_sheet(df, RANGE_NAME)
         df['add_time'] = pd.Timestamp.now() + pd.Timedelta(hours=3)
 
-        # Очистка таблицы
-        truncate_t_bike = "TRUNCATE TABLE checkup_goals_from_google RESTART IDENTITY;"
-        with engine_postgresql.connect() as connection:
-            with connection.begin() as transaction:
-                print(f"Попытка очистить таблицу")
-                # Очистка grafik_rabot_google
-                connection.execute(sa.text(truncate_t_bike))
-                # Если ошибок нет, транзакция фиксируется автоматически
-                print(f"Таблица checkup_goals_from_google успешно очищена!")
-
-        df.to_sql("checkup_goals_from_google", engine_postgresql, if_exists="append", index=False)
+        # Замена содержимого таблицы
+        with engine_postgresql.begin() as connection:
+            replace_table(connection, df, "checkup_goals_from_google")
+            remember_sheet(connection, SPREADSHEET_ID, RANGE_NAME)
         print('Таблица checkup_goals_from_google успешно обновлена!')
     except Exception as e:
         print(f"Произошла ошибка в Цели по чекапам: {e}")
-        pass
+        raise
 
     # Цели по чекапам. Конец
 
-    # # Расчет зп. Начало 30.09.2025
-    # SERVICE_ACCOUNT_FILE = './google_json.json'
-    # SPREADSHEET_ID = '1dSOV9X2FV3mnOmnwWvTMJuCCZ-tVBf64DP90k3EYD90'
-    # RANGE_NAME = 'График работ!A:L'
-    # service_account_file = generated_json_file
-    #
-    # sheets_service = get_sheets_service(SERVICE_ACCOUNT_FILE)
-    #
-    # # Выгрузка для Каждый работник
-    # select_for_workers = '''
-    #     SELECT
-    #         date_trunc('month', grg."Date")::date AS "Месяц",
-    #         grg.* ,
-    #         EXTRACT(EPOCH FROM (grg."Actual finish time" - grg."Actual start time"))::int AS "Actual working seconds"
-    #     FROM
-    #     (
-    #         SELECT
-    #             grg."Date"::date ,
-    #             grg."Worker id"::int ,
-    #             grg."Worker username" ,
-    #             grg."Worker nickname" ,
-    #             to_timestamp(concat(grg."Date", ' ', grg."Actual start time"), 'YYYY-MM-DD HH24:MI:SS') AS "Actual start time" ,
-    #             CASE
-    #                 WHEN grg."Actual start time" < grg."Actual finish time" THEN to_timestamp(concat(grg."Date", ' ', grg."Actual finish time"), 'YYYY-MM-DD HH24:MI:SS')
-    #                 ELSE to_timestamp(concat(grg."Date", ' ', grg."Actual finish time"), 'YYYY-MM-DD HH24:MI:SS') + interval '1 day'
-    #             END  AS "Actual finish time" ,
-    #             grg."Finish odometer kilometers"::float - grg."Start odometer kilometers"::float AS distance
-    #         FROM damir.grafik_rabot_google grg
-    #         WHERE grg."Actual start time" != '00:00:70'
-    #             AND grg."Actual finish time" != '00:00:70'
-    #             AND grg."Date" >= '2025-08-01'
-    #         ) AS grg
-    # '''
-    # df_for_workers = pd.read_sql(select_for_workers, engine_postgresql)
-    # df_for_workers['Месяц'] = pd.to_datetime(df_for_workers['Месяц'], errors='coerce')
-    #
-    # # Скачиваю Таблица(ставки)
-    # RANGE_NAME_2 = 'Таблица(ставки)!A:BF'
-    # sheets_service = get_sheets_service(SERVICE_ACCOUNT_FILE)
-    # df_tabl_stavki = read_sheet_data_to_pandas(sheets_service, SPREADSHEET_ID, RANGE_NAME_2)
-    #
-    # new_columns = df_tabl_stavki.iloc[0]
-    # df_tabl_stavki.columns = new_columns
-    # df_tabl_stavki.drop(index=df_tabl_stavki.index[0], axis=0, inplace=True)
-    # df_tabl_stavki = df_tabl_stavki[df_tabl_stavki['Месяц'].notna()]
-    # df_tabl_stavki['Месяц'] = pd.to_datetime(df_tabl_stavki['Месяц'], errors='coerce')
-    # df_tabl_stavki['Дата нового условия ставки (час)'] = pd.to_datetime(
-    #     df_tabl_stavki['Дата нового условия ставки (час)'], errors='coerce').replace('1970-01-01', 'NaT')
-    # df_tabl_stavki['Дата нового условия ставки (нед)'] = pd.to_datetime(
-    #     df_tabl_stavki['Дата нового условия ставки (нед)'], errors='coerce').replace('1970-01-01', 'NaT')
-    # df_tabl_stavki['Дата нового условия ставки (мес)'] = pd.to_datetime(
-    #     df_tabl_stavki['Дата нового условия ставки (мес)'], errors='coerce').replace('1970-01-01', 'NaT')
-    # df_tabl_stavki['Нач_дата_расч_бонуса_нов_сотр'] = pd.to_datetime(
-    #     df_tabl_stavki['Нач_дата_расч_бонуса_нов_сотр'], errors='coerce').replace('1970-01-01', 'NaT')
-    # df_tabl_stavki['Оконч_дата_расч_бонус_нов_сотр'] = pd.to_datetime(
-    #     df_tabl_stavki['Оконч_дата_расч_бонус_нов_сотр'], errors='coerce')
-    # df_tabl_stavki = df_tabl_stavki.replace('', '0')
-    # df_tabl_stavki['Worker id'] = df_tabl_stavki['Worker id'].astype(int)
-    # df_tabl_stavki['Количество отработанных часов'] = df_tabl_stavki['Количество отработанных часов'].fillna(0).astype(float)
-    # df_tabl_stavki['Ставка за час'] = df_tabl_stavki['Ставка за час'].fillna(0).astype(float)
-    # df_tabl_stavki['Ставка измененная за час'] = df_tabl_stavki['Ставка измененная за час'].fillna(0).astype(float)
-    # df_tabl_stavki['Ставка за неделю'] = df_tabl_stavki['Ставка за неделю'].fillna(0).astype(float)
-    # df_tabl_stavki['Ставка измененная за неделю'] = df_tabl_stavki['Ставка измененная за неделю'].fillna(0).astype(float)
-    # df_tabl_stavki['Ставка за месяц'] = df_tabl_stavki['Ставка за месяц'].fillna(0).astype(float)
-    # df_tabl_stavki['Норма рабочих часов за месяц'] = df_tabl_stavki['Норма рабочих часов за месяц'].fillna(0).astype(float)
-    # df_tabl_stavki['Ставка свыше нормы'] = df_tabl_stavki['Ставка свыше нормы'].fillna(0).astype(float)
-    # df_tabl_stavki['Количество отработанных часов свыше нормы'] = df_tabl_stavki[
-    #     'Количество отработанных часов свыше нормы'].fillna(0).astype(float)
-    # df_tabl_stavki['Ставка измененная за месяц'] = df_tabl_stavki['Ставка измененная за месяц'].fillna(0).astype(float)
-    # df_tabl_stavki['Норма расхода топлива на 100 км, литры'] = df_tabl_stavki[
-    #     'Норма расхода топлива на 100 км, литры'].fillna(0).astype(float)
-    # df_tabl_stavki['Цена топлива за 1 литр, евро'] = df_tabl_stavki['Цена топлива за 1 литр, евро'].fillna(0).astype(float)
-    # df_tabl_stavki['Количество часов работы на складе'] = df_tabl_stavki['Количество часов работы на складе'].fillna(0).astype(
-    #     float)
-    # df_tabl_stavki['Бонус за работу на складе'] = df_tabl_stavki['Бонус за работу на складе'].fillna(0).astype(float)
-    # df_tabl_stavki['Бонус за ремонт'] = df_tabl_stavki['Бонус за ремонт'].fillna(0).astype(float)
-    # df_tabl_stavki['Общее количество заряженных батарей'] = df_tabl_stavki[
-    #     'Общее количество заряженных батарей'].replace('-', '0').fillna(0).astype(float)
-    # df_tabl_stavki['Сумма1'] = df_tabl_stavki['Сумма1'].fillna(0).astype(float)
-    # df_tabl_stavki['Сумма2'] = df_tabl_stavki['Сумма2'].fillna(0).astype(float)
-    # df_tabl_stavki['Сумма3'] = df_tabl_stavki['Сумма3'].fillna(0).astype(float)
-    # df_tabl_stavki['Сумма4'] = df_tabl_stavki['Сумма4'].fillna(0).astype(float)
-    # df_tabl_stavki['Сумма5'] = df_tabl_stavki['Сумма5'].fillna(0).astype(float)
-    # df_tabl_stavki['Сумма6'] = df_tabl_stavki['Сумма6'].fillna(0).astype(float)
-    # df_tabl_stavki['Сумма7'] = df_tabl_stavki['Сумма7'].fillna(0).astype(float)
-    # df_tabl_stavki['Штраф'] = df_tabl_stavki['Штраф'].fillna(0).astype(float)
-    # df_tabl_stavki['Аванс'] = df_tabl_stavki['Аванс'].fillna(0).astype(float)
-    # df_tabl_stavki['Сумма8'] = df_tabl_stavki['Сумма8'].fillna(0).astype(float)
-    # df_tabl_stavki['Сумма9'] = df_tabl_stavki['Сумма9'].fillna(0).astype(float)
-    # df_tabl_stavki['Сумма10'] = df_tabl_stavki['Сумма10'].fillna(0).astype(float)
-    # df_tabl_stavki['Процент_от_зп_бонус_прогр'] = df_tabl_stavki[
-    #     'Процент_от_зп_бонус_прогр'].fillna(0).astype(float)
-    # df_tabl_stavki['id_invited_worker_nickname_бонусная_программа'] = df_tabl_stavki[
-    #     'id_invited_worker_nickname_бонусная_программа'].fillna(0).astype(int)
-    # df_for_workers_distance = df_for_workers.groupby(['Месяц', 'Worker id', 'Worker username', 'Worker nickname'],
-    #                                                  as_index=False) \
-    #     .agg({'distance': 'sum'})
-    #
-    # df_temp = df_tabl_stavki.merge(df_for_workers_distance,
-    #                                how='left', on=['Месяц', 'Worker id', 'Worker username', 'Worker nickname'])
-    # df_temp['Компенсация топлива'] = df_temp['Норма расхода топлива на 100 км, литры'] * df_temp['distance'] * df_temp[
-    #     'Цена топлива за 1 литр, евро'] / 100
-    # df_temp['Зарядка АКБ'] = df_temp['Общее количество заряженных батарей'] * 0.2
-    # df_temp['Работа на складе'] = df_temp['Количество часов работы на складе'] * df_temp['Ставка за час']
-    # df_temp['Возмещаемые расходы'] = df_temp['Сумма1'] + df_temp['Сумма2'] + df_temp['Сумма3']
-    # df_temp['Офиц_зп'] = df_temp['Сумма4'] + df_temp['Сумма5'] + df_temp['Сумма6'] + df_temp['Сумма7']
-    # df_temp['Кол-во дней для расчета бонуса'] = (df_temp['Оконч_дата_расч_бонус_нов_сотр'] - df_temp[
-    #     'Нач_дата_расч_бонуса_нов_сотр']) / pd.Timedelta(days=1)
-    # # df_temp['Бонус приведи друга'] = df_temp['Кол-во дней для расчета бонуса'] * 5 * df_temp[
-    # #     'Процент от зарплаты, % (бонусная программа)'] / 100
-    # df_temp['Бонус приведи друга'] = df_temp['Кол-во дней для расчета бонуса'].fillna(0) * 5 * df_temp[
-    #     'Процент_от_зп_бонус_прогр'].fillna(0).astype(float) / 100
-    # df_temp['Всего удержано'] = df_temp['Сумма8'].fillna(0) + df_temp['Сумма9'].fillna(0) + df_temp['Сумма10'].fillna(0)
-    # df_temp['Конец месяца'] = df_temp['Месяц'] + pd.tseries.offsets.MonthEnd()
-    #
-    # # Проверка вида ставки
-    # def type_stavka(df):
-    #     if df['Ставка за час'] != 0:
-    #         return 'Ставка за час'
-    #     elif df['Ставка за неделю'] != 0:
-    #         return 'Ставка за неделю'
-    #     elif df['Ставка за месяц'] != 0:
-    #         return 'Ставка за месяц'
-    #     else:
-    #         return None
-    #
-    # df_temp['Тип ставки'] = df_temp.apply(type_stavka, axis=1)
-    #
-    # # Обработка столбцов Ставка за час
-    # # По дням расписываю работников
-    # df_temp['Ставка за час постоянно'] = df_temp['Дата нового условия ставки (час)'].fillna(0).apply(
-    #     lambda x: 0 if x == 0 else 1)
-    #
-    # columns = ['Date', 'Worker id', 'Ставка за час']
-    # res = pd.DataFrame(columns=columns)
-    #
-    # columns_month = ['Месяц', 'Worker id']
-    # res_month = pd.DataFrame(columns=columns_month)
-    #
-    # for index, row in df_temp.iterrows():
-    #
-    #     if (row['Ставка за час постоянно'] == 0) & (row['Тип ставки'] == 'Ставка за час'):
-    #         #         print('Постоянно')
-    #         dates1 = pd.date_range(start=row['Месяц'], end=row['Конец месяца'], freq='D')
-    #         df1 = pd.DataFrame(dates1, columns=['Date'])
-    #         df1['Ставка за час'] = row['Ставка за час']
-    #         df1['Worker id'] = row['Worker id']
-    #         df1['Worker username'] = row['Worker username']
-    #         df1['Worker nickname'] = row['Worker nickname']
-    #         df1['Worker role'] = row['Worker role']
-    #         df1['city'] = row['city']
-    #         res = pd.concat([res, df1], ignore_index=True)
-    #
-    #     elif (row['Ставка за час постоянно'] == 1) & (row['Тип ставки'] == 'Ставка за час'):
-    #         #         print('Не постоянно')
-    #         # Диапазон до изменения ставки
-    #         dates1 = pd.date_range(start=row['Месяц'],
-    #                                end=row['Дата нового условия ставки (час)'] - pd.Timedelta(hours=1), freq='D')
-    #         df1 = pd.DataFrame(dates1, columns=['Date'])
-    #         df1['Ставка за час'] = row['Ставка за час']
-    #         df1['Worker id'] = row['Worker id']
-    #         df1['Worker username'] = row['Worker username']
-    #         df1['Worker nickname'] = row['Worker nickname']
-    #         df1['Worker role'] = row['Worker role']
-    #         df1['city'] = row['city']
-    #         df1['Посменная зп'] = 0
-    #
-    #         # Диапазон после изменения ставки
-    #         dates2 = pd.date_range(start=row['Дата нового условия ставки (час)'], end=row['Конец месяца'], freq='D')
-    #         df2 = pd.DataFrame(dates2, columns=['Date'])
-    #         df2['Ставка за час'] = row['Ставка измененная за час']
-    #         df2['Worker id'] = row['Worker id']
-    #         df2['Worker username'] = row['Worker username']
-    #         df2['Worker nickname'] = row['Worker nickname']
-    #         df2['Worker role'] = row['Worker role']
-    #         df2['city'] = row['city']
-    #         df2['Посменная зп'] = 0
-    #         res = pd.concat([res, df1, df2], ignore_index=True)
-    #     elif row['Тип ставки'] == 'Ставка за месяц':
-    #         dates3 = pd.date_range(start=row['Месяц'], end=row['Месяц'], freq='D')
-    #         df3 = pd.DataFrame(dates3, columns=['Месяц'])
-    #         df3['Worker id'] = row['Worker id']
-    #         df3['Worker username'] = row['Worker username']
-    #         df3['Worker nickname'] = row['Worker nickname']
-    #         df3['Worker role'] = row['Worker role']
-    #         df3['city'] = row['city']
-    #         res_month = pd.concat([res_month, df3], ignore_index=True)
-    #         res_month['Сдельная зп'] = 0
-    #         res_month['Посменная зп'] = row['Ставка за месяц']
-    #
-    # res_month['Месяц'] = pd.to_datetime(res_month['Месяц'], errors='coerce')
-    #
-    # # Работаю для Христоса
-    # # Удаляю Христоса
-    # res = res.drop(res[res['Worker id'] == 35].index)
-    #
-    # res['Месяц'] = res['Date'].apply(lambda x: x.strftime('%Y-%m-01'))
-    # res['Месяц'] = pd.to_datetime(res['Месяц'], errors='coerce')
-    # res['Date'] = pd.to_datetime(res['Date'], errors='coerce')
-    # res['Ставка за час'] = res['Ставка за час'].astype(float)
-    # res['Worker id'] = res['Worker id'].astype(int)
-    #
-    # # Выгрузка Ставка за час для Христоса
-    # select_min_efficiency = '''
-    #     SELECT
-    #         ds."Date",
-    #         ds."Worker id",
-    #         ds."Nickname" AS "Worker nickname",
-    #         CASE
-    #             WHEN COALESCE( SUM(ds."Minutes") / NULLIF(SUM(ds."Actual duration (hours)" ), 0) / 60, 0) < 0.36 THEN 5
-    #             ELSE 6
-    #         END AS "Ставка за час"
-    #     FROM public.daily_shifts ds
-    #     WHERE ds."Date" >= '2025-08-01' AND ds."Worker id" = 35
-    #     GROUP BY ds."Date", ds."Worker id", ds."Nickname"
-    # '''
-    #
-    # df_c = pd.read_sql(select_min_efficiency, engine_postgresql)
-    # df_c['Date'] = pd.to_datetime(df_c['Date'], errors='coerce')
-    #
-    # # Генерирую календарь для Христоса
-    # columns = ['Date', 'Worker id']
-    # res_c = pd.DataFrame(columns=columns)
-    #
-    # for index, row in df_temp[df_temp['Worker id'] == 35].iterrows():
-    #
-    #     if (row['Ставка за час постоянно'] == 0) & (row['Тип ставки'] == 'Ставка за час'):
-    #         #         print('Постоянно')
-    #
-    #         dates1 = pd.date_range(start=row['Месяц'], end=row['Конец месяца'], freq='D')
-    #         df1 = pd.DataFrame(dates1, columns=['Date'])
-    #         df1['Worker id'] = row['Worker id']
-    #         df1['Worker username'] = row['Worker username']
-    #         df1['Worker nickname'] = row['Worker nickname']
-    #         df1['Worker role'] = row['Worker role']
-    #         df1['city'] = row['city']
-    #         res_c = pd.concat([res_c, df1], ignore_index=True)
-    #
-    #     elif (row['Ставка за час постоянно'] == 1) & (row['Тип ставки'] == 'Ставка за час'):
-    #         #         print('Не постоянно')
-    #         # Диапазон до изменения ставки
-    #         dates1 = pd.date_range(start=row['Месяц'],
-    #                                end=row['Дата нового условия ставки (час)'] - pd.Timedelta(hours=1), freq='D')
-    #         df1 = pd.DataFrame(dates1, columns=['Date'])
-    #         df1['Worker id'] = row['Worker id']
-    #         df1['Worker username'] = row['Worker username']
-    #         df1['Worker nickname'] = row['Worker nickname']
-    #         df1['Worker role'] = row['Worker role']
-    #         df1['city'] = row['city']
-    #         df1['Посменная зп'] = 0
-    #
-    #         # Диапазон после изменения ставки
-    #         dates2 = pd.date_range(start=row['Дата нового условия ставки (час)'], end=row['Конец месяца'], freq='D')
-    #         df2 = pd.DataFrame(dates2, columns=['Date'])
-    #         df2['Worker id'] = row['Worker id']
-    #         df2['Worker username'] = row['Worker username']
-    #         df2['Worker nickname'] = row['Worker nickname']
-    #         df2['Worker role'] = row['Worker role']
-    #         df2['city'] = row['city']
-    #         df2['Посменная зп'] = 0
-    #         res_c = pd.concat([res_c, df1, df2], ignore_index=True)
-    #
-    # res_c['Месяц'] = res_c['Date'].apply(lambda x: x.strftime('%Y-%m-01'))
-    # res_c['Месяц'] = pd.to_datetime(res_c['Месяц'], errors='coerce')
-    # res_c['Date'] = pd.to_datetime(res_c['Date'], errors='coerce')
-    # res_c['Worker id'] = res_c['Worker id'].astype(int)
-    # res_c['Посменная зп'] = 0
-    #
-    # res_c = res_c.merge(df_c, on=['Date', 'Worker id', 'Worker nickname'])
-    # res = pd.concat([res, res_c])
-    #
-    # df_for_workers['Date'] = pd.to_datetime(df_for_workers['Date'])
-    # res['Date'] = pd.to_datetime(res['Date'])
-    #
-    # # Учет дат выезда_. Начало
-    # df_vyezd = df_tabl_stavki[['Месяц', 'Worker id',
-    #                            'Ставка за выезд в другие города', 'Дата выезда 1',
-    #                            'Дата выезда 2', 'Дата выезда3', 'Дата выезда4', 'Дата выезда5']]
-    #
-    # df_vyezd = df_vyezd[df_vyezd['Ставка за выезд в другие города'].notna()]
-    # df_vyezd['Ставка за выезд в другие города'] = df_vyezd['Ставка за выезд в другие города'].astype(float)
-    # df_vyezd['Дата выезда 1'] = pd.to_datetime(df_vyezd['Дата выезда 1'], errors='coerce')
-    # df_vyezd['Дата выезда 2'] = pd.to_datetime(df_vyezd['Дата выезда 2'], errors='coerce')
-    # df_vyezd['Дата выезда3'] = pd.to_datetime(df_vyezd['Дата выезда3'], errors='coerce')
-    # df_vyezd['Дата выезда4'] = pd.to_datetime(df_vyezd['Дата выезда4'], errors='coerce')
-    # df_vyezd['Дата выезда5'] = pd.to_datetime(df_vyezd['Дата выезда5'], errors='coerce')
-    #
-    # for index, row in df_vyezd.iterrows():
-    #     if not pd.isnull(df_vyezd.loc[index]['Дата выезда 1']):
-    #         res.loc[(res['Worker id'] == df_vyezd.loc[index]['Worker id']) & \
-    #                 (res['Date'] == df_vyezd.loc[index]['Дата выезда 1']), 'Ставка за час'] = \
-    #             float(df_vyezd.loc[index]['Ставка за выезд в другие города'])
-    #     if not pd.isnull(df_vyezd.loc[index]['Дата выезда 2']):
-    #         res.loc[(res['Worker id'] == df_vyezd.loc[index]['Worker id']) & \
-    #                 (res['Date'] == df_vyezd.loc[index]['Дата выезда 2']), 'Ставка за час'] = \
-    #             float(df_vyezd.loc[index]['Ставка за выезд в другие города'])
-    #     if not pd.isnull(df_vyezd.loc[index]['Дата выезда3']):
-    #         res.loc[(res['Worker id'] == df_vyezd.loc[index]['Worker id']) & \
-    #                 (res['Date'] == df_vyezd.loc[index]['Дата выезда3']), 'Ставка за час'] = \
-    #             float(df_vyezd.loc[index]['Ставка за выезд в другие города'])
-    #     if not pd.isnull(df_vyezd.loc[index]['Дата выезда4']):
-    #         res.loc[(res['Worker id'] == df_vyezd.loc[index]['Worker id']) & \
-    #                 (res['Date'] == df_vyezd.loc[index]['Дата выезда4']), 'Ставка за час'] = \
-    #             float(df_vyezd.loc[index]['Ставка за выезд в другие города'])
-    #     if not pd.isnull(df_vyezd.loc[index]['Дата выезда5']):
-    #         res.loc[(res['Worker id'] == df_vyezd.loc[index]['Worker id']) & \
-    #                 (res['Date'] == df_vyezd.loc[index]['Дата выезда5']), 'Ставка за час'] = \
-    #             float(df_vyezd.loc[index]['Ставка за выезд в другие города'])
-    #
-    # res = df_for_workers.merge(res, on=['Месяц', 'Date', 'Worker id', 'Worker username', 'Worker nickname'], how='left')
-    # res['Сдельная зп'] = res['Ставка за час'] * res['Actual working seconds'] / 3600
-    #
-    # res_workers_month = res.groupby(['Месяц', 'Worker id', 'Worker username', 'Worker nickname', 'Worker role', 'city']) \
-    #     .agg({'Actual working seconds': 'sum',
-    #           'Сдельная зп': 'sum', 'Посменная зп': 'sum'}) \
-    #     .reset_index()
-    # res_month['Actual worked seconds'] = 0
-    # res_month['Сдельная зп'] = res_month['Сдельная зп'].astype(float)
-    # res_month['Actual worked seconds'] = res_month['Actual worked seconds'].astype(float)
-    # res_month['Worker id'] = res_month['Worker id'].astype(int)
-    # res_month['Date'] = res_month['Месяц']
-    # res_month['Actual start time'] = res_month['Месяц']
-    # res_month['Actual finish time'] = res_month['Месяц']
-    #
-    #
-    # df_zp = pd.concat([res, res_month]).fillna(0)
-    #
-    # res_for_workers = df_zp[['Месяц', 'Date', 'Worker id', 'Worker username', 'Worker nickname',
-    #                          'Actual start time', 'Actual finish time', 'distance',
-    #                          'Actual working seconds', 'Ставка за час']]
-    #
-    # # Очистка таблицы
-    # truncate_t_bike = "TRUNCATE TABLE salary_outer_1 RESTART IDENTITY;"
-    # with engine_postgresql.connect() as connection:
-    #     with connection.begin() as transaction:
-    #         print(f"Попытка очистить таблицу")
-    #         # Очистка salary_inner
-    #         connection.execute(sa.text(truncate_t_bike))
-    #         # Если ошибок нет, транзакция фиксируется автоматически
-    #         print(f"Таблица salary_outer_1 успешно очищена!")
-    #
-    # res_for_workers.to_sql("salary_outer_1", engine_postgresql, if_exists="append", index=False)
-    # print('Таблица salary_outer_1 успешно обновлена!')
-    #
-    # df_zp_month = df_zp.groupby(['Месяц', 'Worker id', 'Worker username', 'Worker nickname'], as_index=False) \
-    #     .agg({'distance': 'sum',
-    #           'Actual working seconds': 'sum',
-    #           'Посменная зп': 'sum',
-    #           'Сдельная зп': 'sum',
-    #           'Actual worked seconds': 'sum'})
-    #
-    # df = df_zp_month.merge(df_temp,
-    #                        on=['Месяц', 'Worker id', 'Worker username', 'Worker nickname'],
-    #                        how='right')
-    # df = df[['Месяц', 'Worker id', 'Worker username', 'Worker nickname',
-    #          'Worker role', 'city', 'Сдельная зп', 'Посменная зп',
-    #          'Компенсация топлива', 'Зарядка АКБ', 'Работа на складе',
-    #          'Бонус за работу на складе', 'Бонус за ремонт', 'Возмещаемые расходы',
-    #          'Бонус приведи друга', 'Штраф', 'Аванс', 'Всего удержано', 'Офиц_зп',
-    #          'Actual working seconds',
-    #          'Actual worked seconds',
-    #          'Количество отработанных часов', 'Ставка за час',
-    #          'Ставка измененная за час', 'Дата нового условия ставки (час)',
-    #          'Ставка за неделю', 'Ставка измененная за неделю',
-    #          'Дата нового условия ставки (нед)', 'Ставка за месяц',
-    #          'Норма рабочих часов за месяц', 'Ставка свыше нормы',
-    #          'Количество отработанных часов свыше нормы',
-    #          'Ставка измененная за месяц', 'Дата нового условия ставки (мес)',
-    #          'Норма расхода топлива на 100 км, литры',
-    #          'Цена топлива за 1 литр, евро', 'Количество часов работы на складе',
-    #          'Общее количество заряженных батарей', 'Сумма1', 'Возмещаемые расходы1',
-    #          'Сумма2', 'Возмещаемые расходы2', 'Сумма3', 'Возмещаемые расходы3',
-    #          'Сумма4', 'официальная зп 1', 'Сумма5', 'официальная зп 2', 'Сумма6',
-    #          'официальная зп 3', 'Сумма7', 'официальная зп 4',
-    #          'Сумма8', 'Удерживаемые расходы1', 'Сумма9', 'Удерживаемые расходы2',
-    #          'Сумма10', 'Удерживаемые расходы3',
-    #          'id_invited_worker_nickname_бонусная_программа',
-    #          'invited_worker_nickname_бонусная_программа',
-    #          'Процент_от_зп_бонус_прогр',
-    #          'Нач_дата_расч_бонуса_нов_сотр',
-    #          'Оконч_дата_расч_бонус_нов_сотр',
-    #          'Кол-во дней для расчета бонуса',
-    #          'Конец месяца', 'Тип ставки',
-    #          'Ставка за час постоянно']]
-    #
-    # df['Дата нового условия ставки (час)'] = df['Дата нового условия ставки (час)'].fillna(df['Месяц'])
-    # df['Дата нового условия ставки (нед)'] = df['Дата нового условия ставки (нед)'].fillna(df['Месяц'])
-    # df['Дата нового условия ставки (мес)'] = df['Дата нового условия ставки (мес)'].fillna(df['Месяц'])
-    # df['Нач_дата_расч_бонуса_нов_сотр'] = df['Нач_дата_расч_бонуса_нов_сотр'].fillna(df['Месяц'])
-    # df['Оконч_дата_расч_бонус_нов_сотр'] = df['Оконч_дата_расч_бонус_нов_сотр'].fillna(df['Месяц'])
-    # df = df.round(2).fillna(0)
-    #
-    # # Бонусы за декады
-    # select_decades_bonus = '''
-    #     SELECT
-    #         ds."month" AS "Месяц",
-    #         ds."decade",
-    #         ds."nomer_decada",
-    #         ds."Worker id",
-    #         ds."Nickname" AS "Worker nickname",
-    #         CASE
-    #             WHEN ds."Prediction minutes" >= 1440 AND ds."Prediction minutes" <= 1920
-    #                 THEN
-    #                     CASE
-    #                         WHEN ds.min_eff >= 0.25 AND ds.min_eff < 0.35 THEN round((0.5 * ds."Prediction minutes" / 60)::NUMERIC, 2)
-    #                         WHEN ds.min_eff >= 0.35 AND ds.min_eff < 0.4 THEN round((0.6 * ds."Prediction minutes" / 60)::NUMERIC, 2)
-    #                         WHEN ds.min_eff >= 0.4 AND ds.min_eff < 0.5 THEN round((0.75 * ds."Prediction minutes" / 60)::NUMERIC, 2)
-    #                         WHEN ds.min_eff >= 0.5 AND ds.min_eff < 0.6 THEN round((1 * ds."Prediction minutes" / 60)::NUMERIC, 2)
-    #                         WHEN ds.min_eff >= 0.6 THEN round((2 * ds."Prediction minutes" / 60)::NUMERIC, 2)
-    #                     END
-    #             WHEN ds."Prediction minutes" > 1920 AND ds."Prediction minutes" <= 2880
-    #                 THEN
-    #                     CASE
-    #                         WHEN ds.min_eff >= 0.25 AND ds.min_eff < 0.35 THEN round((0.6 * ds."Prediction minutes" / 60)::NUMERIC, 2)
-    #                         WHEN ds.min_eff >= 0.35 AND ds.min_eff < 0.4 THEN round((0.7 * ds."Prediction minutes" / 60)::NUMERIC, 2)
-    #                         WHEN ds.min_eff >= 0.4 AND ds.min_eff < 0.5 THEN round((1 * ds."Prediction minutes" / 60)::NUMERIC, 2)
-    #                         WHEN ds.min_eff >= 0.5 AND ds.min_eff < 0.6 THEN round((1.25 * ds."Prediction minutes" / 60)::NUMERIC, 2)
-    #                         WHEN ds.min_eff >= 0.6 THEN round((2.1 * ds."Prediction minutes" / 60)::NUMERIC, 2)
-    #                     END
-    #             WHEN ds."Prediction minutes" > 2880 AND ds."Prediction minutes" <= 3840
-    #                 THEN
-    #                     CASE
-    #                         WHEN ds.min_eff >= 0.25 AND ds.min_eff < 0.35 THEN round((0.7 * ds."Prediction minutes" / 60)::NUMERIC, 2)
-    #                         WHEN ds.min_eff >= 0.35 AND ds.min_eff < 0.4 THEN round((0.75 * ds."Prediction minutes" / 60)::NUMERIC, 2)
-    #                         WHEN ds.min_eff >= 0.4 AND ds.min_eff < 0.5 THEN round((1 * ds."Prediction minutes" / 60)::NUMERIC, 2)
-    #                         WHEN ds.min_eff >= 0.5 AND ds.min_eff < 0.6 THEN round((1.5 * ds."Prediction minutes" / 60)::NUMERIC, 2)
-    #                         WHEN ds.min_eff >= 0.6 THEN round((2.25 * ds."Prediction minutes" / 60)::NUMERIC, 2)
-    #                     END
-    #             WHEN ds."Prediction minutes" > 3840
-    #                 THEN
-    #                     CASE
-    #                         WHEN ds.min_eff >= 0.25 AND ds.min_eff < 0.35 THEN round((0.75 * ds."Prediction minutes" / 60)::NUMERIC, 2)
-    #                         WHEN ds.min_eff >= 0.35 AND ds.min_eff < 0.4 THEN round((1 * ds."Prediction minutes" / 60)::NUMERIC, 2)
-    #                         WHEN ds.min_eff >= 0.4 AND ds.min_eff < 0.5 THEN round((1.5 * ds."Prediction minutes" / 60)::NUMERIC, 2)
-    #                         WHEN ds.min_eff >= 0.5 AND ds.min_eff < 0.6 THEN round((2 * ds."Prediction minutes" / 60)::NUMERIC, 2)
-    #                         WHEN ds.min_eff >= 0.6 THEN round((2.5 * ds."Prediction minutes" / 60)::NUMERIC, 2)
-    #                     END
-    #             ELSE 0
-    #         END AS bonus
-    #     FROM
-    #         (SELECT
-    #             ds.*,
-    #             CASE
-    #                 WHEN ds."nomer_decada" IN (1,2) THEN
-    #                     CASE
-    #                         WHEN CURRENT_DATE - ds."decade" > 10 THEN ds."Actual duration (hours)" * 60
-    #                         ELSE ds."Actual duration (hours)" * 60 / GREATEST(CURRENT_DATE - ds."decade", 1) * 10
-    #                     END
-    #                 WHEN ds."nomer_decada" IN (3) THEN
-    #                     CASE
-    #                         WHEN EXTRACT(MONTH FROM ds."decade") IN (1,3,5,7,8,10,12) THEN
-    #                             CASE
-    #                                 WHEN CURRENT_DATE - ds."decade" > 11 THEN ds."Actual duration (hours)" * 60
-    #                                 ELSE ds."Actual duration (hours)" * 60 / GREATEST(CURRENT_DATE - ds."decade", 1) * ds."kol_vo_dney_3_decada"
-    #                             END
-    #                         WHEN EXTRACT(MONTH FROM ds."decade") IN (4,6,9,11) THEN
-    #                             CASE
-    #                                 WHEN CURRENT_DATE - ds."decade" > 10 THEN ds."Actual duration (hours)" * 60
-    #                                 ELSE ds."Actual duration (hours)" * 60 / GREATEST(CURRENT_DATE - ds."decade", 1) * ds."kol_vo_dney_3_decada"
-    #                             END
-    #                         WHEN EXTRACT(MONTH FROM ds."decade") IN (2) THEN
-    #                             CASE
-    #                                 WHEN CURRENT_DATE - ds."decade" > 8 THEN ds."Actual duration (hours)" * 60
-    #                                 ELSE ds."Actual duration (hours)" * 60 / GREATEST(CURRENT_DATE - ds."decade", 1) * ds."kol_vo_dney_3_decada"
-    #                             END
-    #                     END
-    #             END AS "Prediction minutes"
-    #         FROM
-    #             (
-    #             SELECT
-    #                 ds."month",
-    #                 ds."decade",
-    #                 ds."nomer_decada",
-    #                 ds."kol_vo_dney_3_decada",
-    #                 ds."Worker id",
-    #                 ds."Nickname",
-    #                 SUM(ds."Actual duration (hours)") * 60 AS "Actual minutes",
-    #                 SUM(ds."Actual duration (hours)") AS "Actual duration (hours)",
-    #                 ROUND((SUM(ds."Minutes") / NULLIF(SUM(ds."Actual duration (hours)"), 0))::numeric / 60, 2) AS "min_eff"
-    #             FROM
-    #                 (
-    #                 SELECT
-    #                     date_trunc('month', ds."Date") :: date AS "month",
-    #                     ds.*,
-    #                     (CONCAT(EXTRACT(YEAR FROM "Date"), '-',
-    #                             EXTRACT(MONTH FROM "Date"), '-',
-    #                             CASE
-    #                                 WHEN EXTRACT(DAY FROM "Date") <= 10 THEN 1
-    #                                 WHEN EXTRACT(DAY FROM "Date") <= 20 THEN 11
-    #                                 ELSE 21
-    #                             END
-    #                     )) :: date AS decade,
-    #                     CASE
-    #                         WHEN EXTRACT(DAY FROM "Date") <= 10 THEN 1
-    #                         WHEN EXTRACT(DAY FROM "Date") <= 20 THEN 2
-    #                         WHEN EXTRACT(DAY FROM "Date") <= 31 THEN 3
-    #                     END AS "nomer_decada",
-    #                     CASE
-    #                         WHEN EXTRACT(MONTH FROM "Date") IN (1,3,5,7,8,10,12) THEN 11
-    #                         WHEN EXTRACT(MONTH FROM "Date") IN (4,6,9,11) THEN 10
-    #                         ELSE 8
-    #                     END AS "kol_vo_dney_3_decada"
-    #                 FROM public.daily_shifts ds
-    #                 WHERE "Date" >= '2025-08-01'
-    #                 ) ds
-    #             GROUP BY ds."month", ds."decade", ds."nomer_decada", ds."kol_vo_dney_3_decada", ds."Worker id", ds."Nickname"
-    #             ) ds
-    #         ORDER BY ds."decade", ds."Nickname") ds
-    # '''
-    #
-    # df_decades_bonus_temp = pd.read_sql(select_decades_bonus, engine_postgresql).fillna(0)
-    # df_decades_bonus = df_decades_bonus_temp.pivot_table(index=['Месяц', 'Worker id', 'Worker nickname'],
-    #                                                      columns='nomer_decada',
-    #                                                      values='bonus') \
-    #     .reset_index().fillna(0) \
-    #     .rename(columns={1: 'Бонус за 1 декаду',
-    #                      2: 'Бонус за 2 декаду',
-    #                      3: 'Бонус за 3 декаду'})
-    # df_decades_bonus['Месяц'] = pd.to_datetime(df_decades_bonus['Месяц'], errors='coerce')
-    # df1 = df.merge(df_decades_bonus, on=['Месяц', 'Worker id', 'Worker nickname'], how='left')
-    #
-    # # Бонусы за месяц
-    # select_month_bonus = '''
-    #     SELECT
-    #         ds."month" AS "Месяц",
-    #         ds."Worker id",
-    #         ds."Nickname" AS "Worker nickname",
-    #         -- ds."rn",
-    #         CASE
-    #             WHEN ds."rn" = 1 THEN 100
-    #             WHEN ds."rn" = 2 THEN 75
-    #             WHEN ds."rn" IN (3,4,5) THEN 50
-    #         END AS "Бонус за месяц"
-    #     FROM
-    #         (
-    #         SELECT
-    #             ds.*,
-    #             rank() OVER (PARTITION BY ds."month" ORDER BY ds."min_eff" DESC) AS rn
-    #         FROM
-    #             (SELECT
-    #                 ds.*,
-    #                 CASE
-    #                     WHEN EXTRACT(MONTH FROM ds."month") IN (1,3,5,7,8,10,12) THEN
-    #                         CASE
-    #                             WHEN CURRENT_DATE - ds."month" > 31 THEN ds."Actual duration (hours)" * 60
-    #                             ELSE ds."Actual duration (hours)" * 60 / GREATEST(CURRENT_DATE - ds."month", 1) * ds."kol_vo_dney_month"
-    #                         END
-    #                     WHEN EXTRACT(MONTH FROM ds."month") IN (4,6,9,11) THEN
-    #                         CASE
-    #                             WHEN CURRENT_DATE - ds."month" > 30 THEN ds."Actual duration (hours)" * 60
-    #                             ELSE ds."Actual duration (hours)" * 60 / GREATEST(CURRENT_DATE - ds."month", 1) * ds."kol_vo_dney_month"
-    #                         END
-    #                     WHEN EXTRACT(MONTH FROM ds."month") IN (2) THEN
-    #                         CASE
-    #                             WHEN CURRENT_DATE - ds."month" > 28 THEN ds."Actual duration (hours)" * 60
-    #                             ELSE ds."Actual duration (hours)" * 60 / GREATEST(CURRENT_DATE - ds."month", 1) * ds."kol_vo_dney_month"
-    #                         END
-    #                 END AS "Prediction minutes"
-    #             FROM
-    #                 (SELECT
-    #                     ds."month",
-    #                     ds."kol_vo_dney_month",
-    #                     ds."Worker id",
-    #                     ds."Nickname",
-    #                     SUM(ds."Actual duration (hours)") * 60 AS "Actual minutes",
-    #                     SUM(ds."Actual duration (hours)") AS "Actual duration (hours)",
-    #                     ROUND((SUM(ds."Minutes") / NULLIF(SUM(ds."Actual duration (hours)"), 0) / 60)::numeric, 2) AS "min_eff"
-    #                 FROM
-    #                     (SELECT
-    #                         date_trunc('month', ds."Date") :: date AS "month",
-    #                         CASE
-    #                             WHEN EXTRACT(MONTH FROM "Date") IN (1,3,5,7,8,10,12) THEN 31
-    #                             WHEN EXTRACT(MONTH FROM "Date") IN (4,6,9,11) THEN 30
-    #                             ELSE 28
-    #                         END AS "kol_vo_dney_month",
-    #                         ds.*
-    #                     FROM daily_shifts ds
-    #                     WHERE "Date" >= '2025-08-01') AS ds
-    #                 GROUP BY ds."month", ds."kol_vo_dney_month", ds."Worker id", ds."Nickname"
-    #                 ) ds
-    #             ) ds
-    #         WHERE ds."Prediction minutes" > 4000
-    #         ORDER BY ds."min_eff" DESC
-    #         ) ds
-    #     WHERE rn <= 5
-    # '''
-    #
-    # df_month_bonus_temp = pd.read_sql(select_month_bonus, engine_postgresql).fillna(0)
-    # df_month_bonus_temp['Месяц'] = pd.to_datetime(df_month_bonus_temp['Месяц'], errors='coerce')
-    #
-    # df_res = df1.merge(df_month_bonus_temp, on=['Месяц', 'Worker id', 'Worker nickname'], how='left').fillna(0)
-    # df_res['add_time'] = pd.Timestamp.now() + pd.Timedelta(hours=3)
-    #
-    # # Очистка таблицы
-    # truncate_t_bike = "TRUNCATE TABLE salary_inner RESTART IDENTITY;"
-    #
-    # with engine_postgresql.connect() as connection:
-    #     with connection.begin() as transaction:
-    #         print(f"Попытка очистить таблицу")
-    #         # Очистка salary_inner
-    #         connection.execute(sa.text(truncate_t_bike))
-    #         # Если ошибок нет, транзакция фиксируется автоматически
-    #         print(f"Таблица salary_inner успешно очищена!")
-    #
-    # df_res.to_sql("salary_inner", engine_postgresql, if_exists="append", index=False)
-    # print('Таблица salary_inner успешно обновлена!')
-    #
-    # # Расчет зп. Конец 30.09.2025
-
-    #   Обновление таблицы t_bike_use в Postgres. Начало
-    # Максимальный id записи в принимающей таблице
-    select_max_id_t_bike_use = '''
-    SELECT 
-    	MAX(id)
-    FROM damir.t_bike_use
-    '''
-    df_max_id_t_bike_use_postgres = pd.read_sql(select_max_id_t_bike_use, engine_postgresql)
-    max_id_t_bike_use = int(df_max_id_t_bike_use_postgres.iloc[0].iloc[0])
-
-    select_fresh_t_bike_use_mysql = '''
-            SELECT
-                NOW() AS add_time,
-                IfNULL(t_bike_use.id,0) AS id,
-                IfNULL(t_bike_use.uid,0) AS uid,
-                IfNULL(t_bike_use.bid,0) AS bid,
-                IfNULL(t_bike_use.start_time,0) AS start_time,
-                IfNULL(t_bike_use.end_time,0) AS end_time,
-                IfNULL(t_bike_use.duration,0) AS duration ,
-                IfNULL(t_bike_use.distance,0) AS distance ,
-                IfNULL(t_bike_use.orbit,0) AS orbit,
-                IfNULL(t_bike_use.start_lat,0) AS start_lat,
-                IfNULL(t_bike_use.start_lng,0) AS start_lng,
-                IfNULL(t_bike_use.end_lat,0) AS end_lat,
-                IfNULL(t_bike_use.end_lng,0) AS end_lng,
-                IfNULL(t_bike_use.ispay,0) AS ispay,
-                IfNULL(t_bike_use.`date`,0) AS `date`,
-                IfNULL(t_bike_use.lock_location,0) AS lock_location,
-                IfNULL(t_bike_use.out_area,0) AS out_area,
-                IfNULL(t_bike_use.open_way,0) AS open_way,
-                IfNULL(t_bike_use.ride_amount,0) AS ride_amount,
-                IfNULL(t_bike_use.ride_status,0) AS ride_status,
-                IfNULL(t_bike_use.old_date,0) AS old_date,
-                IfNULL(t_bike_use.close_way,0) AS close_way,
-                IfNULL(t_bike_use.old_duration,0) AS old_duration,
-                IfNULL(t_bike_use.admin_id,0) AS admin_id,
-                IfNULL(t_bike_use.update_time,0) AS update_time,
-                IfNULL(t_bike_use.lock_time,0) AS lock_time, 
-                IfNULL(t_bike_use.host_id,0) AS host_id,
-                IfNULL(t_bike_use.ride_user,0) AS ride_user,
-                IfNULL(t_bike_use.group_ride,0) AS group_ride,
-                IfNULL(t_bike_use.start_area,0) AS start_area,
-                IfNULL(t_bike_use.end_area,0) AS end_area,
-                IfNULL(t_bike_use.stripe_charge,0) AS stripe_charge,
-                IfNULL(t_bike_use.stripe_refund,0) AS stripe_refund,
-                IfNULL(t_bike_use.pause_duration,0) AS pause_duration,
-                IfNULL(t_bike_use.discount,0) AS discount,
-                IfNULL(t_bike_use.subscription_id,0) AS subscription_id,
-                IfNULL(t_bike_use.subscription_mapping_id,0) AS subscription_mapping_id,
-                IfNULL(t_bike_use.route_image,0) AS route_image,
-                IfNULL(t_bike_use.parking_image,0) AS parking_image,
-                IfNULL(t_bike_use.force_stop,0) AS force_stop,
-                IfNULL(t_bike_use.force_stop_comment,0) AS force_stop_comment,
-                IfNULL(t_bike_use.lights,0) AS lights,
-                IfNULL(t_bike_use.gear,0) AS gear,
-                IfNULL(t_bike_use.sent_unlock_time,0) AS sent_unlock_time,
-                IfNULL(t_bike_use.recalculated,0) AS recalculated,
-                IfNULL(t_bike_use.notified,0) AS notified,
-                IfNULL(t_bike_use.notified_time,0) AS notified_time,
-                IfNULL(t_bike_use.speed_zone_id,0) AS speed_zone_id,
-                IfNULL(t_bike_use.admin_note,0) AS admin_note,
-                IfNULL(t_bike_use.subscription_payment_id,0) AS subscription_payment_id,
-                IfNULL(t_bike_use.subscr_paid_before_ride_balance,0) AS subscr_paid_before_ride_balance
-            FROM shamri.t_bike_use
-            WHERE t_bike_use.id > {max_id_t_bike_use}
-                    '''.format(max_id_t_bike_use=max_id_t_bike_use)
-
-    df_fresh_t_bike_use_mysql = pd.read_sql(select_fresh_t_bike_use_mysql, engine_mysql)
-    df_fresh_t_bike_use_mysql.replace('', '0').to_sql("t_bike_use", engine_postgresql, if_exists="append", index=False)
-    print('Added {x} records to t_bike_use in Postgres!'.format(x=df_fresh_t_bike_use_mysql.shape[0]))
-
-    #   Обновление таблицы t_bike_use в Postgres. Конец
-
-    #   Обновление таблицы t_trade в Postgres. Начало
-    # Максимальный id записи в принимающей таблице
-    select_max_id_t_trade = '''
-    SELECT 
-        MAX(id)
-    FROM damir.t_trade
-    '''
-    df_max_id_t_trade_postgres = pd.read_sql(select_max_id_t_trade, engine_postgresql)
-    max_id_t_trade = int(df_max_id_t_trade_postgres.iloc[0].iloc[0])
-
-    select_fresh_t_trade_mysql = '''
-        SELECT
-            NOW() AS add_time ,
-            tt.id ,
-            COALESCE(tt.record_id, '0') AS record_id,
-            COALESCE(tt.status, 0) AS status,
-            COALESCE(tt.way, 0) AS way,
-            tt.`date` ,
-            COALESCE(tt.amount, 0) AS amount,
-            COALESCE(tt.`type`, 0) AS type,
-            COALESCE(tt.uid, 0) AS uid,
-            COALESCE(tt.out_pay_id, 0) AS out_pay_id,
-            COALESCE(tt.notify, 0) AS notify,
-            COALESCE(tt.out_trade_no, '0') AS out_trade_no,
-            COALESCE(tt.balance, 0) AS balance,
-            tt.city_id ,
-            COALESCE(tt.account_pay_amount, 0) AS account_pay_amount,
-            COALESCE(tt.gift_pay_amount, 0) AS gift_pay_amount,
-            COALESCE(tt.prefix, '0') AS prefix,
-            COALESCE(tt.card_type, '0') AS card_type,
-            COALESCE(tt.card_issue_bank, '0') AS card_issue_bank,
-            COALESCE(tt.card_number, '0') AS card_number,
-            COALESCE(tt.industry_id, 0) AS industry_id,
-            COALESCE(tt.admin_id, 0) AS admin_id,
-            COALESCE(tt.error_message, '0') AS error_message,
-            COALESCE(tt.discount, 0) AS discount
-        FROM shamri.t_trade tt
-        WHERE tt.id > {max_id_t_trade}
-                    '''.format(max_id_t_trade=max_id_t_trade)
-
-    df_fresh_t_trade_mysql = pd.read_sql(select_fresh_t_trade_mysql, engine_mysql)
-    df_fresh_t_trade_mysql.replace('', '0').to_sql("t_trade", engine_postgresql, if_exists="append", index=False)
-    print('Added {x} records to t_trade in Postgres!'.format(x=df_fresh_t_trade_mysql.shape[0]))
-    #   Обновление таблицы t_trade в Postgres. Конец
-
-    #   Обновление таблицы t_subscription_mapping в Postgres. Начало
-    # Максимальный id записи в принимающей таблице
-    select_max_id_t_subscription_mapping = '''
-        SELECT 
-            MAX(id)
-        FROM damir.t_subscription_mapping
-    '''
-    df_max_id_t_subscription_mapping_postgres = pd.read_sql(select_max_id_t_subscription_mapping, engine_postgresql)
-    max_id_t_subscription_mapping = int(df_max_id_t_subscription_mapping_postgres.iloc[0].iloc[0])
-
-    select_fresh_t_subscription_mapping_mysql = '''
-        SELECT
-            NOW() AS add_time ,
-            tsm.id ,
-            tsm.user_id ,
-            tsm.subscription_id ,
-            tsm.spent ,
-            tsm.end_time ,
-            tsm.start_time 
-        FROM shamri.t_subscription_mapping tsm 
-            WHERE tsm.id > {max_id_t_subscription_mapping}
-                    '''.format(max_id_t_subscription_mapping=max_id_t_subscription_mapping)
-    df_fresh_t_subscription_mapping_mysql = pd.read_sql(select_fresh_t_subscription_mapping_mysql, engine_mysql)
-    df_fresh_t_subscription_mapping_mysql.replace('', '0').to_sql("t_subscription_mapping", engine_postgresql,
-                                                                  if_exists="append", index=False)
-    print('Added {x} records to t_subscription_mapping in Postgres!'.format(
-        x=df_fresh_t_subscription_mapping_mysql.shape[0]))
-    #   Обновление таблицы t_subscription_mapping в Postgres. Конец
-
-    #   Обновление таблицы t_ride_event_log в Postgres. Начало
-    # Максимальный id записи в принимающей таблице
-    select_max_id_t_ride_event_log = '''
-        SELECT 
-            MAX(id)
-        FROM damir.t_ride_event_log
-        '''
-    df_max_id_t_ride_event_log_postgres = pd.read_sql(select_max_id_t_ride_event_log, engine_postgresql)
-    max_id_t_ride_event_log = int(df_max_id_t_ride_event_log_postgres.iloc[0].iloc[0])
-
-    select_fresh_t_ride_event_log_mysql = '''
-                SELECT
-                    NOW() AS add_time,
-                    t_ride_event_log.id,
-                    t_ride_event_log.ride_id,
-                    t_ride_event_log.event,
-                    t_ride_event_log.description,
-                    t_ride_event_log.created 
-                FROM shamri.t_ride_event_log
-                WHERE t_ride_event_log.id > {max_id_t_ride_event_log}
-                        '''.format(max_id_t_ride_event_log=max_id_t_ride_event_log)
-
-    df_fresh_t_ride_event_log_mysql = pd.read_sql(select_fresh_t_ride_event_log_mysql, engine_mysql)
-
-    df_fresh_t_ride_event_log_mysql.replace('', '0').to_sql("t_ride_event_log", engine_postgresql, if_exists="append",
-                                                            index=False)
-    print('Added {x} records to t_ride_event_log in Postgres!'.format(x=df_fresh_t_ride_event_log_mysql.shape[0]))
-
-    #   Обновление таблицы t_ride_event_log в Postgres. Конец
-
-    #   Обновление таблицы t_payment_details в Postgres. Начало
-    #   Максимальный id записи в принимающей таблице
-    select_max_id_t_payment_details = '''
-            SELECT 
-                MAX(id)
-            FROM damir.t_payment_details
-        '''
-    df_max_id_t_payment_details_postgres = pd.read_sql(select_max_id_t_payment_details, engine_postgresql)
-
-    max_id_t_payment_details = int(df_max_id_t_payment_details_postgres.iloc[0].iloc[0])
-
-    select_fresh_t_payment_details_mysql = '''
-                SELECT 
-                    NOW() AS add_time ,
-                    IFNULL(tpd.id, 0) AS id ,
-                    IFNULL(tpd.user_id, 0) AS user_id ,
-                    IFNULL(tpd.ride_id, 0) AS ride_id ,
-                    IFNULL(tpd.price, 0) AS price ,
-                    IFNULL(tpd.unlock_price, 0) AS unlock_price ,
-                    IFNULL(tpd.unit_count, 0) AS unit_count ,
-                    IFNULL(tpd.unit_type, 0) AS unit_type ,
-                    IFNULL(tpd.currency, 'EUR') AS currency ,
-                    IFNULL(tpd.hold_price, 0) AS hold_price ,
-                    IFNULL(tpd.hold_count, 0) AS hold_count ,
-                    IFNULL(tpd.hold_unit_type, 0) AS hold_unit_type ,
-                    IFNULL(tpd.total_ride_cost, 0) AS total_ride_cost ,
-                    IFNULL(tpd.pause_cost, 0) AS pause_cost,
-                    IFNULL(tpd.debit_balance, 0) AS debit_balance,
-                    IFNULL(tpd.debit_gift_amount, 0) AS debit_gift_amount,
-                    IFNULL(tpd.debit_cash, 0) AS debit_cash,
-                    IFNULL(tpd.subscription_pause_sec, 0) AS subscription_pause_sec ,
-                    IFNULL(tpd.subscription_cost, 0) AS subscription_cost ,
-                    IFNULL(tpd.subscription_id, 0) AS subscription_id ,
-                    IFNULL(tpd.subscription_mapping_id, 0) AS subscription_mapping_id ,
-                    IFNULL(tpd.subscription_paid_before_ride, 0) AS subscription_paid_before_ride ,
-                    IFNULL(tpd.created, STR_TO_DATE("2024-01-01 00:00:00", "%Y-%m-%d %H:%i:%s")) AS created ,
-                    IFNULL(tpd.unlock_sec_included, 0) AS unlock_sec_included,
-                    IFNULL(tpd.area_bonus_type, 0) AS area_bonus_type,
-                    IFNULL(tpd.area_bonus_value, 0) AS area_bonus_value,
-                    IFNULL(tpd.area_bonus_amount, 0) AS area_bonus_amount,
-                    IFNULL(tpd.bike_discount_id, 0) AS bike_discount_id,
-                    IFNULL(tpd.bike_discount_amount, 0) AS bike_discount_amount,
-                    IFNULL(tpd.bike_discount_value, 0) AS bike_discount_value,
-                    IFNULL(tpd.bike_discount_type, 0) AS bike_discount_type
-                FROM shamri.t_payment_details tpd 
-                WHERE tpd.id > {max_id_t_payment_details}
-                        '''.format(max_id_t_payment_details=max_id_t_payment_details)
-    df_fresh_t_payment_details_mysql = pd.read_sql(select_fresh_t_payment_details_mysql, engine_mysql)
-    df_fresh_t_payment_details_mysql.replace('', '0').to_sql("t_payment_details", engine_postgresql, if_exists="append",
-                                                             index=False)
-    print('Added {x} records to t_payment_details in Postgres!'.format(x=df_fresh_t_payment_details_mysql.shape[0]))
-    #   Обновление таблицы t_payment_details в Postgres. Конец
-
-    #   Обновление таблицы t_audit_user_location в Postgres. Начало
-    # Максимальный id записи в принимающей таблице
-    select_max_id_t_audit_user_location = '''
-        SELECT 
-            MAX(id)
-        FROM damir.t_audit_user_location
-    '''
-
-    df_max_id_t_audit_user_location = pd.read_sql(select_max_id_t_audit_user_location, engine_postgresql)
-    max_id_t_audit_user_location = int(df_max_id_t_audit_user_location.iloc[0].iloc[0])
-
-    select_fresh_t_audit_user_location_mysql = '''
-            SELECT
-                NOW() AS add_time ,
-                t_audit_user_location.*
-            FROM shamri.t_audit_user_location
-            WHERE t_audit_user_location.id > {max_id_t_audit_user_location}
-                    '''.format(max_id_t_audit_user_location=max_id_t_audit_user_location)
-
-    df_fresh_t_audit_user_location_mysql = pd.read_sql(select_fresh_t_audit_user_location_mysql, engine_mysql)
-
-    df_fresh_t_audit_user_location_mysql.replace('', '0').to_sql("t_audit_user_location",
-                                                                 engine_postgresql,
-                                                                 if_exists="append",
-                                                                 index=False)
-    print('Added {x} records to t_audit_user_location in Postgres!'.format(
-        x=df_fresh_t_audit_user_location_mysql.shape[0]))
-    #   Обновление таблицы t_audit_user_location в Postgres. Конец
 
+# # Расчет зп. Начало 30.09.2025
+# SERVICE_ACCOUNT_FILE = './google_json.json'
+# SPREADSHEET_ID = '1dSOV9X2FV3mnOmnwWvTMJuCCZ-tVBf64DP90k3EYD90'
+# RANGE_NAME = 'График работ!A:L'
+# service_account_file = generated_json_file
+#
+# sheets_service = get_sheets_service(SERVICE_ACCOUNT_FILE)
+#
+# # Выгрузка для Каждый работник
+# select_for_workers = '''
+#     SELECT
+#         date_trunc('month', grg."Date")::date AS "Месяц",
+#         grg.* ,
+#         EXTRACT(EPOCH FROM (grg."Actual finish time" - grg."Actual start time"))::int AS "Actual working seconds"
+#     FROM
+#     (
+#         SELECT
+#             grg."Date"::date ,
+#             grg."Worker id"::int ,
+#             grg."Worker username" ,
+#             grg."Worker nickname" ,
+#             to_timestamp(concat(grg."Date", ' ', grg."Actual start time"), 'YYYY-MM-DD HH24:MI:SS') AS "Actual start time" ,
+#             CASE
+#                 WHEN grg."Actual start time" < grg."Actual finish time" THEN to_timestamp(concat(grg."Date", ' ', grg."Actual finish time"), 'YYYY-MM-DD HH24:MI:SS')
+#                 ELSE to_timestamp(concat(grg."Date", ' ', grg."Actual finish time"), 'YYYY-MM-DD HH24:MI:SS') + interval '1 day'
+#             END  AS "Actual finish time" ,
+#             grg."Finish odometer kilometers"::float - grg."Start odometer kilometers"::float AS distance
+#         FROM damir.grafik_rabot_google grg
+#         WHERE grg."Actual start time" != '00:00:70'
+#             AND grg."Actual finish time" != '00:00:70'
+#             AND grg."Date" >= '2025-08-01'
+#         ) AS grg
+# '''
+# df_for_workers = pd.read_sql(select_for_workers, engine_postgresql)
+# df_for_workers['Месяц'] = pd.to_datetime(df_for_workers['Месяц'], errors='coerce')
+#
+# # Скачиваю Таблица(ставки)
+# RANGE_NAME_2 = 'Таблица(ставки)!A:BF'
+# sheets_service = get_sheets_service(SERVICE_ACCOUNT_FILE)
+# df_tabl_stavki = read_sheet_data_to_pandas(sheets_service, SPREADSHEET_ID, RANGE_NAME_2)
+#
+# new_columns = df_tabl_stavki.iloc[0]
+# df_tabl_stavki.columns = new_columns
+# df_tabl_stavki.drop(index=df_tabl_stavki.index[0], axis=0, inplace=True)
+# df_tabl_stavki = df_tabl_stavki[df_tabl_stavki['Месяц'].notna()]
+# df_tabl_stavki['Месяц'] = pd.to_datetime(df_tabl_stavki['Месяц'], errors='coerce')
+# df_tabl_stavki['Дата нового условия ставки (час)'] = pd.to_datetime(
+#     df_tabl_stavki['Дата нового условия ставки (час)'], errors='coerce').replace('1970-01-01', 'NaT')
+# df_tabl_stavki['Дата нового условия ставки (нед)'] = pd.to_datetime(
+#     df_tabl_stavki['Дата нового условия ставки (нед)'], errors='coerce').replace('1970-01-01', 'NaT')
+# df_tabl_stavki['Дата нового условия ставки (мес)'] = pd.to_datetime(
+#     df_tabl_stavki['Дата нового условия ставки (мес)'], errors='coerce').replace('1970-01-01', 'NaT')
+# df_tabl_stavki['Нач_дата_расч_бонуса_нов_сотр'] = pd.to_datetime(
+#     df_tabl_stavki['Нач_дата_расч_бонуса_нов_сотр'], errors='coerce').replace('1970-01-01', 'NaT')
+# df_tabl_stavki['Оконч_дата_расч_бонус_нов_сотр'] = pd.to_datetime(
+#     df_tabl_stavki['Оконч_дата_расч_бонус_нов_сотр'], errors='coerce')
+# df_tabl_stavki = df_tabl_stavki.replace('', '0')
+# df_tabl_stavki['Worker id'] = df_tabl_stavki['Worker id'].astype(int)
+# df_tabl_stavki['Количество отработанных часов'] = df_tabl_stavki['Количество отработанных часов'].fillna(0).astype(float)
+# df_tabl_stavki['Ставка за час'] = df_tabl_stavki['Ставка за час'].fillna(0).astype(float)
+# df_tabl_stavki['Ставка измененная за час'] = df_tabl_stavki['Ставка измененная за час'].fillna(0).astype(float)
+# df_tabl_stavki['Ставка за неделю'] = df_tabl_stavki['Ставка за неделю'].fillna(0).astype(float)
+# df_tabl_stavki['Ставка измененная за неделю'] = df_tabl_stavki['Ставка измененная за неделю'].fillna(0).astype(float)
+# df_tabl_stavki['Ставка за месяц'] = df_tabl_stavki['Ставка за месяц'].fillna(0).astype(float)
+# df_tabl_stavki['Норма рабочих часов за месяц'] = df_tabl_stavki['Норма рабочих часов за месяц'].fillna(0).astype(float)
+# df_tabl_stavki['Ставка свыше нормы'] = df_tabl_stavki['Ставка свыше нормы'].fillna(0).astype(float)
+# df_tabl_stavki['Количество отработанных часов свыше нормы'] = df_tabl_stavki[
+#     'Количество отработанных часов свыше нормы'].fillna(0).astype(float)
+# df_tabl_stavki['Ставка измененная за месяц'] = df_tabl_stavki['Ставка измененная за месяц'].fillna(0).astype(float)
+# df_tabl_stavki['Норма расхода топлива на 100 км, литры'] = df_tabl_stavki[
+#     'Норма расхода топлива на 100 км, литры'].fillna(0).astype(float)
+# df_tabl_stavki['Цена топлива за 1 литр, евро'] = df_tabl_stavki['Цена топлива за 1 литр, евро'].fillna(0).astype(float)
+# df_tabl_stavki['Количество часов работы на складе'] = df_tabl_stavki['Количество часов работы на складе'].fillna(0).astype(
+#     float)
+# df_tabl_stavki['Бонус за работу на складе'] = df_tabl_stavki['Бонус за работу на складе'].fillna(0).astype(float)
+# df_tabl_stavki['Бонус за ремонт'] = df_tabl_stavki['Бонус за ремонт'].fillna(0).astype(float)
+# df_tabl_stavki['Общее количество заряженных батарей'] = df_tabl_stavki[
+#     'Общее количество заряженных батарей'].replace('-', '0').fillna(0).astype(float)
+# df_tabl_stavki['Сумма1'] = df_tabl_stavki['Сумма1'].fillna(0).astype(float)
+# df_tabl_stavki['Сумма2'] = df_tabl_stavki['Сумма2'].fillna(0).astype(float)
+# df_tabl_stavki['Сумма3'] = df_tabl_stavki['Сумма3'].fillna(0).astype(float)
+# df_tabl_stavki['Сумма4'] = df_tabl_stavki['Сумма4'].fillna(0).astype(float)
+# df_tabl_stavki['Сумма5'] = df_tabl_stavki['Сумма5'].fillna(0).astype(float)
+# df_tabl_stavki['Сумма6'] = df_tabl_stavki['Сумма6'].fillna(0).astype(float)
+# df_tabl_stavki['Сумма7'] = df_tabl_stavki['Сумма7'].fillna(0).astype(float)
+# df_tabl_stavki['Штраф'] = df_tabl_stavki['Штраф'].fillna(0).astype(float)
+# df_tabl_stavki['Аванс'] = df_tabl_stavki['Аванс'].fillna(0).astype(float)
+# df_tabl_stavki['Сумма8'] = df_tabl_stavki['Сумма8'].fillna(0).astype(float)
+# df_tabl_stavki['Сумма9'] = df_tabl_stavki['Сумма9'].fillna(0).astype(float)
+# df_tabl_stavki['Сумма10'] = df_tabl_stavki['Сумма10'].fillna(0).astype(float)
+# df_tabl_stavki['Процент_от_зп_бонус_прогр'] = df_tabl_stavki[
+#     'Процент_от_зп_бонус_прогр'].fillna(0).astype(float)
+# df_tabl_stavki['id_invited_worker_nickname_бонусная_программа'] = df_tabl_stavki[
+#     'id_invited_worker_nickname_бонусная_программа'].fillna(0).astype(int)
+# df_for_workers_distance = df_for_workers.groupby(['Месяц', 'Worker id', 'Worker username', 'Worker nickname'],
+#                                                  as_index=False) \
+#     .agg({'distance': 'sum'})
+#
+# df_temp = df_tabl_stavki.merge(df_for_workers_distance,
+#                                how='left', on=['Месяц', 'Worker id', 'Worker username', 'Worker nickname'])
+# df_temp['Компенсация топлива'] = df_temp['Норма расхода топлива на 100 км, литры'] * df_temp['distance'] * df_temp[
+#     'Цена топлива за 1 литр, евро'] / 100
+# df_temp['Зарядка АКБ'] = df_temp['Общее количество заряженных батарей'] * 0.2
+# df_temp['Работа на складе'] = df_temp['Количество часов работы на складе'] * df_temp['Ставка за час']
+# df_temp['Возмещаемые расходы'] = df_temp['Сумма1'] + df_temp['Сумма2'] + df_temp['Сумма3']
+# df_temp['Офиц_зп'] = df_temp['Сумма4'] + df_temp['Сумма5'] + df_temp['Сумма6'] + df_temp['Сумма7']
+# df_temp['Кол-во дней для расчета бонуса'] = (df_temp['Оконч_дата_расч_бонус_нов_сотр'] - df_temp[
+#     'Нач_дата_расч_бонуса_нов_сотр']) / pd.Timedelta(days=1)
+# # df_temp['Бонус приведи друга'] = df_temp['Кол-во дней для расчета бонуса'] * 5 * df_temp[
+# #     'Процент от зарплаты, % (бонусная программа)'] / 100
+# df_temp['Бонус приведи друга'] = df_temp['Кол-во дней для расчета бонуса'].fillna(0) * 5 * df_temp[
+#     'Процент_от_зп_бонус_прогр'].fillna(0).astype(float) / 100
+# df_temp['Всего удержано'] = df_temp['Сумма8'].fillna(0) + df_temp['Сумма9'].fillna(0) + df_temp['Сумма10'].fillna(0)
+# df_temp['Конец месяца'] = df_temp['Месяц'] + pd.tseries.offsets.MonthEnd()
+#
+# # Проверка вида ставки
+# def type_stavka(df):
+#     if df['Ставка за час'] != 0:
+#         return 'Ставка за час'
+#     elif df['Ставка за неделю'] != 0:
+#         return 'Ставка за неделю'
+#     elif df['Ставка за месяц'] != 0:
+#         return 'Ставка за месяц'
+#     else:
+#         return None
+#
+# df_temp['Тип ставки'] = df_temp.apply(type_stavka, axis=1)
+#
+# # Обработка столбцов Ставка за час
+# # По дням расписываю работников
+# df_temp['Ставка за час постоянно'] = df_temp['Дата нового условия ставки (час)'].fillna(0).apply(
+#     lambda x: 0 if x == 0 else 1)
+#
+# columns = ['Date', 'Worker id', 'Ставка за час']
+# res = pd.DataFrame(columns=columns)
+#
+# columns_month = ['Месяц', 'Worker id']
+# res_month = pd.DataFrame(columns=columns_month)
+#
+# for index, row in df_temp.iterrows():
+#
+#     if (row['Ставка за час постоянно'] == 0) & (row['Тип ставки'] == 'Ставка за час'):
+#         #         print('Постоянно')
+#         dates1 = pd.date_range(start=row['Месяц'], end=row['Конец месяца'], freq='D')
+#         df1 = pd.DataFrame(dates1, columns=['Date'])
+#         df1['Ставка за час'] = row['Ставка за час']
+#         df1['Worker id'] = row['Worker id']
+#         df1['Worker username'] = row['Worker username']
+#         df1['Worker nickname'] = row['Worker nickname']
+#         df1['Worker role'] = row['Worker role']
+#         df1['city'] = row['city']
+#         res = pd.concat([res, df1], ignore_index=True)
+#
+#     elif (row['Ставка за час постоянно'] == 1) & (row['Тип ставки'] == 'Ставка за час'):
+#         #         print('Не постоянно')
+#         # Диапазон до изменения ставки
+#         dates1 = pd.date_range(start=row['Месяц'],
+#                                end=row['Дата нового условия ставки (час)'] - pd.Timedelta(hours=1), freq='D')
+#         df1 = pd.DataFrame(dates1, columns=['Date'])
+#         df1['Ставка за час'] = row['Ставка за час']
+#         df1['Worker id'] = row['Worker id']
+#         df1['Worker username'] = row['Worker username']
+#         df1['Worker nickname'] = row['Worker nickname']
+#         df1['Worker role'] = row['Worker role']
+#         df1['city'] = row['city']
+#         df1['Посменная зп'] = 0
+#
+#         # Диапазон после изменения ставки
+#         dates2 = pd.date_range(start=row['Дата нового условия ставки (час)'], end=row['Конец месяца'], freq='D')
+#         df2 = pd.DataFrame(dates2, columns=['Date'])
+#         df2['Ставка за час'] = row['Ставка измененная за час']
+#         df2['Worker id'] = row['Worker id']
+#         df2['Worker username'] = row['Worker username']
+#         df2['Worker nickname'] = row['Worker nickname']
+#         df2['Worker role'] = row['Worker role']
+#         df2['city'] = row['city']
+#         df2['Посменная зп'] = 0
+#         res = pd.concat([res, df1, df2], ignore_index=True)
+#     elif row['Тип ставки'] == 'Ставка за месяц':
+#         dates3 = pd.date_range(start=row['Месяц'], end=row['Месяц'], freq='D')
+#         df3 = pd.DataFrame(dates3, columns=['Месяц'])
+#         df3['Worker id'] = row['Worker id']
+#         df3['Worker username'] = row['Worker username']
+#         df3['Worker nickname'] = row['Worker nickname']
+#         df3['Worker role'] = row['Worker role']
+#         df3['city'] = row['city']
+#         res_month = pd.concat([res_month, df3], ignore_index=True)
+#         res_month['Сдельная зп'] = 0
+#         res_month['Посменная зп'] = row['Ставка за месяц']
+#
+# res_month['Месяц'] = pd.to_datetime(res_month['Месяц'], errors='coerce')
+#
+# # Работаю для Христоса
+# # Удаляю Христоса
+# res = res.drop(res[res['Worker id'] == 35].index)
+#
+# res['Месяц'] = res['Date'].apply(lambda x: x.strftime('%Y-%m-01'))
+# res['Месяц'] = pd.to_datetime(res['Месяц'], errors='coerce')
+# res['Date'] = pd.to_datetime(res['Date'], errors='coerce')
+# res['Ставка за час'] = res['Ставка за час'].astype(float)
+# res['Worker id'] = res['Worker id'].astype(int)
+#
+# # Выгрузка Ставка за час для Христоса
+# select_min_efficiency = '''
+#     SELECT
+#         ds."Date",
+#         ds."Worker id",
+#         ds."Nickname" AS "Worker nickname",
+#         CASE
+#             WHEN COALESCE( SUM(ds."Minutes") / NULLIF(SUM(ds."Actual duration (hours)" ), 0) / 60, 0) < 0.36 THEN 5
+#             ELSE 6
+#         END AS "Ставка за час"
+#     FROM public.daily_shifts ds
+#     WHERE ds."Date" >= '2025-08-01' AND ds."Worker id" = 35
+#     GROUP BY ds."Date", ds."Worker id", ds."Nickname"
+# '''
+#
+# df_c = pd.read_sql(select_min_efficiency, engine_postgresql)
+# df_c['Date'] = pd.to_datetime(df_c['Date'], errors='coerce')
+#
+# # Генерирую календарь для Христоса
+# columns = ['Date', 'Worker id']
+# res_c = pd.DataFrame(columns=columns)
+#
+# for index, row in df_temp[df_temp['Worker id'] == 35].iterrows():
+#
+#     if (row['Ставка за час постоянно'] == 0) & (row['Тип ставки'] == 'Ставка за час'):
+#         #         print('Постоянно')
+#
+#         dates1 = pd.date_range(start=row['Месяц'], end=row['Конец месяца'], freq='D')
+#         df1 = pd.DataFrame(dates1, columns=['Date'])
+#         df1['Worker id'] = row['Worker id']
+#         df1['Worker username'] = row['Worker username']
+#         df1['Worker nickname'] = row['Worker nickname']
+#         df1['Worker role'] = row['Worker role']
+#         df1['city'] = row['city']
+#         res_c = pd.concat([res_c, df1], ignore_index=True)
+#
+#     elif (row['Ставка за час постоянно'] == 1) & (row['Тип ставки'] == 'Ставка за час'):
+#         #         print('Не постоянно')
+#         # Диапазон до изменения ставки
+#         dates1 = pd.date_range(start=row['Месяц'],
+#                                end=row['Дата нового условия ставки (час)'] - pd.Timedelta(hours=1), freq='D')
+#         df1 = pd.DataFrame(dates1, columns=['Date'])
+#         df1['Worker id'] = row['Worker id']
+#         df1['Worker username'] = row['Worker username']
+#         df1['Worker nickname'] = row['Worker nickname']
+#         df1['Worker role'] = row['Worker role']
+#         df1['city'] = row['city']
+#         df1['Посменная зп'] = 0
+#
+#         # Диапазон после изменения ставки
+#         dates2 = pd.date_range(start=row['Дата нового условия ставки (час)'], end=row['Конец месяца'], freq='D')
+#         df2 = pd.DataFrame(dates2, columns=['Date'])
+#         df2['Worker id'] = row['Worker id']
+#         df2['Worker username'] = row['Worker username']
+#         df2['Worker nickname'] = row['Worker nickname']
+#         df2['Worker role'] = row['Worker role']
+#         df2['city'] = row['city']
+#         df2['Посменная зп'] = 0
+#         res_c = pd.concat([res_c, df1, df2], ignore_index=True)
+#
+# res_c['Месяц'] = res_c['Date'].apply(lambda x: x.strftime('%Y-%m-01'))
+# res_c['Месяц'] = pd.to_datetime(res_c['Месяц'], errors='coerce')
+# res_c['Date'] = pd.to_datetime(res_c['Date'], errors='coerce')
+# res_c['Worker id'] = res_c['Worker id'].astype(int)
+# res_c['Посменная зп'] = 0
+#
+# res_c = res_c.merge(df_c, on=['Date', 'Worker id', 'Worker nickname'])
+# res = pd.concat([res, res_c])
+#
+# df_for_workers['Date'] = pd.to_datetime(df_for_workers['Date'])
+# res['Date'] = pd.to_datetime(res['Date'])
+#
+# # Учет дат выезда_. Начало
+# df_vyezd = df_tabl_stavki[['Месяц', 'Worker id',
+#                            'Ставка за выезд в другие города', 'Дата выезда 1',
+#                            'Дата выезда 2', 'Дата выезда3', 'Дата выезда4', 'Дата выезда5']]
+#
+# df_vyezd = df_vyezd[df_vyezd['Ставка за выезд в другие города'].notna()]
+# df_vyezd['Ставка за выезд в другие города'] = df_vyezd['Ставка за выезд в другие города'].astype(float)
+# df_vyezd['Дата выезда 1'] = pd.to_datetime(df_vyezd['Дата выезда 1'], errors='coerce')
+# df_vyezd['Дата выезда 2'] = pd.to_datetime(df_vyezd['Дата выезда 2'], errors='coerce')
+# df_vyezd['Дата выезда3'] = pd.to_datetime(df_vyezd['Дата выезда3'], errors='coerce')
+# df_vyezd['Дата выезда4'] = pd.to_datetime(df_vyezd['Дата выезда4'], errors='coerce')
+# df_vyezd['Дата выезда5'] = pd.to_datetime(df_vyezd['Дата выезда5'], errors='coerce')
+#
+# for index, row in df_vyezd.iterrows():
+#     if not pd.isnull(df_vyezd.loc[index]['Дата выезда 1']):
+#         res.loc[(res['Worker id'] == df_vyezd.loc[index]['Worker id']) & \
+#                 (res['Date'] == df_vyezd.loc[index]['Дата выезда 1']), 'Ставка за час'] = \
+#             float(df_vyezd.loc[index]['Ставка за выезд в другие города'])
+#     if not pd.isnull(df_vyezd.loc[index]['Дата выезда 2']):
+#         res.loc[(res['Worker id'] == df_vyezd.loc[index]['Worker id']) & \
+#                 (res['Date'] == df_vyezd.loc[index]['Дата выезда 2']), 'Ставка за час'] = \
+#             float(df_vyezd.loc[index]['Ставка за выезд в другие города'])
+#     if not pd.isnull(df_vyezd.loc[index]['Дата выезда3']):
+#         res.loc[(res['Worker id'] == df_vyezd.loc[index]['Worker id']) & \
+#                 (res['Date'] == df_vyezd.loc[index]['Дата выезда3']), 'Ставка за час'] = \
+#             float(df_vyezd.loc[index]['Ставка за выезд в другие города'])
+#     if not pd.isnull(df_vyezd.loc[index]['Дата выезда4']):
+#         res.loc[(res['Worker id'] == df_vyezd.loc[index]['Worker id']) & \
+#                 (res['Date'] == df_vyezd.loc[index]['Дата выезда4']), 'Ставка за час'] = \
+#             float(df_vyezd.loc[index]['Ставка за выезд в другие города'])
+#     if not pd.isnull(df_vyezd.loc[index]['Дата выезда5']):
+#         res.loc[(res['Worker id'] == df_vyezd.loc[index]['Worker id']) & \
+#                 (res['Date'] == df_vyezd.loc[index]['Дата выезда5']), 'Ставка за час'] = \
+#             float(df_vyezd.loc[index]['Ставка за выезд в другие города'])
+#
+# res = df_for_workers.merge(res, on=['Месяц', 'Date', 'Worker id', 'Worker username', 'Worker nickname'], how='left')
+# res['Сдельная зп'] = res['Ставка за час'] * res['Actual working seconds'] / 3600
+#
+# res_workers_month = res.groupby(['Месяц', 'Worker id', 'Worker username', 'Worker nickname', 'Worker role', 'city']) \
+#     .agg({'Actual working seconds': 'sum',
+#           'Сдельная зп': 'sum', 'Посменная зп': 'sum'}) \
+#     .reset_index()
+# res_month['Actual worked seconds'] = 0
+# res_month['Сдельная зп'] = res_month['Сдельная зп'].astype(float)
+# res_month['Actual worked seconds'] = res_month['Actual worked seconds'].astype(float)
+# res_month['Worker id'] = res_month['Worker id'].astype(int)
+# res_month['Date'] = res_month['Месяц']
+# res_month['Actual start time'] = res_month['Месяц']
+# res_month['Actual finish time'] = res_month['Месяц']
+#
+#
+# df_zp = pd.concat([res, res_month]).fillna(0)
+#
+# res_for_workers = df_zp[['Месяц', 'Date', 'Worker id', 'Worker username', 'Worker nickname',
+#                          'Actual start time', 'Actual finish time', 'distance',
+#                          'Actual working seconds', 'Ставка за час']]
+#
+# # Очистка таблицы
+# truncate_t_bike = "TRUNCATE TABLE salary_outer_1 RESTART IDENTITY;"
+# with engine_postgresql.connect() as connection:
+#     with connection.begin() as transaction:
+#         print(f"Попытка очистить таблицу")
+#         # Очистка salary_inner
+#         connection.execute(sa.text(truncate_t_bike))
+#         # Если ошибок нет, транзакция фиксируется автоматически
+#         print(f"Таблица salary_outer_1 успешно очищена!")
+#
+# res_for_workers.to_sql("salary_outer_1", engine_postgresql, if_exists="append", index=False)
+# print('Таблица salary_outer_1 успешно обновлена!')
+#
+# df_zp_month = df_zp.groupby(['Месяц', 'Worker id', 'Worker username', 'Worker nickname'], as_index=False) \
+#     .agg({'distance': 'sum',
+#           'Actual working seconds': 'sum',
+#           'Посменная зп': 'sum',
+#           'Сдельная зп': 'sum',
+#           'Actual worked seconds': 'sum'})
+#
+# df = df_zp_month.merge(df_temp,
+#                        on=['Месяц', 'Worker id', 'Worker username', 'Worker nickname'],
+#                        how='right')
+# df = df[['Месяц', 'Worker id', 'Worker username', 'Worker nickname',
+#          'Worker role', 'city', 'Сдельная зп', 'Посменная зп',
+#          'Компенсация топлива', 'Зарядка АКБ', 'Работа на складе',
+#          'Бонус за работу на складе', 'Бонус за ремонт', 'Возмещаемые расходы',
+#          'Бонус приведи друга', 'Штраф', 'Аванс', 'Всего удержано', 'Офиц_зп',
+#          'Actual working seconds',
+#          'Actual worked seconds',
+#          'Количество отработанных часов', 'Ставка за час',
+#          'Ставка измененная за час', 'Дата нового условия ставки (час)',
+#          'Ставка за неделю', 'Ставка измененная за неделю',
+#          'Дата нового условия ставки (нед)', 'Ставка за месяц',
+#          'Норма рабочих часов за месяц', 'Ставка свыше нормы',
+#          'Количество отработанных часов свыше нормы',
+#          'Ставка измененная за месяц', 'Дата нового условия ставки (мес)',
+#          'Норма расхода топлива на 100 км, литры',
+#          'Цена топлива за 1 литр, евро', 'Количество часов работы на складе',
+#          'Общее количество заряженных батарей', 'Сумма1', 'Возмещаемые расходы1',
+#          'Сумма2', 'Возмещаемые расходы2', 'Сумма3', 'Возмещаемые расходы3',
+#          'Сумма4', 'официальная зп 1', 'Сумма5', 'официальная зп 2', 'Сумма6',
+#          'официальная зп 3', 'Сумма7', 'официальная зп 4',
+#          'Сумма8', 'Удерживаемые расходы1', 'Сумма9', 'Удерживаемые расходы2',
+#          'Сумма10', 'Удерживаемые расходы3',
+#          'id_invited_worker_nickname_бонусная_программа',
+#          'invited_worker_nickname_бонусная_программа',
+#          'Процент_от_зп_бонус_прогр',
+#          'Нач_дата_расч_бонуса_нов_сотр',
+#          'Оконч_дата_расч_бонус_нов_сотр',
+#          'Кол-во дней для расчета бонуса',
+#          'Конец месяца', 'Тип ставки',
+#          'Ставка за час постоянно']]
+#
+# df['Дата нового условия ставки (час)'] = df['Дата нового условия ставки (час)'].fillna(df['Месяц'])
+# df['Дата нового условия ставки (нед)'] = df['Дата нового условия ставки (нед)'].fillna(df['Месяц'])
+# df['Дата нового условия ставки (мес)'] = df['Дата нового условия ставки (мес)'].fillna(df['Месяц'])
+# df['Нач_дата_расч_бонуса_нов_сотр'] = df['Нач_дата_расч_бонуса_нов_сотр'].fillna(df['Месяц'])
+# df['Оконч_дата_расч_бонус_нов_сотр'] = df['Оконч_дата_расч_бонус_нов_сотр'].fillna(df['Месяц'])
+# df = df.round(2).fillna(0)
+#
+# # Бонусы за декады
+# select_decades_bonus = '''
+#     SELECT
+#         ds."month" AS "Месяц",
+#         ds."decade",
+#         ds."nomer_decada",
+#         ds."Worker id",
+#         ds."Nickname" AS "Worker nickname",
+#         CASE
+#             WHEN ds."Prediction minutes" >= 1440 AND ds."Prediction minutes" <= 1920
+#                 THEN
+#                     CASE
+#                         WHEN ds.min_eff >= 0.25 AND ds.min_eff < 0.35 THEN round((0.5 * ds."Prediction minutes" / 60)::NUMERIC, 2)
+#                         WHEN ds.min_eff >= 0.35 AND ds.min_eff < 0.4 THEN round((0.6 * ds."Prediction minutes" / 60)::NUMERIC, 2)
+#                         WHEN ds.min_eff >= 0.4 AND ds.min_eff < 0.5 THEN round((0.75 * ds."Prediction minutes" / 60)::NUMERIC, 2)
+#                         WHEN ds.min_eff >= 0.5 AND ds.min_eff < 0.6 THEN round((1 * ds."Prediction minutes" / 60)::NUMERIC, 2)
+#                         WHEN ds.min_eff >= 0.6 THEN round((2 * ds."Prediction minutes" / 60)::NUMERIC, 2)
+#                     END
+#             WHEN ds."Prediction minutes" > 1920 AND ds."Prediction minutes" <= 2880
+#                 THEN
+#                     CASE
+#                         WHEN ds.min_eff >= 0.25 AND ds.min_eff < 0.35 THEN round((0.6 * ds."Prediction minutes" / 60)::NUMERIC, 2)
+#                         WHEN ds.min_eff >= 0.35 AND ds.min_eff < 0.4 THEN round((0.7 * ds."Prediction minutes" / 60)::NUMERIC, 2)
+#                         WHEN ds.min_eff >= 0.4 AND ds.min_eff < 0.5 THEN round((1 * ds."Prediction minutes" / 60)::NUMERIC, 2)
+#                         WHEN ds.min_eff >= 0.5 AND ds.min_eff < 0.6 THEN round((1.25 * ds."Prediction minutes" / 60)::NUMERIC, 2)
+#                         WHEN ds.min_eff >= 0.6 THEN round((2.1 * ds."Prediction minutes" / 60)::NUMERIC, 2)
+#                     END
+#             WHEN ds."Prediction minutes" > 2880 AND ds."Prediction minutes" <= 3840
+#                 THEN
+#                     CASE
+#                         WHEN ds.min_eff >= 0.25 AND ds.min_eff < 0.35 THEN round((0.7 * ds."Prediction minutes" / 60)::NUMERIC, 2)
+#                         WHEN ds.min_eff >= 0.35 AND ds.min_eff < 0.4 THEN round((0.75 * ds."Prediction minutes" / 60)::NUMERIC, 2)
+#                         WHEN ds.min_eff >= 0.4 AND ds.min_eff < 0.5 THEN round((1 * ds."Prediction minutes" / 60)::NUMERIC, 2)
+#                         WHEN ds.min_eff >= 0.5 AND ds.min_eff < 0.6 THEN round((1.5 * ds."Prediction minutes" / 60)::NUMERIC, 2)
+#                         WHEN ds.min_eff >= 0.6 THEN round((2.25 * ds."Prediction minutes" / 60)::NUMERIC, 2)
+#                     END
+#             WHEN ds."Prediction minutes" > 3840
+#                 THEN
+#                     CASE
+#                         WHEN ds.min_eff >= 0.25 AND ds.min_eff < 0.35 THEN round((0.75 * ds."Prediction minutes" / 60)::NUMERIC, 2)
+#                         WHEN ds.min_eff >= 0.35 AND ds.min_eff < 0.4 THEN round((1 * ds."Prediction minutes" / 60)::NUMERIC, 2)
+#                         WHEN ds.min_eff >= 0.4 AND ds.min_eff < 0.5 THEN round((1.5 * ds."Prediction minutes" / 60)::NUMERIC, 2)
+#                         WHEN ds.min_eff >= 0.5 AND ds.min_eff < 0.6 THEN round((2 * ds."Prediction minutes" / 60)::NUMERIC, 2)
+#                         WHEN ds.min_eff >= 0.6 THEN round((2.5 * ds."Prediction minutes" / 60)::NUMERIC, 2)
+#                     END
+#             ELSE 0
+#         END AS bonus
+#     FROM
+#         (SELECT
+#             ds.*,
+#             CASE
+#                 WHEN ds."nomer_decada" IN (1,2) THEN
+#                     CASE
+#                         WHEN CURRENT_DATE - ds."decade" > 10 THEN ds."Actual duration (hours)" * 60
+#                         ELSE ds."Actual duration (hours)" * 60 / GREATEST(CURRENT_DATE - ds."decade", 1) * 10
+#                     END
+#                 WHEN ds."nomer_decada" IN (3) THEN
+#                     CASE
+#                         WHEN EXTRACT(MONTH FROM ds."decade") IN (1,3,5,7,8,10,12) THEN
+#                             CASE
+#                                 WHEN CURRENT_DATE - ds."decade" > 11 THEN ds."Actual duration (hours)" * 60
+#                                 ELSE ds."Actual duration (hours)" * 60 / GREATEST(CURRENT_DATE - ds."decade", 1) * ds."kol_vo_dney_3_decada"
+#                             END
+#                         WHEN EXTRACT(MONTH FROM ds."decade") IN (4,6,9,11) THEN
+#                             CASE
+#                                 WHEN CURRENT_DATE - ds."decade" > 10 THEN ds."Actual duration (hours)" * 60
+#                                 ELSE ds."Actual duration (hours)" * 60 / GREATEST(CURRENT_DATE - ds."decade", 1) * ds."kol_vo_dney_3_decada"
+#                             END
+#                         WHEN EXTRACT(MONTH FROM ds."decade") IN (2) THEN
+#                             CASE
+#                                 WHEN CURRENT_DATE - ds."decade" > 8 THEN ds."Actual duration (hours)" * 60
+#                                 ELSE ds."Actual duration (hours)" * 60 / GREATEST(CURRENT_DATE - ds."decade", 1) * ds."kol_vo_dney_3_decada"
+#                             END
+#                     END
+#             END AS "Prediction minutes"
+#         FROM
+#             (
+#             SELECT
+#                 ds."month",
+#                 ds."decade",
+#                 ds."nomer_decada",
+#                 ds."kol_vo_dney_3_decada",
+#                 ds."Worker id",
+#                 ds."Nickname",
+#                 SUM(ds."Actual duration (hours)") * 60 AS "Actual minutes",
+#                 SUM(ds."Actual duration (hours)") AS "Actual duration (hours)",
+#                 ROUND((SUM(ds."Minutes") / NULLIF(SUM(ds."Actual duration (hours)"), 0))::numeric / 60, 2) AS "min_eff"
+#             FROM
+#                 (
+#                 SELECT
+#                     date_trunc('month', ds."Date") :: date AS "month",
+#                     ds.*,
+#                     (CONCAT(EXTRACT(YEAR FROM "Date"), '-',
+#                             EXTRACT(MONTH FROM "Date"), '-',
+#                             CASE
+#                                 WHEN EXTRACT(DAY FROM "Date") <= 10 THEN 1
+#                                 WHEN EXTRACT(DAY FROM "Date") <= 20 THEN 11
+#                                 ELSE 21
+#                             END
+#                     )) :: date AS decade,
+#                     CASE
+#                         WHEN EXTRACT(DAY FROM "Date") <= 10 THEN 1
+#                         WHEN EXTRACT(DAY FROM "Date") <= 20 THEN 2
+#                         WHEN EXTRACT(DAY FROM "Date") <= 31 THEN 3
+#                     END AS "nomer_decada",
+#                     CASE
+#                         WHEN EXTRACT(MONTH FROM "Date") IN (1,3,5,7,8,10,12) THEN 11
+#                         WHEN EXTRACT(MONTH FROM "Date") IN (4,6,9,11) THEN 10
+#                         ELSE 8
+#                     END AS "kol_vo_dney_3_decada"
+#                 FROM public.daily_shifts ds
+#                 WHERE "Date" >= '2025-08-01'
+#                 ) ds
+#             GROUP BY ds."month", ds."decade", ds."nomer_decada", ds."kol_vo_dney_3_decada", ds."Worker id", ds."Nickname"
+#             ) ds
+#         ORDER BY ds."decade", ds."Nickname") ds
+# '''
+#
+# df_decades_bonus_temp = pd.read_sql(select_decades_bonus, engine_postgresql).fillna(0)
+# df_decades_bonus = df_decades_bonus_temp.pivot_table(index=['Месяц', 'Worker id', 'Worker nickname'],
+#                                                      columns='nomer_decada',
+#                                                      values='bonus') \
+#     .reset_index().fillna(0) \
+#     .rename(columns={1: 'Бонус за 1 декаду',
+#                      2: 'Бонус за 2 декаду',
+#                      3: 'Бонус за 3 декаду'})
+# df_decades_bonus['Месяц'] = pd.to_datetime(df_decades_bonus['Месяц'], errors='coerce')
+# df1 = df.merge(df_decades_bonus, on=['Месяц', 'Worker id', 'Worker nickname'], how='left')
+#
+# # Бонусы за месяц
+# select_month_bonus = '''
+#     SELECT
+#         ds."month" AS "Месяц",
+#         ds."Worker id",
+#         ds."Nickname" AS "Worker nickname",
+#         -- ds."rn",
+#         CASE
+#             WHEN ds."rn" = 1 THEN 100
+#             WHEN ds."rn" = 2 THEN 75
+#             WHEN ds."rn" IN (3,4,5) THEN 50
+#         END AS "Бонус за месяц"
+#     FROM
+#         (
+#         SELECT
+#             ds.*,
+#             rank() OVER (PARTITION BY ds."month" ORDER BY ds."min_eff" DESC) AS rn
+#         FROM
+#             (SELECT
+#                 ds.*,
+#                 CASE
+#                     WHEN EXTRACT(MONTH FROM ds."month") IN (1,3,5,7,8,10,12) THEN
+#                         CASE
+#                             WHEN CURRENT_DATE - ds."month" > 31 THEN ds."Actual duration (hours)" * 60
+#                             ELSE ds."Actual duration (hours)" * 60 / GREATEST(CURRENT_DATE - ds."month", 1) * ds."kol_vo_dney_month"
+#                         END
+#                     WHEN EXTRACT(MONTH FROM ds."month") IN (4,6,9,11) THEN
+#                         CASE
+#                             WHEN CURRENT_DATE - ds."month" > 30 THEN ds."Actual duration (hours)" * 60
+#                             ELSE ds."Actual duration (hours)" * 60 / GREATEST(CURRENT_DATE - ds."month", 1) * ds."kol_vo_dney_month"
+#                         END
+#                     WHEN EXTRACT(MONTH FROM ds."month") IN (2) THEN
+#                         CASE
+#                             WHEN CURRENT_DATE - ds."month" > 28 THEN ds."Actual duration (hours)" * 60
+#                             ELSE ds."Actual duration (hours)" * 60 / GREATEST(CURRENT_DATE - ds."month", 1) * ds."kol_vo_dney_month"
+#                         END
+#                 END AS "Prediction minutes"
+#             FROM
+#                 (SELECT
+#                     ds."month",
+#                     ds."kol_vo_dney_month",
+#                     ds."Worker id",
+#                     ds."Nickname",
+#                     SUM(ds."Actual duration (hours)") * 60 AS "Actual minutes",
+#                     SUM(ds."Actual duration (hours)") AS "Actual duration (hours)",
+#                     ROUND((SUM(ds."Minutes") / NULLIF(SUM(ds."Actual duration (hours)"), 0) / 60)::numeric, 2) AS "min_eff"
+#                 FROM
+#                     (SELECT
+#                         date_trunc('month', ds."Date") :: date AS "month",
+#                         CASE
+#                             WHEN EXTRACT(MONTH FROM "Date") IN (1,3,5,7,8,10,12) THEN 31
+#                             WHEN EXTRACT(MONTH FROM "Date") IN (4,6,9,11) THEN 30
+#                             ELSE 28
+#                         END AS "kol_vo_dney_month",
+#                         ds.*
+#                     FROM daily_shifts ds
+#                     WHERE "Date" >= '2025-08-01') AS ds
+#                 GROUP BY ds."month", ds."kol_vo_dney_month", ds."Worker id", ds."Nickname"
+#                 ) ds
+#             ) ds
+#         WHERE ds."Prediction minutes" > 4000
+#         ORDER BY ds."min_eff" DESC
+#         ) ds
+#     WHERE rn <= 5
+# '''
+#
+# df_month_bonus_temp = pd.read_sql(select_month_bonus, engine_postgresql).fillna(0)
+# df_month_bonus_temp['Месяц'] = pd.to_datetime(df_month_bonus_temp['Месяц'], errors='coerce')
+#
+# df_res = df1.merge(df_month_bonus_temp, on=['Месяц', 'Worker id', 'Worker nickname'], how='left').fillna(0)
+# df_res['add_time'] = pd.Timestamp.now() + pd.Timedelta(hours=3)
+#
+# # Очистка таблицы
+# truncate_t_bike = "TRUNCATE TABLE salary_inner RESTART IDENTITY;"
+#
+# with engine_postgresql.connect() as connection:
+#     with connection.begin() as transaction:
+#         print(f"Попытка очистить таблицу")
+#         # Очистка salary_inner
+#         connection.execute(sa.text(truncate_t_bike))
+#         # Если ошибок нет, транзакция фиксируется автоматически
+#         print(f"Таблица salary_inner успешно очищена!")
+#
+# df_res.to_sql("salary_inner", engine_postgresql, if_exists="append", index=False)
+# print('Таблица salary_inner успешно обновлена!')
+#
+# # Расчет зп. Конец 30.09.2025
+
+
+def update_checkups_history(engine_mysql, engine_postgresql):
     # История чекапов. Начало
     select_checkups_history = r'''
         WITH work_tab AS (
@@ -2754,7 +2297,7 @@ def main():
                             to_timestamp(tbu.start_time) >= '2024-07-21'
                             AND 
                             tbu.ride_status!=5
-                            AND tbu.uid NOT IN (52536,58249,72860,37592,63824,49704,54187,70354,70408,49618,72907,70404,44902,45094)
+                            AND tbu.uid IS NOT NULL AND NOT EXISTS (SELECT 1 FROM excluded_test_users etu WHERE etu.uid = tbu.uid)
                         GROUP BY tb.id, tb.release_time, tb.model, tb."number", tc."name"
                     ) AS rides ON tb_all.id = rides.id 
             LEFT JOIN damir.t_city tc ON tb_all.city_id = tc.id
@@ -2793,7 +2336,7 @@ def main():
                             to_timestamp(tbu.start_time) >= '2024-07-21'
                             AND 
                             tbu.ride_status!=5
-                            AND tbu.uid NOT IN (52536,58249,72860,37592,63824,49704,54187,70354,70408,49618,72907,70404,44902,45094)
+                            AND tbu.uid IS NOT NULL AND NOT EXISTS (SELECT 1 FROM excluded_test_users etu WHERE etu.uid = tbu.uid)
                         GROUP BY tb.id, tb.release_time, tb.model, tb."number", tc."name"
                     ) AS rides ON tb_all.id = rides.id 
             LEFT JOIN damir.t_city tc ON tb_all.city_id = tc.id
@@ -2877,13 +2420,15 @@ def main():
             ) AS completed_tab ON target_tab."City" = completed_tab."City"
     '''
 
-    df_checkups_history = pd.read_sql(select_checkups_history, engine_postgresql)
+    df_checkups_history = extract_sql(select_checkups_history, engine_postgresql)
 
-    df_checkups_history.to_sql("checkups_history", engine_postgresql, if_exists="append", index=False)
+    copy_dataframe_to_postgres(df_checkups_history, "checkups_history", engine_postgresql)
 
     print('Added {x} records to checkups_history in Postgres!'.format(x=df_checkups_history.shape[0]))
     # История чекапов. Конец
 
+
+def update_today_checkup_scooters(engine_mysql, engine_postgresql):
     # Процент исполнения чекапов. Начало
     # Выгрузка старых чекапов
     select_old_checkups = '''
@@ -2893,7 +2438,7 @@ def main():
         FROM damir.today_checkup_scooters tcs
     '''
 
-    df_old_checkups = pd.read_sql(select_old_checkups, engine_postgresql)
+    df_old_checkups = extract_sql(select_old_checkups, engine_postgresql)
     df_old_checkups['add_time'] = pd.to_datetime(df_old_checkups['add_time'])
     df_old_checkups['current_date'] = pd.to_datetime(df_old_checkups['current_date'])
     df_old_checkups['release_time'] = pd.to_datetime(df_old_checkups['release_time'])
@@ -2934,7 +2479,7 @@ def main():
                             to_timestamp(tbu.start_time) >= '2024-07-21'
                             AND 
                             tbu.ride_status!=5
-                            AND tbu.uid NOT IN (52536,58249,72860,37592,63824,49704,54187,70354,70408,49618,72907,70404,44902,45094)
+                            AND tbu.uid IS NOT NULL AND NOT EXISTS (SELECT 1 FROM excluded_test_users etu WHERE etu.uid = tbu.uid)
                         GROUP BY tb.id, tb.release_time, tb.model, tb."number", tc."name"
                     ) AS rides ON tb_all.id = rides.id 
             LEFT JOIN damir.t_city tc ON tb_all.city_id = tc.id
@@ -2961,7 +2506,7 @@ def main():
         ORDER BY coalesce(number_of_rides.number_of_rides,0) DESC
     '''
 
-    df_new_checkups = pd.read_sql(select_new_checkups, engine_postgresql)
+    df_new_checkups = extract_sql(select_new_checkups, engine_postgresql)
     df_new_checkups['add_time'] = pd.to_datetime(df_new_checkups['add_time'])
     df_new_checkups['add_time'] = df_new_checkups['add_time'].dt.tz_localize(None)
     df_new_checkups['current_date'] = pd.to_datetime(df_new_checkups['current_date'])
@@ -2978,25 +2523,14 @@ def main():
     df_temp.drop_duplicates(subset=['Scooter ID'], inplace=True)
     df_temp.drop(columns=['current_date'], inplace=True)
 
-    # Очистка today_checkup_scooters
-
-    # Очистка таблицы
-    truncate_t_bike = "TRUNCATE TABLE today_checkup_scooters RESTART IDENTITY;"
-
-    with engine_postgresql.connect() as connection:
-        with connection.begin() as transaction:
-            print(f"Попытка очистить таблицу")
-            # Очистка grafik_rabot_google
-            connection.execute(sa.text(truncate_t_bike))
-            # Если ошибок нет, транзакция фиксируется автоматически
-            print(f"Таблица today_checkup_scooters успешно очищена!")
-
-    # Загрузка обновленного списка чекапов
-    df_temp.to_sql("today_checkup_scooters", engine_postgresql, if_exists="append", index=False)
+    # Замена содержимого таблицы
+    replace_table_contents(df_temp, "today_checkup_scooters", engine_postgresql)
     print('Таблица today_checkup_scooters успешно обновлена!')
 
     # Процент исполнения чекапов. Конец
 
+
+def update_t_area(engine_mysql, engine_postgresql):
     # Обновление t_area в Postgresql. Начало
     # Копирую t_area
     select_t_area = '''
@@ -3026,23 +2560,15 @@ def main():
         FROM shamri.t_area ta
     '''
 
-    df_t_area = pd.read_sql(select_t_area, engine_mysql)
-
-    # Очистка таблицы
-    truncate_t_bike = "TRUNCATE TABLE t_area RESTART IDENTITY;"
+    df_t_area = extract_sql(select_t_area, engine_mysql)
 
-    with engine_postgresql.connect() as connection:
-        with connection.begin() as transaction:
-            print(f"Попытка очистить таблицу")
-            # Очистка t_area
-            connection.execute(sa.text(truncate_t_bike))
-            # Если ошибок нет, транзакция фиксируется автоматически
-            print(f"Таблица t_area успешно очищена!")
-
-    df_t_area.to_sql("t_area", engine_postgresql, if_exists="append", index=False)
+    # Замена содержимого таблицы
+    replace_table_contents(df_t_area, "t_area", engine_postgresql)
     print('Таблица t_area успешно обновлена!')
     # Обновление t_area в Postgresql. Конец
 
+
+def update_t_areas_parkings(engine_mysql, engine_postgresql):
     # Обновление t_areas_parkings в Postgresql. Начало
     select_active_parkings = '''
         SELECT 
@@ -3053,7 +2579,7 @@ def main():
         WHERE ta.active = 1
             AND ta.detail != ''
     '''
-    df_active_parkings = pd.read_sql(select_active_parkings, engine_postgresql)
+    df_active_parkings = extract_sql(select_active_parkings, engine_postgresql)
     select_areas = '''
         SELECT
             ta.id AS area_id ,
@@ -3062,36 +2588,28 @@ def main():
         FROM damir.t_area ta
         WHERE ta."name" LIKE '%%| Area |%%'
     '''
-    df_areas = pd.read_sql(select_areas, engine_postgresql)
+    df_areas = extract_sql(select_areas, engine_postgresql)
 
     # Декодирование полигонов
     df_active_parkings['parking_detail_tuple'] = df_active_parkings['parking_detail'].apply(decode_polyline_to_tuples)
     df_areas['area_detail_tuple'] = df_areas['area_detail'].apply(decode_polyline_to_tuples)
 
-    # Соединение areas и parkings
-    df_areas_parkings = df_active_parkings[['parking_id', 'parking_name', 'parking_detail_tuple']] \
-        .merge(df_areas[['area_id', 'area_name', 'area_detail_tuple']], how='cross')
-    df_areas_parkings['res'] = df_areas_parkings.apply(poly_contains, axis=1)
-    df_areas_parkings['add_time'] = pd.Timestamp.now()
-    res = df_areas_parkings[df_areas_parkings['res'] == True]
-    res = res[['add_time', 'area_id', 'area_name', 'parking_id', 'parking_name']]
+    # Пары area-parking, где area содержит parking: STRtree по зонам вместо cross merge
+    parking_idx, area_idx = areas_containing_polygons(polygons_from_tuples(df_areas['area_detail_tuple']),
+                                                      polygons_from_tuples(df_active_parkings['parking_detail_tuple']))
+    res = pd.concat([df_areas[['area_id', 'area_name']].iloc[area_idx].reset_index(drop=True),
+                     df_active_parkings[['parking_id', 'parking_name']].iloc[parking_idx].reset_index(drop=True)],
+                    axis=1)
+    res.insert(0, 'add_time', pd.Timestamp.now())
 
-    # Очистка таблицы t_areas_parkings
-    truncate_t_areas_parkings = "TRUNCATE TABLE t_areas_parkings RESTART IDENTITY;"
-    with engine_postgresql.connect() as connection:
-        with connection.begin() as transaction:
-            print(f"Попытка очистить таблицу")
-            # Очистка t_areas_parkings
-            connection.execute(sa.text(truncate_t_areas_parkings))
-            # Если ошибок нет, транзакция фиксируется автоматически
-            print(f"Таблица truncate_t_areas_parkings успешно очищена!")
-
-    res.to_sql("t_areas_parkings", engine_postgresql, if_exists="append", index=False)
+    # Замена содержимого таблицы
+    replace_table_contents(res, "t_areas_parkings", engine_postgresql)
     print('Таблица t_areas_parkings успешно обновлена!')
 
     # Обновление t_areas_parkings в Postgresql. Конец
 
 
+def update_t_parking_stats(engine_mysql, engine_postgresql):
     # Обновление t_parking_stats в Postgresql. Начало
 
     # id последней поездки(заказа)
@@ -3101,297 +2619,64 @@ def main():
         FROM damir.t_orders t
     '''
 
-    df_max_id_order = pd.read_sql(select_max_id_order, engine_postgresql)
+    df_max_id_order = extract_sql(select_max_id_order, engine_postgresql)
     max_id_order = int(df_max_id_order.iloc[0].iloc[0])
 
-    select_fresh_parking_stats = '''
-    WITH t_res AS 
-    (
+    # Поездки только выбираются из Postgres; ближайшая парковка ищется в Python
+    select_fresh_rides = '''
         SELECT 
             tbu.id ,
             tbu.start_lat ,
             tbu.start_lng ,
             tbu.end_lat ,
-            tbu.end_lng ,
-            ta.lat AS  area_lat,
-            ta.lng AS area_lng ,
-            ta.city_id ,
-            ta.name AS area,
-            ta.id AS area_id ,
-                6371000 * acos(
-                cos(radians(tbu.start_lat)) * 
-                cos(radians(ta.lat)) * 
-                cos(radians(ta.lng) - radians(tbu.start_lng)) + 
-                sin(radians(tbu.start_lat)) * 
-                sin(radians(ta.lat))
-            ) AS start_distance ,
-                6371000 * acos(
-                cos(radians(tbu.end_lat)) * 
-                cos(radians(ta.lat)) * 
-                cos(radians(ta.lng) - radians(tbu.end_lng)) + 
-                sin(radians(tbu.end_lat)) * 
-                sin(radians(ta.lat))
-            ) AS end_distance ,
-            rank() OVER (PARTITION BY tbu.id ORDER BY 6371000 * acos(
-                                                                    cos(radians(tbu.start_lat)) * 
-                                                                    cos(radians(ta.lat)) * 
-                                                                    cos(radians(ta.lng) - radians(tbu.start_lng)) + 
-                                                                    sin(radians(tbu.start_lat)) * 
-                                                                    sin(radians(ta.lat))
-                                                                )) AS rn_start_distance	,
-            rank() OVER (PARTITION BY tbu.id ORDER BY 6371000 * acos(
-                                                            cos(radians(tbu.end_lat)) * 
-                                                            cos(radians(ta.lat)) * 
-                                                            cos(radians(ta.lng) - radians(tbu.end_lng)) + 
-                                                            sin(radians(tbu.end_lat)) * 
-                                                            sin(radians(ta.lat))
-                                                        )) AS rn_end_distance	
+            tbu.end_lng
         FROM damir.t_bike_use tbu
-        CROSS JOIN damir.t_area ta 
         WHERE tbu.ride_status != 5
-            AND ta.active = 1
-            AND tbu.uid NOT IN (52536,58249,72860,37592,63824,49704,54187,70354,70408,49618,72907,70404,44902,45094)
+            AND tbu.uid IS NOT NULL AND NOT EXISTS (SELECT 1 FROM excluded_test_users etu WHERE etu.uid = tbu.uid)
             AND tbu.id > {max_id_order}
-            )
-    SELECT 
-        NOW() + INTERVAL '3 hours' AS add_time ,
-        COALESCE(t_starts_res.city_id, t_ends_res.city_id) AS city_id ,
-        COALESCE(t_starts_res.area , t_ends_res.area) AS parking_name ,
-        COALESCE(t_starts_res.area_id , t_ends_res.area_id) AS parking_id ,
-        COALESCE(t_ends_res.count_end_under_15m, 0) AS count_end_under_15m ,
-        COALESCE(t_ends_res.count_end_under_15m_50m, 0) AS count_end_under_15m_50m ,
-        COALESCE(t_ends_res.count_end_more_50m, 0) AS count_end_more_50m ,
-        COALESCE(t_starts_res.count_start_under_15m, 0) AS count_start_under_15m ,
-        COALESCE(t_starts_res.count_start_under_15m_50m, 0) AS count_start_under_15m_50m ,
-        COALESCE(t_starts_res.count_start_more_50m , 0) AS count_start_more_50m ,
-        COALESCE(t_instant.instant_scooter_count_under_15m, 0) AS instant_scooter_count_under_15m,
-        COALESCE(t_instant.instant_scooter_count_under_15m_50m, 0) AS instant_scooter_count_under_15m_50m,
-        COALESCE(t_instant.instant_scooter_count_end_more_50m, 0) AS instant_scooter_count_end_more_50m
-    FROM
-        (
-            SELECT
-                t_res.city_id ,
-                t_res.area ,
-                t_res.area_id ,
-                COUNT(t_res.id) FILTER (WHERE t_res.start_distance <= 15) AS count_start_under_15m ,
-                COUNT(t_res.id) FILTER (WHERE (t_res.start_distance > 15 AND t_res.start_distance <= 50)) AS count_start_under_15m_50m ,
-                COUNT(t_res.id) FILTER (WHERE t_res.start_distance > 50) AS count_start_more_50m
-            FROM t_res
-            WHERE t_res.rn_start_distance = 1
-            GROUP BY t_res.city_id , t_res.area , t_res.area_id
-        ) AS t_starts_res
-    FULL JOIN 
-        (
-            SELECT
-                t_res.city_id ,
-                t_res.area ,
-                t_res.area_id ,
-                COUNT(t_res.id) FILTER (WHERE t_res.end_distance <= 15) AS count_end_under_15m ,
-                COUNT(t_res.id) FILTER (WHERE (t_res.end_distance > 15 AND t_res.end_distance <= 50)) AS count_end_under_15m_50m ,
-                COUNT(t_res.id) FILTER (WHERE t_res.end_distance > 50) AS count_end_more_50m
-            FROM t_res
-            WHERE t_res.rn_end_distance = 1
-            GROUP BY t_res.city_id , t_res.area , t_res.area_id
-        ) AS t_ends_res ON t_starts_res.city_id = t_ends_res.city_id AND t_starts_res."area" = t_ends_res."area" AND t_starts_res.area_id = t_ends_res.area_id
-    LEFT JOIN 
-        (
+    '''.format(max_id_order=max_id_order)
+    select_add_time = "SELECT NOW() + INTERVAL '3 hours' AS add_time"
+    select_areas_parkings = '''
         SELECT 
-            t.city_id ,
-            t.area AS parking_name ,
-            t.area_id AS parking_id ,
-            COUNT(t.id) FILTER (WHERE t.distance <= 15) AS instant_scooter_count_under_15m ,
-            COUNT(t.id) FILTER (WHERE (t.distance > 15 AND t.distance <= 50)) AS instant_scooter_count_under_15m_50m ,
-            COUNT(t.id) FILTER (WHERE t.distance > 50) AS instant_scooter_count_end_more_50m
-        FROM 
-            (
-            SELECT 
-                tb.id ,
-                tb."number" ,
-                tb.g_lat ,
-                tb.g_lng ,
-                ta.lat AS  area_lat,
-                ta.lng AS area_lng ,
-                ta.city_id ,
-                ta.name AS area,
-                ta.id AS area_id ,
-                    6371000 * acos(
-                        cos(radians(tb.g_lat)) * 
-                        cos(radians(ta.lat)) * 
-                        cos(radians(ta.lng) - radians(tb.g_lng)) + 
-                        sin(radians(tb.g_lat)) * 
-                        sin(radians(ta.lat))) AS distance ,
-                rank() OVER (PARTITION BY tb.id ORDER BY 6371000 * acos(
-                                                                    cos(radians(tb.g_lat)) * 
-                                                                    cos(radians(ta.lat)) * 
-                                                                    cos(radians(ta.lng) - radians(tb.g_lng)) + 
-                                                                    sin(radians(tb.g_lat)) * 
-                                                                    sin(radians(ta.lat)))) AS rn
-            FROM damir.t_bike tb
-            CROSS JOIN damir.t_area ta
-            WHERE tb.error_status IN (0,7)
-                AND TO_TIMESTAMP(tb.g_time) > NOW() - INTERVAL '900 seconds' 
-                AND TO_CHAR(TO_TIMESTAMP(tb.heart_time), 'YYYY-MM-DD') = TO_CHAR(NOW(), 'YYYY-MM-DD')
-                AND tb.status != 1
-                AND ta.active = 1
-                ) AS t
-        WHERE t.rn = 1
-        GROUP BY t.city_id , t.area , t.area_id
-        ) AS t_instant ON COALESCE(t_starts_res.city_id, t_ends_res.city_id) = t_instant.city_id 
-                        AND COALESCE(t_starts_res.area , t_ends_res.area) = t_instant.parking_name 
-                        AND COALESCE(t_starts_res.area_id , t_ends_res.area_id) = t_instant.parking_id
-            '''.format(max_id_order=max_id_order)
+            tap.parking_id ,
+            tap.area_id ,
+            tap.area_name
+        FROM damir.t_areas_parkings tap
+    '''
 
-    df_fresh_parking_stats = pd.read_sql(select_fresh_parking_stats, engine_postgresql)
-    df_fresh_parking_stats.replace('', '0').to_sql("t_parking_stats", engine_postgresql, if_exists="append",
-                                                   index=False)
+    df_fresh_rides = extract_sql(select_fresh_rides, engine_postgresql)
+    # Мгновенные самокаты берутся из снимка t_bike этого запуска, а не из таблицы damir.t_bike
+    df_instant_scooters = instant_scooters(get_fleet_snapshot(engine_mysql))
+    add_time = extract_sql(select_add_time, engine_postgresql)['add_time'].iloc[0]
+    parking_index = load_parking_index(engine_postgresql)
+
+    # Старты и финиши считаются по ближайшей парковке (FULL JOIN), мгновенные самокаты - LEFT JOIN к ним
+    starts = count_by_distance(*nearest_parking(parking_index, df_fresh_rides['start_lat'], df_fresh_rides['start_lng']),
+                               ('count_start_under_15m', 'count_start_under_15m_50m', 'count_start_more_50m'))
+    ends = count_by_distance(*nearest_parking(parking_index, df_fresh_rides['end_lat'], df_fresh_rides['end_lng']),
+                             ('count_end_under_15m', 'count_end_under_15m_50m', 'count_end_more_50m'))
+    instant = count_by_distance(*nearest_parking(parking_index, df_instant_scooters['g_lat'], df_instant_scooters['g_lng']),
+                                ('instant_scooter_count_under_15m', 'instant_scooter_count_under_15m_50m',
+                                 'instant_scooter_count_end_more_50m'))
+    counts = ends.join(starts, how='outer').join(instant, how='left').fillna(0).astype('int64')
+
+    parkings = parking_index['parkings'].iloc[counts.index]
+    df_fresh_parking_stats = pd.concat([parkings[['city_id', 'parking_name', 'parking_id']].reset_index(drop=True),
+                                        counts.reset_index(drop=True)], axis=1)
+    df_fresh_parking_stats.insert(0, 'add_time', add_time)
+
+    copy_dataframe_to_postgres(df_fresh_parking_stats.replace('', '0'), "t_parking_stats", engine_postgresql)
     print('Added {x} records to t_parking_stats in Postgres!'.format(x=df_fresh_parking_stats.shape[0]))
 
 
-    #
-    select_fresh_parking_stats1 = '''
-        WITH t_res AS 
-        (
-            SELECT 
-                tbu.id ,
-                tbu.start_lat ,
-                tbu.start_lng ,
-                tbu.end_lat ,
-                tbu.end_lng ,
-                ta.lat AS  area_lat,
-                ta.lng AS area_lng ,
-                ta.city_id ,
-                ta.name AS area,
-                ta.id AS area_id ,
-                    6371000 * acos(
-                    cos(radians(tbu.start_lat)) * 
-                    cos(radians(ta.lat)) * 
-                    cos(radians(ta.lng) - radians(tbu.start_lng)) + 
-                    sin(radians(tbu.start_lat)) * 
-                    sin(radians(ta.lat))
-                ) AS start_distance ,
-                    6371000 * acos(
-                    cos(radians(tbu.end_lat)) * 
-                    cos(radians(ta.lat)) * 
-                    cos(radians(ta.lng) - radians(tbu.end_lng)) + 
-                    sin(radians(tbu.end_lat)) * 
-                    sin(radians(ta.lat))
-                ) AS end_distance ,
-                rank() OVER (PARTITION BY tbu.id ORDER BY 6371000 * acos(
-                                                                        cos(radians(tbu.start_lat)) * 
-                                                                        cos(radians(ta.lat)) * 
-                                                                        cos(radians(ta.lng) - radians(tbu.start_lng)) + 
-                                                                        sin(radians(tbu.start_lat)) * 
-                                                                        sin(radians(ta.lat))
-                                                                    )) AS rn_start_distance	,
-                rank() OVER (PARTITION BY tbu.id ORDER BY 6371000 * acos(
-                                                                cos(radians(tbu.end_lat)) * 
-                                                                cos(radians(ta.lat)) * 
-                                                                cos(radians(ta.lng) - radians(tbu.end_lng)) + 
-                                                                sin(radians(tbu.end_lat)) * 
-                                                                sin(radians(ta.lat))
-                                                            )) AS rn_end_distance	
-            FROM damir.t_bike_use tbu
-            CROSS JOIN damir.t_area ta 
-            WHERE tbu.ride_status != 5
-                AND ta.active = 1
-                AND tbu.uid NOT IN (52536,58249,72860,37592,63824,49704,54187,70354,70408,49618,72907,70404,44902,45094)
-                AND tbu.id > {max_id_order}
-                )
-        SELECT 
-            NOW() + INTERVAL '3 hours' AS add_time ,
-            COALESCE(t_starts_res.city_id, t_ends_res.city_id) AS city_id ,
-            COALESCE(tap.area_id, 0) AS area_id ,
-            COALESCE(tap.area_name, '0') AS area_name ,
-            COALESCE(t_starts_res.area , t_ends_res.area) AS parking_name ,
-            COALESCE(t_starts_res.area_id , t_ends_res.area_id) AS parking_id ,
-            COALESCE(t_ends_res.count_end_under_15m, 0) AS count_end_under_15m ,
-            COALESCE(t_ends_res.count_end_under_15m_50m, 0) AS count_end_under_15m_50m ,
-            COALESCE(t_ends_res.count_end_more_50m, 0) AS count_end_more_50m ,
-            COALESCE(t_starts_res.count_start_under_15m, 0) AS count_start_under_15m ,
-            COALESCE(t_starts_res.count_start_under_15m_50m, 0) AS count_start_under_15m_50m ,
-            COALESCE(t_starts_res.count_start_more_50m , 0) AS count_start_more_50m ,
-            COALESCE(t_instant.instant_scooter_count_under_15m, 0) AS instant_scooter_count_under_15m,
-            COALESCE(t_instant.instant_scooter_count_under_15m_50m, 0) AS instant_scooter_count_under_15m_50m,
-            COALESCE(t_instant.instant_scooter_count_end_more_50m, 0) AS instant_scooter_count_end_more_50m
-        FROM
-            (
-                SELECT
-                    t_res.city_id ,
-                    t_res.area ,
-                    t_res.area_id ,
-                    COUNT(t_res.id) FILTER (WHERE t_res.start_distance <= 15) AS count_start_under_15m ,
-                    COUNT(t_res.id) FILTER (WHERE (t_res.start_distance > 15 AND t_res.start_distance <= 50)) AS count_start_under_15m_50m ,
-                    COUNT(t_res.id) FILTER (WHERE t_res.start_distance > 50) AS count_start_more_50m
-                FROM t_res
-                WHERE t_res.rn_start_distance = 1
-                GROUP BY t_res.city_id , t_res.area , t_res.area_id
-            ) AS t_starts_res
-        FULL JOIN 
-            (
-                SELECT
-                    t_res.city_id ,
-                    t_res.area ,
-                    t_res.area_id ,
-                    COUNT(t_res.id) FILTER (WHERE t_res.end_distance <= 15) AS count_end_under_15m ,
-                    COUNT(t_res.id) FILTER (WHERE (t_res.end_distance > 15 AND t_res.end_distance <= 50)) AS count_end_under_15m_50m ,
-                    COUNT(t_res.id) FILTER (WHERE t_res.end_distance > 50) AS count_end_more_50m
-                FROM t_res
-                WHERE t_res.rn_end_distance = 1
-                GROUP BY t_res.city_id , t_res.area , t_res.area_id
-            ) AS t_ends_res ON t_starts_res.city_id = t_ends_res.city_id AND t_starts_res."area" = t_ends_res."area" AND t_starts_res.area_id = t_ends_res.area_id
-        LEFT JOIN 
-            (
-            SELECT 
-                t.city_id ,
-                t.area AS parking_name ,
-                t.area_id AS parking_id ,
-                COUNT(t.id) FILTER (WHERE t.distance <= 15) AS instant_scooter_count_under_15m ,
-                COUNT(t.id) FILTER (WHERE (t.distance > 15 AND t.distance <= 50)) AS instant_scooter_count_under_15m_50m ,
-                COUNT(t.id) FILTER (WHERE t.distance > 50) AS instant_scooter_count_end_more_50m
-            FROM 
-                (
-                SELECT 
-                    tb.id ,
-                    tb."number" ,
-                    tb.g_lat ,
-                    tb.g_lng ,
-                    ta.lat AS  area_lat,
-                    ta.lng AS area_lng ,
-                    ta.city_id ,
-                    ta.name AS area,
-                    ta.id AS area_id ,
-                        6371000 * acos(
-                            cos(radians(tb.g_lat)) * 
-                            cos(radians(ta.lat)) * 
-                            cos(radians(ta.lng) - radians(tb.g_lng)) + 
-                            sin(radians(tb.g_lat)) * 
-                            sin(radians(ta.lat))) AS distance ,
-                    rank() OVER (PARTITION BY tb.id ORDER BY 6371000 * acos(
-                                                                        cos(radians(tb.g_lat)) * 
-                                                                        cos(radians(ta.lat)) * 
-                                                                        cos(radians(ta.lng) - radians(tb.g_lng)) + 
-                                                                        sin(radians(tb.g_lat)) * 
-                                                                        sin(radians(ta.lat)))) AS rn
-                FROM damir.t_bike tb
-                CROSS JOIN damir.t_area ta
-                WHERE tb.error_status IN (0,7)
-                    AND TO_TIMESTAMP(tb.g_time) > NOW() - INTERVAL '900 seconds' 
-                    AND TO_CHAR(TO_TIMESTAMP(tb.heart_time), 'YYYY-MM-DD') = TO_CHAR(NOW(), 'YYYY-MM-DD')
-                    AND tb.status != 1
-                    AND ta.active = 1
-                    ) AS t
-            WHERE t.rn = 1
-            GROUP BY t.city_id , t.area , t.area_id
-            ) AS t_instant ON COALESCE(t_starts_res.city_id, t_ends_res.city_id) = t_instant.city_id 
-                            AND COALESCE(t_starts_res.area , t_ends_res.area) = t_instant.parking_name 
-                            AND COALESCE(t_starts_res.area_id , t_ends_res.area_id) = t_instant.parking_id
-        LEFT JOIN damir.t_areas_parkings tap ON COALESCE(t_starts_res.area_id , t_ends_res.area_id) = tap.parking_id
-        --LEFT JOIN public.parking p ON COALESCE(t_starts_res.area_id , t_ends_res.area_id) = p.parking_id
-                '''.format(max_id_order=max_id_order)
-
-    df_fresh_parking_stats1 = pd.read_sql(select_fresh_parking_stats1, engine_postgresql)
-    df_fresh_parking_stats1.replace('', '0').to_sql("t_parking_stats1", engine_postgresql, if_exists="append",
-                                                   index=False)
+    # То же с зоной парковки из t_areas_parkings
+    df_areas_parkings = extract_sql(select_areas_parkings, engine_postgresql)
+    df_fresh_parking_stats1 = df_fresh_parking_stats.merge(df_areas_parkings, on='parking_id', how='left')
+    df_fresh_parking_stats1['area_id'] = df_fresh_parking_stats1['area_id'].fillna(0).astype('int64')
+    df_fresh_parking_stats1['area_name'] = df_fresh_parking_stats1['area_name'].fillna('0')
+    df_fresh_parking_stats1 = df_fresh_parking_stats1[['add_time', 'city_id', 'area_id', 'area_name'] +
+                                                      list(df_fresh_parking_stats.columns[2:])]
+    copy_dataframe_to_postgres(df_fresh_parking_stats1.replace('', '0'), "t_parking_stats1", engine_postgresql)
     print('Added {x} records to t_parking_stats1 in Postgres!'.format(x=df_fresh_parking_stats1.shape[0]))
 
     #
@@ -3411,16 +2696,18 @@ def main():
             tbu.end_lng 
         FROM damir.t_bike_use tbu 
         WHERE tbu.ride_status != 5
-            AND tbu.uid NOT IN (52536,58249,72860,37592,63824,49704,54187,70354,70408,49618,72907,70404,44902,45094)
+            AND tbu.uid IS NOT NULL AND NOT EXISTS (SELECT 1 FROM excluded_test_users etu WHERE etu.uid = tbu.uid)
             AND tbu.id > {max_id_order}
             '''.format(max_id_order=max_id_order)
 
-    df_fresh_orders = pd.read_sql(select_fresh_orders, engine_postgresql)
+    df_fresh_orders = extract_sql(select_fresh_orders, engine_postgresql)
 
-    df_fresh_orders.replace('', '0').to_sql("t_orders", engine_postgresql, if_exists="append", index=False)
+    copy_dataframe_to_postgres(df_fresh_orders.replace('', '0'), "t_orders", engine_postgresql)
     print('Added {x} records to t_orders in Postgres!'.format(x=df_fresh_orders.shape[0]))
     # Обновление t_parking_stats в Postgresql. Конец
 
+
+def update_t_daily_report(engine_mysql, engine_postgresql):
     # Обновление t_daily_report в Postgresql. Начало
 
     select_df_t_daily_report = '''
@@ -3501,15 +2788,16 @@ def main():
                 FROM 
                     (
                     SELECT
-                        tbh."timestamp",
-                        date_trunc('hour', tbh."timestamp") + CASE
-                            WHEN EXTRACT(minute FROM tbh."timestamp") > 0 THEN INTERVAL '1 hour'
+                        r."timestamp",
+                        date_trunc('hour', r."timestamp") + CASE
+                            WHEN EXTRACT(minute FROM r."timestamp") > 0 THEN INTERVAL '1 hour'
                             ELSE INTERVAL '0 hour' 
                         END AS "timestamp_hour",
                         tbh.city_id ,
                         tbh.id 
-                    FROM damir.t_bike_history tbh 
-                    WHERE tbh."timestamp"::date = NOW()::date - INTERVAL '1 days'
+                    FROM damir.t_bike_history_runs r
+                    CROSS JOIN LATERAL damir.t_bike_history_at(r."timestamp") tbh
+                    WHERE r."timestamp"::date = NOW()::date - INTERVAL '1 days'
                         AND tbh.power < 30
                     ) AS res_tab
             ) AS tbh
@@ -3530,31 +2818,27 @@ def main():
     scooters_7_17 AS (
         SELECT 
             tbh.city_id ,
-            count(tbh.id) FILTER (WHERE tbh."timestamp" = (CURRENT_DATE + INTERVAL '8 hours')::timestamp) AS scooters_charge_less_30_not_rent_at_7_00 ,
-            count(tbh.id) FILTER (WHERE tbh."timestamp" = (CURRENT_DATE + INTERVAL '18 hours')::timestamp) AS scooters_charge_less_30_not_rent_at_17_00
+            count(tbh.id) FILTER (WHERE hr."timestamp" = (CURRENT_DATE + INTERVAL '8 hours')::timestamp) AS scooters_charge_less_30_not_rent_at_7_00 ,
+            count(tbh.id) FILTER (WHERE hr."timestamp" = (CURRENT_DATE + INTERVAL '18 hours')::timestamp) AS scooters_charge_less_30_not_rent_at_17_00
         FROM 
         (
             SELECT 
-                date_trunc('hour', tbh."timestamp")  + 
+                date_trunc('hour', r."timestamp")  + 
                                                CASE 
-                                                 WHEN EXTRACT(minute FROM tbh."timestamp") > 0 THEN INTERVAL '1 hour'
+                                                 WHEN EXTRACT(minute FROM r."timestamp") > 0 THEN INTERVAL '1 hour'
                                                  ELSE INTERVAL '0 hour'
                                                END AS "timestamp" ,
-                tbh.id ,
-                tbh.city_id ,
-                RANK() OVER (PARTITION BY date_trunc('hour', tbh."timestamp")  + 
-                                               CASE 
-                                                 WHEN EXTRACT(minute FROM tbh."timestamp") > 0 THEN INTERVAL '1 hour'
-                                                 ELSE INTERVAL '0 hour'
-                                               END ORDER BY tbh."timestamp" DESC) AS rn
-            FROM damir.t_bike_history tbh
-            WHERE tbh.timestamp >= current_date
-                AND
-                tbh.error_status NOT IN (0, 7) 
-                AND 
-                tbh.power < 30
-            ) AS tbh
-        WHERE tbh.rn = 1
+                MAX(r."timestamp") AS run_timestamp
+            FROM damir.t_bike_history_runs r
+            WHERE r."timestamp" >= current_date
+            GROUP BY 1
+            ) AS hr
+        CROSS JOIN LATERAL damir.t_bike_history_at(hr.run_timestamp) tbh
+        WHERE hr."timestamp" IN ((CURRENT_DATE + INTERVAL '8 hours')::timestamp, (CURRENT_DATE + INTERVAL '18 hours')::timestamp)
+            AND
+            tbh.error_status NOT IN (0, 7) 
+            AND 
+            tbh.power < 30
         GROUP BY tbh.city_id
     ),
     scooters_without_rides_yesterday AS (
@@ -3566,7 +2850,7 @@ def main():
                                 tbu.bid 
                             FROM damir.t_bike_use tbu 
                             WHERE tbu.ride_status!=5 
-                                AND tbu.uid NOT IN (52536,58249,72860,37592,63824,49704,54187,70354,70408,49618,72907,70404,44902,45094)
+                                AND tbu.uid IS NOT NULL AND NOT EXISTS (SELECT 1 FROM excluded_test_users etu WHERE etu.uid = tbu.uid)
                                 AND to_timestamp(tbu."date") >= NOW() - INTERVAL '1 days')
                 AND 
                 tb.error_status IN (0, 7)
@@ -3581,7 +2865,7 @@ def main():
                                 tbu.bid 
                             FROM damir.t_bike_use tbu 
                             WHERE tbu.ride_status!=5
-                                AND tbu.uid NOT IN (52536,58249,72860,37592,63824,49704,54187,70354,70408,49618,72907,70404,44902,45094) 
+                                AND tbu.uid IS NOT NULL AND NOT EXISTS (SELECT 1 FROM excluded_test_users etu WHERE etu.uid = tbu.uid) 
                                 AND (to_timestamp(tbu."date") >= NOW() - INTERVAL '2 days')
                 AND 
                 tb.error_status IN (0, 7)
@@ -3620,7 +2904,7 @@ def main():
         LEFT JOIN damir.t_bike tb ON tbu.bid = tb.id 
         WHERE tpd.created >= current_date
             AND tpd.bike_discount_amount > 0
-            AND tpd.user_id NOT IN (52536,58249,72860,37592,63824,49704,54187,70354,70408,49618,72907,70404,44902,45094)
+            AND tpd.user_id IS NOT NULL AND NOT EXISTS (SELECT 1 FROM excluded_test_users etu WHERE etu.uid = tpd.user_id)
         GROUP BY tb.city_id
     ),
     uteryany AS (
@@ -3641,7 +2925,7 @@ def main():
                                 tbu.bid 
                             FROM damir.t_bike_use tbu 
                             WHERE tbu.ride_status!=5
-                                AND tbu.uid NOT IN (52536,58249,72860,37592,63824,49704,54187,70354,70408,49618,72907,70404,44902,45094) 
+                                AND tbu.uid IS NOT NULL AND NOT EXISTS (SELECT 1 FROM excluded_test_users etu WHERE etu.uid = tbu.uid) 
                                 AND to_timestamp(tbu."date") >= current_date - INTERVAL '1 month')
             AND tb.error_status NOT IN (0, 7)
         GROUP BY tb.city_id
@@ -3683,11 +2967,13 @@ def main():
     LEFT JOIN damir.t_kvt_plan tkp ON tc.id = tkp.city_id 
     '''
 
-    df_t_daily_report = pd.read_sql(select_df_t_daily_report, engine_postgresql)
-    df_t_daily_report.to_sql("t_daily_report", engine_postgresql, if_exists="append", index=False)
+    df_t_daily_report = extract_sql(select_df_t_daily_report, engine_postgresql)
+    copy_dataframe_to_postgres(df_t_daily_report, "t_daily_report", engine_postgresql)
     print('Got it!: t_daily_report')
     # Обновление t_daily_report в Postgresql. Конец
 
+
+def update_t_daily_report_result(engine_mysql, engine_postgresql):
     # Выгрузка t_daily_report_result. Начало
     # Выгрузка для t_daily_report_result
     select_t_daily_report_result = '''
@@ -3724,21 +3010,16 @@ def main():
             ) AS tdr
         WHERE tdr.rn = 1
     '''
-    df_t_daily_report_result = pd.read_sql(select_t_daily_report_result, engine_postgresql)
-
-    # Очистка таблицы
-    truncate_t_daily_report_result = "TRUNCATE TABLE t_daily_report_result RESTART IDENTITY;"
-    with engine_postgresql.connect() as connection:
-        with connection.begin() as transaction:
-            connection.execute(sa.text(truncate_t_daily_report_result))
-            # Если ошибок нет, транзакция фиксируется автоматически
-            print(f"Таблица t_daily_report_result успешно очищена!")
+    df_t_daily_report_result = extract_sql(select_t_daily_report_result, engine_postgresql)
 
-    df_t_daily_report_result.to_sql("t_daily_report_result", engine_postgresql, if_exists="append", index=False)
+    # Замена содержимого таблицы
+    replace_table_contents(df_t_daily_report_result, "t_daily_report_result", engine_postgresql)
     print('Таблица t_daily_report_result успешно обновлена!')
     # Выгрузка t_daily_report_result. Конец
 
-    #   Выгрузка t_parking_revenue_stats. Начало
+
+def update_t_orders_revenue(engine_mysql, engine_postgresql):
+    #   Выгрузка t_orders_revenue
     # Удаление заказов за последние 2 часа
     truncate_orders_revenue = '''
         DELETE FROM damir.t_orders_revenue 
@@ -3767,13 +3048,15 @@ def main():
         LEFT JOIN shamri.t_payment_details tpd ON tbu.id = tpd.ride_id
         LEFT JOIN shamri.t_subscription ts ON tbu.subscription_id = ts.id 
         WHERE tbu.ride_status != 5
-             AND tbu.uid NOT IN (52536,58249,72860,37592,63824,49704,54187,70354,70408,49618,72907,70404,44902,45094)
-             AND 
-            from_unixtime(tbu.`date`) >= STR_TO_DATE(DATE_FORMAT(NOW(), '%Y-%m-%d %H:00:00'), "%Y-%m-%d %H:%i:%s") - INTERVAL 2 HOUR
-    '''
-    df_new_orders_revenue = pd.read_sql(select_new_orders_revenue, engine_mysql)
-    df_new_orders_revenue.to_sql("t_orders_revenue", engine_postgresql, if_exists="append", index=False)
+             AND tbu.uid IS NOT NULL AND NOT EXISTS (SELECT 1 FROM excluded_test_users etu WHERE etu.uid = tbu.uid)
+             AND tbu.`date` >= UNIX_TIMESTAMP('{hour_from}')
+    '''.format(hour_from=get_run_window(engine_mysql)['hour_from'])
+    df_new_orders_revenue = extract_sql(with_excluded_test_users(select_new_orders_revenue), engine_mysql)
+    copy_dataframe_to_postgres(df_new_orders_revenue, "t_orders_revenue", engine_postgresql)
 
+
+def update_t_parking_revenue_stats(engine_mysql, engine_postgresql):
+    #   Выгрузка t_parking_revenue_stats. Начало
     truncate_parking_revenue_stats1 = '''
         DELETE FROM t_parking_revenue_stats1 
         WHERE t_parking_revenue_stats1."timestamp" >= date_trunc('hour', NOW() AT TIME ZONE 'Europe/Athens') - INTERVAL '2 hours'
@@ -3814,7 +3097,7 @@ def main():
                 FROM damir.t_bike_use tbu
                 LEFT JOIN t_bike tb ON tbu.bid = tb.id
                 WHERE tbu.ride_status = 2 
-                    AND tbu.uid NOT IN (52536,58249,72860,37592,63824,49704,54187,70354,70408,49618,72907,70404,44902,45094)
+                    AND tbu.uid IS NOT NULL AND NOT EXISTS (SELECT 1 FROM excluded_test_users etu WHERE etu.uid = tbu.uid)
                     AND to_timestamp( tbu.start_time) >= date_trunc('hour', NOW() AT TIME ZONE 'Europe/Athens') - INTERVAL '2 hours'
                 ) AS dolgi ON tpd.ride_id = dolgi.id 
             ) AS dolgi
@@ -3841,7 +3124,7 @@ def main():
                 FROM damir.t_bike_use
                 LEFT JOIN damir.t_bike ON t_bike_use.bid = t_bike.id
                 WHERE t_bike_use.ride_status != 5 
-                    AND t_bike_use.uid NOT IN (52536,58249,72860,37592,63824,49704,54187,70354,70408,49618,72907,70404,44902,45094)
+                    AND t_bike_use.uid IS NOT NULL AND NOT EXISTS (SELECT 1 FROM excluded_test_users etu WHERE etu.uid = t_bike_use.uid)
                     AND TO_TIMESTAMP(t_bike_use.start_time) >= date_trunc('hour', NOW() AT TIME ZONE 'Europe/Athens') - INTERVAL '2 hours'
                 GROUP BY 1, 2
                 ) 
@@ -3854,7 +3137,7 @@ def main():
             FROM damir.t_trade
             WHERE t_trade.type = 6 
                 AND t_trade.status = 1 
-                AND t_trade.uid NOT IN (52536,58249,72860,37592,63824,49704,54187,70354,70408,49618,72907,70404,44902,45094)
+                AND t_trade.uid IS NOT NULL AND NOT EXISTS (SELECT 1 FROM excluded_test_users etu WHERE etu.uid = t_trade.uid)
                 AND t_trade.date >= date_trunc('hour', NOW() AT TIME ZONE 'Europe/Athens') - INTERVAL '2 hours'
             GROUP BY 1
             ) AS sum_uspeh_abon
@@ -3879,7 +3162,7 @@ def main():
                 FROM damir.t_bike_use
                 LEFT JOIN damir.t_bike ON t_bike_use.bid = t_bike.id
                 WHERE t_bike_use.ride_status != 5 
-                    AND t_bike_use.uid NOT IN (52536,58249,72860,37592,63824,49704,54187,70354,70408,49618,72907,70404,44902,45094)
+                    AND t_bike_use.uid IS NOT NULL AND NOT EXISTS (SELECT 1 FROM excluded_test_users etu WHERE etu.uid = t_bike_use.uid)
                     AND TO_TIMESTAMP(t_bike_use.start_time) >= date_trunc('hour', NOW() AT TIME ZONE 'Europe/Athens') - INTERVAL '2 hours'
                 GROUP BY 1, 2
             ) AS dp
@@ -3892,7 +3175,7 @@ def main():
             LEFT JOIN damir.t_subscription ON t_subscription_mapping.subscription_id = t_subscription.id
             WHERE 
                 t_subscription_mapping.start_time >= date_trunc('hour', NOW() AT TIME ZONE 'Europe/Athens') - INTERVAL '2 hours'
-                AND t_subscription_mapping.user_id NOT IN (52536,58249,72860,37592,63824,49704,54187,70354,70408,49618,72907,70404,44902,45094)
+                AND t_subscription_mapping.user_id IS NOT NULL AND NOT EXISTS (SELECT 1 FROM excluded_test_users etu WHERE etu.uid = t_subscription_mapping.user_id)
             GROUP BY 1
         ) AS sum_mnogor_abon
         ON distr_poezdki_po_gorodam.start_time = sum_mnogor_abon.start_time
@@ -3984,7 +3267,7 @@ def main():
                 FROM damir.t_bike_use tbu
                 LEFT JOIN t_bike tb ON tbu.bid = tb.id
                 WHERE tbu.ride_status = 2 
-                    AND tbu.uid NOT IN (52536,58249,72860,37592,63824,49704,54187,70354,70408,49618,72907,70404,44902,45094)
+                    AND tbu.uid IS NOT NULL AND NOT EXISTS (SELECT 1 FROM excluded_test_users etu WHERE etu.uid = tbu.uid)
                     AND to_timestamp( tbu.start_time) >= date_trunc('hour', NOW() AT TIME ZONE 'Europe/Athens') - INTERVAL '2 hours'
                 ) AS dolgi ON tpd.ride_id = dolgi.id 
             ) AS dolgi
@@ -4010,7 +3293,7 @@ def main():
                 FROM damir.t_bike_use
                 LEFT JOIN damir.t_bike ON t_bike_use.bid = t_bike.id
                 WHERE t_bike_use.ride_status != 5 
-                    AND t_bike_use.uid NOT IN (52536,58249,72860,37592,63824,49704,54187,70354,70408,49618,72907,70404,44902,45094)
+                    AND t_bike_use.uid IS NOT NULL AND NOT EXISTS (SELECT 1 FROM excluded_test_users etu WHERE etu.uid = t_bike_use.uid)
                     AND TO_TIMESTAMP(t_bike_use.start_time) >= date_trunc('hour', NOW() AT TIME ZONE 'Europe/Athens') - INTERVAL '2 hours'
                 GROUP BY 1, 2
                 ) 
@@ -4023,7 +3306,7 @@ def main():
             FROM damir.t_trade
             WHERE t_trade.type = 6 
                 AND t_trade.status = 1 
-                AND t_trade.uid NOT IN (52536,58249,72860,37592,63824,49704,54187,70354,70408,49618,72907,70404,44902,45094)
+                AND t_trade.uid IS NOT NULL AND NOT EXISTS (SELECT 1 FROM excluded_test_users etu WHERE etu.uid = t_trade.uid)
                 AND t_trade.date >= date_trunc('hour', NOW() AT TIME ZONE 'Europe/Athens') - INTERVAL '2 hours'
             GROUP BY 1
             ) AS sum_uspeh_abon
@@ -4048,7 +3331,7 @@ def main():
                 FROM damir.t_bike_use
                 LEFT JOIN damir.t_bike ON t_bike_use.bid = t_bike.id
                 WHERE t_bike_use.ride_status != 5 
-                    AND t_bike_use.uid NOT IN (52536,58249,72860,37592,63824,49704,54187,70354,70408,49618,72907,70404,44902,45094)
+                    AND t_bike_use.uid IS NOT NULL AND NOT EXISTS (SELECT 1 FROM excluded_test_users etu WHERE etu.uid = t_bike_use.uid)
                     AND TO_TIMESTAMP(t_bike_use.start_time) >= date_trunc('hour', NOW() AT TIME ZONE 'Europe/Athens') - INTERVAL '2 hours'
                 GROUP BY 1, 2
             ) AS dp
@@ -4061,7 +3344,7 @@ def main():
             LEFT JOIN damir.t_subscription ON t_subscription_mapping.subscription_id = t_subscription.id
             WHERE 
                 t_subscription_mapping.start_time >= date_trunc('hour', NOW() AT TIME ZONE 'Europe/Athens') - INTERVAL '2 hours'
-                AND t_subscription_mapping.user_id NOT IN (52536,58249,72860,37592,63824,49704,54187,70354,70408,49618,72907,70404,44902,45094) 
+                AND t_subscription_mapping.user_id IS NOT NULL AND NOT EXISTS (SELECT 1 FROM excluded_test_users etu WHERE etu.uid = t_subscription_mapping.user_id) 
             GROUP BY 1
         ) AS sum_mnogor_abon
         ON distr_poezdki_po_gorodam.start_time = sum_mnogor_abon.start_time
@@ -4137,63 +3420,44 @@ def main():
         LEFT JOIN damir.t_areas_parkings tap ON res.parking_id = tap.parking_id
     ORDER BY date_trunc('hour', res.timestamp) ASC
     '''
-    df_new_parking_revenue_stats1 = pd.read_sql(select_new_parking_revenue_stats1, engine_postgresql)
-    df_new_parking_revenue_stats2 = pd.read_sql(select_new_parking_revenue_stats2, engine_postgresql)
+    df_new_parking_revenue_stats1 = extract_sql(select_new_parking_revenue_stats1, engine_postgresql)
+    df_new_parking_revenue_stats2 = extract_sql(select_new_parking_revenue_stats2, engine_postgresql)
 
-    df_new_parking_revenue_stats1.to_sql("t_parking_revenue_stats1", engine_postgresql, if_exists="append",
-                                        index=False)
-    df_new_parking_revenue_stats2.to_sql("t_parking_revenue_stats2", engine_postgresql, if_exists="append",
-                                         index=False)
+    copy_dataframe_to_postgres(df_new_parking_revenue_stats1, "t_parking_revenue_stats1", engine_postgresql)
+    copy_dataframe_to_postgres(df_new_parking_revenue_stats2, "t_parking_revenue_stats2", engine_postgresql)
 
+
+def update_t_parking_kvt1(engine_mysql, engine_postgresql):
+    # Последний снимок самокатов за каждый час; ближайшая парковка ищется в Python вместо CROSS JOIN с t_area
     select_t_parking_kvt1 = '''
-    SELECT
-        NOW() AS add_time ,
-        res.timestamp AS timestamp ,
-        res.city_id ,
-        res.parking_id ,
-        COUNT(res.id) AS kvt
-    FROM 
-        (
+    WITH hour_runs AS (
         SELECT 
-            res_tab.timestamp_hour AS "timestamp" ,
-            ta.city_id ,
-            ta.id AS parking_id ,
-            res_tab.id ,
-            6371000 * acos(
-                                cos(radians(res_tab.g_lat)) * 
-                                cos(radians(ta.lat)) * 
-                                cos(radians(ta.lng) - radians(res_tab.g_lng)) + 
-                                sin(radians(res_tab.g_lat)) * 
-                                sin(radians(ta.lat))) AS distance ,
-            RANK() OVER (PARTITION BY res_tab.timestamp_hour, res_tab.id ORDER BY 6371000 * acos(
-                                                                                        cos(radians(res_tab.g_lat)) * 
-                                                                                        cos(radians(ta.lat)) * 
-                                                                                        cos(radians(ta.lng) - radians(res_tab.g_lng)) + 
-                                                                                        sin(radians(res_tab.g_lat)) * 
-                                                                                        sin(radians(ta.lat))) ASC) AS rn
-        FROM 
-            (
-            SELECT 
-                tbh."timestamp" ,
-                date_trunc('hour', tbh."timestamp") AS "timestamp_hour" ,
-                tbh.id ,
-                tbh.g_lat ,
-                tbh.g_lng ,
-                RANK() OVER (PARTITION BY date_trunc('hour', tbh."timestamp") ORDER BY tbh."timestamp" DESC) AS rn
-            FROM damir.t_bike_history tbh
-            WHERE tbh.error_status IN (0,7)
-                AND tbh."timestamp" >= date_trunc('hour', NOW() AT TIME ZONE 'Europe/Athens') - INTERVAL '2 hours'
-                --AND date_trunc('hour', tbh."timestamp") >= NOW()::date
-                ) AS res_tab
-        CROSS JOIN damir.t_area ta 
-        WHERE res_tab.rn = 1
-            AND ta.active = 1
-        ) AS res
-    WHERE res.rn = 1
-    GROUP BY res.timestamp , res.city_id , res.parking_id
-    ORDER BY res.timestamp ASC
+            date_trunc('hour', r."timestamp") AS "timestamp_hour" ,
+            MAX(r."timestamp") AS "timestamp"
+        FROM damir.t_bike_history_runs r
+        WHERE r."timestamp" >= date_trunc('hour', NOW() AT TIME ZONE 'Europe/Athens') - INTERVAL '2 hours'
+        GROUP BY 1
+    )
+    SELECT 
+        NOW() AS add_time ,
+        hr.timestamp_hour AS "timestamp" ,
+        tbh.id ,
+        tbh.g_lat ,
+        tbh.g_lng
+    FROM hour_runs hr
+    CROSS JOIN LATERAL damir.t_bike_history_at(hr."timestamp") tbh
+    WHERE tbh.error_status IN (0,7)
     '''
-    df_t_parking_kvt1 = pd.read_sql(select_t_parking_kvt1, engine_postgresql)
+    df_snapshots = extract_sql(select_t_parking_kvt1, engine_postgresql)
+    parking_index = load_parking_index(engine_postgresql)
+
+    positions, _ = nearest_parking(parking_index, df_snapshots['g_lat'], df_snapshots['g_lng'])
+    found = positions >= 0
+    df_snapshots = df_snapshots[found]
+    parkings = parking_index['parkings'].iloc[positions[found]]
+    df_snapshots = df_snapshots.assign(city_id=parkings['city_id'].to_numpy(), parking_id=parkings['parking_id'].to_numpy())
+    df_t_parking_kvt1 = df_snapshots.groupby(['add_time', 'timestamp', 'city_id', 'parking_id'], dropna=False)['id'] \
+        .count().rename('kvt').reset_index().sort_values('timestamp', kind='stable')
 
     # Очистка старых данных в t_parking_kvt1
     truncate_t_parking_kvt1 = '''DELETE FROM damir.t_parking_kvt1
@@ -4206,9 +3470,11 @@ def main():
             transaction.commit()
             print(f"Таблица t_parking_kvt1 успешно очищена!")
 
-    df_t_parking_kvt1.to_sql("t_parking_kvt1", engine_postgresql, if_exists="append", index=False)
+    copy_dataframe_to_postgres(df_t_parking_kvt1, "t_parking_kvt1", engine_postgresql)
     print('Таблица df_t_parking_kvt1 успешно обновлена!')
 
+
+def update_t_area_revenue_stats1(engine_mysql, engine_postgresql):
     select_t_area_revenue_stats1 = '''
     WITH revenue AS (
         SELECT
@@ -4270,111 +3536,73 @@ def main():
     ORDER BY res.timestamp
     '''
 
-    df_t_area_revenue_stats1 = pd.read_sql(select_t_area_revenue_stats1, engine_postgresql)
+    df_t_area_revenue_stats1 = extract_sql(select_t_area_revenue_stats1, engine_postgresql)
 
-    # Очистка таблицы
-    truncate_t_area_revenue_stats1 = "TRUNCATE TABLE t_area_revenue_stats1 RESTART IDENTITY;"
-    with engine_postgresql.connect() as connection:
-        with connection.begin() as transaction:
-            print(f"Попытка очистить таблицу")
-            # Очистка t_area_revenue_stats1
-            connection.execute(sa.text(truncate_t_area_revenue_stats1))
-            # Если ошибок нет, транзакция фиксируется автоматически
-            print(f"Таблица t_area_revenue_stats1 успешно очищена!")
-
-    df_t_area_revenue_stats1.to_sql("t_area_revenue_stats1", engine_postgresql, if_exists="append", index=False)
+    # Замена содержимого таблицы
+    replace_table_contents(df_t_area_revenue_stats1, "t_area_revenue_stats1", engine_postgresql)
     print('Таблица t_area_revenue_stats1 успешно обновлена!')
 
-    # Выгрузка гугл таблиц(Workers_city_role и График работ) в БД для alarms_5. Начало
-
-
-    google_service_account_json = get_google_creds()
-
-    with open('google_json.json', 'w') as fp:
-        json.dump(json.loads(google_service_account_json, strict=False), fp)
-    generated_json_file = './google_json.json'
-    SERVICE_ACCOUNT_FILE = './google_json.json'
-    service_account_file = generated_json_file
-
 
+def update_workers_city_role(engine_mysql, engine_postgresql):
+    # Выгрузка гугл таблиц(Workers_city_role и График работ) в БД для alarms_5.
     # Выгрузка из Workers_city_role из гугла
-    # Выгрузка Workers_city_role
     try:
-        sheets_service = get_sheets_service(SERVICE_ACCOUNT_FILE)
-        SPREADSHEET_ID = '1dSOV9X2FV3mnOmnwWvTMJuCCZ-tVBf64DP90k3EYD90'
+        sheets_service = get_sheets_service(get_google_creds())
+        SPREADSHEET_ID = WORKERS_SPREADSHEET_ID
         RANGE_NAME = 'Workers_city_role!A:E'
 
-        df_workers_city_role = read_sheet_data_to_pandas(sheets_service, SPREADSHEET_ID, RANGE_NAME)
+        df_workers_city_role = get_sheet(sheets_service, SPREADSHEET_ID, RANGE_NAME)
+        if not sheet_changed(engine_postgresql, SPREADSHEET_ID, RANGE_NAME, "workers_city_role"):
+            print('Workers_city_role не изменилась, workers_city_role не перезагружается')
+            return
 
-        df_workers_city_role = df_workers_city_role.fillna('0').replace('', '0')
+        df_workers_city_role = coerce_sheet(df_workers_city_role, RANGE_NAME)
         df_workers_city_role['add_time'] = pd.Timestamp.now() + pd.Timedelta(hours=3)
 
-        # Очистка таблицы
-        truncate_t_bike = "TRUNCATE TABLE damir.workers_city_role RESTART IDENTITY;"
-        with engine_postgresql.connect() as connection:
-            with connection.begin() as transaction:
-                print(f"Попытка очистить таблицу")
-                # Очистка workers_city_role
-                connection.execute(sa.text(truncate_t_bike))
-                # Если ошибок нет, транзакция фиксируется автоматически
-                print(f"Таблица workers_city_role успешно очищена!")
-
-        df_workers_city_role.to_sql("workers_city_role", engine_postgresql, if_exists="append", index=False)
+        # Замена содержимого таблицы
+        with engine_postgresql.begin() as connection:
+            replace_table(connection, df_workers_city_role, "workers_city_role")
+            remember_sheet(connection, SPREADSHEET_ID, RANGE_NAME)
         print('Таблица workers_city_role успешно обновлена!')
     except Exception as e:
         print(f"Произошла ошибка в workers_city_role: {e}")
-        pass
+        raise
+
 
+def update_grafik_rabot_google(engine_mysql, engine_postgresql):
     # Выгрузка График работ из гугла
     try:
-        SERVICE_ACCOUNT_FILE = './google_json.json'
-        SPREADSHEET_ID = '1dSOV9X2FV3mnOmnwWvTMJuCCZ-tVBf64DP90k3EYD90'
+        SPREADSHEET_ID = WORKERS_SPREADSHEET_ID
         RANGE_NAME = 'График работ!A:L'
-        service_account_file = generated_json_file
-
-        df_grafik = read_sheet_data_to_pandas(sheets_service, SPREADSHEET_ID, RANGE_NAME)
-
-        df_grafik['Worker id'] = df_grafik['Worker id'].fillna('0').replace('', '0')
-        df_grafik['Worker username'] = df_grafik['Worker username'].fillna('0').replace('#N/A', '0').replace('', '0')
-        df_grafik['Worker nickname'] = df_grafik['Worker nickname'].fillna('0').replace('#N/A', '0').replace('', '0')
-        df_grafik['Planned start time'] = df_grafik['Planned start time'].fillna('00:00:70').replace('', '00:00:70')
-        df_grafik['Planned finish time'] = df_grafik['Planned finish time'].fillna('00:00:70').replace('', '00:00:70')
-        df_grafik['Actual start time'] = df_grafik['Actual start time'].fillna('00:00:70').replace('', '00:00:70')
-        df_grafik['Actual finish time'] = df_grafik['Actual finish time'].fillna('00:00:70').replace('', '00:00:70')
-        df_grafik['Start odometer kilometers'] = df_grafik['Start odometer kilometers'].fillna('0').replace('', '0')
-        df_grafik['Finish odometer kilometers'] = df_grafik['Finish odometer kilometers'].fillna('0').replace('', '0')
-        df_grafik['Fines (euro)'] = df_grafik['Fines (euro)'].fillna('0').replace('', '0')
-        df_grafik['Note'] = df_grafik['Note'].fillna('0').replace('', '0')
+        sheets_service = get_sheets_service(get_google_creds())
+
+        df_grafik = get_sheet(sheets_service, SPREADSHEET_ID, RANGE_NAME)
+        if not sheet_changed(engine_postgresql, SPREADSHEET_ID, RANGE_NAME, "grafik_rabot_google"):
+            print('График работ не изменился, grafik_rabot_google не перезагружается')
+            return
+
+        df_grafik = coerce_sheet(df_grafik, RANGE_NAME)
         df_grafik['add_time'] = pd.Timestamp.now() + pd.Timedelta(hours=3)
 
-        # Очистка таблицы
-        truncate_t_bike = "TRUNCATE TABLE grafik_rabot_google RESTART IDENTITY;"
-        with engine_postgresql.connect() as connection:
-            with connection.begin() as transaction:
-                print(f"Попытка очистить таблицу")
-                # Очистка grafik_rabot_google
-                connection.execute(sa.text(truncate_t_bike))
-                # Если ошибок нет, транзакция фиксируется автоматически
-                print(f"Таблица grafik_rabot_google успешно очищена!")
-
-        df_grafik.to_sql("grafik_rabot_google", engine_postgresql, if_exists="append", index=False)
+        # Замена содержимого таблицы
+        with engine_postgresql.begin() as connection:
+            replace_table(connection, df_grafik, "grafik_rabot_google")
+            remember_sheet(connection, SPREADSHEET_ID, RANGE_NAME)
         print('Таблица grafik_rabot_google успешно обновлена!')
     except Exception as e:
         print(f"Произошла ошибка в grafik_rabot_google: {e}")
-        pass
+        raise
 
 
+def update_salary(engine_mysql, engine_postgresql):
     # Выгрузка гугл таблиц(Workers_city_role и График работ) в БД для ЗП и alarms_5. Конец
 
 
     try:
         # Расчет зп. Начало 30.09.2025
-        SERVICE_ACCOUNT_FILE = './google_json.json'
-        SPREADSHEET_ID = '1dSOV9X2FV3mnOmnwWvTMJuCCZ-tVBf64DP90k3EYD90'
-        RANGE_NAME = 'График работ!A:L'
-        service_account_file = generated_json_file
+        SPREADSHEET_ID = WORKERS_SPREADSHEET_ID
 
-        sheets_service = get_sheets_service(SERVICE_ACCOUNT_FILE)
+        sheets_service = get_sheets_service(get_google_creds())
 
         # Выгрузка для Каждый работник
         select_for_workers = '''
@@ -4401,67 +3629,19 @@ def main():
                     AND grg."Date" >= '2025-08-01'
                 ) AS grg
         '''
-        df_for_workers = pd.read_sql(select_for_workers, engine_postgresql)
+        df_for_workers = extract_sql(select_for_workers, engine_postgresql)
         df_for_workers['Месяц'] = pd.to_datetime(df_for_workers['Месяц'], errors='coerce')
 
         # Скачиваю Таблица(ставки)
         RANGE_NAME_2 = 'Таблица(ставки)!A:BF'
-        sheets_service = get_sheets_service(SERVICE_ACCOUNT_FILE)
-        df_tabl_stavki = read_sheet_data_to_pandas(sheets_service, SPREADSHEET_ID, RANGE_NAME_2)
+        df_tabl_stavki = get_sheet(sheets_service, SPREADSHEET_ID, RANGE_NAME_2)
 
         new_columns = df_tabl_stavki.iloc[0]
         df_tabl_stavki.columns = new_columns
         df_tabl_stavki.drop(index=df_tabl_stavki.index[0], axis=0, inplace=True)
         df_tabl_stavki = df_tabl_stavki[df_tabl_stavki['Месяц'].notna()]
-        df_tabl_stavki['Месяц'] = pd.to_datetime(df_tabl_stavki['Месяц'], errors='coerce')
-        df_tabl_stavki['Дата нового условия ставки (час)'] = pd.to_datetime(
-            df_tabl_stavki['Дата нового условия ставки (час)'], errors='coerce').replace('1970-01-01', 'NaT')
-        df_tabl_stavki['Дата нового условия ставки (нед)'] = pd.to_datetime(
-            df_tabl_stavki['Дата нового условия ставки (нед)'], errors='coerce').replace('1970-01-01', 'NaT')
-        df_tabl_stavki['Дата нового условия ставки (мес)'] = pd.to_datetime(
-            df_tabl_stavki['Дата нового условия ставки (мес)'], errors='coerce').replace('1970-01-01', 'NaT')
-        df_tabl_stavki['Нач_дата_расч_бонуса_нов_сотр'] = pd.to_datetime(
-            df_tabl_stavki['Нач_дата_расч_бонуса_нов_сотр'], errors='coerce').replace('1970-01-01', 'NaT')
-        df_tabl_stavki['Оконч_дата_расч_бонус_нов_сотр'] = pd.to_datetime(
-            df_tabl_stavki['Оконч_дата_расч_бонус_нов_сотр'], errors='coerce')
-        df_tabl_stavki = df_tabl_stavki.replace('', '0')
-        df_tabl_stavki['Worker id'] = df_tabl_stavki['Worker id'].astype(int)
-        df_tabl_stavki['Количество отработанных часов'] = df_tabl_stavki['Количество отработанных часов'].fillna(0).astype(float)
-        df_tabl_stavki['Ставка за час'] = df_tabl_stavki['Ставка за час'].fillna(0).astype(float)
-        df_tabl_stavki['Ставка измененная за час'] = df_tabl_stavki['Ставка измененная за час'].fillna(0).astype(float)
-        df_tabl_stavki['Ставка за неделю'] = df_tabl_stavki['Ставка за неделю'].fillna(0).astype(float)
-        df_tabl_stavki['Ставка измененная за неделю'] = df_tabl_stavki['Ставка измененная за неделю'].fillna(0).astype(float)
-        df_tabl_stavki['Ставка за месяц'] = df_tabl_stavki['Ставка за месяц'].fillna(0).astype(float)
-        df_tabl_stavki['Норма рабочих часов за месяц'] = df_tabl_stavki['Норма рабочих часов за месяц'].fillna(0).astype(float)
-        df_tabl_stavki['Ставка свыше нормы'] = df_tabl_stavki['Ставка свыше нормы'].fillna(0).astype(float)
-        df_tabl_stavki['Количество отработанных часов свыше нормы'] = df_tabl_stavki[
-            'Количество отработанных часов свыше нормы'].fillna(0).astype(float)
-        df_tabl_stavki['Ставка измененная за месяц'] = df_tabl_stavki['Ставка измененная за месяц'].fillna(0).astype(float)
-        df_tabl_stavki['Норма расхода топлива на 100 км, литры'] = df_tabl_stavki[
-            'Норма расхода топлива на 100 км, литры'].fillna(0).astype(float)
-        df_tabl_stavki['Цена топлива за 1 литр, евро'] = df_tabl_stavki['Цена топлива за 1 литр, евро'].fillna(0).astype(float)
-        df_tabl_stavki['Количество часов работы на складе'] = df_tabl_stavki['Количество часов работы на складе'].fillna(0).astype(
-            float)
-        df_tabl_stavki['Бонус за работу на складе'] = df_tabl_stavki['Бонус за работу на складе'].fillna(0).astype(float)
-        df_tabl_stavki['Бонус за ремонт'] = df_tabl_stavki['Бонус за ремонт'].fillna(0).astype(float)
-        df_tabl_stavki['Общее количество заряженных батарей'] = df_tabl_stavki[
-            'Общее количество заряженных батарей'].replace('-', '0').fillna(0).astype(float)
-        df_tabl_stavki['Сумма1'] = df_tabl_stavki['Сумма1'].fillna(0).astype(float)
-        df_tabl_stavki['Сумма2'] = df_tabl_stavki['Сумма2'].fillna(0).astype(float)
-        df_tabl_stavki['Сумма3'] = df_tabl_stavki['Сумма3'].fillna(0).astype(float)
-        df_tabl_stavki['Сумма4'] = df_tabl_stavki['Сумма4'].fillna(0).astype(float)
-        df_tabl_stavki['Сумма5'] = df_tabl_stavki['Сумма5'].fillna(0).astype(float)
-        df_tabl_stavki['Сумма6'] = df_tabl_stavki['Сумма6'].fillna(0).astype(float)
-        df_tabl_stavki['Сумма7'] = df_tabl_stavki['Сумма7'].fillna(0).astype(float)
-        df_tabl_stavki['Штраф'] = df_tabl_stavki['Штраф'].fillna(0).astype(float)
-        df_tabl_stavki['Аванс'] = df_tabl_stavki['Аванс'].fillna(0).astype(float)
-        df_tabl_stavki['Сумма8'] = df_tabl_stavki['Сумма8'].fillna(0).astype(float)
-        df_tabl_stavki['Сумма9'] = df_tabl_stavki['Сумма9'].fillna(0).astype(float)
-        df_tabl_stavki['Сумма10'] = df_tabl_stavki['Сумма10'].fillna(0).astype(float)
-        df_tabl_stavki['Процент_от_зп_бонус_прогр'] = df_tabl_stavki[
-            'Процент_от_зп_бонус_прогр'].fillna(0).astype(float)
-        df_tabl_stavki['id_invited_worker_nickname_бонусная_программа'] = df_tabl_stavki[
-            'id_invited_worker_nickname_бонусная_программа'].fillna(0).astype(int)
+        # Типы столбцов по схеме листа (sheet_schemas): даты, числа с 0 вместо пустых, '' -> '0' в остальных
+        df_tabl_stavki = coerce_sheet(df_tabl_stavki, RANGE_NAME_2)
         df_for_workers_distance = df_for_workers.groupby(['Месяц', 'Worker id', 'Worker username', 'Worker nickname'],
                                                          as_index=False) \
             .agg({'distance': 'sum'})
@@ -4501,62 +3681,8 @@ def main():
         df_temp['Ставка за час постоянно'] = df_temp['Дата нового условия ставки (час)'].fillna(0).apply(
             lambda x: 0 if x == 0 else 1)
 
-        columns = ['Date', 'Worker id', 'Ставка за час']
-        res = pd.DataFrame(columns=columns)
-
-        columns_month = ['Месяц', 'Worker id']
-        res_month = pd.DataFrame(columns=columns_month)
-
-        for index, row in df_temp.iterrows():
-
-            if (row['Ставка за час постоянно'] == 0) & (row['Тип ставки'] == 'Ставка за час'):
-                #         print('Постоянно')
-                dates1 = pd.date_range(start=row['Месяц'], end=row['Конец месяца'], freq='D')
-                df1 = pd.DataFrame(dates1, columns=['Date'])
-                df1['Ставка за час'] = row['Ставка за час']
-                df1['Worker id'] = row['Worker id']
-                df1['Worker username'] = row['Worker username']
-                df1['Worker nickname'] = row['Worker nickname']
-                df1['Worker role'] = row['Worker role']
-                df1['city'] = row['city']
-                res = pd.concat([res, df1], ignore_index=True)
-
-            elif (row['Ставка за час постоянно'] == 1) & (row['Тип ставки'] == 'Ставка за час'):
-                #         print('Не постоянно')
-                # Диапазон до изменения ставки
-                dates1 = pd.date_range(start=row['Месяц'],
-                                       end=row['Дата нового условия ставки (час)'] - pd.Timedelta(hours=1), freq='D')
-                df1 = pd.DataFrame(dates1, columns=['Date'])
-                df1['Ставка за час'] = row['Ставка за час']
-                df1['Worker id'] = row['Worker id']
-                df1['Worker username'] = row['Worker username']
-                df1['Worker nickname'] = row['Worker nickname']
-                df1['Worker role'] = row['Worker role']
-                df1['city'] = row['city']
-                df1['Посменная зп'] = 0
-
-                # Диапазон после изменения ставки
-                dates2 = pd.date_range(start=row['Дата нового условия ставки (час)'], end=row['Конец месяца'], freq='D')
-                df2 = pd.DataFrame(dates2, columns=['Date'])
-                df2['Ставка за час'] = row['Ставка измененная за час']
-                df2['Worker id'] = row['Worker id']
-                df2['Worker username'] = row['Worker username']
-                df2['Worker nickname'] = row['Worker nickname']
-                df2['Worker role'] = row['Worker role']
-                df2['city'] = row['city']
-                df2['Посменная зп'] = 0
-                res = pd.concat([res, df1, df2], ignore_index=True)
-            elif row['Тип ставки'] == 'Ставка за месяц':
-                dates3 = pd.date_range(start=row['Месяц'], end=row['Месяц'], freq='D')
-                df3 = pd.DataFrame(dates3, columns=['Месяц'])
-                df3['Worker id'] = row['Worker id']
-                df3['Worker username'] = row['Worker username']
-                df3['Worker nickname'] = row['Worker nickname']
-                df3['Worker role'] = row['Worker role']
-                df3['city'] = row['city']
-                res_month = pd.concat([res_month, df3], ignore_index=True)
-                res_month['Сдельная зп'] = 0
-                res_month['Посменная зп'] = row['Ставка за месяц']
+        # res - дни работников со ставкой за час, res_month - ставка за месяц, res_c - дни Христоса
+        res, res_month, res_c = expand_salary_calendar(df_temp, 35)
 
         res_month['Месяц'] = pd.to_datetime(res_month['Месяц'], errors='coerce')
 
@@ -4585,51 +3711,9 @@ def main():
             GROUP BY ds."Date", ds."Worker id", ds."Nickname"
         '''
 
-        df_c = pd.read_sql(select_min_efficiency, engine_postgresql)
+        df_c = extract_sql(select_min_efficiency, engine_postgresql)
         df_c['Date'] = pd.to_datetime(df_c['Date'], errors='coerce')
 
-        # Генерирую календарь для Христоса
-        columns = ['Date', 'Worker id']
-        res_c = pd.DataFrame(columns=columns)
-
-        for index, row in df_temp[df_temp['Worker id'] == 35].iterrows():
-
-            if (row['Ставка за час постоянно'] == 0) & (row['Тип ставки'] == 'Ставка за час'):
-                #         print('Постоянно')
-
-                dates1 = pd.date_range(start=row['Месяц'], end=row['Конец месяца'], freq='D')
-                df1 = pd.DataFrame(dates1, columns=['Date'])
-                df1['Worker id'] = row['Worker id']
-                df1['Worker username'] = row['Worker username']
-                df1['Worker nickname'] = row['Worker nickname']
-                df1['Worker role'] = row['Worker role']
-                df1['city'] = row['city']
-                res_c = pd.concat([res_c, df1], ignore_index=True)
-
-            elif (row['Ставка за час постоянно'] == 1) & (row['Тип ставки'] == 'Ставка за час'):
-                #         print('Не постоянно')
-                # Диапазон до изменения ставки
-                dates1 = pd.date_range(start=row['Месяц'],
-                                       end=row['Дата нового условия ставки (час)'] - pd.Timedelta(hours=1), freq='D')
-                df1 = pd.DataFrame(dates1, columns=['Date'])
-                df1['Worker id'] = row['Worker id']
-                df1['Worker username'] = row['Worker username']
-                df1['Worker nickname'] = row['Worker nickname']
-                df1['Worker role'] = row['Worker role']
-                df1['city'] = row['city']
-                df1['Посменная зп'] = 0
-
-                # Диапазон после изменения ставки
-                dates2 = pd.date_range(start=row['Дата нового условия ставки (час)'], end=row['Конец месяца'], freq='D')
-                df2 = pd.DataFrame(dates2, columns=['Date'])
-                df2['Worker id'] = row['Worker id']
-                df2['Worker username'] = row['Worker username']
-                df2['Worker nickname'] = row['Worker nickname']
-                df2['Worker role'] = row['Worker role']
-                df2['city'] = row['city']
-                df2['Посменная зп'] = 0
-                res_c = pd.concat([res_c, df1, df2], ignore_index=True)
-
         res_c['Месяц'] = res_c['Date'].apply(lambda x: x.strftime('%Y-%m-01'))
         res_c['Месяц'] = pd.to_datetime(res_c['Месяц'], errors='coerce')
         res_c['Date'] = pd.to_datetime(res_c['Date'], errors='coerce')
@@ -4655,27 +3739,23 @@ def main():
         df_vyezd['Дата выезда4'] = pd.to_datetime(df_vyezd['Дата выезда4'], errors='coerce')
         df_vyezd['Дата выезда5'] = pd.to_datetime(df_vyezd['Дата выезда5'], errors='coerce')
 
-        for index, row in df_vyezd.iterrows():
-            if not pd.isnull(df_vyezd.loc[index]['Дата выезда 1']):
-                res.loc[(res['Worker id'] == df_vyezd.loc[index]['Worker id']) & \
-                        (res['Date'] == df_vyezd.loc[index]['Дата выезда 1']), 'Ставка за час'] = \
-                    float(df_vyezd.loc[index]['Ставка за выезд в другие города'])
-            if not pd.isnull(df_vyezd.loc[index]['Дата выезда 2']):
-                res.loc[(res['Worker id'] == df_vyezd.loc[index]['Worker id']) & \
-                        (res['Date'] == df_vyezd.loc[index]['Дата выезда 2']), 'Ставка за час'] = \
-                    float(df_vyezd.loc[index]['Ставка за выезд в другие города'])
-            if not pd.isnull(df_vyezd.loc[index]['Дата выезда3']):
-                res.loc[(res['Worker id'] == df_vyezd.loc[index]['Worker id']) & \
-                        (res['Date'] == df_vyezd.loc[index]['Дата выезда3']), 'Ставка за час'] = \
-                    float(df_vyezd.loc[index]['Ставка за выезд в другие города'])
-            if not pd.isnull(df_vyezd.loc[index]['Дата выезда4']):
-                res.loc[(res['Worker id'] == df_vyezd.loc[index]['Worker id']) & \
-                        (res['Date'] == df_vyezd.loc[index]['Дата выезда4']), 'Ставка за час'] = \
-                    float(df_vyezd.loc[index]['Ставка за выезд в другие города'])
-            if not pd.isnull(df_vyezd.loc[index]['Дата выезда5']):
-                res.loc[(res['Worker id'] == df_vyezd.loc[index]['Worker id']) & \
-                        (res['Date'] == df_vyezd.loc[index]['Дата выезда5']), 'Ставка за час'] = \
-                    float(df_vyezd.loc[index]['Ставка за выезд в другие города'])
+        # Даты выезда в длинном виде (Worker id, Date, ставка) в порядке строк и столбцов таблицы:
+        # при повторе даты у работника действует последняя, как при поочередной перезаписи
+        trip_columns = ['Дата выезда 1', 'Дата выезда 2', 'Дата выезда3', 'Дата выезда4', 'Дата выезда5']
+        df_trips = df_vyezd.reset_index(drop=True).reset_index(names='row') \
+            .melt(id_vars=['row', 'Worker id', 'Ставка за выезд в другие города'], value_vars=trip_columns,
+                  var_name='column', value_name='Date')
+        df_trips['column'] = df_trips['column'].map({column: i for i, column in enumerate(trip_columns)})
+        df_trips = df_trips[df_trips['Date'].notna()].sort_values(['row', 'column'], kind='stable') \
+            .drop_duplicates(subset=['Worker id', 'Date'], keep='last')
+        trip_rates = df_trips.set_index(['Worker id', 'Date'])['Ставка за выезд в другие города']
+
+        positions = trip_rates.index.get_indexer(pd.MultiIndex.from_arrays([res['Worker id'], res['Date']]))
+        found = positions >= 0
+        rate = res['Ставка за час'].to_numpy(copy=True)
+        rate[found] = trip_rates.to_numpy()[positions[found]]
+        res['Ставка за час'] = rate
+        # Учет дат выезда_. Конец
 
         res = df_for_workers.merge(res, on=['Месяц', 'Date', 'Worker id', 'Worker username', 'Worker nickname'], how='left')
         res['Сдельная зп'] = res['Ставка за час'] * res['Actual working seconds'] / 3600
@@ -4699,17 +3779,8 @@ def main():
                                  'Actual start time', 'Actual finish time', 'distance',
                                  'Actual working seconds', 'Ставка за час']]
 
-        # Очистка таблицы
-        truncate_t_bike = "TRUNCATE TABLE salary_outer_1 RESTART IDENTITY;"
-        with engine_postgresql.connect() as connection:
-            with connection.begin() as transaction:
-                print(f"Попытка очистить таблицу")
-                # Очистка salary_inner
-                connection.execute(sa.text(truncate_t_bike))
-                # Если ошибок нет, транзакция фиксируется автоматически
-                print(f"Таблица salary_outer_1 успешно очищена!")
-
-        res_for_workers.to_sql("salary_outer_1", engine_postgresql, if_exists="append", index=False)
+        # Замена содержимого таблицы
+        replace_table_contents(res_for_workers, "salary_outer_1", engine_postgresql)
         print('Таблица salary_outer_1 успешно обновлена!')
 
         df_zp_month = df_zp.groupby(['Месяц', 'Worker id', 'Worker username', 'Worker nickname'], as_index=False) \
@@ -4878,7 +3949,7 @@ def main():
                 ORDER BY ds."decade", ds."Nickname") ds
         '''
 
-        df_decades_bonus_temp = pd.read_sql(select_decades_bonus, engine_postgresql).fillna(0)
+        df_decades_bonus_temp = extract_sql(select_decades_bonus, engine_postgresql).fillna(0)
         df_decades_bonus = df_decades_bonus_temp.pivot_table(index=['Месяц', 'Worker id', 'Worker nickname'],
                                                              columns='nomer_decada',
                                                              values='bonus') \
@@ -4955,29 +4026,186 @@ def main():
             WHERE rn <= 5
         '''
 
-        df_month_bonus_temp = pd.read_sql(select_month_bonus, engine_postgresql).fillna(0)
+        df_month_bonus_temp = extract_sql(select_month_bonus, engine_postgresql).fillna(0)
         df_month_bonus_temp['Месяц'] = pd.to_datetime(df_month_bonus_temp['Месяц'], errors='coerce')
 
         df_res = df1.merge(df_month_bonus_temp, on=['Месяц', 'Worker id', 'Worker nickname'], how='left').fillna(0)
         df_res['add_time'] = pd.Timestamp.now() + pd.Timedelta(hours=3)
 
-        # Очистка таблицы
-        truncate_t_bike = "TRUNCATE TABLE salary_inner RESTART IDENTITY;"
-
-        with engine_postgresql.connect() as connection:
-            with connection.begin() as transaction:
-                print(f"Попытка очистить таблицу")
-                # Очистка salary_inner
-                connection.execute(sa.text(truncate_t_bike))
-                # Если ошибок нет, транзакция фиксируется автоматически
-                print(f"Таблица salary_inner успешно очищена!")
-
-        df_res.to_sql("salary_inner", engine_postgresql, if_exists="append", index=False)
+        # Замена содержимого таблицы
+        replace_table_contents(df_res, "salary_inner", engine_postgresql)
         print('Таблица salary_inner успешно обновлена!')
 
         # Расчет зп. Конец 30.09.2025
     except Exception as e:
         print(f"Произошла ошибка в ЗП: {e}")
-        pass
+        raise
+
+
+def get_mirror_spec(table: str) -> dict:
+    return next(spec for spec in MIRROR_TABLES if spec['table'] == table)
+
+
+# Стадии ETL и зависимости между ними. Стадия запускается после успешного завершения всех своих зависимостей,
+# независимые стадии выполняются параллельно.
+# Группа задает частоту запуска: fast - каждые 15 минут, hourly - раз в час, daily - раз в сутки.
+# workload - класс нагрузки для параметров сессии БД (см. db_engines), по умолчанию etl;
+# bulk - без ограничения времени запроса, для зеркальных таблиц и первоначального заполнения.
+STAGES = [
+    {'name': 'vni_city_daily_base', 'func': update_vni_city_daily_base, 'deps': [], 'group': 'fast',
+     'workload': 'bulk'},
+    {'name': 'vni_total', 'func': update_vni_total, 'deps': ['vni_city_daily_base'], 'group': 'fast',
+     'workload': 'report'},
+    {'name': 'vni_cities', 'func': update_vni_cities, 'deps': ['vni_city_daily_base'], 'group': 'fast',
+     'workload': 'report'},
+    {'name': 'vni_cities_for_graph', 'func': update_vni_cities_for_graph, 'deps': ['vni_cities'], 'group': 'fast'},
+    {'name': 'akb', 'func': update_akb, 'deps': [], 'group': 'fast', 'workload': 'report',
+     'sheets': [(PLAN_SPREADSHEET_ID, 'Плановое!A:E')]},
+    {'name': 'akb_result', 'func': update_akb_result, 'deps': ['akb'], 'group': 'fast'},
+    {'name': 't_bike_history', 'func': update_t_bike_history, 'deps': [], 'group': 'fast'},
+    {'name': 't_bike', 'func': update_t_bike_t_city_t_subscription, 'deps': [], 'group': 'fast'},
+    {'name': 'mirror_t_bike_use', 'func': partial(sync_mirror_table, get_mirror_spec('t_bike_use')),
+     'deps': [], 'group': 'fast', 'workload': 'bulk'},
+    {'name': 'mirror_t_trade', 'func': partial(sync_mirror_table, get_mirror_spec('t_trade')),
+     'deps': [], 'group': 'fast', 'workload': 'bulk'},
+    {'name': 'mirror_t_subscription_mapping',
+     'func': partial(sync_mirror_table, get_mirror_spec('t_subscription_mapping')), 'deps': [], 'group': 'fast',
+     'workload': 'bulk'},
+    {'name': 'mirror_t_ride_event_log', 'func': partial(sync_mirror_table, get_mirror_spec('t_ride_event_log')),
+     'deps': [], 'group': 'fast', 'workload': 'bulk'},
+    {'name': 'mirror_t_payment_details', 'func': partial(sync_mirror_table, get_mirror_spec('t_payment_details')),
+     'deps': [], 'group': 'fast', 'workload': 'bulk'},
+    {'name': 'mirror_t_audit_user_location',
+     'func': partial(sync_mirror_table, get_mirror_spec('t_audit_user_location')), 'deps': [], 'group': 'fast',
+     'workload': 'bulk'},
+    {'name': 'checkups_history', 'func': update_checkups_history,
+     'deps': ['checkup_goals', 't_bike', 'mirror_t_bike_use'], 'group': 'fast', 'workload': 'report'},
+    {'name': 'today_checkup_scooters', 'func': update_today_checkup_scooters,
+     'deps': ['t_bike', 'mirror_t_bike_use'], 'group': 'fast'},
+    {'name': 't_daily_report', 'func': update_t_daily_report,
+     'deps': ['vni_cities', 'akb_result', 't_bike_history', 't_bike', 'mirror_t_bike_use',
+              'mirror_t_payment_details'], 'group': 'fast', 'workload': 'report'},
+    {'name': 't_daily_report_result', 'func': update_t_daily_report_result, 'deps': ['t_daily_report'],
+     'group': 'fast'},
+    {'name': 'checkup_goals', 'func': update_checkup_goals, 'deps': [], 'group': 'hourly',
+     'sheets': [(WORKERS_SPREADSHEET_ID, 'Цели по чекапам!A:E')]},
+    {'name': 't_area', 'func': update_t_area, 'deps': [], 'group': 'hourly'},
+    {'name': 't_areas_parkings', 'func': update_t_areas_parkings, 'deps': ['t_area'], 'group': 'hourly'},
+    {'name': 't_parking_stats', 'func': update_t_parking_stats,
+     'deps': ['mirror_t_bike_use', 't_area', 't_areas_parkings'],
+     'group': 'hourly', 'workload': 'report'},
+    {'name': 't_orders_revenue', 'func': update_t_orders_revenue, 'deps': [], 'group': 'hourly'},
+    {'name': 't_parking_revenue_stats', 'func': update_t_parking_revenue_stats,
+     'deps': ['t_orders_revenue', 'mirror_t_bike_use', 'mirror_t_trade', 'mirror_t_subscription_mapping',
+              'mirror_t_payment_details', 't_bike', 't_area', 't_areas_parkings'],
+     'group': 'hourly', 'workload': 'report'},
+    {'name': 't_parking_kvt1', 'func': update_t_parking_kvt1, 'deps': ['t_bike_history', 't_area'],
+     'group': 'hourly', 'workload': 'report'},
+    {'name': 't_area_revenue_stats1', 'func': update_t_area_revenue_stats1,
+     'deps': ['t_parking_revenue_stats', 't_parking_kvt1'], 'group': 'hourly'},
+    {'name': 'workers_city_role', 'func': update_workers_city_role, 'deps': [], 'group': 'hourly',
+     'sheets': [(WORKERS_SPREADSHEET_ID, 'Workers_city_role!A:E')]},
+    {'name': 'grafik_rabot_google', 'func': update_grafik_rabot_google, 'deps': [], 'group': 'hourly',
+     'sheets': [(WORKERS_SPREADSHEET_ID, 'График работ!A:L')]},
+    {'name': 'salary', 'func': update_salary, 'deps': ['grafik_rabot_google'], 'group': 'daily',
+     'sheets': [(WORKERS_SPREADSHEET_ID, 'Таблица(ставки)!A:BF')]},
+    {'name': 't_bike_history_retention', 'func': update_t_bike_history_retention, 'deps': ['t_bike_history'],
+     'group': 'daily'},
+]
+
+STAGE_GROUPS = ('fast', 'hourly', 'daily')
+
+
+def resolve_stage_names(names) -> set:
+    """
+    Раскрывает имена групп в имена стадий.
+
+    Args:
+        names: Имена стадий и/или групп (fast, hourly, daily).
+
+    Returns:
+        Множество имен стадий.
+    """
+    stage_names = {stage['name'] for stage in STAGES}
+    res = set()
+    for name in names:
+        if name in STAGE_GROUPS:
+            res |= {stage['name'] for stage in STAGES if stage['group'] == name}
+        elif name in stage_names:
+            res.add(name)
+        else:
+            raise ValueError(f"Неизвестная стадия или группа: {name}")
+    return res
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Выгрузка данных из MySQL и Google Sheets в Postgres. '
+                    'Группы стадий: ' + ', '.join(STAGE_GROUPS) + '.')
+    parser.add_argument('--only', nargs='+', metavar='STAGE',
+                        help='запустить только эти стадии или группы (зависимости вне списка не запускаются)')
+    parser.add_argument('--skip', nargs='+', metavar='STAGE', default=[],
+                        help='не запускать эти стадии или группы')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='количество параллельных стадий (по умолчанию etl_max_workers или 4)')
+    parser.add_argument('--list', action='store_true', help='показать стадии и выйти')
+    parser.add_argument('--refresh-sheets', action='store_true',
+                        help='перезагрузить таблицы из Google Sheets, даже если их содержимое не изменилось')
+    parser.add_argument('--partition-history', action='store_true',
+                        help='перевести t_bike_history_delta в секционированную по дням таблицу и выйти')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    if args.list:
+        for stage in STAGES:
+            deps = ', '.join(stage['deps'])
+            print(f"{stage['name']} [{stage['group']}]" + (f" <- {deps}" if deps else ''))
+        return
+
+    try:
+        selected = resolve_stage_names(args.only) if args.only else {stage['name'] for stage in STAGES}
+        selected -= resolve_stage_names(args.skip)
+    except ValueError as e:
+        raise SystemExit(e)
+
+    max_workers = args.workers or get_max_workers()
+    engines = create_engines(get_mysql_url(), get_postgres_url(), pool_size=max_workers)
+
+    ensure_watermark_table(engines['etl'][1])
+    ensure_stage_runs_table(engines['etl'][1])
+    ensure_vni_total_state_table(engines['etl'][1])
+    sync_excluded_test_users(engines['etl'][1])
+    ensure_vni_city_daily_base_table(engines['etl'][1])
+    ensure_fleet_history_tables(engines['etl'][1])
+    ensure_history_hourly_table(engines['etl'][1])
+    ensure_sheet_hashes_table(engines['etl'][1])
+
+    if args.partition_history:
+        migrate_history_to_partitions(engines['etl'][1], get_run_window(engines['etl'][0])['today'])
+        return
+
+    # Метрики каждой стадии пишутся в etl_stage_runs с общим run_id
+    run_id = uuid.uuid4().hex
+    print(f"Запуск {run_id}")
+    # Диапазоны Google Таблиц выбранных стадий скачиваются по таблицам одним batchGet
+    plan_sheet_ranges([sheet for stage in STAGES if stage['name'] in selected for sheet in stage.get('sheets', [])],
+                      force_refresh=args.refresh_sheets)
+    stages = [{'name': stage['name'],
+               'func': partial(measure_stage, run_id, stage['name'],
+                               partial(stage['func'], *engines[stage.get('workload', 'etl')]), engines['etl'][1]),
+               'deps': stage['deps']} for stage in STAGES if stage['name'] in selected]
+    status = run_stages(stages, max_workers)
+    clear_fleet_snapshot()
+    clear_sheets()
+
+    failed = [name for name, result in status.items() if result != 'ok']
+    print(f"Выполнено стадий: {len(status) - len(failed)} из {len(status)}")
+    if failed:
+        print(f"Не выполнены: {', '.join(failed)}")
+
+
 if __name__ == "__main__":
     main()
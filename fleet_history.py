@@ -0,0 +1,299 @@
+import numpy as np
+import pandas as pd
+import sqlalchemy as sa
+
+from dtype_plans import widen_dtypes
+from postgres_loader import copy_dataframe, get_table_columns
+from stage_metrics import extract_sql
+
+
+# История парка самокатов в виде изменений вместо полного снимка t_bike на каждый запуск.
+# t_bike_history_delta - строки самокатов, у которых изменился хэш значимых столбцов с прошлого запуска,
+#     и строки removed = TRUE для самокатов, пропавших из t_bike;
+# t_bike_history_runs - по строке на запуск (пульс): момент снимка, размер парка, сколько строк изменилось;
+# t_bike_history_state - последний сохраненный хэш по каждому самокату;
+# t_bike_history_last_of_day - полный снимок на последний запуск каждого дня, опорный кадр для восстановления.
+# Снимок на момент запуска восстанавливает функция Postgres t_bike_history_at(момент): опорный кадр
+# не позже момента плюс изменения после него, по каждому самокату берется последняя строка.
+# Изменения, пульс и опорный кадр дня пишутся в одной транзакции (save_fleet_history).
+# При первом запуске (t_bike_history_runs пуст) история с начала вчерашнего дня один раз переносится
+# из полных снимков t_bike_history, чтобы отчеты "за вчера" не были пустыми.
+
+DELTA_TABLE = 't_bike_history_delta'
+
+# Столбцы, которые меняются с каждым сигналом самоката и не считаются изменением его состояния.
+# В восстановленном снимке они остаются такими, какими были при последнем изменении остальных столбцов
+UNHASHED_COLUMNS = ['timestamp', 'g_time', 'heart_time', 'gsm']
+
+create_t_bike_history_state = '''
+    CREATE TABLE IF NOT EXISTS t_bike_history_state (
+        id BIGINT PRIMARY KEY,
+        row_hash BIGINT NOT NULL
+    )
+'''
+
+create_t_bike_history_runs = '''
+    CREATE TABLE IF NOT EXISTS t_bike_history_runs (
+        "timestamp" TIMESTAMP PRIMARY KEY,
+        bikes INTEGER NOT NULL,
+        changed INTEGER NOT NULL,
+        removed INTEGER NOT NULL
+    )
+'''
+
+select_t_bike_history_state = '''
+    SELECT id, row_hash
+    FROM t_bike_history_state
+'''
+
+upsert_t_bike_history_run = '''
+    INSERT INTO t_bike_history_runs ("timestamp", bikes, changed, removed)
+    VALUES (:timestamp, :bikes, :changed, :removed)
+    ON CONFLICT ("timestamp") DO UPDATE
+    SET bikes = EXCLUDED.bikes,
+        changed = EXCLUDED.changed,
+        removed = EXCLUDED.removed
+'''
+
+create_history_indexes = [
+    'CREATE INDEX IF NOT EXISTS t_bike_history_delta_timestamp_idx ON t_bike_history_delta ("timestamp")',
+    'CREATE INDEX IF NOT EXISTS t_bike_history_last_of_day_timestamp_idx ON t_bike_history_last_of_day ("timestamp")',
+]
+
+select_delta_columns = '''
+    SELECT a.attname AS column_name
+    FROM pg_attribute a
+    WHERE a.attrelid = to_regclass('t_bike_history_delta')
+        AND a.attnum > 0
+        AND NOT a.attisdropped
+    ORDER BY a.attnum
+'''
+
+create_t_bike_history_at = '''
+    CREATE OR REPLACE FUNCTION t_bike_history_at(at_time TIMESTAMP)
+    RETURNS SETOF t_bike_history_delta
+    LANGUAGE sql STABLE
+    SET search_path FROM CURRENT
+    AS $$
+        WITH keyframe AS (
+            SELECT COALESCE(MAX(k."timestamp"), '-infinity'::timestamp) AS "timestamp"
+            FROM t_bike_history_last_of_day k
+            WHERE k."timestamp" <= at_time
+        ),
+        candidates AS (
+            SELECT {keyframe_columns}
+            FROM t_bike_history_last_of_day k
+            WHERE k."timestamp" = (SELECT "timestamp" FROM keyframe)
+            UNION ALL
+            SELECT {delta_columns}
+            FROM t_bike_history_delta d
+            WHERE d."timestamp" > (SELECT "timestamp" FROM keyframe)
+                AND d."timestamp" <= at_time
+        )
+        SELECT s.*
+        FROM
+            (
+            SELECT DISTINCT ON (c.id) c.*
+            FROM candidates c
+            ORDER BY c.id, c."timestamp" DESC
+            ) AS s
+        WHERE NOT s.removed
+    $$
+'''
+
+
+delete_t_bike_history_last_of_day = '''
+    DELETE FROM t_bike_history_last_of_day
+    WHERE t_bike_history_last_of_day."timestamp"::date = (NOW() AT TIME ZONE 'Europe/Athens')::date
+'''
+
+select_history_runs_exist = '''
+    SELECT EXISTS (SELECT 1 FROM t_bike_history_runs)
+'''
+
+# Перенос из t_bike_history: пульс по каждому снимку (changed - весь парк, снимки полные)
+backfill_t_bike_history_runs = '''
+    INSERT INTO t_bike_history_runs ("timestamp", bikes, changed, removed)
+    SELECT h."timestamp", COUNT(*), COUNT(*), 0
+    FROM t_bike_history h
+    WHERE h."timestamp" >= CAST(:date_from AS TIMESTAMP) AND h."timestamp" < CAST(:date_to AS TIMESTAMP)
+    GROUP BY h."timestamp"
+    ON CONFLICT ("timestamp") DO NOTHING
+'''
+
+# Каждый перенесенный снимок целиком - строки изменений
+backfill_t_bike_history_delta = '''
+    INSERT INTO t_bike_history_delta ({columns}, removed)
+    SELECT {columns}, FALSE
+    FROM t_bike_history h
+    WHERE h."timestamp" >= CAST(:date_from AS TIMESTAMP) AND h."timestamp" < CAST(:date_to AS TIMESTAMP)
+'''
+
+# Самокаты, пропавшие к следующему перенесенному снимку
+backfill_t_bike_history_removed = '''
+    INSERT INTO t_bike_history_delta ("timestamp", id, removed)
+    SELECT r.next_timestamp, h.id, TRUE
+    FROM
+        (
+        SELECT
+            r."timestamp" ,
+            LEAD(r."timestamp") OVER (ORDER BY r."timestamp") AS next_timestamp
+        FROM t_bike_history_runs r
+        WHERE r."timestamp" >= CAST(:date_from AS TIMESTAMP) AND r."timestamp" < CAST(:date_to AS TIMESTAMP)
+        ) AS r
+    JOIN t_bike_history h ON h."timestamp" = r."timestamp"
+    WHERE r.next_timestamp IS NOT NULL
+        AND NOT EXISTS (SELECT 1 FROM t_bike_history n WHERE n."timestamp" = r.next_timestamp AND n.id = h.id)
+'''
+
+# Опорный кадр вчерашнего дня - его последний снимок
+backfill_t_bike_history_last_of_day = '''
+    INSERT INTO t_bike_history_last_of_day ({columns})
+    SELECT {columns}
+    FROM t_bike_history h
+    WHERE h."timestamp" = (SELECT MAX(r."timestamp") FROM t_bike_history_runs r
+                           WHERE r."timestamp" < CAST(:day_to AS TIMESTAMP))
+'''
+
+# Самокаты последнего перенесенного снимка: первый запуск отметит пропавшие после него,
+# нулевой хэш заставит записать всех оставшихся
+backfill_t_bike_history_state = '''
+    INSERT INTO t_bike_history_state (id, row_hash)
+    SELECT DISTINCT h.id, 0
+    FROM t_bike_history h
+    WHERE h."timestamp" = (SELECT MAX(r."timestamp") FROM t_bike_history_runs r)
+'''
+
+
+def ensure_fleet_history_tables(engine_postgresql):
+    with engine_postgresql.begin() as connection:
+        connection.execute(sa.text(create_t_bike_history_state))
+        connection.execute(sa.text(create_t_bike_history_runs))
+
+
+def row_hashes(df: pd.DataFrame) -> np.ndarray:
+    """
+    Хэши строк снимка t_bike по всем столбцам, кроме UNHASHED_COLUMNS, в виде int64 для BIGINT.
+    Считаются по расширенным типам: хэш отрицательного int32 отличается от хэша того же int64.
+    """
+    hashes = pd.util.hash_pandas_object(widen_dtypes(df.drop(columns=UNHASHED_COLUMNS)), index=False)
+    return hashes.to_numpy().view(np.int64)
+
+
+def backfill_fleet_history(connection, timestamp: pd.Timestamp) -> int:
+    """
+    Один раз переносит историю с начала вчерашнего дня до снимка timestamp из полных снимков t_bike_history:
+    пульс запусков, строки изменений (с пропавшими самокатами), опорный кадр вчерашнего дня
+    и состояние для первого запуска. Выполняется, только если t_bike_history_runs пуст.
+
+    Args:
+        connection: Соединение SQLAlchemy с Postgres в транзакции записи истории.
+        timestamp: Момент текущего снимка.
+
+    Returns:
+        Количество перенесенных запусков.
+    """
+    if connection.execute(sa.text(select_history_runs_exist)).scalar():
+        return 0
+    history_columns = get_table_columns(connection, 't_bike_history')
+    delta_columns = [row.column_name for row in connection.execute(sa.text(select_delta_columns))]
+    columns = [column for column in delta_columns if column in history_columns and column != 'removed']
+    if not columns:
+        return 0
+
+    day = timestamp.normalize()
+    params = {'date_from': (day - pd.Timedelta(days=1)).to_pydatetime(), 'date_to': timestamp.to_pydatetime()}
+    column_list = ', '.join(f'"{column}"' for column in columns)
+    runs = connection.execute(sa.text(backfill_t_bike_history_runs), params).rowcount
+    if not runs:
+        return 0
+    connection.execute(sa.text(backfill_t_bike_history_delta.format(columns=column_list)), params)
+    connection.execute(sa.text(backfill_t_bike_history_removed), params)
+    connection.execute(sa.text(backfill_t_bike_history_last_of_day.format(columns=column_list)),
+                       {'day_to': day.to_pydatetime()})
+    connection.execute(sa.text('TRUNCATE TABLE t_bike_history_state'))
+    connection.execute(sa.text(backfill_t_bike_history_state))
+    return runs
+
+
+def append_fleet_history_delta(connection, df_t_bike: pd.DataFrame) -> dict:
+    """
+    Дописывает в t_bike_history_delta изменившиеся с прошлого запуска самокаты и пропавшие из t_bike,
+    записывает пульс запуска и обновляет сохраненные хэши.
+
+    Args:
+        connection: Соединение SQLAlchemy с Postgres в транзакции записи истории.
+        df_t_bike: Снимок t_bike (столбцы таблицы t_bike_history).
+
+    Returns:
+        Словарь {'bikes': размер парка, 'changed': изменившихся, 'removed': пропавших}.
+    """
+    if df_t_bike.empty:
+        return {'bikes': 0, 'changed': 0, 'removed': 0}
+
+    timestamp = df_t_bike['timestamp'].iloc[0]
+    hashes = row_hashes(df_t_bike)
+    ids = df_t_bike['id'].to_numpy()
+
+    df_state = extract_sql(sa.text(select_t_bike_history_state), connection)
+    stored_ids = df_state['id'].to_numpy(dtype=np.int64)
+    stored_hashes = df_state['row_hash'].to_numpy(dtype=np.int64)
+
+    positions = pd.Index(stored_ids).get_indexer(ids)
+    changed = positions < 0
+    known = ~changed
+    changed[known] = stored_hashes[positions[known]] != hashes[known]
+    removed_ids = stored_ids[~np.isin(stored_ids, ids)]
+
+    df_changed = df_t_bike[changed].assign(removed=False)
+    df_removed = pd.DataFrame({'timestamp': timestamp, 'id': removed_ids, 'removed': True})
+    df_new_state = pd.DataFrame({'id': ids, 'row_hash': hashes})
+    res = {'bikes': len(df_t_bike), 'changed': len(df_changed), 'removed': len(df_removed)}
+
+    copy_dataframe(connection, df_changed, DELTA_TABLE)
+    copy_dataframe(connection, df_removed, DELTA_TABLE)
+    connection.execute(sa.text(upsert_t_bike_history_run), dict(res, timestamp=timestamp.to_pydatetime()))
+    connection.execute(sa.text('TRUNCATE TABLE t_bike_history_state'))
+    copy_dataframe(connection, df_new_state, 't_bike_history_state')
+    return res
+
+
+def save_fleet_history(engine_postgresql, df_t_bike: pd.DataFrame) -> dict:
+    """
+    Записывает снимок парка в историю одной транзакцией: перенос истории при первом запуске,
+    изменения с пульсом запуска и опорный кадр дня в t_bike_history_last_of_day.
+    Упавшая запись не оставляет день с изменениями без опорного кадра.
+
+    Args:
+        engine_postgresql: Engine SQLAlchemy для Postgres.
+        df_t_bike: Снимок t_bike (столбцы таблицы t_bike_history).
+
+    Returns:
+        Словарь append_fleet_history_delta и 'backfilled' - количество перенесенных запусков.
+    """
+    with engine_postgresql.begin() as connection:
+        backfilled = 0
+        if not df_t_bike.empty:
+            backfilled = backfill_fleet_history(connection, df_t_bike['timestamp'].iloc[0])
+        res = append_fleet_history_delta(connection, df_t_bike)
+        connection.execute(sa.text(delete_t_bike_history_last_of_day))
+        copy_dataframe(connection, df_t_bike, 't_bike_history_last_of_day')
+    return dict(res, backfilled=backfilled)
+
+
+def create_history_snapshot_function(engine_postgresql):
+    """
+    Создает индексы по "timestamp" и функцию t_bike_history_at по текущему набору столбцов t_bike_history_delta.
+    Вызывается после загрузки: до первого снимка таблиц еще нет.
+    """
+    with engine_postgresql.begin() as connection:
+        columns = [row.column_name for row in connection.execute(sa.text(select_delta_columns))]
+        if not columns:
+            return
+        for create_index in create_history_indexes:
+            connection.execute(sa.text(create_index))
+        keyframe_columns = ', '.join('FALSE AS removed' if column == 'removed' else f'k."{column}"'
+                                     for column in columns)
+        delta_columns = ', '.join(f'd."{column}"' for column in columns)
+        connection.execute(sa.text(create_t_bike_history_at.format(keyframe_columns=keyframe_columns,
+                                                                   delta_columns=delta_columns)))
@@ -0,0 +1,129 @@
+import threading
+
+import pandas as pd
+
+from dtype_plans import plan_dtypes
+from stage_metrics import extract_sql
+
+
+# Снимок парка самокатов (shamri.t_bike) читается из MySQL один раз за запуск и общий для всех стадий:
+# t_bike_history, t_bike_history_last_of_day, t_bike и мгновенные самокаты в t_parking_stats
+# получают одни и те же строки на один момент времени.
+# Стадии работают в параллельных потоках, поэтому первое обращение читает снимок под блокировкой,
+# остальные ждут и получают тот же DataFrame. Изменять его нельзя - только копии (assign, replace, срезы).
+# Снимок живет весь запуск, поэтому хранится в компактных типах (dtype_plans): суженные целые и category.
+
+# Столбцы часов MySQL на момент снимка; в загружаемый DataFrame не попадают
+SNAPSHOT_CLOCK_COLUMNS = ['snapshot_epoch', 'day_from_epoch', 'day_to_epoch']
+
+select_fleet_snapshot = '''
+    SELECT
+        NOW() as 'timestamp',
+        IFNULL(t_bike.id,0) AS id,
+        IFNULL(t_bike.number,0) AS number,
+        IFNULL(t_bike.imei,0) AS imei,
+        IFNULL(t_bike.type_id,0) AS type_id,
+        IFNULL(t_bike.g_time,0) AS g_time,
+        IFNULL(t_bike.g_lat,0) AS g_lat,
+        IFNULL(t_bike.g_lng,0) AS g_lng,
+        IFNULL(t_bike.status,0) AS status,
+        IFNULL(t_bike.use_status,0) AS use_status,
+        IFNULL(t_bike.power,0) AS power,
+        IFNULL(t_bike.gsm,0) AS gsm,
+        IFNULL(t_bike.gps_number,'empty') AS gps_number,
+        IFNULL(t_bike.city_id,0) AS city_id,
+        IFNULL(t_bike.heart_time,0) AS heart_time,
+        IFNULL(t_bike.version,0) AS version,
+        IFNULL(t_bike.version_time,0) AS version_time,
+        IFNULL(t_bike.readpack,0) AS readpack,
+        IFNULL(t_bike.add_date, STR_TO_DATE("2024-01-01 00:00:00", "%Y-%m-%d %H:%i:%s")) AS add_date,
+        IFNULL(t_bike.error_status,0) AS error_status,
+        IFNULL(t_bike.server_ip,'0.0.0.0') AS server_ip,
+        IFNULL(t_bike.bike_status,0) AS bike_status,
+        IFNULL(t_bike.sponsors_id,0) AS sponsors_id,
+        IFNULL(t_bike.bike_no,0) AS bike_no,
+        IFNULL(t_bike.bike_type,0) AS bike_type,
+        IFNULL(t_bike.extend_info,0) AS extend_info,
+        IFNULL(t_bike.area_id,0) AS area_id,
+        IFNULL(t_bike.bike_power,0) AS bike_power,
+        IFNULL(t_bike.bike_power_status,0) AS bike_power_status,
+        IFNULL(t_bike.mac,0) AS mac,
+        IFNULL(t_bike.iccid,'empty') AS iccid,
+        IFNULL(t_bike.maintain_status,0) AS maintain_status,
+        IFNULL(t_bike.extra_lock_status,0) AS extra_lock_status,
+        IFNULL(t_bike.available,0) AS available,
+        IFNULL(t_bike.model,'empty') AS model,
+        IFNULL(t_bike.protocol,0) AS protocol,
+        IFNULL(t_bike.frame_number,'empty') AS frame_number,
+        IFNULL(t_bike.battery_key,0) AS battery_key,
+        IFNULL(t_bike.release_time, STR_TO_DATE("2024-01-01 00:00:00", "%Y-%m-%d %H:%i:%s")) AS release_time,
+        IFNULL(t_bike.last_service_time, STR_TO_DATE("2024-01-01 00:00:00", "%Y-%m-%d %H:%i:%s")) AS last_service_time,
+        IFNULL(t_bike.industry_id,0) AS industry_id,
+        IFNULL(t_bike.ble_key,'empty') AS ble_key,
+        IFNULL(t_bike.user_group_id,0) AS user_group_id,
+        UNIX_TIMESTAMP(NOW()) AS snapshot_epoch,
+        UNIX_TIMESTAMP(CURDATE()) AS day_from_epoch,
+        UNIX_TIMESTAMP(CURDATE() + INTERVAL 1 DAY) AS day_to_epoch
+    FROM shamri.t_bike
+'''
+
+_lock = threading.Lock()
+_snapshot = None
+
+
+def get_fleet_snapshot(engine_mysql) -> dict:
+    """
+    Возвращает снимок t_bike текущего запуска, при первом обращении читает его из MySQL.
+
+    Args:
+        engine_mysql: Engine SQLAlchemy для MySQL.
+
+    Returns:
+        Словарь {'frame': DataFrame строк t_bike в формате таблиц t_bike и t_bike_history,
+                 'epoch': unix-время снимка,
+                 'day_from_epoch', 'day_to_epoch': границы текущего дня MySQL в unix-времени}.
+        Для пустого t_bike значения времени равны None.
+    """
+    global _snapshot
+    with _lock:
+        if _snapshot is None:
+            df = extract_sql(select_fleet_snapshot, engine_mysql)
+            clock = df[SNAPSHOT_CLOCK_COLUMNS].iloc[0] if len(df) else None
+            _snapshot = {
+                'frame': plan_dtypes(df.drop(columns=SNAPSHOT_CLOCK_COLUMNS), 't_bike'),
+                'epoch': None if clock is None else int(clock['snapshot_epoch']),
+                'day_from_epoch': None if clock is None else int(clock['day_from_epoch']),
+                'day_to_epoch': None if clock is None else int(clock['day_to_epoch']),
+            }
+        return _snapshot
+
+
+def clear_fleet_snapshot():
+    """
+    Забывает снимок после запуска: следующий запуск прочитает t_bike заново, а память освобождается.
+    """
+    global _snapshot
+    with _lock:
+        _snapshot = None
+
+
+def instant_scooters(snapshot: dict) -> pd.DataFrame:
+    """
+    Самокаты, доступные в момент снимка: error_status 0 или 7, координаты свежее 15 минут,
+    сигнал за текущий день и status != 1.
+
+    Args:
+        snapshot: Снимок из get_fleet_snapshot.
+
+    Returns:
+        DataFrame (id, g_lat, g_lng).
+    """
+    df = snapshot['frame']
+    if df.empty:
+        return df[['id', 'g_lat', 'g_lng']]
+    mask = (df['error_status'].isin([0, 7])
+            & (df['g_time'] > snapshot['epoch'] - 900)
+            & (df['heart_time'] >= snapshot['day_from_epoch'])
+            & (df['heart_time'] < snapshot['day_to_epoch'])
+            & (df['status'] != 1))
+    return df.loc[mask, ['id', 'g_lat', 'g_lng']]
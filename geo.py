@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+import shapely
+from shapely.geometry import Polygon
+
+
+# Геометрические операции над полигонами парковок и зон.
+# Координаты из polyline идут как (lat, lng) и используются в этом же порядке, как и раньше в Polygon(...)
+
+
+def polygons_from_tuples(tuples: pd.Series) -> np.ndarray:
+    """
+    Строит массив полигонов shapely из списков координат.
+
+    Args:
+        tuples: Серия списков кортежей (lat, lng), например результат decode_polyline_to_tuples.
+
+    Returns:
+        Массив shapely.Polygon в порядке серии.
+    """
+    return np.array([Polygon(coordinates) for coordinates in tuples], dtype=object)
+
+
+def areas_containing_polygons(area_polys: np.ndarray, inner_polys: np.ndarray) -> tuple:
+    """
+    Находит пары (внутренний полигон, зона), где зона содержит полигон целиком.
+    Зоны индексируются STRtree, кандидаты отбираются по охватывающим прямоугольникам,
+    затем проверяются точным предикатом (within для полигона равносилен contains для зоны).
+
+    Args:
+        area_polys: Полигоны зон.
+        inner_polys: Полигоны, для которых ищутся содержащие их зоны (парковки).
+
+    Returns:
+        Кортеж массивов (позиции в inner_polys, позиции в area_polys),
+        упорядоченный как при cross merge: по внутреннему полигону, затем по зоне.
+    """
+    tree = shapely.STRtree(area_polys)
+    inner_idx, area_idx = tree.query(inner_polys, predicate='within')
+    order = np.lexsort((area_idx, inner_idx))
+    return inner_idx[order], area_idx[order]
+
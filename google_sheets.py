@@ -0,0 +1,337 @@
+import hashlib
+import json
+import threading
+import time
+
+import google.oauth2.service_account
+import google_auth_httplib2
+import googleapiclient.discovery
+import googleapiclient.errors
+import googleapiclient.http
+import httplib2
+import pandas as pd
+import sqlalchemy as sa
+from psycopg import sql
+
+from sheet_schemas import FORMATTED_VALUE, UNFORMATTED_VALUE
+from stage_metrics import record_extract
+
+
+# Чтение Google Таблиц. Диапазоны, которые нужны выбранным стадиям, заранее собираются по таблицам
+# (plan_sheet_ranges), и первая стадия, обратившаяся к таблице, скачивает все ее диапазоны одним
+# values().batchGet; остальные стадии получают свои DataFrame из памяти запуска.
+# Стадии работают в параллельных потоках: блокировка _lock защищает только словари запуска, сам batchGet
+# идет без нее. Пока таблица скачивается, другие стадии той же таблицы ждут ее события в _fetching,
+# а стадии других таблиц скачивают свои параллельно.
+# Хэши содержимого загруженных диапазонов хранятся в Postgres (google_sheet_hashes) и пишутся в той же
+# транзакции, что и перезагрузка таблицы: если диапазон не изменился с последней успешной загрузки
+# и таблица не пуста, стадия не чистит и не перезагружает ее.
+# Клиент Sheets API создается один раз на процесс (get_sheets_service) и общий для всех стадий.
+# Все диапазоны таблицы скачиваются одним batchGet в UNFORMATTED_VALUE, типы и текст столбцов
+# приводит coerce_sheet по схемам sheet_schemas.
+
+create_google_sheet_hashes = '''
+    CREATE TABLE IF NOT EXISTS google_sheet_hashes (
+        spreadsheet_id TEXT NOT NULL,
+        range_name TEXT NOT NULL,
+        content_hash TEXT NOT NULL,
+        updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        PRIMARY KEY (spreadsheet_id, range_name)
+    )
+'''
+
+select_sheet_hash = '''
+    SELECT content_hash
+    FROM google_sheet_hashes
+    WHERE spreadsheet_id = :spreadsheet_id AND range_name = :range_name
+'''
+
+upsert_sheet_hash = '''
+    INSERT INTO google_sheet_hashes (spreadsheet_id, range_name, content_hash, updated_at)
+    VALUES (:spreadsheet_id, :range_name, :content_hash, NOW())
+    ON CONFLICT (spreadsheet_id, range_name) DO UPDATE
+    SET content_hash = EXCLUDED.content_hash,
+        updated_at = EXCLUDED.updated_at
+'''
+
+select_table_exists = '''
+    SELECT to_regclass(:table_name) IS NOT NULL
+'''
+
+# Для чтения достаточно 'spreadsheets.readonly'
+SCOPES = ['https://www.googleapis.com/auth/spreadsheets.readonly']
+
+_lock = threading.Lock()
+_planned_ranges = {}
+_frames = {}
+_hashes = {}
+_force_refresh = False
+# Таблицы, которые сейчас скачиваются: {ID таблицы: threading.Event}
+_fetching = {}
+
+# Клиент Sheets API один на процесс
+_service_lock = threading.Lock()
+_service = None
+
+
+def values_to_dataframe(values: list, spreadsheet_id: str, range_name: str) -> pd.DataFrame:
+    """
+    Преобразует значения диапазона (список строк) в DataFrame, первая строка - заголовки.
+    """
+    if not values:
+        print(f"В диапазоне '{range_name}' таблицы '{spreadsheet_id}' нет данных.")
+        return pd.DataFrame()
+
+    headers = values[0]
+    data_rows = values[1:]
+    if headers:
+        df = pd.DataFrame(data_rows, columns=headers)
+    else:
+        df = pd.DataFrame(values)
+        print("Предупреждение: Заголовки не обнаружены. Столбцы названы автоматически (0, 1, 2...).")
+    print(f"Данные из диапазона '{range_name}' успешно прочитаны и преобразованы в Pandas DataFrame.")
+    return df
+
+
+def _report_error(error: Exception):
+    if isinstance(error, googleapiclient.errors.HttpError):
+        print(f"Ошибка Google Sheets API: {error}")
+        print(f"Код ошибки: {error.resp.status}")
+        print(f"Сообщение об ошибке: {error._get_reason()}")
+    else:
+        print(f"Произошла непредвиденная ошибка: {error}")
+
+
+def read_sheet_data_to_pandas(service, spreadsheet_id: str, range_name: str):
+    """
+    Читает данные из Google Таблицы по указанному диапазону и преобразует их в Pandas DataFrame.
+
+    Args:
+        service: Объект службы Google Sheets API.
+        spreadsheet_id: ID Google Таблицы.
+        range_name: Диапазон ячеек (например, 'Sheet1!A1:D10').
+
+    Returns:
+        Pandas DataFrame с данными или None в случае ошибки.
+    """
+    frames = batch_read_sheets(service, spreadsheet_id, [range_name])
+    return None if frames is None else frames[range_name]
+
+
+def values_hash(values: list) -> str:
+    return hashlib.sha256(json.dumps(values, ensure_ascii=False, separators=(',', ':')).encode()).hexdigest()
+
+
+def _batch_get(service, spreadsheet_id: str, ranges: list, render_option: str):
+    # Значения диапазонов и их хэши: {диапазон: (DataFrame, хэш)} или None в случае ошибки
+    if not service:
+        return None
+
+    try:
+        started = time.monotonic()
+        result = service.spreadsheets().values().batchGet(
+            spreadsheetId=spreadsheet_id,
+            ranges=list(ranges),
+            majorDimension='ROWS',
+            valueRenderOption=render_option,
+            dateTimeRenderOption='FORMATTED_STRING'
+        ).execute()
+        seconds = time.monotonic() - started
+
+        # valueRanges идут в порядке запроса, а их 'range' уже нормализован API ('Sheet1'!A1:E1000)
+        value_ranges = result.get('valueRanges', [])
+        res = {}
+        for range_name, value_range in zip(ranges, value_ranges):
+            values = value_range.get('values', [])
+            res[range_name] = (values_to_dataframe(values, spreadsheet_id, range_name), values_hash(values))
+        for df, _ in res.values():
+            record_extract(df, seconds / len(res))
+        return res
+
+    except Exception as e:
+        _report_error(e)
+        return None
+
+
+def batch_read_sheets(service, spreadsheet_id: str, ranges: list, render_option: str = FORMATTED_VALUE):
+    """
+    Читает несколько диапазонов одной Google Таблицы одним запросом values().batchGet.
+
+    Args:
+        service: Объект службы Google Sheets API.
+        spreadsheet_id: ID Google Таблицы.
+        ranges: Диапазоны ячеек (например, ['Sheet1!A:E', 'Sheet2!A:L']).
+        render_option: valueRenderOption запроса ('FORMATTED_VALUE' или 'UNFORMATTED_VALUE').
+
+    Returns:
+        Словарь {диапазон: DataFrame} в порядке ranges или None в случае ошибки.
+    """
+    res = _batch_get(service, spreadsheet_id, ranges, render_option)
+    return None if res is None else {range_name: df for range_name, (df, _) in res.items()}
+
+
+def plan_sheet_ranges(sheet_ranges, force_refresh: bool = False):
+    """
+    Запоминает диапазоны, которые прочитают стадии запуска, чтобы скачать их по таблицам одним запросом.
+
+    Args:
+        sheet_ranges: Пары (ID таблицы, диапазон).
+        force_refresh: Перезагружать таблицы, даже если диапазоны не изменились.
+    """
+    global _force_refresh
+    with _lock:
+        _force_refresh = force_refresh
+        for spreadsheet_id, range_name in sheet_ranges:
+            ranges = _planned_ranges.setdefault(spreadsheet_id, [])
+            if range_name not in ranges:
+                ranges.append(range_name)
+
+
+def get_sheet(service, spreadsheet_id: str, range_name: str):
+    """
+    Возвращает DataFrame диапазона. При первом обращении к таблице скачивает одним batchGet
+    в UNFORMATTED_VALUE этот диапазон и все еще не скачанные запланированные диапазоны той же таблицы
+    (привести столбцы - coerce_sheet). Запрос идет вне _lock; параллельные обращения к той же таблице
+    дожидаются его, а не скачивают ее повторно.
+
+    Args:
+        service: Объект службы Google Sheets API.
+        spreadsheet_id: ID Google Таблицы.
+        range_name: Диапазон ячеек.
+
+    Returns:
+        Копия DataFrame с данными или None в случае ошибки.
+    """
+    key = (spreadsheet_id, range_name)
+    while True:
+        with _lock:
+            if key in _frames:
+                df = _frames[key]
+                break
+            event = _fetching.get(spreadsheet_id)
+            if event is None:
+                event = _fetching[spreadsheet_id] = threading.Event()
+                ranges = [range_name] + [r for r in _planned_ranges.get(spreadsheet_id, [])
+                                         if r != range_name and (spreadsheet_id, r) not in _frames]
+                fetching = True
+            else:
+                fetching = False
+        if not fetching:
+            # Таблицу скачивает другая стадия; после нее диапазон берется из памяти или скачивается заново
+            event.wait()
+            continue
+
+        frames = None
+        try:
+            frames = _batch_get(service, spreadsheet_id, ranges, UNFORMATTED_VALUE)
+        finally:
+            with _lock:
+                for r, (df, content_hash) in (frames or {}).items():
+                    _frames[(spreadsheet_id, r)] = df
+                    _hashes[(spreadsheet_id, r)] = content_hash
+                del _fetching[spreadsheet_id]
+            event.set()
+        if frames is None:
+            return None
+    # Стадии изменяют полученный DataFrame, общий остается нетронутым
+    return df.copy()
+
+
+def ensure_sheet_hashes_table(engine_postgresql):
+    with engine_postgresql.begin() as connection:
+        connection.execute(sa.text(create_google_sheet_hashes))
+
+
+def _table_is_empty(connection, table_name: str) -> bool:
+    if not connection.execute(sa.text(select_table_exists), {'table_name': table_name}).scalar():
+        return True
+    table = sql.Identifier(table_name).as_string(connection.connection.driver_connection)
+    return not connection.exec_driver_sql(f'SELECT EXISTS (SELECT 1 FROM {table})').scalar()
+
+
+def sheet_changed(engine_postgresql, spreadsheet_id: str, range_name: str, table_name: str) -> bool:
+    """
+    Нужно ли перезагружать таблицу из скачанного в этом запуске диапазона: диапазон изменился
+    с последней успешной загрузки (remember_sheet) или таблица пуста либо отсутствует.
+    Всегда True при force_refresh и для диапазонов, которые еще не скачивались.
+
+    Args:
+        engine_postgresql: Engine SQLAlchemy для Postgres.
+        spreadsheet_id: ID Google Таблицы.
+        range_name: Диапазон ячеек.
+        table_name: Таблица Postgres, в которую загружается диапазон.
+    """
+    with _lock:
+        content_hash = _hashes.get((spreadsheet_id, range_name))
+        if _force_refresh or content_hash is None:
+            return True
+    with engine_postgresql.connect() as connection:
+        stored_hash = connection.execute(sa.text(select_sheet_hash), {'spreadsheet_id': spreadsheet_id,
+                                                                      'range_name': range_name}).scalar()
+        return stored_hash != content_hash or _table_is_empty(connection, table_name)
+
+
+def remember_sheet(connection, spreadsheet_id: str, range_name: str):
+    """
+    Сохраняет хэш скачанного диапазона. Вызывается в транзакции перезагрузки таблицы,
+    чтобы хэш и содержимое таблицы фиксировались или откатывались вместе.
+
+    Args:
+        connection: Соединение SQLAlchemy с Postgres в транзакции перезагрузки.
+        spreadsheet_id: ID Google Таблицы.
+        range_name: Диапазон ячеек.
+    """
+    with _lock:
+        content_hash = _hashes.get((spreadsheet_id, range_name))
+    if content_hash is not None:
+        connection.execute(sa.text(upsert_sheet_hash), {'spreadsheet_id': spreadsheet_id, 'range_name': range_name,
+                                                        'content_hash': content_hash})
+
+
+def clear_sheets():
+    """
+    Забывает скачанные диапазоны, их хэши и план после запуска.
+    """
+    global _force_refresh
+    with _lock:
+        _planned_ranges.clear()
+        _frames.clear()
+        _hashes.clear()
+        _force_refresh = False
+
+
+def _request_builder(credentials):
+    # httplib2.Http не потокобезопасен: каждый запрос общего клиента идет через свое соединение
+    def build_request(http, *args, **kwargs):
+        return googleapiclient.http.HttpRequest(
+            google_auth_httplib2.AuthorizedHttp(credentials, http=httplib2.Http()), *args, **kwargs)
+    return build_request
+
+
+def get_sheets_service(service_account_json: str):
+    """
+    Возвращает общий для всех стадий объект службы Google Sheets API, при первом вызове создает его.
+    Учетные данные берутся из JSON в памяти, документ discovery - из поставляемого с библиотекой
+    (static_discovery), без запроса к Google.
+
+    Args:
+        service_account_json: JSON учетных данных сервисного аккаунта.
+
+    Returns:
+        Объект googleapiclient.discovery.Resource для Sheets API.
+    """
+    global _service
+    with _service_lock:
+        if _service is None:
+            try:
+                # strict=False: в private_key переменной окружения бывают неэкранированные переводы строк
+                info = json.loads(service_account_json, strict=False)
+                creds = google.oauth2.service_account.Credentials.from_service_account_info(info, scopes=SCOPES)
+                _service = googleapiclient.discovery.build('sheets', 'v4', credentials=creds,
+                                                           requestBuilder=_request_builder(creds),
+                                                           static_discovery=True, cache_discovery=False)
+                print("Сервис Google Sheets API успешно инициализирован.")
+            except Exception as e:
+                print(f"Ошибка при инициализации сервиса Google Sheets API: {e}")
+                return None
+        return _service
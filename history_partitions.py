@@ -0,0 +1,265 @@
+import datetime
+import os
+import re
+
+import pandas as pd
+import sqlalchemy as sa
+
+from fleet_history import create_history_snapshot_function
+from postgres_loader import create_table_for_frame
+
+
+# Секционирование истории самокатов t_bike_history_delta по дням (PARTITION BY RANGE ("timestamp")).
+# Секции создаются заранее на t_bike_history_partitions_ahead дней вперед, чтобы строки не попадали
+# в секцию по умолчанию; чтения с фильтром по "timestamp" затрагивают только свои дни.
+# Секции старше t_bike_history_retention_days сворачиваются в почасовые агрегаты t_bike_history_hourly
+# (по последнему запуску каждого часа, восстановленному через t_bike_history_at) и удаляются.
+# Перевод уже существующей обычной таблицы в секционированную - только явно: entrypoint.py --partition-history.
+
+PARENT_TABLE = 't_bike_history_delta'
+LEGACY_PARTITION = 't_bike_history_delta_legacy'
+
+DEFAULT_PARTITIONS_AHEAD = 7
+DEFAULT_RETENTION_DAYS = 90
+
+create_t_bike_history_hourly = '''
+    CREATE TABLE IF NOT EXISTS t_bike_history_hourly (
+        "timestamp_hour" TIMESTAMP NOT NULL,
+        city_id BIGINT NOT NULL,
+        error_status BIGINT NOT NULL,
+        bikes INTEGER NOT NULL,
+        power_less_30 INTEGER NOT NULL,
+        avg_power DOUBLE PRECISION,
+        PRIMARY KEY ("timestamp_hour", city_id, error_status)
+    )
+'''
+
+# relkind: 'p' - секционированная таблица, 'r' - обычная
+select_table_kind = '''
+    SELECT c.relkind
+    FROM pg_class c
+    WHERE c.oid = to_regclass(:table_name)
+'''
+
+select_partitions = '''
+    SELECT
+        c.relname AS name,
+        pg_get_expr(c.relpartbound, c.oid) AS bound
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = to_regclass('t_bike_history_delta')
+'''
+
+# Столбцы как у полного снимка дня плюс признак пропавшего самоката
+create_partitioned_parent = '''
+    CREATE TABLE t_bike_history_delta (
+        LIKE t_bike_history_last_of_day INCLUDING DEFAULTS,
+        removed BOOLEAN
+    ) PARTITION BY RANGE ("timestamp")
+'''
+
+create_partitioned_parent_like = '''
+    CREATE TABLE t_bike_history_delta (
+        LIKE t_bike_history_delta_legacy INCLUDING DEFAULTS
+    ) PARTITION BY RANGE ("timestamp")
+'''
+
+create_default_partition = '''
+    CREATE TABLE IF NOT EXISTS t_bike_history_delta_default PARTITION OF t_bike_history_delta DEFAULT
+'''
+
+create_day_partition = '''
+    CREATE TABLE IF NOT EXISTS {name} PARTITION OF t_bike_history_delta
+    FOR VALUES FROM ('{day_from}') TO ('{day_to}')
+'''
+
+select_legacy_max_timestamp = '''
+    SELECT MAX("timestamp") AS max_timestamp
+    FROM t_bike_history_delta_legacy
+'''
+
+rollup_partition = '''
+    INSERT INTO t_bike_history_hourly ("timestamp_hour", city_id, error_status, bikes, power_less_30, avg_power)
+    SELECT
+        hr."timestamp_hour" ,
+        tbh.city_id ,
+        tbh.error_status ,
+        COUNT(tbh.id) AS bikes ,
+        COUNT(tbh.id) FILTER (WHERE tbh.power < 30) AS power_less_30 ,
+        AVG(tbh.power)::float AS avg_power
+    FROM
+        (
+        SELECT
+            date_trunc('hour', r."timestamp") AS "timestamp_hour" ,
+            MAX(r."timestamp") AS "timestamp"
+        FROM t_bike_history_runs r
+        WHERE r."timestamp" >= CAST(:date_from AS TIMESTAMP)
+            AND r."timestamp" < CAST(:date_to AS TIMESTAMP)
+        GROUP BY 1
+        ) AS hr
+    CROSS JOIN LATERAL t_bike_history_at(hr."timestamp") tbh
+    GROUP BY 1, 2, 3
+    ON CONFLICT DO NOTHING
+'''
+
+_BOUND_RE = re.compile(r"FOR VALUES FROM \((.+)\) TO \((.+)\)")
+
+
+def get_partitions_ahead() -> int:
+    return int(os.environ.get('t_bike_history_partitions_ahead', DEFAULT_PARTITIONS_AHEAD))
+
+
+def get_retention_days() -> int:
+    return int(os.environ.get('t_bike_history_retention_days', DEFAULT_RETENTION_DAYS))
+
+
+def ensure_history_hourly_table(engine_postgresql):
+    with engine_postgresql.begin() as connection:
+        connection.execute(sa.text(create_t_bike_history_hourly))
+
+
+def _partition_name(day: datetime.date) -> str:
+    return f"{PARENT_TABLE}_p{day:%Y%m%d}"
+
+
+def _parse_bound(value: str):
+    # MINVALUE/MAXVALUE - открытая граница, иначе '2026-10-18 00:00:00'
+    value = value.strip()
+    if value in ('MINVALUE', 'MAXVALUE'):
+        return None
+    return datetime.datetime.fromisoformat(value.strip("'"))
+
+
+def _table_kind(connection, table_name: str):
+    return connection.execute(sa.text(select_table_kind), {'table_name': table_name}).scalar()
+
+
+def list_history_partitions(connection) -> list:
+    """
+    Секции t_bike_history_delta с границами.
+
+    Returns:
+        Список словарей {'name', 'lower', 'upper'}; для открытой границы значение None,
+        у секции по умолчанию обе границы None и 'default': True.
+    """
+    res = []
+    for row in connection.execute(sa.text(select_partitions)):
+        match = _BOUND_RE.search(row.bound)
+        if match is None:
+            res.append({'name': row.name, 'lower': None, 'upper': None, 'default': True})
+        else:
+            res.append({'name': row.name, 'lower': _parse_bound(match.group(1)),
+                        'upper': _parse_bound(match.group(2)), 'default': False})
+    return res
+
+
+def _create_day_partitions(connection, first_day: datetime.date, last_day: datetime.date) -> int:
+    partitions = [p for p in list_history_partitions(connection) if not p['default']]
+    created = 0
+    day = first_day
+    while day <= last_day:
+        day_from = datetime.datetime.combine(day, datetime.time())
+        day_to = day_from + datetime.timedelta(days=1)
+        overlaps = any((p['lower'] is None or p['lower'] < day_to) and (p['upper'] is None or p['upper'] > day_from)
+                       for p in partitions)
+        if not overlaps:
+            connection.execute(sa.text(create_day_partition.format(name=_partition_name(day), day_from=day_from,
+                                                                   day_to=day_to)))
+            created += 1
+        day += datetime.timedelta(days=1)
+    return created
+
+
+def ensure_history_partitions(engine_postgresql, df_t_bike: pd.DataFrame) -> int:
+    """
+    Создает секции t_bike_history_delta на день снимка и t_bike_history_partitions_ahead дней вперед.
+    Если таблицы еще нет, создает ее сразу секционированной (по столбцам t_bike_history_last_of_day);
+    на новой установке пустая t_bike_history_last_of_day сначала создается по столбцам снимка.
+    Обычную таблицу не трогает: ее переводит только entrypoint.py --partition-history.
+
+    Args:
+        engine_postgresql: Engine SQLAlchemy для Postgres.
+        df_t_bike: Непустой снимок парка (get_fleet_snapshot), день берется по его "timestamp".
+
+    Returns:
+        Количество созданных секций.
+    """
+    with engine_postgresql.begin() as connection:
+        kind = _table_kind(connection, PARENT_TABLE)
+        if kind is None:
+            if _table_kind(connection, 't_bike_history_last_of_day') is None:
+                create_table_for_frame(connection, df_t_bike, 't_bike_history_last_of_day')
+            connection.execute(sa.text(create_partitioned_parent))
+            connection.execute(sa.text(create_default_partition))
+        elif kind != 'p':
+            print(f"Таблица {PARENT_TABLE} не секционирована, для перевода запустите entrypoint.py --partition-history")
+            return 0
+        first_day = df_t_bike['timestamp'].iloc[0].date()
+        return _create_day_partitions(connection, first_day,
+                                      first_day + datetime.timedelta(days=get_partitions_ahead()))
+
+
+def migrate_history_to_partitions(engine_postgresql, today: str):
+    """
+    Переводит обычную t_bike_history_delta в секционированную в одной транзакции:
+    старая таблица переименовывается и подключается секцией до следующего дня после ее последней строки,
+    дальше создаются дневные секции. Функция t_bike_history_at пересоздается на новую таблицу.
+
+    Args:
+        engine_postgresql: Engine SQLAlchemy для Postgres.
+        today: Сегодняшний день 'YYYY-MM-DD'.
+    """
+    with engine_postgresql.begin() as connection:
+        kind = _table_kind(connection, PARENT_TABLE)
+        if kind != 'r':
+            print(f"Таблица {PARENT_TABLE} уже секционирована или отсутствует, перевод не нужен")
+            return
+        connection.execute(sa.text('DROP FUNCTION IF EXISTS t_bike_history_at(TIMESTAMP)'))
+        connection.execute(sa.text(f'ALTER TABLE {PARENT_TABLE} RENAME TO {LEGACY_PARTITION}'))
+        connection.execute(sa.text('ALTER INDEX IF EXISTS t_bike_history_delta_timestamp_idx '
+                                   'RENAME TO t_bike_history_delta_legacy_timestamp_idx'))
+        connection.execute(sa.text(create_partitioned_parent_like))
+
+        max_timestamp = connection.execute(sa.text(select_legacy_max_timestamp)).scalar()
+        first_day = datetime.date.fromisoformat(today)
+        if max_timestamp is not None:
+            first_day = max(first_day, max_timestamp.date() + datetime.timedelta(days=1))
+        connection.execute(sa.text(f'''
+            ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {LEGACY_PARTITION}
+            FOR VALUES FROM (MINVALUE) TO ('{first_day}')
+        '''))
+        connection.execute(sa.text(create_default_partition))
+        _create_day_partitions(connection, first_day,
+                               datetime.date.fromisoformat(today) + datetime.timedelta(days=get_partitions_ahead()))
+    create_history_snapshot_function(engine_postgresql)
+    print(f"Таблица {PARENT_TABLE} переведена в секционированную, старые строки - в секции {LEGACY_PARTITION}")
+
+
+def roll_up_history_partitions(engine_postgresql, today: str) -> list:
+    """
+    Сворачивает секции, целиком лежащие раньше today - t_bike_history_retention_days,
+    в почасовые агрегаты t_bike_history_hourly и удаляет их. Каждая секция - своя транзакция.
+
+    Args:
+        engine_postgresql: Engine SQLAlchemy для Postgres.
+        today: Сегодняшний день 'YYYY-MM-DD'.
+
+    Returns:
+        Имена удаленных секций.
+    """
+    cutoff = datetime.datetime.combine(datetime.date.fromisoformat(today), datetime.time()) \
+        - datetime.timedelta(days=get_retention_days())
+    with engine_postgresql.connect() as connection:
+        if _table_kind(connection, PARENT_TABLE) != 'p':
+            return []
+        partitions = [p for p in list_history_partitions(connection)
+                      if not p['default'] and p['upper'] is not None and p['upper'] <= cutoff]
+
+    dropped = []
+    for partition in sorted(partitions, key=lambda p: p['upper']):
+        date_from = partition['lower'] or datetime.datetime.min
+        with engine_postgresql.begin() as connection:
+            connection.execute(sa.text(rollup_partition), {'date_from': date_from, 'date_to': partition['upper']})
+            connection.execute(sa.text(f"DROP TABLE {partition['name']}"))
+        dropped.append(partition['name'])
+    return dropped
@@ -0,0 +1,308 @@
+import time
+
+import pandas as pd
+import sqlalchemy as sa
+
+from postgres_loader import copy_dataframe
+from stage_metrics import record_extract
+
+
+# Инкрементальная синхронизация зеркальных таблиц MySQL -> Postgres по водяной отметке (максимальному ключу)
+
+# Сколько строк читать из MySQL и загружать в Postgres за один шаг
+MIRROR_CHUNK_ROWS = 50000
+
+create_etl_watermarks = '''
+    CREATE TABLE IF NOT EXISTS etl_watermarks (
+        table_name TEXT PRIMARY KEY,
+        watermark BIGINT NOT NULL,
+        updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    )
+'''
+
+select_watermark = '''
+    SELECT watermark
+    FROM etl_watermarks
+    WHERE table_name = :table_name
+'''
+
+upsert_watermark = '''
+    INSERT INTO etl_watermarks (table_name, watermark, updated_at)
+    VALUES (:table_name, :watermark, NOW())
+    ON CONFLICT (table_name) DO UPDATE
+    SET watermark = EXCLUDED.watermark,
+        updated_at = EXCLUDED.updated_at
+'''
+
+select_fresh_t_bike_use_mysql = '''
+    SELECT
+        NOW() AS add_time,
+        IfNULL(t_bike_use.id,0) AS id,
+        IfNULL(t_bike_use.uid,0) AS uid,
+        IfNULL(t_bike_use.bid,0) AS bid,
+        IfNULL(t_bike_use.start_time,0) AS start_time,
+        IfNULL(t_bike_use.end_time,0) AS end_time,
+        IfNULL(t_bike_use.duration,0) AS duration ,
+        IfNULL(t_bike_use.distance,0) AS distance ,
+        IfNULL(t_bike_use.orbit,0) AS orbit,
+        IfNULL(t_bike_use.start_lat,0) AS start_lat,
+        IfNULL(t_bike_use.start_lng,0) AS start_lng,
+        IfNULL(t_bike_use.end_lat,0) AS end_lat,
+        IfNULL(t_bike_use.end_lng,0) AS end_lng,
+        IfNULL(t_bike_use.ispay,0) AS ispay,
+        IfNULL(t_bike_use.`date`,0) AS `date`,
+        IfNULL(t_bike_use.lock_location,0) AS lock_location,
+        IfNULL(t_bike_use.out_area,0) AS out_area,
+        IfNULL(t_bike_use.open_way,0) AS open_way,
+        IfNULL(t_bike_use.ride_amount,0) AS ride_amount,
+        IfNULL(t_bike_use.ride_status,0) AS ride_status,
+        IfNULL(t_bike_use.old_date,0) AS old_date,
+        IfNULL(t_bike_use.close_way,0) AS close_way,
+        IfNULL(t_bike_use.old_duration,0) AS old_duration,
+        IfNULL(t_bike_use.admin_id,0) AS admin_id,
+        IfNULL(t_bike_use.update_time,0) AS update_time,
+        IfNULL(t_bike_use.lock_time,0) AS lock_time, 
+        IfNULL(t_bike_use.host_id,0) AS host_id,
+        IfNULL(t_bike_use.ride_user,0) AS ride_user,
+        IfNULL(t_bike_use.group_ride,0) AS group_ride,
+        IfNULL(t_bike_use.start_area,0) AS start_area,
+        IfNULL(t_bike_use.end_area,0) AS end_area,
+        IfNULL(t_bike_use.stripe_charge,0) AS stripe_charge,
+        IfNULL(t_bike_use.stripe_refund,0) AS stripe_refund,
+        IfNULL(t_bike_use.pause_duration,0) AS pause_duration,
+        IfNULL(t_bike_use.discount,0) AS discount,
+        IfNULL(t_bike_use.subscription_id,0) AS subscription_id,
+        IfNULL(t_bike_use.subscription_mapping_id,0) AS subscription_mapping_id,
+        IfNULL(t_bike_use.route_image,0) AS route_image,
+        IfNULL(t_bike_use.parking_image,0) AS parking_image,
+        IfNULL(t_bike_use.force_stop,0) AS force_stop,
+        IfNULL(t_bike_use.force_stop_comment,0) AS force_stop_comment,
+        IfNULL(t_bike_use.lights,0) AS lights,
+        IfNULL(t_bike_use.gear,0) AS gear,
+        IfNULL(t_bike_use.sent_unlock_time,0) AS sent_unlock_time,
+        IfNULL(t_bike_use.recalculated,0) AS recalculated,
+        IfNULL(t_bike_use.notified,0) AS notified,
+        IfNULL(t_bike_use.notified_time,0) AS notified_time,
+        IfNULL(t_bike_use.speed_zone_id,0) AS speed_zone_id,
+        IfNULL(t_bike_use.admin_note,0) AS admin_note,
+        IfNULL(t_bike_use.subscription_payment_id,0) AS subscription_payment_id,
+        IfNULL(t_bike_use.subscr_paid_before_ride_balance,0) AS subscr_paid_before_ride_balance
+    FROM shamri.t_bike_use
+    WHERE t_bike_use.id > {watermark}
+    ORDER BY t_bike_use.id
+'''
+
+select_fresh_t_trade_mysql = '''
+    SELECT
+        NOW() AS add_time ,
+        tt.id ,
+        COALESCE(tt.record_id, '0') AS record_id,
+        COALESCE(tt.status, 0) AS status,
+        COALESCE(tt.way, 0) AS way,
+        tt.`date` ,
+        COALESCE(tt.amount, 0) AS amount,
+        COALESCE(tt.`type`, 0) AS type,
+        COALESCE(tt.uid, 0) AS uid,
+        COALESCE(tt.out_pay_id, 0) AS out_pay_id,
+        COALESCE(tt.notify, 0) AS notify,
+        COALESCE(tt.out_trade_no, '0') AS out_trade_no,
+        COALESCE(tt.balance, 0) AS balance,
+        tt.city_id ,
+        COALESCE(tt.account_pay_amount, 0) AS account_pay_amount,
+        COALESCE(tt.gift_pay_amount, 0) AS gift_pay_amount,
+        COALESCE(tt.prefix, '0') AS prefix,
+        COALESCE(tt.card_type, '0') AS card_type,
+        COALESCE(tt.card_issue_bank, '0') AS card_issue_bank,
+        COALESCE(tt.card_number, '0') AS card_number,
+        COALESCE(tt.industry_id, 0) AS industry_id,
+        COALESCE(tt.admin_id, 0) AS admin_id,
+        COALESCE(tt.error_message, '0') AS error_message,
+        COALESCE(tt.discount, 0) AS discount
+    FROM shamri.t_trade tt
+    WHERE tt.id > {watermark}
+    ORDER BY tt.id
+'''
+
+select_fresh_t_subscription_mapping_mysql = '''
+    SELECT
+        NOW() AS add_time ,
+        tsm.id ,
+        tsm.user_id ,
+        tsm.subscription_id ,
+        tsm.spent ,
+        tsm.end_time ,
+        tsm.start_time 
+    FROM shamri.t_subscription_mapping tsm 
+    WHERE tsm.id > {watermark}
+    ORDER BY tsm.id
+'''
+
+select_fresh_t_ride_event_log_mysql = '''
+    SELECT
+        NOW() AS add_time,
+        t_ride_event_log.id,
+        t_ride_event_log.ride_id,
+        t_ride_event_log.event,
+        t_ride_event_log.description,
+        t_ride_event_log.created 
+    FROM shamri.t_ride_event_log
+    WHERE t_ride_event_log.id > {watermark}
+    ORDER BY t_ride_event_log.id
+'''
+
+select_fresh_t_payment_details_mysql = '''
+    SELECT 
+        NOW() AS add_time ,
+        IFNULL(tpd.id, 0) AS id ,
+        IFNULL(tpd.user_id, 0) AS user_id ,
+        IFNULL(tpd.ride_id, 0) AS ride_id ,
+        IFNULL(tpd.price, 0) AS price ,
+        IFNULL(tpd.unlock_price, 0) AS unlock_price ,
+        IFNULL(tpd.unit_count, 0) AS unit_count ,
+        IFNULL(tpd.unit_type, 0) AS unit_type ,
+        IFNULL(tpd.currency, 'EUR') AS currency ,
+        IFNULL(tpd.hold_price, 0) AS hold_price ,
+        IFNULL(tpd.hold_count, 0) AS hold_count ,
+        IFNULL(tpd.hold_unit_type, 0) AS hold_unit_type ,
+        IFNULL(tpd.total_ride_cost, 0) AS total_ride_cost ,
+        IFNULL(tpd.pause_cost, 0) AS pause_cost,
+        IFNULL(tpd.debit_balance, 0) AS debit_balance,
+        IFNULL(tpd.debit_gift_amount, 0) AS debit_gift_amount,
+        IFNULL(tpd.debit_cash, 0) AS debit_cash,
+        IFNULL(tpd.subscription_pause_sec, 0) AS subscription_pause_sec ,
+        IFNULL(tpd.subscription_cost, 0) AS subscription_cost ,
+        IFNULL(tpd.subscription_id, 0) AS subscription_id ,
+        IFNULL(tpd.subscription_mapping_id, 0) AS subscription_mapping_id ,
+        IFNULL(tpd.subscription_paid_before_ride, 0) AS subscription_paid_before_ride ,
+        IFNULL(tpd.created, STR_TO_DATE("2024-01-01 00:00:00", "%Y-%m-%d %H:%i:%s")) AS created ,
+        IFNULL(tpd.unlock_sec_included, 0) AS unlock_sec_included,
+        IFNULL(tpd.area_bonus_type, 0) AS area_bonus_type,
+        IFNULL(tpd.area_bonus_value, 0) AS area_bonus_value,
+        IFNULL(tpd.area_bonus_amount, 0) AS area_bonus_amount,
+        IFNULL(tpd.bike_discount_id, 0) AS bike_discount_id,
+        IFNULL(tpd.bike_discount_amount, 0) AS bike_discount_amount,
+        IFNULL(tpd.bike_discount_value, 0) AS bike_discount_value,
+        IFNULL(tpd.bike_discount_type, 0) AS bike_discount_type
+    FROM shamri.t_payment_details tpd 
+    WHERE tpd.id > {watermark}
+    ORDER BY tpd.id
+'''
+
+select_fresh_t_audit_user_location_mysql = '''
+    SELECT
+        NOW() AS add_time ,
+        t_audit_user_location.*
+    FROM shamri.t_audit_user_location
+    WHERE t_audit_user_location.id > {watermark}
+    ORDER BY t_audit_user_location.id
+'''
+
+# Описание зеркальных таблиц: запрос к MySQL с плейсхолдером {watermark}, ключ и таблица-приемник.
+# Запрос должен быть упорядочен по ключу, чтобы отметку можно было сдвигать после каждой порции.
+# Необязательный 'chunk_size' переопределяет MIRROR_CHUNK_ROWS.
+# Чтобы добавить таблицу, достаточно дописать сюда запрос и словарь.
+MIRROR_TABLES = [
+    {'table': 't_bike_use', 'key': 'id', 'query': select_fresh_t_bike_use_mysql},
+    {'table': 't_trade', 'key': 'id', 'query': select_fresh_t_trade_mysql},
+    {'table': 't_subscription_mapping', 'key': 'id', 'query': select_fresh_t_subscription_mapping_mysql},
+    {'table': 't_ride_event_log', 'key': 'id', 'query': select_fresh_t_ride_event_log_mysql},
+    {'table': 't_payment_details', 'key': 'id', 'query': select_fresh_t_payment_details_mysql},
+    {'table': 't_audit_user_location', 'key': 'id', 'query': select_fresh_t_audit_user_location_mysql},
+]
+
+
+def ensure_watermark_table(engine_postgresql):
+    with engine_postgresql.begin() as connection:
+        connection.execute(sa.text(create_etl_watermarks))
+
+
+def get_watermark(connection, spec: dict) -> int:
+    """
+    Возвращает сохраненную водяную отметку таблицы.
+    При первом запуске отметка один раз берется из MAX(ключа) в damir.<таблица>.
+
+    Args:
+        connection: Соединение SQLAlchemy с Postgres.
+        spec: Описание зеркальной таблицы из MIRROR_TABLES.
+
+    Returns:
+        Максимальное значение ключа, уже загруженное в Postgres.
+    """
+    watermark = connection.execute(sa.text(select_watermark), {'table_name': spec['table']}).scalar()
+    if watermark is None:
+        select_max_key = 'SELECT MAX({key}) FROM damir.{table}'.format(key=spec['key'], table=spec['table'])
+        watermark = connection.execute(sa.text(select_max_key)).scalar()
+    return int(watermark or 0)
+
+
+def read_sql_chunks(query: str, engine_mysql, chunk_size: int):
+    """
+    Читает результат запроса MySQL порциями через небуферизованный курсор.
+    Следующая порция запрашивается с сервера только после обработки предыдущей,
+    поэтому в памяти никогда не больше chunk_size строк.
+
+    Args:
+        query: Текст запроса.
+        engine_mysql: Engine SQLAlchemy для MySQL.
+        chunk_size: Размер порции в строках.
+
+    Returns:
+        Генератор DataFrame (как у pd.read_sql).
+    """
+    raw_connection = engine_mysql.raw_connection()
+    completed = False
+    try:
+        cursor = raw_connection.cursor(buffered=False)
+        cursor.execute(query)
+        columns = [column[0] for column in cursor.description]
+        while True:
+            started = time.monotonic()
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            df = pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+            record_extract(df, time.monotonic() - started)
+            yield df
+        cursor.close()
+        completed = True
+    finally:
+        if not completed:
+            # В соединении остались непрочитанные строки - в пул его не возвращаем
+            raw_connection.invalidate()
+        raw_connection.close()
+
+
+def sync_mirror_table(spec: dict, engine_mysql, engine_postgresql) -> int:
+    """
+    Догружает в Postgres новые строки таблицы MySQL с ключом больше водяной отметки.
+    Данные читаются и загружаются порциями; каждая порция и сдвинутая отметка
+    записываются в одной транзакции, так что прерванную догрузку можно продолжить.
+
+    Args:
+        spec: Описание зеркальной таблицы из MIRROR_TABLES.
+        engine_mysql: Engine SQLAlchemy для MySQL.
+        engine_postgresql: Engine SQLAlchemy для Postgres.
+
+    Returns:
+        Количество добавленных строк.
+    """
+    with engine_postgresql.connect() as connection:
+        watermark = get_watermark(connection, spec)
+
+    query = spec['query'].format(watermark=watermark)
+    rows = 0
+    for df in read_sql_chunks(query, engine_mysql, spec.get('chunk_size', MIRROR_CHUNK_ROWS)):
+        with engine_postgresql.begin() as connection:
+            copy_dataframe(connection, df.replace('', '0'), spec['table'])
+            connection.execute(sa.text(upsert_watermark),
+                               {'table_name': spec['table'], 'watermark': int(df[spec['key']].max())})
+        rows += df.shape[0]
+
+    print('Added {x} records to {table} in Postgres!'.format(x=rows, table=spec['table']))
+    return rows
+
+
+def sync_mirror_tables(engine_mysql, engine_postgresql, specs=None):
+    ensure_watermark_table(engine_postgresql)
+    for spec in specs or MIRROR_TABLES:
+        sync_mirror_table(spec, engine_mysql, engine_postgresql)
@@ -0,0 +1,162 @@
+import numpy as np
+import pandas as pd
+import shapely
+
+from stage_metrics import extract_sql
+
+
+# Поиск ближайшей активной парковки для больших пачек координат вместо CROSS JOIN с t_area в SQL.
+# Центроиды парковок индексируются STRtree (точки lng, lat), кандидаты для точки - парковки
+# в прямоугольнике lat/lng, который содержит круг радиуса r вокруг нее на сфере.
+# Среди кандидатов выбирается максимум скалярного произведения единичных векторов на сфере, что равносильно
+# минимуму расстояния по большому кругу, то есть тому же acos-хаверсину, что был в запросах.
+# Если лучший кандидат не дальше r, ближайшей парковки вне круга быть не может и ответ точный;
+# иначе точка ищется снова с вдвое большим r. Начальный r - медианное расстояние между соседними
+# парковками (query_nearest по самим парковкам), так что большинству точек хватает одного прохода.
+# Прямоугольники, выходящие за 180-й меридиан, проверяются еще и со сдвигом долготы на ±360.
+
+EARTH_RADIUS_M = 6371000
+
+# Запас к радиусу поиска на погрешность вычислений с плавающей точкой (радианы)
+RADIUS_EPSILON = 1e-9
+
+select_active_parkings = '''
+    SELECT
+        ta.id AS parking_id ,
+        ta.name AS parking_name ,
+        ta.city_id ,
+        ta.lat ,
+        ta.lng
+    FROM damir.t_area ta
+    WHERE ta.active = 1
+    ORDER BY ta.id
+'''
+
+
+def _unit_vectors(lat, lng) -> np.ndarray:
+    lat = np.radians(np.asarray(lat, dtype=float))
+    lng = np.radians(np.asarray(lng, dtype=float))
+    cos_lat = np.cos(lat)
+    return np.column_stack((cos_lat * np.cos(lng), cos_lat * np.sin(lng), np.sin(lat)))
+
+
+def _angles(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    # Угол между единичными векторами через длину хорды: acos от произведения, близкого к 1,
+    # на метровых расстояниях неточен
+    return 2 * np.arcsin(np.minimum(np.linalg.norm(a - b, axis=1) / 2, 1.0))
+
+
+def load_parking_index(engine_postgresql) -> dict:
+    """
+    Загружает активные парковки из damir.t_area и строит по ним индекс для поиска ближайшей.
+
+    Args:
+        engine_postgresql: Engine SQLAlchemy для Postgres.
+
+    Returns:
+        Словарь {'parkings': DataFrame парковок (parking_id, parking_name, city_id, lat, lng),
+                 'vectors': единичные векторы центроидов в порядке parkings,
+                 'tree': STRtree точек (lng, lat) центроидов в порядке parkings,
+                 'radius': начальный радиус поиска в радианах}.
+    """
+    df_parkings = extract_sql(select_active_parkings, engine_postgresql)
+    df_parkings = df_parkings[df_parkings['lat'].notna() & df_parkings['lng'].notna()].reset_index(drop=True)
+    return build_parking_index(df_parkings)
+
+
+def build_parking_index(df_parkings: pd.DataFrame) -> dict:
+    """
+    Строит индекс load_parking_index по DataFrame парковок с заполненными lat и lng.
+    """
+    vectors = _unit_vectors(df_parkings['lat'], df_parkings['lng'])
+    tree = shapely.STRtree(shapely.points(df_parkings['lng'].to_numpy(dtype=float),
+                                          df_parkings['lat'].to_numpy(dtype=float)))
+    radius = np.pi
+    if len(df_parkings) > 1:
+        parking_idx, neighbour_idx = tree.query_nearest(tree.geometries, exclusive=True, all_matches=False)
+        radius = max(float(np.median(_angles(vectors[parking_idx], vectors[neighbour_idx]))), RADIUS_EPSILON)
+    return {'parkings': df_parkings, 'vectors': vectors, 'tree': tree, 'radius': radius}
+
+
+def _query_circles(tree, lat: np.ndarray, lng: np.ndarray, radius: float) -> tuple:
+    # Пары (позиция точки, позиция парковки) для парковок в прямоугольниках lat/lng (градусы), содержащих
+    # круги радиуса radius (радианы): по хаверсину sin²(d/2) >= cos φ1 · cos φ2 · sin²(Δλ/2), а |φ2| <= |φ1| + d
+    lat_r = np.radians(lat)
+    cos_far = np.cos(np.minimum(np.abs(lat_r) + radius, np.pi / 2)) * np.cos(lat_r)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.sin(radius / 2) / np.sqrt(cos_far)
+    dlng = np.where((cos_far > 0) & (ratio < 1), np.degrees(2 * np.arcsin(np.minimum(ratio, 1))), 180.0)
+    dlat = np.degrees(radius)
+    pairs = [tree.query(shapely.box(lng - dlng, lat - dlat, lng + dlng, lat + dlat))]
+    for shift, crossing in ((360, lng - dlng < -180), (-360, lng + dlng > 180)):
+        rows = np.flatnonzero(crossing)
+        if len(rows):
+            point_idx, tree_idx = tree.query(shapely.box(lng[rows] - dlng[rows] + shift, lat[rows] - dlat,
+                                                         lng[rows] + dlng[rows] + shift, lat[rows] + dlat))
+            pairs.append(np.vstack((rows[point_idx], tree_idx)))
+    return tuple(np.hstack(pairs))
+
+
+def nearest_parking(index: dict, lat, lng) -> tuple:
+    """
+    Находит ближайшую парковку и расстояние до нее для каждой точки.
+
+    Args:
+        index: Индекс из load_parking_index.
+        lat: Широты точек.
+        lng: Долготы точек.
+
+    Returns:
+        Кортеж массивов (позиция парковки в index['parkings'], расстояние в метрах).
+        Для точек без координат позиция -1, расстояние NaN.
+    """
+    lat = np.asarray(lat, dtype=float)
+    lng = np.asarray(lng, dtype=float)
+    points = _unit_vectors(lat, lng)
+    positions = np.full(len(points), -1, dtype=np.int64)
+    distances = np.full(len(points), np.nan)
+    vectors = index['vectors']
+    pending = np.flatnonzero(~np.isnan(points).any(axis=1))
+    if len(vectors) == 0:
+        return positions, distances
+
+    radius = index['radius']
+    while len(pending):
+        point_idx, tree_idx = _query_circles(index['tree'], lat[pending], lng[pending], radius + RADIUS_EPSILON)
+        # Ближайший кандидат - по максимуму скалярного произведения, при равных - с меньшей позицией
+        dots = np.einsum('ij,ij->i', points[pending[point_idx]], vectors[tree_idx])
+        order = np.lexsort((tree_idx, -dots, point_idx))
+        _, first = np.unique(point_idx[order], return_index=True)
+        best = order[first]
+        rows = pending[point_idx[best]]
+        angles = _angles(points[rows], vectors[tree_idx[best]])
+        found = angles <= radius
+        positions[rows[found]] = tree_idx[best][found]
+        distances[rows[found]] = EARTH_RADIUS_M * angles[found]
+
+        resolved = np.zeros(len(points), dtype=bool)
+        resolved[rows[found]] = True
+        pending = pending[~resolved[pending]]
+        # Круг радиуса pi покрывает всю сферу, дальше расширять некуда
+        radius = np.pi if radius * 2 >= np.pi else radius * 2
+    return positions, distances
+
+
+def count_by_distance(positions: np.ndarray, distances: np.ndarray, columns: tuple) -> pd.DataFrame:
+    """
+    Считает точки по ближайшей парковке в разбивке до 15 м, от 15 до 50 м и дальше 50 м.
+
+    Args:
+        positions: Позиции ближайших парковок из nearest_parking.
+        distances: Расстояния до них в метрах.
+        columns: Имена трех столбцов результата для соответствующих интервалов.
+
+    Returns:
+        DataFrame с индексом по позиции парковки; строки только для парковок, ближайших хотя бы к одной точке.
+    """
+    found = positions >= 0
+    df = pd.DataFrame({'position': positions[found], 'distance': distances[found]})
+    df[columns[0]] = df['distance'] <= 15
+    df[columns[1]] = (df['distance'] > 15) & (df['distance'] <= 50)
+    df[columns[2]] = df['distance'] > 50
+    return df.groupby('position')[list(columns)].sum().astype('int64')
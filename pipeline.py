@@ -0,0 +1,70 @@
+import concurrent.futures
+import os
+import time
+
+
+# Параллельный запуск стадий ETL с учетом зависимостей между ними
+
+DEFAULT_MAX_WORKERS = 4
+
+
+def get_max_workers() -> int:
+    return int(os.environ.get('etl_max_workers', DEFAULT_MAX_WORKERS))
+
+
+def run_stage(stage: dict):
+    started = time.monotonic()
+    print(f"Стадия {stage['name']} запущена")
+    stage['func']()
+    print(f"Стадия {stage['name']} выполнена за {time.monotonic() - started:.1f} с")
+
+
+def run_stages(stages: list, max_workers: int) -> dict:
+    """
+    Выполняет стадии в пуле потоков. Стадия запускается, когда успешно завершены все ее зависимости;
+    если зависимость упала или была пропущена, стадия пропускается. Независимые стадии продолжают работу.
+
+    Args:
+        stages: Список словарей {'name': имя, 'func': функция без аргументов, 'deps': [имена стадий]}.
+            Зависимости, которых нет в списке, считаются выполненными.
+        max_workers: Максимальное количество одновременно выполняемых стадий.
+
+    Returns:
+        Словарь {имя стадии: 'ok' | 'failed' | 'skipped'}.
+    """
+    names = {stage['name'] for stage in stages}
+    pending = {stage['name']: stage for stage in stages}
+    status = {}
+    running = {}
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            progress = False
+            for name, stage in list(pending.items()):
+                deps = [dep for dep in stage['deps'] if dep in names]
+                if any(status.get(dep) in ('failed', 'skipped') for dep in deps):
+                    print(f"Стадия {name} пропущена: не выполнены зависимости")
+                    status[name] = 'skipped'
+                    del pending[name]
+                    progress = True
+                elif all(status.get(dep) == 'ok' for dep in deps):
+                    running[executor.submit(run_stage, stage)] = name
+                    del pending[name]
+                    progress = True
+
+            if not running:
+                if pending and not progress:
+                    raise ValueError(f"Циклические зависимости между стадиями: {sorted(pending)}")
+                continue
+
+            done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    future.result()
+                    status[name] = 'ok'
+                except Exception as e:
+                    print(f"Произошла ошибка в стадии {name}: {e}")
+                    status[name] = 'failed'
+
+    return status
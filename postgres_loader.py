@@ -0,0 +1,374 @@
+import io
+import re
+import time
+
+import numpy as np
+import pandas as pd
+import sqlalchemy as sa
+from psycopg import sql
+
+from dtype_plans import widen_dtypes
+from stage_metrics import record_load
+
+
+# Загрузка DataFrame в Postgres через COPY FROM STDIN вместо построчных INSERT из to_sql
+
+COPY_CHUNK_ROWS = 50000
+
+# Типы Postgres, которые psycopg умеет писать в бинарном формате COPY без сюрпризов
+INTEGER_TYPES = ('int2', 'int4', 'int8')
+FLOAT_TYPES = ('float4', 'float8')
+TEXT_TYPES = ('text', 'varchar', 'bpchar')
+
+select_table_columns = '''
+    SELECT a.attname AS column_name, t.typname AS type_name
+    FROM pg_attribute a
+    JOIN pg_type t ON t.oid = a.atttypid
+    WHERE a.attrelid = to_regclass(quote_ident(:table_name))
+        AND a.attnum > 0
+        AND NOT a.attisdropped
+'''
+
+
+def get_table_columns(connection, table_name: str) -> dict:
+    """
+    Возвращает типы столбцов таблицы Postgres.
+
+    Args:
+        connection: Соединение SQLAlchemy с Postgres.
+        table_name: Имя таблицы (ищется по search_path, как и в to_sql).
+
+    Returns:
+        Словарь {имя столбца: имя типа в pg_type}, пустой если таблицы нет.
+    """
+    rows = connection.execute(sa.text(select_table_columns), {'table_name': table_name})
+    return {row.column_name: row.type_name for row in rows}
+
+
+def _is_binary_compatible(series: pd.Series, type_name: str) -> bool:
+    dtype = series.dtype
+    if type_name in INTEGER_TYPES:
+        return pd.api.types.is_integer_dtype(dtype)
+    if type_name in FLOAT_TYPES:
+        return pd.api.types.is_integer_dtype(dtype) or pd.api.types.is_float_dtype(dtype)
+    if type_name == 'bool':
+        return pd.api.types.is_bool_dtype(dtype)
+    if type_name == 'timestamp':
+        return pd.api.types.is_datetime64_dtype(dtype) and getattr(dtype, 'tz', None) is None
+    if type_name == 'timestamptz':
+        return isinstance(dtype, pd.DatetimeTZDtype)
+    if type_name in TEXT_TYPES:
+        if isinstance(dtype, pd.CategoricalDtype):
+            return pd.api.types.infer_dtype(dtype.categories, skipna=True) in ('string', 'empty')
+        return pd.api.types.infer_dtype(series, skipna=True) in ('string', 'empty')
+    if type_name == 'date':
+        return pd.api.types.infer_dtype(series, skipna=True) in ('date', 'empty')
+    return False
+
+
+def _float_to_text(series: pd.Series) -> pd.Series:
+    # Postgres выводит целые float8 без '.0' - повторяем это для текстовых столбцов
+    integral = series.notna() & np.isfinite(series) & (series % 1 == 0) & (series.abs() < 1e15)
+    res = series.astype(object)
+    res[integral] = series[integral].astype(np.int64).astype(str)
+    return res
+
+
+def _prepare_csv_frame(df: pd.DataFrame, columns: dict) -> pd.DataFrame:
+    """
+    Приводит значения к текстовому виду, который Postgres принимает так же, как параметры to_sql.
+    """
+    df = df.copy()
+    for column in df.columns:
+        if columns[column] in TEXT_TYPES and pd.api.types.is_float_dtype(df[column].dtype):
+            df[column] = _float_to_text(df[column])
+    return df
+
+
+def create_table_for_frame(connection, df: pd.DataFrame, table_name: str):
+    """
+    Создает таблицу под DataFrame с теми же типами столбцов, что выбрал бы to_sql.
+    Типы определяются по всем значениям (date в object-столбце - DATE), а не по пустому кадру,
+    целые и category - по расширенным dtype, как до сужения в dtype_plans. Строки не вставляются.
+    """
+    pd.io.sql.SQLDatabase(connection).prep_table(widen_dtypes(df), table_name, if_exists='fail', index=False)
+
+
+def _copy_with_cast(connection, df: pd.DataFrame, table_name: str, cast_columns: list) -> int:
+    # Дробные значения для целых столбцов: COPY их не примет, а to_sql отдавал float и Postgres
+    # округлял его при присваивании. Значения грузятся во временную таблицу с float8 в этих столбцах,
+    # и округление делает сам Postgres в INSERT ... SELECT
+    temp_name = f'{table_name[:57]}__cast'
+    temp = _ident(connection, temp_name)
+    _execute_ddl(connection, f'DROP TABLE IF EXISTS {temp}')
+    _execute_ddl(connection, f'CREATE TEMP TABLE {temp} (LIKE {_ident(connection, table_name)}) ON COMMIT DROP')
+    for column in cast_columns:
+        _execute_ddl(connection, f'ALTER TABLE {temp} ALTER COLUMN {_ident(connection, column)} TYPE float8')
+    rows = copy_dataframe(connection, df, temp_name)
+    columns = ', '.join(_ident(connection, column) for column in df.columns)
+    _execute_ddl(connection, f'INSERT INTO {_ident(connection, table_name)} ({columns}) SELECT {columns} FROM {temp}')
+    _execute_ddl(connection, f'DROP TABLE {temp}')
+    return rows
+
+
+def _binary_rows(df: pd.DataFrame):
+    # Значения переводятся в объекты Python порциями по COPY_CHUNK_ROWS, а не всем DataFrame сразу
+    for start in range(0, len(df), COPY_CHUNK_ROWS):
+        chunk = df.iloc[start:start + COPY_CHUNK_ROWS]
+        values = []
+        for column in chunk.columns:
+            series = chunk[column]
+            if series.isna().any() or not (pd.api.types.is_integer_dtype(series.dtype)
+                                           or pd.api.types.is_float_dtype(series.dtype)
+                                           or pd.api.types.is_bool_dtype(series.dtype)):
+                values.append(series.astype(object).where(series.notna(), None).tolist())
+            else:
+                values.append(series.tolist())
+        yield from zip(*values)
+
+
+def copy_dataframe(connection, df: pd.DataFrame, table_name: str) -> int:
+    """
+    Загружает DataFrame в таблицу Postgres через COPY FROM STDIN в рамках транзакции соединения.
+
+    Бинарный формат используется, когда типы всех столбцов DataFrame однозначно совпадают
+    с типами таблицы, иначе - CSV. Если таблицы нет, она создается как в to_sql.
+
+    Args:
+        connection: Соединение SQLAlchemy с Postgres (драйвер psycopg).
+        df: Загружаемые данные.
+        table_name: Имя таблицы.
+
+    Returns:
+        Количество загруженных строк.
+    """
+    if df.empty:
+        return 0
+
+    columns = get_table_columns(connection, table_name)
+    if not columns:
+        create_table_for_frame(connection, df, table_name)
+        columns = get_table_columns(connection, table_name)
+
+    missing = [column for column in df.columns if column not in columns]
+    if missing:
+        raise ValueError(f"В таблице {table_name} нет столбцов: {missing}")
+
+    cast_columns = [column for column in df.columns
+                    if columns[column] in INTEGER_TYPES and pd.api.types.is_float_dtype(df[column].dtype)]
+    if cast_columns:
+        return _copy_with_cast(connection, df, table_name, cast_columns)
+
+    binary = all(_is_binary_compatible(df[column], columns[column]) for column in df.columns)
+
+    statement = sql.SQL("COPY {table} ({columns}) FROM STDIN WITH ({options})").format(
+        table=sql.Identifier(table_name),
+        columns=sql.SQL(', ').join(sql.Identifier(column) for column in df.columns),
+        options=sql.SQL("FORMAT BINARY" if binary else "FORMAT CSV, NULL '\\N'"),
+    )
+
+    started = time.monotonic()
+    dbapi_connection = connection.connection.driver_connection
+    with dbapi_connection.cursor() as cursor:
+        with cursor.copy(statement) as copy:
+            if binary:
+                copy.set_types([columns[column] for column in df.columns])
+                for row in _binary_rows(df):
+                    copy.write_row(row)
+            else:
+                df_csv = _prepare_csv_frame(df, columns)
+                for start in range(0, len(df_csv), COPY_CHUNK_ROWS):
+                    chunk = df_csv.iloc[start:start + COPY_CHUNK_ROWS]
+                    buffer = io.StringIO()
+                    chunk.to_csv(buffer, header=False, index=False, na_rep='\\N')
+                    copy.write(buffer.getvalue())
+    record_load(df, time.monotonic() - started)
+    return len(df)
+
+
+def copy_dataframe_to_postgres(df: pd.DataFrame, table_name: str, engine) -> int:
+    """
+    Загружает DataFrame в таблицу Postgres через COPY в отдельной транзакции.
+    Замена df.to_sql(table_name, engine, if_exists="append", index=False).
+
+    Args:
+        df: Загружаемые данные.
+        table_name: Имя таблицы.
+        engine: Engine SQLAlchemy для Postgres.
+
+    Returns:
+        Количество загруженных строк.
+    """
+    with engine.begin() as connection:
+        return copy_dataframe(connection, df, table_name)
+
+
+# Полная перезаливка таблицы: данные грузятся в промежуточную таблицу, индексы строятся уже по данным,
+# затем промежуточная таблица подменяет основную переименованием в той же транзакции.
+# Дашборды до фиксации видят старые данные, упавшая загрузка откатывается целиком.
+
+STAGING_SUFFIX = '__staging'
+
+select_table_info = '''
+    SELECT c.oid, n.nspname AS schema_name, c.relname AS table_name, c.relkind
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE c.oid = to_regclass(quote_ident(:table_name))
+'''
+
+# Переименование невозможно, если на таблицу ссылаются представления, внешние ключи, триггеры или наследование:
+# они привязаны к oid старой таблицы. Собственные внешние ключи таблицы, права на отдельные столбцы
+# и членство в публикациях на промежуточную таблицу не переносятся - с ними таблица тоже заполняется на месте
+select_swap_blockers = '''
+    SELECT
+        EXISTS (SELECT 1 FROM pg_depend d
+                JOIN pg_rewrite r ON r.oid = d.objid
+                WHERE d.classid = 'pg_rewrite'::regclass AND d.refobjid = CAST(:oid AS oid)
+                    AND r.ev_class <> d.refobjid)
+        OR EXISTS (SELECT 1 FROM pg_constraint c WHERE c.confrelid = CAST(:oid AS oid))
+        OR EXISTS (SELECT 1 FROM pg_trigger t WHERE t.tgrelid = CAST(:oid AS oid) AND NOT t.tgisinternal)
+        OR EXISTS (SELECT 1 FROM pg_inherits i
+                   WHERE i.inhrelid = CAST(:oid AS oid) OR i.inhparent = CAST(:oid AS oid))
+        OR EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conrelid = CAST(:oid AS oid) AND c.contype = 'f')
+        OR EXISTS (SELECT 1 FROM pg_attribute a
+                   WHERE a.attrelid = CAST(:oid AS oid) AND a.attnum > 0 AND a.attacl IS NOT NULL)
+        OR EXISTS (SELECT 1 FROM pg_publication_rel p WHERE p.prrelid = CAST(:oid AS oid)) AS blocked
+'''
+
+select_plain_indexes = '''
+    SELECT i.relname AS index_name, pg_get_indexdef(x.indexrelid) AS definition
+    FROM pg_index x
+    JOIN pg_class i ON i.oid = x.indexrelid
+    WHERE x.indrelid = CAST(:oid AS oid)
+        AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = x.indexrelid AND c.conrelid = x.indrelid)
+'''
+
+select_index_constraints = '''
+    SELECT c.conname AS constraint_name, pg_get_constraintdef(c.oid) AS definition
+    FROM pg_constraint c
+    WHERE c.conrelid = CAST(:oid AS oid) AND c.contype IN ('p', 'u', 'x')
+'''
+
+select_table_grants = '''
+    SELECT
+        CASE WHEN a.grantee = 0 THEN 'PUBLIC' ELSE a.grantee::regrole::text END AS grantee,
+        a.privilege_type,
+        a.is_grantable
+    FROM pg_class c, aclexplode(c.relacl) a
+    WHERE c.oid = CAST(:oid AS oid) AND a.grantee <> c.relowner
+'''
+
+# Последовательности serial-столбцов принадлежат таблице и удалились бы вместе с ней
+select_owned_sequences = '''
+    SELECT s.oid::regclass::text AS sequence_name, a.attname AS column_name
+    FROM pg_depend d
+    JOIN pg_class s ON s.oid = d.objid AND s.relkind = 'S'
+    JOIN pg_attribute a ON a.attrelid = d.refobjid AND a.attnum = d.refobjsubid
+    WHERE d.classid = 'pg_class'::regclass AND d.refobjid = CAST(:oid AS oid) AND d.deptype = 'a'
+'''
+
+_INDEX_DEF_RE = re.compile(r'^CREATE (UNIQUE )?INDEX \S+ ON (ONLY )?\S+ ')
+
+
+def _ident(connection, *names) -> str:
+    return sql.Identifier(*names).as_string(connection.connection.driver_connection)
+
+
+def _execute_ddl(connection, statement: str):
+    # Текст из каталога (pg_get_constraintdef, pg_get_indexdef) и собранный DDL выполняются как есть:
+    # в sa.text ':имя' стало бы параметром, а без no_parameters psycopg разбирал бы '%' в строке
+    connection.exec_driver_sql(statement, execution_options={'no_parameters': True})
+
+
+def _staging_name(name: str) -> str:
+    return name[:63 - len(STAGING_SUFFIX)] + STAGING_SUFFIX
+
+
+def replace_table(connection, df: pd.DataFrame, table_name: str) -> int:
+    """
+    Заменяет содержимое таблицы Postgres данными DataFrame в рамках транзакции соединения.
+    Замена TRUNCATE ... RESTART IDENTITY и последующей загрузки.
+
+    Данные грузятся через COPY в промежуточную таблицу (LIKE основной), затем на ней строятся индексы
+    и ограничения основной, переносятся права и serial-последовательности, и она переименовывается
+    в основную. Если на таблицу ссылаются представления, внешние ключи или триггеры, у нее есть свои
+    внешние ключи, права на столбцы или публикации, основная таблица очищается и заполняется
+    из промежуточной INSERT ... SELECT в той же транзакции. В обоих случаях таблица анализируется (ANALYZE).
+    Если таблицы нет, она создается как в copy_dataframe.
+
+    Args:
+        connection: Соединение SQLAlchemy с Postgres (драйвер psycopg).
+        df: Новое содержимое таблицы.
+        table_name: Имя таблицы (ищется по search_path).
+
+    Returns:
+        Количество загруженных строк.
+    """
+    info = connection.execute(sa.text(select_table_info), {'table_name': table_name}).first()
+    if info is None:
+        return copy_dataframe(connection, df, table_name)
+
+    params = {'oid': info.oid}
+    table = _ident(connection, info.schema_name, info.table_name)
+    staging_name = _staging_name(info.table_name)
+    staging = _ident(connection, info.schema_name, staging_name)
+
+    _execute_ddl(connection, f'DROP TABLE IF EXISTS {staging}')
+    _execute_ddl(connection, f'CREATE TABLE {staging} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS '
+                             f'INCLUDING IDENTITY INCLUDING GENERATED INCLUDING STORAGE INCLUDING COMMENTS)')
+    rows = copy_dataframe(connection, df, staging_name)
+
+    blocked = info.relkind != 'r' or connection.execute(sa.text(select_swap_blockers), params).scalar()
+    if blocked:
+        columns = ', '.join(_ident(connection, column) for column in df.columns)
+        _execute_ddl(connection, f'TRUNCATE TABLE {table} RESTART IDENTITY')
+        if rows:
+            _execute_ddl(connection, f'INSERT INTO {table} ({columns}) SELECT {columns} FROM {staging}')
+        _execute_ddl(connection, f'DROP TABLE {staging}')
+        _execute_ddl(connection, f'ANALYZE {table}')
+        return rows
+
+    renames = []
+    for row in connection.execute(sa.text(select_index_constraints), params).all():
+        temp_name = _staging_name(row.constraint_name)
+        _execute_ddl(connection, f'ALTER TABLE {staging} ADD CONSTRAINT {_ident(connection, temp_name)} '
+                                 f'{row.definition}')
+        renames.append(f'ALTER TABLE {table} RENAME CONSTRAINT {_ident(connection, temp_name)} '
+                       f'TO {_ident(connection, row.constraint_name)}')
+    for row in connection.execute(sa.text(select_plain_indexes), params).all():
+        temp_name = _staging_name(row.index_name)
+        definition = _INDEX_DEF_RE.sub(lambda m: f"CREATE {m.group(1) or ''}INDEX {_ident(connection, temp_name)} "
+                                                 f"ON {staging} ", row.definition)
+        _execute_ddl(connection, definition)
+        renames.append(f'ALTER INDEX {_ident(connection, info.schema_name, temp_name)} '
+                       f'RENAME TO {_ident(connection, row.index_name)}')
+    for row in connection.execute(sa.text(select_table_grants), params).all():
+        _execute_ddl(connection, f'GRANT {row.privilege_type} ON {staging} TO {row.grantee}'
+                                 + (' WITH GRANT OPTION' if row.is_grantable else ''))
+    for row in connection.execute(sa.text(select_owned_sequences), params).all():
+        _execute_ddl(connection, f'ALTER SEQUENCE {row.sequence_name} '
+                                 f'OWNED BY {staging}.{_ident(connection, row.column_name)}')
+
+    # Статистика планировщика у новой таблицы есть сразу, без ожидания autovacuum
+    _execute_ddl(connection, f'ANALYZE {staging}')
+    _execute_ddl(connection, f'DROP TABLE {table}')
+    _execute_ddl(connection, f'ALTER TABLE {staging} RENAME TO {_ident(connection, info.table_name)}')
+    for rename in renames:
+        _execute_ddl(connection, rename)
+    return rows
+
+
+def replace_table_contents(df: pd.DataFrame, table_name: str, engine) -> int:
+    """
+    Полностью заменяет содержимое таблицы Postgres в отдельной транзакции (см. replace_table).
+
+    Args:
+        df: Новое содержимое таблицы.
+        table_name: Имя таблицы.
+        engine: Engine SQLAlchemy для Postgres.
+
+    Returns:
+        Количество загруженных строк.
+    """
+    with engine.begin() as connection:
+        return replace_table(connection, df, table_name)
@@ -0,0 +1,34 @@
+import datetime
+
+from stage_metrics import extract_sql
+
+
+# Границы дат и времени для запросов к MySQL считаются в Python от часов MySQL.
+# В запросах они сравниваются с исходными столбцами (start_time, `date`, created) без функций над столбцом,
+# чтобы MySQL мог использовать индексы; день форматируется только в GROUP BY уже отобранных строк.
+# Unix-время сравнивается с UNIX_TIMESTAMP('...'): это константа запроса в часовом поясе сессии,
+# тот же, что использует FROM_UNIXTIME.
+
+select_mysql_now = "SELECT NOW() AS now"
+
+
+def next_day(day: str) -> str:
+    return str(datetime.date.fromisoformat(day) + datetime.timedelta(days=1))
+
+
+def get_run_window(engine_mysql) -> dict:
+    """
+    Возвращает границы окна запуска по часам MySQL.
+
+    Returns:
+        Словарь {'now': datetime, 'today': 'YYYY-MM-DD', 'tomorrow': 'YYYY-MM-DD',
+                 'hour_from': 'YYYY-MM-DD HH:00:00' - начало часа два часа назад}.
+    """
+    now = extract_sql(select_mysql_now, engine_mysql)['now'].iloc[0].to_pydatetime()
+    hour_from = now.replace(minute=0, second=0, microsecond=0) - datetime.timedelta(hours=2)
+    return {
+        'now': now,
+        'today': str(now.date()),
+        'tomorrow': str(now.date() + datetime.timedelta(days=1)),
+        'hour_from': hour_from.strftime('%Y-%m-%d %H:%M:%S'),
+    }
@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+
+
+# Календарь работников для расчета зп: строки Таблицы(ставки) по месяцам разворачиваются в строки по дням.
+# Все интервалы дат разворачиваются за один проход через np.repeat вместо pd.date_range и pd.concat на каждую строку.
+# Порядок строк и столбцов, типы и значения совпадают с прежним циклом по iterrows.
+
+DAY = pd.Timedelta(days=1)
+
+WORKER_COLUMNS = ['Worker id', 'Worker username', 'Worker nickname', 'Worker role', 'city']
+
+
+def _expand_days(starts, ends) -> tuple:
+    """
+    Разворачивает интервалы [start, end] в дни с шагом сутки от start, как pd.date_range(start, end, freq='D').
+
+    Returns:
+        Кортеж (позиции интервалов для каждой строки результата, даты).
+    """
+    starts = pd.DatetimeIndex(starts)
+    counts = ((pd.DatetimeIndex(ends) - starts) // DAY + 1).to_numpy()
+    counts = np.clip(counts, 0, None).astype(np.int64)
+    positions = np.repeat(np.arange(len(counts)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return positions, starts[positions] + offsets * DAY
+
+
+def _hourly_segments(df_temp: pd.DataFrame) -> pd.DataFrame:
+    # Интервалы ставки за час по строкам df_temp: весь месяц,
+    # либо до 'Дата нового условия ставки (час)' со старой ставкой и после нее с измененной
+    hourly = df_temp[df_temp['Тип ставки'] == 'Ставка за час']
+    whole = hourly[hourly['Ставка за час постоянно'] == 0]
+    changed = hourly[hourly['Ставка за час постоянно'] == 1]
+    new_date = changed['Дата нового условия ставки (час)']
+    segments = pd.concat([
+        pd.DataFrame({'row': whole.index, 'part': 0, 'start': whole['Месяц'].to_numpy(),
+                      'end': whole['Конец месяца'].to_numpy(), 'rate': whole['Ставка за час'].to_numpy(),
+                      'changed': False}),
+        pd.DataFrame({'row': changed.index, 'part': 0, 'start': changed['Месяц'].to_numpy(),
+                      'end': (new_date - pd.Timedelta(hours=1)).to_numpy(), 'rate': changed['Ставка за час'].to_numpy(),
+                      'changed': True}),
+        pd.DataFrame({'row': changed.index, 'part': 1, 'start': new_date.to_numpy(),
+                      'end': changed['Конец месяца'].to_numpy(), 'rate': changed['Ставка измененная за час'].to_numpy(),
+                      'changed': True}),
+    ])
+    return segments.sort_values(['row', 'part'], kind='stable').reset_index(drop=True)
+
+
+def _calendar_frame(df_temp: pd.DataFrame, segments: pd.DataFrame, with_rate: bool) -> pd.DataFrame:
+    # Столбцы в том порядке, в котором их давал pd.concat к пустому DataFrame(columns=[...])
+    positions, dates = _expand_days(segments['start'], segments['end'])
+    rows = segments['row'].to_numpy()[positions]
+    res = pd.DataFrame({'Date': dates})
+    res['Worker id'] = df_temp['Worker id'].to_numpy()[rows]
+    if with_rate:
+        res['Ставка за час'] = segments['rate'].to_numpy()[positions]
+    for column in WORKER_COLUMNS[1:]:
+        res[column] = df_temp[column].to_numpy()[rows]
+    if segments['changed'].any():
+        # Посменная зп = 0 задавалась только в интервалах с изменением ставки, у остальных после concat NaN
+        changed = segments['changed'].to_numpy()[positions]
+        res['Посменная зп'] = np.where(changed, 0.0, np.nan)
+    return res
+
+
+def expand_salary_calendar(df_temp: pd.DataFrame, separate_worker_id: int) -> tuple:
+    """
+    Разворачивает работников из Таблицы(ставки) по дням и месяцам.
+
+    Args:
+        df_temp: Строки Таблицы(ставки) по месяцам с рассчитанными 'Тип ставки', 'Ставка за час постоянно'
+            и 'Конец месяца'.
+        separate_worker_id: Работник, ставка за час которого считается отдельно по эффективности (res_c).
+
+    Returns:
+        Кортеж (res, res_month, res_c):
+        res - дни работников со ставкой за час (Date, Worker id, Ставка за час, данные работника, Посменная зп);
+        res_month - месяцы работников со ставкой за месяц; Посменная зп во всех строках равна
+            ставке последней такой строки, как и в прежнем цикле;
+        res_c - дни separate_worker_id без ставки за час.
+    """
+    df_temp = df_temp.reset_index(drop=True)
+    segments = _hourly_segments(df_temp)
+
+    if len(segments):
+        res = _calendar_frame(df_temp, segments, with_rate=True)
+    else:
+        res = pd.DataFrame(columns=['Date', 'Worker id', 'Ставка за час'])
+
+    segments_c = segments[df_temp['Worker id'].to_numpy()[segments['row'].to_numpy()] == separate_worker_id]
+    if len(segments_c):
+        res_c = _calendar_frame(df_temp, segments_c, with_rate=False)
+    else:
+        res_c = pd.DataFrame(columns=['Date', 'Worker id'])
+
+    monthly = df_temp[df_temp['Тип ставки'] == 'Ставка за месяц']
+    if len(monthly):
+        res_month = monthly[['Месяц'] + WORKER_COLUMNS].reset_index(drop=True)
+        res_month['Сдельная зп'] = 0
+        res_month['Посменная зп'] = monthly['Ставка за месяц'].iloc[-1]
+    else:
+        res_month = pd.DataFrame(columns=['Месяц', 'Worker id'])
+    return res, res_month, res_c
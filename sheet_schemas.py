@@ -0,0 +1,143 @@
+import pandas as pd
+
+
+# Схемы листов Google Sheets: к каким типам приводить столбцы диапазона.
+# get_sheet читает все диапазоны таблицы одним batchGet в 'UNFORMATTED_VALUE': числа приходят числами,
+#     а не строками в формате ячейки; даты и время - строками (dateTimeRenderOption='FORMATTED_STRING').
+#     Текстовые столбцы форматирует coerce_sheet, поэтому у каждого диапазона из get_sheet есть схема.
+# columns - столбец: {'dtype': 'float' | 'int' | 'datetime' | 'str',
+#                     'default': значение вместо пустых (None/''/заглушки), для datetime всегда NaT,
+#                     'sentinels': значения, которые тоже считаются пустыми}.
+#     Столбцы 'str' приводятся к строкам явно: в UNFORMATTED_VALUE числовые имена и ники приходят int/float,
+#     а это ключи соединений с данными из Postgres.
+# other_columns - спецификация для столбцов листа, которых нет в columns.
+# empty_default - чем заменить пустые строки '' в остальных столбцах (None в них остается).
+
+FORMATTED_VALUE = 'FORMATTED_VALUE'
+UNFORMATTED_VALUE = 'UNFORMATTED_VALUE'
+
+# Дата 0 (1970-01-01) в листе означает, что дата не задана
+EPOCH = pd.Timestamp('1970-01-01')
+
+_TABL_STAVKI_FLOAT_COLUMNS = [
+    'Количество отработанных часов', 'Ставка за час', 'Ставка измененная за час', 'Ставка за неделю',
+    'Ставка измененная за неделю', 'Ставка за месяц', 'Норма рабочих часов за месяц', 'Ставка свыше нормы',
+    'Количество отработанных часов свыше нормы', 'Ставка измененная за месяц',
+    'Норма расхода топлива на 100 км, литры', 'Цена топлива за 1 литр, евро', 'Количество часов работы на складе',
+    'Бонус за работу на складе', 'Бонус за ремонт', 'Сумма1', 'Сумма2', 'Сумма3', 'Сумма4', 'Сумма5', 'Сумма6',
+    'Сумма7', 'Штраф', 'Аванс', 'Сумма8', 'Сумма9', 'Сумма10', 'Процент_от_зп_бонус_прогр',
+]
+
+# Текстовые столбцы идентификации сотрудника и города
+_TABL_STAVKI_STR_COLUMNS = ['Worker username', 'Worker nickname', 'Worker role', 'city']
+
+_GRAFIK_TIME_COLUMNS = ['Planned start time', 'Planned finish time', 'Actual start time', 'Actual finish time']
+
+SHEET_SCHEMAS = {
+    'Таблица(ставки)!A:BF': {
+        'empty_default': '0',
+        'columns': {
+            'Месяц': {'dtype': 'datetime'},
+            'Дата нового условия ставки (час)': {'dtype': 'datetime', 'sentinels': [EPOCH]},
+            'Дата нового условия ставки (нед)': {'dtype': 'datetime', 'sentinels': [EPOCH]},
+            'Дата нового условия ставки (мес)': {'dtype': 'datetime', 'sentinels': [EPOCH]},
+            'Нач_дата_расч_бонуса_нов_сотр': {'dtype': 'datetime', 'sentinels': [EPOCH]},
+            'Оконч_дата_расч_бонус_нов_сотр': {'dtype': 'datetime'},
+            'Worker id': {'dtype': 'int', 'default': 0},
+            **{column: {'dtype': 'str', 'default': '0'} for column in _TABL_STAVKI_STR_COLUMNS},
+            **{column: {'dtype': 'float', 'default': 0.0} for column in _TABL_STAVKI_FLOAT_COLUMNS},
+            'Общее количество заряженных батарей': {'dtype': 'float', 'default': 0.0, 'sentinels': ['-']},
+            'id_invited_worker_nickname_бонусная_программа': {'dtype': 'int', 'default': 0},
+        },
+    },
+    'Плановое!A:E': {
+        'empty_default': '0',
+        'columns': {
+            'city_id': {'dtype': 'int', 'default': 0},
+            'city_name': {'dtype': 'str', 'default': '0'},
+            'planovoye': {'dtype': 'int', 'default': 0},
+            'Batteries V4.6/V4.7': {'dtype': 'int', 'default': 0},
+            'Batteries numbers V3 PRO': {'dtype': 'int', 'default': 0},
+        },
+    },
+    'График работ!A:L': {
+        'columns': {
+            'Worker id': {'dtype': 'str', 'default': '0'},
+            'Worker username': {'dtype': 'str', 'default': '0', 'sentinels': ['#N/A']},
+            'Worker nickname': {'dtype': 'str', 'default': '0', 'sentinels': ['#N/A']},
+            # 00:00:70 - время не указано, так его и отбирают запросы к grafik_rabot_google
+            **{column: {'dtype': 'str', 'default': '00:00:70'} for column in _GRAFIK_TIME_COLUMNS},
+            'Start odometer kilometers': {'dtype': 'str', 'default': '0'},
+            'Finish odometer kilometers': {'dtype': 'str', 'default': '0'},
+            'Fines (euro)': {'dtype': 'str', 'default': '0'},
+            'Note': {'dtype': 'str', 'default': '0'},
+        },
+    },
+    # Загружается в Postgres как есть, все столбцы текстовые
+    'Workers_city_role!A:E': {
+        'other_columns': {'dtype': 'str', 'default': '0'},
+    },
+    'Цели по чекапам!A:E': {
+        'columns': {
+            'Worker Id': {'dtype': 'int', 'default': 0},
+            'Цель на смену': {'dtype': 'int', 'default': 0},
+        },
+        'other_columns': {'dtype': 'str', 'default': '0'},
+    },
+}
+
+
+def _to_str(value) -> str:
+    # Целые числа без '.0': 12345.0 из листа - тот же ник '12345', что и в Postgres
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _coerce_column(values: pd.Series, spec: dict) -> pd.Series:
+    dtype = spec['dtype']
+    sentinels = spec.get('sentinels', [])
+    if dtype == 'datetime':
+        res = pd.to_datetime(values, errors='coerce')
+        return res.mask(res.isin(sentinels)) if sentinels else res
+
+    empty = values.isna() | values.isin([''] + sentinels)
+    values = values.mask(empty, spec.get('default'))
+    if dtype in ('float', 'int'):
+        # Числа из UNFORMATTED_VALUE и числовые строки из FORMATTED_VALUE приводятся одним astype
+        return values.astype(dtype)
+    return values.map(_to_str, na_action='ignore')
+
+
+def coerce_sheet(df: pd.DataFrame, range_name: str) -> pd.DataFrame:
+    """
+    Приводит столбцы DataFrame листа к типам из SHEET_SCHEMAS за один проход по столбцам.
+    Столбцы, которых нет в схеме, приводятся по other_columns, а без него остаются как есть
+    (кроме empty_default); отсутствующие в листе столбцы схемы пропускаются. Повторяющиеся заголовки листа сохраняются.
+
+    Args:
+        df: DataFrame диапазона из get_sheet (заголовки уже в columns).
+        range_name: Диапазон, по которому ищется схема.
+
+    Returns:
+        Новый DataFrame с тем же индексом и порядком столбцов.
+    """
+    schema = SHEET_SCHEMAS[range_name]
+    specs = schema.get('columns', {})
+    other = schema.get('other_columns')
+    empty_default = schema.get('empty_default')
+
+    columns = []
+    for i, column in enumerate(df.columns):
+        values = df.iloc[:, i]
+        spec = specs.get(column, other)
+        if spec is not None:
+            values = _coerce_column(values, spec)
+        elif empty_default is not None and values.dtype == object:
+            values = values.mask(values.eq(''), empty_default)
+        columns.append(values)
+    if not columns:
+        return df.copy()
+    res = pd.concat(columns, axis=1)
+    res.columns = df.columns
+    return res
@@ -0,0 +1,139 @@
+import datetime
+import resource
+import threading
+import time
+
+import pandas as pd
+import sqlalchemy as sa
+
+
+# Телеметрия стадий ETL: время извлечения/преобразования/загрузки, строки, байты и пиковая память процесса.
+# Метрики копятся в потоке стадии и в конце пишутся одной строкой в etl_stage_runs.
+# process_peak_rss_mb - пик памяти всего процесса на момент окончания стадии (ru_maxrss), а не стадии:
+# стадии идут параллельно в одном процессе и монотонный пик общий для всех.
+
+create_etl_stage_runs = '''
+    CREATE TABLE IF NOT EXISTS etl_stage_runs (
+        run_id TEXT NOT NULL,
+        stage TEXT NOT NULL,
+        status TEXT NOT NULL,
+        started_at TIMESTAMPTZ NOT NULL,
+        finished_at TIMESTAMPTZ NOT NULL,
+        duration_seconds DOUBLE PRECISION NOT NULL,
+        extract_seconds DOUBLE PRECISION NOT NULL,
+        transform_seconds DOUBLE PRECISION NOT NULL,
+        load_seconds DOUBLE PRECISION NOT NULL,
+        rows_in BIGINT NOT NULL,
+        rows_out BIGINT NOT NULL,
+        bytes_in BIGINT NOT NULL,
+        bytes_out BIGINT NOT NULL,
+        process_peak_rss_mb DOUBLE PRECISION NOT NULL,
+        error TEXT
+    )
+'''
+
+insert_etl_stage_run = '''
+    INSERT INTO etl_stage_runs (run_id, stage, status, started_at, finished_at, duration_seconds,
+        extract_seconds, transform_seconds, load_seconds, rows_in, rows_out, bytes_in, bytes_out,
+        process_peak_rss_mb, error)
+    VALUES (:run_id, :stage, :status, :started_at, :finished_at, :duration_seconds,
+        :extract_seconds, :transform_seconds, :load_seconds, :rows_in, :rows_out, :bytes_in, :bytes_out,
+        :process_peak_rss_mb, :error)
+'''
+
+# Таблицы, созданные до переименования столбца peak_rss_mb
+rename_peak_rss_mb = '''
+    DO $$
+    BEGIN
+        IF EXISTS (SELECT 1 FROM information_schema.columns
+                   WHERE table_name = 'etl_stage_runs' AND column_name = 'peak_rss_mb') THEN
+            ALTER TABLE etl_stage_runs RENAME COLUMN peak_rss_mb TO process_peak_rss_mb;
+        END IF;
+    END $$
+'''
+
+_local = threading.local()
+
+
+def ensure_stage_runs_table(engine_postgresql):
+    with engine_postgresql.begin() as connection:
+        connection.execute(sa.text(create_etl_stage_runs))
+        connection.execute(sa.text(rename_peak_rss_mb))
+
+
+def frame_bytes(df: pd.DataFrame) -> int:
+    # Без deep=True: для object-столбцов считаются только указатели, зато без прохода по каждому значению
+    return int(df.memory_usage(index=False).sum())
+
+
+def _record(phase: str, rows: int, nbytes: int, seconds: float):
+    metrics = getattr(_local, 'metrics', None)
+    if metrics is None:
+        return
+    metrics[f'{phase}_seconds'] += seconds
+    metrics[f'rows_{"in" if phase == "extract" else "out"}'] += rows
+    metrics[f'bytes_{"in" if phase == "extract" else "out"}'] += nbytes
+
+
+def record_extract(df: pd.DataFrame, seconds: float):
+    _record('extract', len(df), frame_bytes(df), seconds)
+
+
+def record_load(df: pd.DataFrame, seconds: float):
+    _record('load', len(df), frame_bytes(df), seconds)
+
+
+def extract_sql(query, con, **kwargs) -> pd.DataFrame:
+    """
+    pd.read_sql с учетом времени, строк и байтов извлечения в метриках текущей стадии.
+    """
+    started = time.monotonic()
+    df = pd.read_sql(query, con, **kwargs)
+    record_extract(df, time.monotonic() - started)
+    return df
+
+
+def get_process_peak_rss_mb() -> float:
+    # ru_maxrss в Linux в килобайтах; это пик всего процесса, а не отдельной стадии
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure_stage(run_id: str, name: str, func, engine_postgresql):
+    """
+    Выполняет стадию и записывает ее метрики в etl_stage_runs. Ошибка стадии пробрасывается дальше.
+
+    Args:
+        run_id: Идентификатор запуска.
+        name: Имя стадии.
+        func: Функция стадии без аргументов.
+        engine_postgresql: Engine SQLAlchemy для записи метрик.
+    """
+    _local.metrics = {'extract_seconds': 0.0, 'load_seconds': 0.0, 'rows_in': 0, 'rows_out': 0,
+                      'bytes_in': 0, 'bytes_out': 0}
+    started_at = datetime.datetime.now(datetime.timezone.utc)
+    started = time.monotonic()
+    status, error = 'ok', None
+    try:
+        func()
+    except Exception as e:
+        status, error = 'failed', str(e)
+        raise
+    finally:
+        duration = time.monotonic() - started
+        metrics = _local.metrics
+        _local.metrics = None
+        row = dict(metrics,
+                   run_id=run_id,
+                   stage=name,
+                   status=status,
+                   started_at=started_at,
+                   finished_at=datetime.datetime.now(datetime.timezone.utc),
+                   duration_seconds=duration,
+                   transform_seconds=max(duration - metrics['extract_seconds'] - metrics['load_seconds'], 0.0),
+                   process_peak_rss_mb=get_process_peak_rss_mb(),
+                   error=error)
+        try:
+            with engine_postgresql.begin() as connection:
+                connection.execute(sa.text(insert_etl_stage_run), row)
+        except Exception as e:
+            print(f"Не удалось записать метрики стадии {name}: {e}")
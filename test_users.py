@@ -0,0 +1,61 @@
+import sqlalchemy as sa
+
+
+# Тестовые пользователи, которые исключаются из всех отчетов.
+# Список ведется только здесь: в Postgres он синхронизируется в таблицу excluded_test_users,
+# в запросы к MySQL (где создавать таблицы нельзя) подставляется одноименный CTE.
+# Запросы исключают их через NOT EXISTS - планировщики обеих баз превращают его в anti-join.
+
+EXCLUDED_TEST_USERS = (52536, 58249, 72860, 37592, 63824, 49704, 54187, 70354, 70408, 49618, 72907, 70404, 44902, 45094)
+
+create_excluded_test_users = '''
+    CREATE TABLE IF NOT EXISTS excluded_test_users (
+        uid BIGINT PRIMARY KEY
+    )
+'''
+
+delete_stale_test_users = '''
+    DELETE FROM excluded_test_users
+    WHERE uid <> ALL(:uids)
+'''
+
+insert_test_users = '''
+    INSERT INTO excluded_test_users (uid)
+    SELECT unnest(CAST(:uids AS BIGINT[]))
+    ON CONFLICT (uid) DO NOTHING
+'''
+
+
+def sync_excluded_test_users(engine_postgresql):
+    """
+    Приводит таблицу excluded_test_users в Postgres к списку EXCLUDED_TEST_USERS.
+    """
+    uids = list(EXCLUDED_TEST_USERS)
+    with engine_postgresql.begin() as connection:
+        connection.execute(sa.text(create_excluded_test_users))
+        connection.execute(sa.text(delete_stale_test_users), {'uids': uids})
+        connection.execute(sa.text(insert_test_users), {'uids': uids})
+
+
+def with_excluded_test_users(query: str) -> str:
+    """
+    Добавляет к запросу MySQL CTE excluded_test_users со списком тестовых пользователей.
+
+    Args:
+        query: Текст запроса; если он начинается с WITH (после комментариев), CTE добавляется первым в список.
+
+    Returns:
+        Текст запроса с CTE.
+    """
+    cte = 'excluded_test_users AS (\n            ' + \
+        '\n            UNION ALL '.join(f'SELECT {uid} AS uid' for uid in EXCLUDED_TEST_USERS) + '\n        )'
+    lines = query.lstrip().splitlines()
+    comments = []
+    while lines and lines[0].lstrip().startswith('--'):
+        comments.append(lines.pop(0))
+    body = '\n'.join(lines).lstrip()
+    if body[:4].upper() == 'WITH' and body[4:5].isspace():
+        body = f'WITH {cte},\n        {body[5:].lstrip()}'
+    else:
+        body = f'WITH {cte}\n        {body}'
+    return '\n'.join(comments + [body])
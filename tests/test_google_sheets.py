@@ -0,0 +1,155 @@
+import threading
+import time
+import unittest
+
+import google_sheets
+
+
+class FakeRequest:
+    def __init__(self, service, kwargs):
+        self.service = service
+        self.kwargs = kwargs
+
+    def execute(self):
+        return self.service.execute(self.kwargs)
+
+
+class FakeService:
+    """
+    Заглушка клиента Sheets API: spreadsheets().values().batchGet(...).execute().
+    sheets - {ID таблицы: {диапазон: значения}}; block - {ID таблицы: threading.Event}, до которого batchGet ждет.
+    """
+
+    def __init__(self, sheets, block=None, error=None):
+        self.sheets = sheets
+        self.block = block or {}
+        self.error = error
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return self
+
+    def batchGet(self, **kwargs):
+        return FakeRequest(self, kwargs)
+
+    def execute(self, kwargs):
+        with self.lock:
+            self.calls.append(kwargs)
+        spreadsheet_id = kwargs['spreadsheetId']
+        if spreadsheet_id in self.block:
+            self.block[spreadsheet_id].wait(5)
+        if self.error is not None:
+            raise self.error
+        sheet = self.sheets[spreadsheet_id]
+        return {'valueRanges': [{'range': r, 'values': sheet[r]} for r in kwargs['ranges']]}
+
+
+SHEETS = {
+    'workers': {
+        'Workers_city_role!A:E': [['Worker id', 'city'], [1, 'Athens'], [2, 'Patras']],
+        'Цели по чекапам!A:E': [['Worker Id', 'Цель на смену'], [1, 10]],
+    },
+    'plan': {
+        'Плановое!A:E': [['city_id', 'planovoye'], [1, 100]],
+    },
+}
+
+
+class BatchReadSheetsTest(unittest.TestCase):
+    def test_reads_ranges_in_one_request(self):
+        service = FakeService(SHEETS)
+        ranges = ['Цели по чекапам!A:E', 'Workers_city_role!A:E']
+        frames = google_sheets.batch_read_sheets(service, 'workers', ranges, 'UNFORMATTED_VALUE')
+
+        self.assertEqual(len(service.calls), 1)
+        self.assertEqual(service.calls[0]['ranges'], ranges)
+        self.assertEqual(service.calls[0]['valueRenderOption'], 'UNFORMATTED_VALUE')
+        self.assertEqual(list(frames), ranges)
+        self.assertEqual(frames['Workers_city_role!A:E']['city'].tolist(), ['Athens', 'Patras'])
+        self.assertEqual(frames['Цели по чекапам!A:E']['Цель на смену'].tolist(), [10])
+
+    def test_error_returns_none(self):
+        service = FakeService(SHEETS, error=RuntimeError('quota'))
+        self.assertIsNone(google_sheets.batch_read_sheets(service, 'workers', ['Workers_city_role!A:E']))
+
+    def test_empty_range(self):
+        service = FakeService({'workers': {'Пусто!A:B': []}})
+        frames = google_sheets.batch_read_sheets(service, 'workers', ['Пусто!A:B'])
+        self.assertTrue(frames['Пусто!A:B'].empty)
+
+
+class GetSheetTest(unittest.TestCase):
+    def setUp(self):
+        google_sheets.clear_sheets()
+
+    def tearDown(self):
+        google_sheets.clear_sheets()
+
+    def test_planned_ranges_are_fetched_once(self):
+        service = FakeService(SHEETS)
+        google_sheets.plan_sheet_ranges([('workers', r) for r in SHEETS['workers']])
+
+        df = google_sheets.get_sheet(service, 'workers', 'Workers_city_role!A:E')
+        df['city'] = 'changed'
+        goals = google_sheets.get_sheet(service, 'workers', 'Цели по чекапам!A:E')
+        again = google_sheets.get_sheet(service, 'workers', 'Workers_city_role!A:E')
+
+        self.assertEqual(len(service.calls), 1)
+        self.assertEqual(service.calls[0]['valueRenderOption'], 'UNFORMATTED_VALUE')
+        self.assertEqual(goals['Worker Id'].tolist(), [1])
+        self.assertEqual(again['city'].tolist(), ['Athens', 'Patras'])
+
+    def test_concurrent_readers_of_one_spreadsheet_share_the_request(self):
+        release = threading.Event()
+        service = FakeService(SHEETS, block={'workers': release})
+        google_sheets.plan_sheet_ranges([('workers', r) for r in SHEETS['workers']])
+
+        results = {}
+
+        def read(range_name):
+            results[range_name] = google_sheets.get_sheet(service, 'workers', range_name)
+
+        threads = [threading.Thread(target=read, args=(r,)) for r in SHEETS['workers']]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(len(service.calls), 1)
+        self.assertEqual(set(results), set(SHEETS['workers']))
+
+    def test_other_spreadsheet_is_not_blocked_by_a_slow_request(self):
+        release = threading.Event()
+        service = FakeService(SHEETS, block={'workers': release})
+
+        slow = threading.Thread(target=google_sheets.get_sheet, args=(service, 'workers', 'Workers_city_role!A:E'))
+        slow.start()
+        try:
+            # Пока batchGet таблицы workers висит (до 5 с), таблица plan читается без ожидания
+            time.sleep(0.1)
+            started = time.monotonic()
+            df = google_sheets.get_sheet(service, 'plan', 'Плановое!A:E')
+            self.assertLess(time.monotonic() - started, 1)
+            self.assertEqual(df['planovoye'].tolist(), [100])
+        finally:
+            release.set()
+            slow.join(5)
+
+    def test_failed_request_is_not_cached(self):
+        service = FakeService(SHEETS, error=RuntimeError('quota'))
+        self.assertIsNone(google_sheets.get_sheet(service, 'workers', 'Workers_city_role!A:E'))
+
+        service.error = None
+        df = google_sheets.get_sheet(service, 'workers', 'Workers_city_role!A:E')
+        self.assertEqual(df['Worker id'].tolist(), [1, 2])
+        self.assertEqual(len(service.calls), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,165 @@
+import unittest
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from salary_calendar import expand_salary_calendar
+
+
+def expand_with_loop(df_temp):
+    # Прежний цикл по iterrows из расчета зп - эталон для expand_salary_calendar
+    columns = ['Date', 'Worker id', 'Ставка за час']
+    res = pd.DataFrame(columns=columns)
+    columns_month = ['Месяц', 'Worker id']
+    res_month = pd.DataFrame(columns=columns_month)
+    for index, row in df_temp.iterrows():
+        if (row['Ставка за час постоянно'] == 0) & (row['Тип ставки'] == 'Ставка за час'):
+            dates1 = pd.date_range(start=row['Месяц'], end=row['Конец месяца'], freq='D')
+            df1 = pd.DataFrame(dates1, columns=['Date'])
+            df1['Ставка за час'] = row['Ставка за час']
+            df1['Worker id'] = row['Worker id']
+            df1['Worker username'] = row['Worker username']
+            df1['Worker nickname'] = row['Worker nickname']
+            df1['Worker role'] = row['Worker role']
+            df1['city'] = row['city']
+            res = pd.concat([res, df1], ignore_index=True)
+        elif (row['Ставка за час постоянно'] == 1) & (row['Тип ставки'] == 'Ставка за час'):
+            dates1 = pd.date_range(start=row['Месяц'],
+                                   end=row['Дата нового условия ставки (час)'] - pd.Timedelta(hours=1), freq='D')
+            df1 = pd.DataFrame(dates1, columns=['Date'])
+            df1['Ставка за час'] = row['Ставка за час']
+            df1['Worker id'] = row['Worker id']
+            df1['Worker username'] = row['Worker username']
+            df1['Worker nickname'] = row['Worker nickname']
+            df1['Worker role'] = row['Worker role']
+            df1['city'] = row['city']
+            df1['Посменная зп'] = 0
+            dates2 = pd.date_range(start=row['Дата нового условия ставки (час)'], end=row['Конец месяца'], freq='D')
+            df2 = pd.DataFrame(dates2, columns=['Date'])
+            df2['Ставка за час'] = row['Ставка измененная за час']
+            df2['Worker id'] = row['Worker id']
+            df2['Worker username'] = row['Worker username']
+            df2['Worker nickname'] = row['Worker nickname']
+            df2['Worker role'] = row['Worker role']
+            df2['city'] = row['city']
+            df2['Посменная зп'] = 0
+            res = pd.concat([res, df1, df2], ignore_index=True)
+        elif row['Тип ставки'] == 'Ставка за месяц':
+            dates3 = pd.date_range(start=row['Месяц'], end=row['Месяц'], freq='D')
+            df3 = pd.DataFrame(dates3, columns=['Месяц'])
+            df3['Worker id'] = row['Worker id']
+            df3['Worker username'] = row['Worker username']
+            df3['Worker nickname'] = row['Worker nickname']
+            df3['Worker role'] = row['Worker role']
+            df3['city'] = row['city']
+            res_month = pd.concat([res_month, df3], ignore_index=True)
+            res_month['Сдельная зп'] = 0
+            res_month['Посменная зп'] = row['Ставка за месяц']
+    columns = ['Date', 'Worker id']
+    res_c = pd.DataFrame(columns=columns)
+    for index, row in df_temp[df_temp['Worker id'] == 35].iterrows():
+        if (row['Ставка за час постоянно'] == 0) & (row['Тип ставки'] == 'Ставка за час'):
+            dates1 = pd.date_range(start=row['Месяц'], end=row['Конец месяца'], freq='D')
+            df1 = pd.DataFrame(dates1, columns=['Date'])
+            df1['Worker id'] = row['Worker id']
+            df1['Worker username'] = row['Worker username']
+            df1['Worker nickname'] = row['Worker nickname']
+            df1['Worker role'] = row['Worker role']
+            df1['city'] = row['city']
+            res_c = pd.concat([res_c, df1], ignore_index=True)
+        elif (row['Ставка за час постоянно'] == 1) & (row['Тип ставки'] == 'Ставка за час'):
+            dates1 = pd.date_range(start=row['Месяц'],
+                                   end=row['Дата нового условия ставки (час)'] - pd.Timedelta(hours=1), freq='D')
+            df1 = pd.DataFrame(dates1, columns=['Date'])
+            df1['Worker id'] = row['Worker id']
+            df1['Worker username'] = row['Worker username']
+            df1['Worker nickname'] = row['Worker nickname']
+            df1['Worker role'] = row['Worker role']
+            df1['city'] = row['city']
+            df1['Посменная зп'] = 0
+            dates2 = pd.date_range(start=row['Дата нового условия ставки (час)'], end=row['Конец месяца'], freq='D')
+            df2 = pd.DataFrame(dates2, columns=['Date'])
+            df2['Worker id'] = row['Worker id']
+            df2['Worker username'] = row['Worker username']
+            df2['Worker nickname'] = row['Worker nickname']
+            df2['Worker role'] = row['Worker role']
+            df2['city'] = row['city']
+            df2['Посменная зп'] = 0
+            res_c = pd.concat([res_c, df1, df2], ignore_index=True)
+    return res, res_month, res_c
+
+
+def make_tabl_stavki(n, seed, kinds=(0, 1, 2, 3)):
+    # Строки Таблицы(ставки) по месяцам: kinds 0 - постоянная ставка за час, 1 - ставка за час с изменением,
+    # 2 - ставка за месяц, 3 - без ставки
+    rng = np.random.default_rng(seed)
+    months = pd.to_datetime(rng.choice(pd.date_range('2025-08-01', '2026-06-01', freq='MS'), n))
+    kind = rng.choice(kinds, n)
+    new = months + pd.to_timedelta(rng.integers(-5, 40, n), unit='D') + pd.to_timedelta(rng.choice([0, 0, 0, 7], n), unit='h')
+    df = pd.DataFrame({
+        'Месяц': months,
+        'Worker id': rng.choice([35, 1, 2, 3, 4, 5] + list(range(100, 100 + n)), n),
+        'Worker username': ['u%d' % i for i in rng.integers(0, 50, n)],
+        'Worker nickname': ['n%d' % i for i in rng.integers(0, 50, n)],
+        'Worker role': rng.choice(['a', 'b'], n),
+        'city': rng.choice(['x', 'y'], n),
+        'Ставка за час': rng.choice([0.0, 5.0, 7.5], n),
+        'Ставка измененная за час': rng.choice([0.0, 6.0, 8.0], n),
+        'Ставка за месяц': rng.choice([1000.0, 1200.0], n),
+        'Дата нового условия ставки (час)': new.where(kind == 1),
+    })
+    df['Тип ставки'] = np.select([kind <= 1, kind == 2], ['Ставка за час', 'Ставка за месяц'], None)
+    df.loc[df['Тип ставки'].isna(), 'Тип ставки'] = None
+    df['Ставка за час постоянно'] = df['Дата нового условия ставки (час)'].fillna(0).apply(lambda x: 0 if x == 0 else 1)
+    df['Конец месяца'] = df['Месяц'] + pd.tseries.offsets.MonthEnd()
+    df.index = rng.permutation(n) + 1
+    return df
+
+
+def post_process(res, res_month, res_c):
+    # Обработка, которую стадия зп применяет к результатам сразу после разворота
+    res_month = res_month.copy()
+    res = res.copy()
+    res_c = res_c.copy()
+    res_month['Месяц'] = pd.to_datetime(res_month['Месяц'], errors='coerce')
+    res = res.drop(res[res['Worker id'] == 35].index)
+    res['Месяц'] = res['Date'].apply(lambda x: x.strftime('%Y-%m-01'))
+    res['Месяц'] = pd.to_datetime(res['Месяц'], errors='coerce')
+    res['Date'] = pd.to_datetime(res['Date'], errors='coerce')
+    res['Ставка за час'] = res['Ставка за час'].astype(float)
+    res['Worker id'] = res['Worker id'].astype(int)
+    res_c['Месяц'] = res_c['Date'].apply(lambda x: x.strftime('%Y-%m-01'))
+    res_c['Месяц'] = pd.to_datetime(res_c['Месяц'], errors='coerce')
+    res_c['Date'] = pd.to_datetime(res_c['Date'], errors='coerce')
+    res_c['Worker id'] = res_c['Worker id'].astype(int)
+    res_c['Посменная зп'] = 0
+    if 'Worker id' in res_month and len(res_month):
+        res_month['Worker id'] = res_month['Worker id'].astype(int)
+    return res, res_month, res_c
+
+
+class ExpandSalaryCalendarTest(unittest.TestCase):
+    def assert_same_as_loop(self, df):
+        with warnings.catch_warnings():
+            # Прежний цикл делает pd.concat к пустым DataFrame
+            warnings.simplefilter('ignore', FutureWarning)
+            expected = post_process(*expand_with_loop(df))
+        actual = post_process(*expand_salary_calendar(df, 35))
+        for name, left, right in zip(['res', 'res_month', 'res_c'], expected, actual):
+            with self.subTest(frame=name):
+                pd.testing.assert_frame_equal(left, right)
+
+    def test_matches_loop(self):
+        for seed in range(8):
+            for kinds in [(0, 1, 2, 3), (0,), (1,), (2,), (3,), (0, 2), (1, 3)]:
+                n = int(np.random.default_rng(seed).integers(1, 30))
+                with self.subTest(seed=seed, kinds=kinds):
+                    self.assert_same_as_loop(make_tabl_stavki(n, seed, kinds))
+
+    def test_matches_loop_on_many_rows(self):
+        self.assert_same_as_loop(make_tabl_stavki(150, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
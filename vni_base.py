@@ -0,0 +1,247 @@
+import datetime
+import decimal
+import os
+
+import pandas as pd
+import sqlalchemy as sa
+
+from mirror_sync import select_watermark, upsert_watermark
+from postgres_loader import copy_dataframe
+from run_window import next_day
+from stage_metrics import extract_sql
+from test_users import with_excluded_test_users
+from vni_state import VNI_START_DATE
+
+
+# Дневные агрегаты поездок по городам - общая основа three_left_cols для ВНИ Общий и ВНИ по городам.
+# Хранятся в Postgres и пересчитываются из MySQL только за дни, затронутые новыми поездками (id выше отметки),
+# плюс скользящее окно последних vni_city_daily_base_refresh_days дней: сумма, скидка, статус и платежные
+# данные поездки дописываются уже после вставки строки.
+# Изменения поездок старше окна (платежные данные, бонусы, статус, список тестовых пользователей) попадают
+# в таблицу при полном пересчете, который выполняется раз в vni_city_daily_base_rebuild_days дней.
+# Итого дни вне окна отстают от MySQL не больше чем на vni_city_daily_base_rebuild_days дней.
+
+BASE_TABLE = 'vni_city_daily_base'
+# Ключ etl_watermarks с днем последнего полного пересчета (date.toordinal())
+REBUILD_KEY = 'vni_city_daily_base_rebuild'
+
+DEFAULT_REFRESH_DAYS = 7
+DEFAULT_REBUILD_DAYS = 7
+
+create_vni_city_daily_base = '''
+    CREATE TABLE IF NOT EXISTS vni_city_daily_base (
+        day DATE NOT NULL,
+        city_id BIGINT NOT NULL,
+        has_payment_details BOOLEAN NOT NULL,
+        poezdok BIGINT NOT NULL,
+        obzchaya_stoimost NUMERIC NOT NULL,
+        oplacheno_bonusami NUMERIC NOT NULL,
+        obschee_vremya_sec NUMERIC NOT NULL,
+        skidka NUMERIC NOT NULL,
+        PRIMARY KEY (day, city_id, has_payment_details)
+    )
+'''
+
+# Дни с новыми поездками после отметки и максимальный id в каждом
+select_new_ride_days_mysql = '''
+    SELECT
+        DATE_FORMAT(FROM_UNIXTIME(t_bike_use.start_time), '%Y-%m-%d') AS day,
+        MAX(t_bike_use.id) AS max_id
+    FROM shamri.t_bike_use
+    WHERE t_bike_use.id > {watermark}
+    GROUP BY 1
+'''
+
+select_max_ride_id_mysql = '''
+    SELECT MAX(t_bike_use.id) AS max_id
+    FROM shamri.t_bike_use
+'''
+
+# city_id = -1 - велосипед не найден в t_bike.
+# has_payment_details - есть строка t_payment_details не тестового пользователя (условие ВНИ по городам)
+select_vni_city_daily_base_mysql = '''
+    SELECT
+        DATE_FORMAT(FROM_UNIXTIME(t_bike_use.start_time), '%Y-%m-%d') AS day,
+        IFNULL(t_bike.city_id, -1) AS city_id,
+        tpd.user_id IS NOT NULL AND etu_tpd.uid IS NULL AS has_payment_details,
+        COUNT(t_bike_use.ride_amount) AS poezdok,
+        SUM(IFNULL(t_bike_use.ride_amount,0)) AS obzchaya_stoimost,
+        SUM(IFNULL(t_bike_use.discount,0)) AS oplacheno_bonusami,
+        SUM(IFNULL(t_bike_use.duration,0)) AS obschee_vremya_sec,
+        SUM(IFNULL(tpd.bike_discount_amount,0)) AS skidka
+    FROM shamri.t_bike_use
+    LEFT JOIN t_bike ON t_bike_use.bid = t_bike.id
+    LEFT JOIN shamri.t_payment_details tpd ON t_bike_use.id = tpd.ride_id
+    LEFT JOIN excluded_test_users etu_tpd ON tpd.user_id = etu_tpd.uid
+    WHERE t_bike_use.ride_status!=5
+        AND t_bike_use.uid IS NOT NULL AND NOT EXISTS (SELECT 1 FROM excluded_test_users etu WHERE etu.uid = t_bike_use.uid)
+        AND ({day_filter})
+    GROUP BY 1, 2, 3
+'''
+
+delete_base_days = '''
+    DELETE FROM vni_city_daily_base
+    WHERE day = ANY(CAST(:days AS DATE[]))
+'''
+
+# three_left_cols ВНИ Общий: все города и поездки, по дням начиная с date_from
+select_vni_total_base = '''
+    SELECT
+        TO_CHAR(b.day, 'YYYY-MM-DD') AS start_time,
+        SUM(b.poezdok) AS poezdok,
+        SUM(b.obzchaya_stoimost) AS obzchaya_stoimost,
+        SUM(b.oplacheno_bonusami) AS oplacheno_bonusami,
+        ROUND(SUM(b.obschee_vremya_sec) / 60, 4) AS obschee_vremya_min,
+        SUM(b.skidka) AS skidka
+    FROM vni_city_daily_base b
+    WHERE b.day >= CAST(:date_from AS DATE)
+    GROUP BY b.day
+    ORDER BY b.day
+'''
+
+# three_left_cols ВНИ по городам: строки за сегодня с накопительными итогами (_ni) по каждому городу
+select_vni_cities_base = '''
+    SELECT
+        TO_CHAR(res.day, 'YYYY-MM-DD') AS start_time,
+        res.city_id,
+        res.poezdok,
+        res.obzchaya_stoimost,
+        res.obzchaya_stoimost_ni,
+        res.oplacheno_bonusami_ni,
+        res.oplacheno_bonusami,
+        res.obschee_vremya_min,
+        res.skidka,
+        res.skidka_ni
+    FROM
+        (
+        SELECT
+            b.day,
+            b.city_id,
+            SUM(b.poezdok) AS poezdok,
+            SUM(b.obzchaya_stoimost) AS obzchaya_stoimost,
+            SUM(SUM(b.obzchaya_stoimost)) OVER (PARTITION BY b.city_id ORDER BY b.day) AS obzchaya_stoimost_ni,
+            SUM(SUM(b.oplacheno_bonusami)) OVER (PARTITION BY b.city_id ORDER BY b.day) AS oplacheno_bonusami_ni,
+            SUM(b.oplacheno_bonusami) AS oplacheno_bonusami,
+            ROUND(SUM(b.obschee_vremya_sec) / 60, 4) AS obschee_vremya_min,
+            SUM(b.skidka) AS skidka,
+            SUM(SUM(b.skidka)) OVER (PARTITION BY b.city_id ORDER BY b.day) AS skidka_ni
+        FROM vni_city_daily_base b
+        WHERE b.has_payment_details
+            AND b.city_id <> -1
+            AND b.day <= CAST(:today AS DATE)
+        GROUP BY b.day, b.city_id
+        ) AS res
+    WHERE res.day = CAST(:today AS DATE)
+    ORDER BY res.city_id
+'''
+
+
+def ensure_vni_city_daily_base_table(engine_postgresql):
+    with engine_postgresql.begin() as connection:
+        connection.execute(sa.text(create_vni_city_daily_base))
+
+
+def _day_ranges(days: list) -> str:
+    return ' OR '.join(f"(t_bike_use.start_time >= UNIX_TIMESTAMP('{day}') "
+                       f"AND t_bike_use.start_time < UNIX_TIMESTAMP('{next_day(day)}'))" for day in days)
+
+
+def get_refresh_days() -> int:
+    return int(os.environ.get('vni_city_daily_base_refresh_days', DEFAULT_REFRESH_DAYS))
+
+
+def get_rebuild_days() -> int:
+    return int(os.environ.get('vni_city_daily_base_rebuild_days', DEFAULT_REBUILD_DAYS))
+
+
+def refresh_vni_city_daily_base(engine_mysql, engine_postgresql, today: str) -> int:
+    """
+    Пересчитывает дневные агрегаты по городам за дни с новыми поездками и последние
+    vni_city_daily_base_refresh_days дней. При первом запуске и раз в vni_city_daily_base_rebuild_days дней
+    таблица пересчитывается целиком за всю историю с VNI_START_DATE.
+
+    Args:
+        engine_mysql: Engine SQLAlchemy для MySQL.
+        engine_postgresql: Engine SQLAlchemy для Postgres.
+        today: Сегодняшний день MySQL 'YYYY-MM-DD'.
+
+    Returns:
+        Количество загруженных строк.
+    """
+    with engine_postgresql.connect() as connection:
+        watermark = connection.execute(sa.text(select_watermark), {'table_name': BASE_TABLE}).scalar()
+        rebuilt = connection.execute(sa.text(select_watermark), {'table_name': REBUILD_KEY}).scalar()
+
+    today_ordinal = datetime.date.fromisoformat(today).toordinal()
+    if watermark is None or rebuilt is None or today_ordinal - int(rebuilt) >= get_rebuild_days():
+        max_id = extract_sql(select_max_ride_id_mysql, engine_mysql)['max_id'].iloc[0]
+        new_watermark = int(max_id or 0)
+        days = None
+        day_filter = f"t_bike_use.start_time >= UNIX_TIMESTAMP('{VNI_START_DATE}')"
+    else:
+        df_new = extract_sql(select_new_ride_days_mysql.format(watermark=int(watermark)), engine_mysql)
+        new_watermark = max([int(watermark)] + [int(max_id) for max_id in df_new['max_id']])
+        window = {str(datetime.date.fromordinal(today_ordinal - i)) for i in range(max(get_refresh_days(), 1))}
+        days = sorted({day for day in df_new['day'] if day is not None} | window)
+        days = [day for day in days if day >= VNI_START_DATE]
+        day_filter = _day_ranges(days)
+
+    # Decimal без перевода во float, чтобы суммы в Postgres совпадали с MySQL
+    df_base = extract_sql(with_excluded_test_users(select_vni_city_daily_base_mysql.format(day_filter=day_filter)),
+                          engine_mysql, coerce_float=False)
+    df_base['has_payment_details'] = df_base['has_payment_details'].astype(int).astype(bool)
+
+    with engine_postgresql.begin() as connection:
+        if days is None:
+            connection.execute(sa.text('TRUNCATE TABLE vni_city_daily_base'))
+            connection.execute(sa.text(upsert_watermark), {'table_name': REBUILD_KEY, 'watermark': today_ordinal})
+        else:
+            connection.execute(sa.text(delete_base_days), {'days': days})
+        copy_dataframe(connection, df_base, BASE_TABLE)
+        connection.execute(sa.text(upsert_watermark), {'table_name': BASE_TABLE, 'watermark': new_watermark})
+    return len(df_base)
+
+
+def _sql_literal(value) -> str:
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return 'NULL'
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    if isinstance(value, decimal.Decimal):
+        return format(value, 'f')
+    return str(value)
+
+
+def literal_rows(df: pd.DataFrame) -> str:
+    """
+    Превращает DataFrame в SELECT ... UNION ALL SELECT ... для подстановки в запрос MySQL как CTE.
+    Для пустого DataFrame возвращает SELECT без строк с теми же столбцами.
+    """
+    if df.empty:
+        return 'SELECT ' + ', '.join(f'NULL AS {column}' for column in df.columns) + ' FROM DUAL WHERE FALSE'
+    rows = []
+    for i, row in enumerate(df.itertuples(index=False)):
+        if i == 0:
+            values = ', '.join(f'{_sql_literal(value)} AS {column}' for column, value in zip(df.columns, row))
+        else:
+            values = ', '.join(_sql_literal(value) for value in row)
+        rows.append('SELECT ' + values)
+    return '\n            UNION ALL '.join(rows)
+
+
+def vni_total_base_rows(engine_postgresql, date_from: str) -> str:
+    """
+    Строки three_left_cols ВНИ Общий за дни начиная с date_from в виде SQL для MySQL.
+    """
+    df = extract_sql(sa.text(select_vni_total_base), engine_postgresql, params={'date_from': date_from},
+                     coerce_float=False)
+    return literal_rows(df)
+
+
+def vni_cities_base_rows(engine_postgresql, today: str) -> str:
+    """
+    Строки three_left_cols ВНИ по городам за сегодня с накопительными итогами в виде SQL для MySQL.
+    """
+    df = extract_sql(sa.text(select_vni_cities_base), engine_postgresql, params={'today': today},
+                     coerce_float=False)
+    return literal_rows(df)
@@ -0,0 +1,83 @@
+import pandas as pd
+import sqlalchemy as sa
+
+from stage_metrics import extract_sql
+
+
+# Накопленные итоги ВНИ Общий по закрытым дням.
+# Каждый запуск считает в MySQL только дни после последнего сохраненного состояния и прибавляет к ним итоги
+
+# Начало истории ВНИ, с которого считается накопительный итог, если состояния еще нет
+VNI_START_DATE = '2024-07-21'
+
+# Столбцы vni_total с SUM(...) OVER (ORDER BY день), которые складываются с сохраненным состоянием
+VNI_TOTAL_CUMULATIVE = ['vni', 'vni_bez_bonusov', 'obsch_PayTabs', 'obsch_Stripe',
+                        'obsch_PayTabs_i_obsch_Stripe', 'user_v_den_obshc']
+
+create_vni_total_state = '''
+    CREATE TABLE IF NOT EXISTS vni_total_state (
+        day DATE PRIMARY KEY,
+        vni NUMERIC NOT NULL,
+        vni_bez_bonusov NUMERIC NOT NULL,
+        "obsch_PayTabs" NUMERIC NOT NULL,
+        "obsch_Stripe" NUMERIC NOT NULL,
+        "obsch_PayTabs_i_obsch_Stripe" NUMERIC NOT NULL,
+        user_v_den_obshc NUMERIC NOT NULL,
+        updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    )
+'''
+
+select_vni_total_states = '''
+    SELECT day, vni, vni_bez_bonusov, "obsch_PayTabs", "obsch_Stripe", "obsch_PayTabs_i_obsch_Stripe", user_v_den_obshc
+    FROM vni_total_state
+    WHERE day < :before
+    ORDER BY day DESC
+'''
+
+upsert_vni_total_state = '''
+    INSERT INTO vni_total_state (day, vni, vni_bez_bonusov, "obsch_PayTabs", "obsch_Stripe",
+        "obsch_PayTabs_i_obsch_Stripe", user_v_den_obshc, updated_at)
+    VALUES (:day, :vni, :vni_bez_bonusov, :obsch_PayTabs, :obsch_Stripe,
+        :obsch_PayTabs_i_obsch_Stripe, :user_v_den_obshc, NOW())
+    ON CONFLICT (day) DO UPDATE
+    SET vni = EXCLUDED.vni,
+        vni_bez_bonusov = EXCLUDED.vni_bez_bonusov,
+        "obsch_PayTabs" = EXCLUDED."obsch_PayTabs",
+        "obsch_Stripe" = EXCLUDED."obsch_Stripe",
+        "obsch_PayTabs_i_obsch_Stripe" = EXCLUDED."obsch_PayTabs_i_obsch_Stripe",
+        user_v_den_obshc = EXCLUDED.user_v_den_obshc,
+        updated_at = EXCLUDED.updated_at
+'''
+
+
+def ensure_vni_total_state_table(engine_postgresql):
+    with engine_postgresql.begin() as connection:
+        connection.execute(sa.text(create_vni_total_state))
+
+
+def get_vni_total_states(engine_postgresql, before: str) -> pd.DataFrame:
+    """
+    Возвращает сохраненные накопленные итоги за дни до указанного, от последнего к первому.
+
+    Args:
+        engine_postgresql: Engine SQLAlchemy для Postgres.
+        before: Дата 'YYYY-MM-DD' (обычно сегодняшний день MySQL), сама в выборку не входит.
+    """
+    df = extract_sql(sa.text(select_vni_total_states), engine_postgresql, params={'before': before})
+    df['day'] = df['day'].astype(str)
+    return df
+
+
+def save_vni_total_state(engine_postgresql, day: str, row: pd.Series):
+    """
+    Сохраняет накопленные итоги на конец закрытого дня.
+
+    Args:
+        engine_postgresql: Engine SQLAlchemy для Postgres.
+        day: Дата 'YYYY-MM-DD'.
+        row: Строка vni_total с накопленными итогами на этот день.
+    """
+    params = {column: float(row[column]) for column in VNI_TOTAL_CUMULATIVE}
+    params['day'] = day
+    with engine_postgresql.begin() as connection:
+        connection.execute(sa.text(upsert_vni_total_state), params)